@@ -388,8 +388,7 @@ def _ensure_table_schema(engine: Engine, table: str, sample: Dict[str, Any]) ->
         try:
             if DEBUG:
                 logger.debug(f"[api_ingest] ensure_table_schema: using native duckdb for table={table}")
-            con = open_duck_native(settings.duckdb_path)
-            try:
+            with open_duck_native(settings.duckdb_path) as con:
                 existing: Dict[str, str] = {}
                 try:
                     info = con.execute(f"PRAGMA table_info('{table}')").fetchall()
@@ -408,11 +407,6 @@ def _ensure_table_schema(engine: Engine, table: str, sample: Dict[str, Any]) ->
                             except Exception:
                                 pass
                 con.commit()
-            finally:
-                try:
-                    con.close()
-                except Exception:
-                    pass
             return list(cols.keys()), cols
         except Exception as e:
             try:
@@ -451,8 +445,7 @@ def _ensure_table_schema(engine: Engine, table: str, sample: Dict[str, Any]) ->
         # Fallback to native duckdb if available
         if _duckdb is not None and ("DuckDBPyType" in str(e) or "unhashable type" in str(e)):
             try:
-                con = open_duck_native(settings.duckdb_path)
-                try:
+                with open_duck_native(settings.duckdb_path) as con:
                     # check existing
                     existing: Dict[str, str] = {}
                     try:
@@ -472,11 +465,6 @@ def _ensure_table_schema(engine: Engine, table: str, sample: Dict[str, Any]) ->
                                 except Exception:
                                     pass
                     con.commit()
-                finally:
-                    try:
-                        con.close()
-                    except Exception:
-                        pass
                 return list(cols.keys()), cols
             except Exception:
                 pass
@@ -493,14 +481,10 @@ def _delete_window(engine: Engine, table: str, date_field: str, start: str, end:
     except Exception as e:
         if _duckdb is not None and ("DuckDBPyType" in str(e) or "unhashable type" in str(e)):
             try:
-                con = open_duck_native(settings.duckdb_path)
-                try:
+                with open_duck_native(settings.duckdb_path) as con:
                     con.execute(sql, (start, end))
                     con.commit()
                     return
-                finally:
-                    try: con.close()
-                    except Exception: pass
             except Exception:
                 pass
         raise
@@ -524,16 +508,10 @@ def _insert_rows(engine: Engine, table: str, rows: List[Dict[str, Any]]) -> int:
         try:
             if DEBUG:
                 logger.debug(f"[api_ingest] insert_rows: using native duckdb for table={table} rows={len(rows)}")
-            con = open_duck_native(settings.duckdb_path)
-            try:
+            with open_duck_native(settings.duckdb_path) as con:
                 con.executemany(sql, payload_vals)
                 con.commit()
                 return len(rows)
-            finally:
-                try:
-                    con.close()
-                except Exception:
-                    pass
         except Exception as e:
             try:
                 logger.exception("native insert_rows failed for %s: %s", table, str(e))
@@ -553,17 +531,11 @@ def _insert_rows(engine: Engine, table: str, rows: List[Dict[str, Any]]) -> int:
         # Fallback to native duckdb
         if _duckdb is not None and ("DuckDBPyType" in str(e) or "unhashable type" in str(e)):
             try:
-                con = open_duck_native(settings.duckdb_path)
-                try:
+                with open_duck_native(settings.duckdb_path) as con:
                     # prepare once
                     con.executemany(sql, payload_vals)
                     con.commit()
                     return len(rows)
-                finally:
-                    try:
-                        con.close()
-                    except Exception:
-                        pass
             except Exception as _:
                 pass
         raise
@@ -578,13 +550,9 @@ def _max_date(engine: Engine, table: str, date_field: str) -> Optional[str]:
     except Exception as e:
         if _duckdb is not None and ("DuckDBPyType" in str(e) or "unhashable type" in str(e)):
             try:
-                con = open_duck_native(settings.duckdb_path)
-                try:
+                with open_duck_native(settings.duckdb_path) as con:
                     v = con.execute(sql).fetchone()
                     return v[0] if v else None
-                finally:
-                    try: con.close()
-                    except Exception: pass
             except Exception:
                 pass
         return None
@@ -636,14 +604,10 @@ def _truncate_table(engine: Engine, table: str) -> None:
     except Exception as e:
         if _duckdb is not None and ("DuckDBPyType" in str(e) or "unhashable type" in str(e)):
             try:
-                con = open_duck_native(settings.duckdb_path)
-                try:
+                with open_duck_native(settings.duckdb_path) as con:
                     con.execute(sql)
                     con.commit()
                     return
-                finally:
-                    try: con.close()
-                    except Exception: pass
             except Exception:
                 pass
         # ignore if table doesn't exist
@@ -0,0 +1,200 @@
+"""Opt-in approximate execution for exploratory widgets.
+
+Exploratory charts over very large fact tables do not need exact answers,
+yet every ``/query/spec`` or ``/pivot`` call scans the whole table. When a
+request sets ``approximate: true`` the endpoint runs inside
+:func:`approximate_scope`; ``run_query`` then passes each DuckDB statement
+through :meth:`ApproxScope.rewrite` before execution:
+
+* **Sample mode** — when the aggregating SELECT only uses SUM / COUNT / AVG,
+  its fact table gets ``TABLESAMPLE SYSTEM (p PERCENT)``, SUM and COUNT are
+  scaled by ``100 / p`` and a hidden ``COUNT(*) AS __approx_n`` column records
+  the sampled rows per group. :meth:`ApproxScope.collect` strips that column
+  and turns it into a 95% relative error bound for counts
+  (``1.96 * sqrt((1 - p) / n)``). That bound assumes rows are sampled
+  independently, which holds for ``BERNOULLI``; the default ``SYSTEM``
+  method samples whole blocks, so on clustered data the real error is
+  larger and no bound is reported (``maxRelativeError`` is None and
+  ``errorBound`` says why). Set ``APPROX_SAMPLE_METHOD=bernoulli`` for
+  bounds at the cost of reading every block.
+* **Sketch mode** — aggregates that do not scale from a sample (distinct
+  counts, quantiles, MIN/MAX) run on the full table, with
+  ``COUNT(DISTINCT x)`` replaced by ``approx_count_distinct(x)`` and
+  ``MEDIAN`` / ``QUANTILE_CONT`` / ``QUANTILE_DISC`` by ``approx_quantile``.
+
+Statements the rewriter cannot reason about (several aggregation levels,
+window functions over samples, non-DuckDB engines) run exactly. The endpoint
+marks a response ``approximate: true`` only when at least one statement was
+actually rewritten, with the per-statement metadata in ``approximation``.
+"""
+from __future__ import annotations
+
+import contextvars
+import logging
+import math
+import os
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+import sqlglot
+from sqlglot import exp
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_N_COLUMN = "__approx_n"
+
+try:
+    DEFAULT_SAMPLE_PERCENT = float(os.environ.get("APPROX_SAMPLE_PERCENT", "10") or "10")
+except Exception:
+    DEFAULT_SAMPLE_PERCENT = 10.0
+APPROX_SAMPLE_METHOD = (os.environ.get("APPROX_SAMPLE_METHOD", "system") or "system").strip().lower()
+
+_Z95 = 1.96
+
+_ACTIVE: contextvars.ContextVar[Optional["ApproxScope"]] = contextvars.ContextVar("approx_scope", default=None)
+
+
+def _own_nodes(select: exp.Select, kind) -> list:
+    """Nodes of *kind* that belong to *select* itself (not to nested SELECTs)."""
+    return [n for n in select.find_all(kind) if n.find_ancestor(exp.Select) is select]
+
+
+def _fact_table(select: exp.Select, cte_names: set[str]) -> Optional[exp.Table]:
+    """The base table under *select*'s FROM, looking through non-aggregating subqueries."""
+    frm = select.args.get("from_") or select.args.get("from")
+    node = frm.this if frm is not None else None
+    while isinstance(node, exp.Subquery):
+        inner = node.this
+        if not isinstance(inner, exp.Select) or _own_nodes(inner, exp.AggFunc):
+            return None
+        frm = inner.args.get("from_") or inner.args.get("from")
+        node = frm.this if frm is not None else None
+    if isinstance(node, exp.Table) and node.name and node.name.lower() not in cte_names:
+        return node
+    return None
+
+
+def _sketch(agg: exp.AggFunc) -> Optional[exp.Expression]:
+    if isinstance(agg, exp.Count) and isinstance(agg.this, exp.Distinct):
+        args = agg.this.expressions
+        if len(args) == 1:
+            return exp.ApproxDistinct(this=args[0].copy())
+    if isinstance(agg, exp.Median):
+        return exp.ApproxQuantile(this=agg.this.copy(), quantile=exp.Literal.number(0.5))
+    if isinstance(agg, (exp.PercentileCont, exp.PercentileDisc)) and isinstance(agg.expression, exp.Literal):
+        return exp.ApproxQuantile(this=agg.this.copy(), quantile=agg.expression.copy())
+    return None
+
+
+class ApproxScope:
+    """Per-request approximation settings plus what was actually applied."""
+
+    def __init__(self, percent: Optional[float] = None, method: Optional[str] = None) -> None:
+        p = float(percent) if percent else DEFAULT_SAMPLE_PERCENT
+        self.percent = min(max(p, 0.01), 100.0)
+        self.method = method or APPROX_SAMPLE_METHOD
+        self.applied: list[dict[str, Any]] = []
+
+    def rewrite(self, sql: str, dialect: str = "duckdb") -> str:
+        """Return the approximate form of *sql*, or *sql* unchanged."""
+        try:
+            tree = sqlglot.parse_one(sql, read=dialect)
+        except Exception:
+            return sql
+        targets = [s for s in tree.find_all(exp.Select) if _own_nodes(s, exp.AggFunc)]
+        if len(targets) != 1:
+            return sql
+        sel = targets[0]
+        aggs = _own_nodes(sel, exp.AggFunc)
+        scalable = (
+            not _own_nodes(sel, exp.Window)
+            and all(isinstance(a, (exp.Sum, exp.Avg)) or (isinstance(a, exp.Count) and not isinstance(a.this, exp.Distinct)) for a in aggs)
+        )
+        cte_names = {c.alias_or_name.lower() for c in tree.find_all(exp.CTE)}
+        table = _fact_table(sel, cte_names) if scalable and self.percent < 100 else None
+        if table is not None:
+            factor = exp.Literal.number(round(100.0 / self.percent, 6))
+            table.set("sample", exp.TableSample(method=exp.Var(this=self.method.upper()), percent=exp.Literal.number(self.percent)))
+            for a in aggs:
+                if isinstance(a, exp.Sum):
+                    a.replace(exp.paren(exp.Mul(this=a.copy(), expression=factor.copy())))
+                elif isinstance(a, exp.Count):
+                    scaled = exp.Round(this=exp.Mul(this=a.copy(), expression=factor.copy()))
+                    a.replace(exp.Cast(this=scaled, to=exp.DataType.build("BIGINT")))
+            sel.append("expressions", exp.Count(this=exp.Star()).as_(SAMPLE_N_COLUMN))
+            self.applied.append({"method": "sample", "table": table.name, "samplePercent": self.percent,
+                                 "sampleMethod": self.method.lower()})
+        else:
+            replaced = 0
+            for a in aggs:
+                new = _sketch(a)
+                if new is not None:
+                    a.replace(new)
+                    replaced += 1
+            if not replaced:
+                return sql
+            self.applied.append({"method": "sketch", "functions": replaced})
+        out = tree.sql(dialect=dialect)
+        logger.debug(f"[approx] {self.applied[-1]} -> {out[:200]}")
+        return out
+
+    def collect(self, columns: list[str], rows: list[list[Any]]) -> tuple[list[str], list[list[Any]]]:
+        """Strip the hidden sample-size column and record error bounds."""
+        if SAMPLE_N_COLUMN not in columns:
+            return columns, rows
+        i = columns.index(SAMPLE_N_COLUMN)
+        ns = [r[i] for r in rows if len(r) > i and isinstance(r[i], (int, float))]
+        if self.applied and self.applied[-1].get("method") == "sample":
+            info = self.applied[-1]
+            info["confidence"] = 0.95
+            if ns:
+                p = info["samplePercent"] / 100.0
+                n_min = max(min(ns), 0)
+                info["minSampleRows"] = int(n_min)
+                if info.get("sampleMethod") != "bernoulli":
+                    # Block samples are not independent rows: the bound would be too tight.
+                    info["maxRelativeError"] = None
+                    info["errorBound"] = "not reported for block (SYSTEM) sampling"
+                else:
+                    info["maxRelativeError"] = (
+                        round(_Z95 * math.sqrt((1.0 - p) / n_min), 6) if n_min > 0 else None
+                    )
+        return (
+            columns[:i] + columns[i + 1:],
+            [list(r[:i]) + list(r[i + 1:]) for r in rows],
+        )
+
+    def metadata(self) -> Optional[dict[str, Any]]:
+        if not self.applied:
+            return None
+        return {"statements": list(self.applied)}
+
+
+def active() -> Optional[ApproxScope]:
+    return _ACTIVE.get()
+
+
+@contextmanager
+def approximate_scope(enabled: Optional[bool], percent: Optional[float] = None) -> Iterator[Optional[ApproxScope]]:
+    """Activate approximate rewriting for the current thread/context when *enabled*."""
+    if not enabled:
+        yield None
+        return
+    scope = ApproxScope(percent)
+    tok = _ACTIVE.set(scope)
+    try:
+        yield scope
+    finally:
+        _ACTIVE.reset(tok)
+
+
+def annotate(res: Any, scope: Optional[ApproxScope]) -> Any:
+    """Flag a QueryResponse as approximate when the scope rewrote anything."""
+    meta = scope.metadata() if scope is not None else None
+    if meta is not None:
+        try:
+            res.approximate = True
+            res.approximation = meta
+        except Exception:
+            pass
+    return res
@@ -0,0 +1,249 @@
+"""Per-datasource cache of date-column semantics.
+
+The period-average and moving-average paths in ``routers/query.py`` need to
+know whether the date field is a native timestamp, a Unix epoch integer (and
+in which unit), a ``YYYYMMDD`` integer or a string date in some format before
+they can wrap it in the right conversion expression. Answering that takes a
+probe query (INFORMATION_SCHEMA / DESCRIBE plus a small value sample), and
+those requests run for every time-series KPI on every dashboard load.
+
+This module memoizes the answer per ``(datasource, table, column)``:
+
+* Entries are filled on first probe (see ``_date_column_semantics`` in
+  ``routers/query.py``) or eagerly at sync time from ``DESCRIBE`` of the
+  destination table (``routers/datasources.py``).
+* Sync invalidates the synced table (and the remote datasource) so a
+  changed column type is re-probed once, then cached again.
+* Local DuckDB tables use :data:`LOCAL_KEY` as their datasource key, the
+  same convention the result cache uses for ``datasourceId=None``.
+* A probe that fails or finds no columns is remembered for
+  :data:`NEGATIVE_TTL_S` seconds (:func:`mark_failed`), so an unreachable
+  source does not re-run the metadata query on every request.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Iterable, Optional
+
+LOCAL_KEY = "__local__"
+
+# Upper bound on cached tables; oldest-inserted entries are evicted first.
+MAX_TABLES = 2048
+
+# How long a failed / empty type probe is remembered before it is retried.
+NEGATIVE_TTL_S = 60.0
+
+# Column kinds
+TIMESTAMP = "timestamp"   # native DATE / DATETIME / TIMESTAMP
+EPOCH = "epoch"           # integer seconds/millis/micros since 1970-01-01
+INT_DATE = "int_date"     # integer YYYYMMDD
+STRING = "string"         # text; ``date_format`` set once a sample parsed
+NUMERIC = "numeric"       # integer/decimal not yet sampled
+OTHER = "other"
+
+_INT_TYPES = ("tinyint", "smallint", "mediumint", "int", "integer", "bigint", "hugeint", "int2", "int4", "int8",
+              "ubigint", "uinteger", "usmallint", "utinyint")
+_TS_TYPES = ("date", "datetime", "datetime2", "smalldatetime", "datetimeoffset", "timestamp", "timestamptz",
+             "timestamp with time zone", "timestamp without time zone", "timestamp_s", "timestamp_ms", "timestamp_ns")
+_STR_TYPES = ("varchar", "char", "text", "nvarchar", "nchar", "ntext", "string", "character varying", "tinytext",
+              "mediumtext", "longtext")
+
+
+@dataclass(frozen=True)
+class ColumnSemantics:
+    name: str
+    kind: str
+    data_type: str = ""
+    epoch_unit: Optional[str] = None   # "s" | "ms" | "us" when kind == EPOCH
+    date_format: Optional[str] = None  # strftime-style format for INT_DATE / STRING
+    sampled: bool = False              # value sample already inspected
+
+
+def _base_type(data_type: str) -> str:
+    return re.sub(r"\(.*$", "", str(data_type or "").strip().lower()).strip()
+
+
+def classify_type(name: str, data_type: str) -> ColumnSemantics:
+    """Classify a column from its declared type alone (no data access)."""
+    bt = _base_type(data_type)
+    if bt in _TS_TYPES or bt.startswith("timestamp"):
+        kind = TIMESTAMP
+    elif bt in _INT_TYPES:
+        kind = NUMERIC
+    elif bt in _STR_TYPES:
+        kind = STRING
+    else:
+        kind = OTHER
+    return ColumnSemantics(name=str(name), kind=kind, data_type=bt, sampled=(kind in (TIMESTAMP, OTHER)))
+
+
+def classify_int_sample(sem: ColumnSemantics, max_value: object) -> ColumnSemantics:
+    """Refine an integer column using its ``MAX()``: epoch (with unit) or YYYYMMDD."""
+    try:
+        v = abs(int(max_value))  # type: ignore[arg-type]
+    except (TypeError, ValueError):
+        return replace(sem, sampled=True)
+    if 19000101 <= v <= 21001231:
+        return replace(sem, kind=INT_DATE, date_format="%Y%m%d", sampled=True)
+    if v < 10**11:
+        unit = "s"
+    elif v < 10**14:
+        unit = "ms"
+    else:
+        unit = "us"
+    return replace(sem, kind=EPOCH, epoch_unit=unit, sampled=True)
+
+
+# Candidate formats for string dates, tried in order. ISO first: it needs no
+# conversion because every engine casts it natively.
+_ISO_FORMATS = ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S")
+_STRING_FORMATS = _ISO_FORMATS + (
+    "%d/%m/%Y", "%m/%d/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d",
+    "%d/%m/%Y %H:%M:%S", "%m/%d/%Y %H:%M:%S", "%Y%m%d",
+)
+
+
+def infer_date_format(samples: Iterable[object]) -> Optional[str]:
+    """Return the first format that parses every non-empty sample, else None."""
+    from datetime import datetime
+    vals = [str(s).strip() for s in samples if s is not None and str(s).strip()]
+    if not vals:
+        return None
+    for fmt in _STRING_FORMATS:
+        try:
+            for v in vals:
+                # Fractional seconds are common in ISO strings; match on the prefix.
+                datetime.strptime(v[:19] if fmt in _ISO_FORMATS[1:] else v, fmt)
+        except ValueError:
+            continue
+        return fmt
+    return None
+
+
+def classify_string_sample(sem: ColumnSemantics, samples: Iterable[object]) -> ColumnSemantics:
+    return replace(sem, date_format=infer_date_format(samples), sampled=True)
+
+
+def is_iso_format(fmt: Optional[str]) -> bool:
+    return fmt in _ISO_FORMATS
+
+
+def to_timestamp_sql(col_sql: str, sem: Optional[ColumnSemantics], dialect: str) -> str:
+    """Wrap *col_sql* so it evaluates to a timestamp in *dialect*.
+
+    Returns *col_sql* unchanged for native timestamps, ISO strings and
+    anything this module does not know how to convert.
+    """
+    if sem is None:
+        return col_sql
+    d = (dialect or "").lower()
+    if sem.kind == EPOCH:
+        div = {"ms": 1000, "us": 1000000}.get(sem.epoch_unit or "s")
+        v = f"({col_sql} / {div})" if div else col_sql
+        if "mysql" in d:
+            return f"FROM_UNIXTIME({v})"
+        if "mssql" in d or "sqlserver" in d:
+            return f"DATEADD(second, {v}, CAST('1970-01-01' AS DATETIME))"
+        if "postgres" in d:
+            return f"TO_TIMESTAMP({v})"
+        return f"to_timestamp({v})"
+    if sem.kind in (INT_DATE, STRING) and sem.date_format and not is_iso_format(sem.date_format):
+        fmt = sem.date_format.replace("'", "''")
+        if "mysql" in d:
+            return f"STR_TO_DATE({col_sql}, '{fmt.replace('%M', '%i')}')"
+        if "duckdb" in d or not d:
+            return f"try_strptime(CAST({col_sql} AS VARCHAR), '{fmt}')"
+    return col_sql
+
+
+# ── Cache ────────────────────────────────────────────────────────────────
+
+_lock = threading.Lock()
+# (ds_key, table_lower) -> {column_lower: ColumnSemantics}
+_tables: dict[tuple[str, str], dict[str, ColumnSemantics]] = {}
+# (ds_key, table_lower) -> monotonic time of the last failed probe
+_failed: dict[tuple[str, str], float] = {}
+
+
+def _key(ds_key: Optional[str], table: str) -> tuple[str, str]:
+    t = str(table or "").replace('"', "").replace("`", "").replace("[", "").replace("]", "").strip().lower()
+    return (str(ds_key or LOCAL_KEY), t)
+
+
+def get_table(ds_key: Optional[str], table: str) -> Optional[dict[str, ColumnSemantics]]:
+    with _lock:
+        cols = _tables.get(_key(ds_key, table))
+        return dict(cols) if cols is not None else None
+
+
+def get_column(ds_key: Optional[str], table: str, column: str) -> Optional[ColumnSemantics]:
+    with _lock:
+        cols = _tables.get(_key(ds_key, table))
+        if cols is None:
+            return None
+        return cols.get(str(column or "").strip().strip('`"[]').lower())
+
+
+def put_table(ds_key: Optional[str], table: str, columns: Iterable[tuple[str, str]]) -> dict[str, ColumnSemantics]:
+    """Store declared types for every column of *table* (replaces the entry)."""
+    cols = {str(n).lower(): classify_type(str(n), str(t)) for n, t in columns}
+    k = _key(ds_key, table)
+    with _lock:
+        _failed.pop(k, None)
+        _tables.pop(k, None)
+        _tables[k] = cols
+        while len(_tables) > MAX_TABLES:
+            _tables.pop(next(iter(_tables)))
+    return dict(cols)
+
+
+def put_column(ds_key: Optional[str], table: str, sem: ColumnSemantics) -> None:
+    """Insert or refine a single column (e.g. after sampling values)."""
+    k = _key(ds_key, table)
+    with _lock:
+        cols = _tables.setdefault(k, {})
+        cols[sem.name.lower()] = sem
+
+
+def mark_failed(ds_key: Optional[str], table: str) -> None:
+    """Remember that probing *table* failed (or returned no columns)."""
+    k = _key(ds_key, table)
+    with _lock:
+        _failed.pop(k, None)
+        _failed[k] = time.monotonic()
+        while len(_failed) > MAX_TABLES:
+            _failed.pop(next(iter(_failed)))
+
+
+def recently_failed(ds_key: Optional[str], table: str) -> bool:
+    """True while a failed probe of *table* is younger than :data:`NEGATIVE_TTL_S`."""
+    k = _key(ds_key, table)
+    with _lock:
+        ts = _failed.get(k)
+        if ts is None:
+            return False
+        if time.monotonic() - ts < NEGATIVE_TTL_S:
+            return True
+        _failed.pop(k, None)
+        return False
+
+
+def invalidate(ds_key: Optional[str] = None, table: Optional[str] = None) -> None:
+    """Drop cached semantics: one table, one datasource, or everything."""
+    with _lock:
+        if ds_key is None and table is None:
+            _tables.clear()
+            _failed.clear()
+            return
+        if table is not None:
+            _tables.pop(_key(ds_key, table), None)
+            _failed.pop(_key(ds_key, table), None)
+            return
+        dk = str(ds_key)
+        for k in [k for k in _tables if k[0] == dk]:
+            _tables.pop(k, None)
+        for k in [k for k in _failed if k[0] == dk]:
+            _failed.pop(k, None)
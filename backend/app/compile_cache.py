@@ -0,0 +1,227 @@
+"""Memoization for SQL compilation (``build_sql`` / ``SQLGlotBuilder``).
+
+Every widget request recompiles its query from scratch. ``sqlgen.build_sql``
+re-validates and re-normalizes each custom-column / transform expression
+with sqlglot, and ``SQLGlotBuilder.build_aggregation_query`` rebuilds and
+renders a full AST. On spec-heavy dashboards that adds up to tens of
+milliseconds per request, even though the inputs barely change between
+refreshes.
+
+Both builders are pure functions of their arguments, so results are memoized
+at two levels:
+
+* **Compile cache** — :func:`memoize_compile` keys a whole builder call by a
+  canonical hash of its arguments: dialect, source, transforms / custom
+  columns / joins as given, and the normalized spec (dict keys sorted, sets
+  ordered). A datasource's transforms are part of the key, so editing them
+  changes the key and no explicit invalidation is needed.
+* **Expression cache** — :func:`memoize_expr` wraps the per-expression
+  helpers (``validate_expr``, ``_normalize_expr_idents``,
+  ``auto_normalize``) with a bounded LRU. They are hit by every compile-cache
+  miss, and a handful of expressions are shared by many widgets.
+
+Sizes come from ``SQL_COMPILE_CACHE_SIZE`` (default 2048 entries) and
+``SQL_EXPR_CACHE_SIZE`` (default 8192). Either can be set to 0 to disable
+that level. Hits and misses are counted in
+``sql_compile_cache_hit_total`` / ``sql_compile_cache_miss_total`` (label
+``cache``); :func:`stats` reports per-process hit rates for
+``/admin/metrics-live``. Cached results are strings or tuples; lists and
+dicts inside tuples are copied on every hit so callers may mutate them.
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+try:
+    COMPILE_CACHE_SIZE = int(os.environ.get("SQL_COMPILE_CACHE_SIZE", "2048") or "2048")
+except Exception:
+    COMPILE_CACHE_SIZE = 2048
+try:
+    EXPR_CACHE_SIZE = int(os.environ.get("SQL_EXPR_CACHE_SIZE", "8192") or "8192")
+except Exception:
+    EXPR_CACHE_SIZE = 8192
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe bounded LRU mapping with hit/miss counters."""
+
+    def __init__(self, name: str, maxsize: int) -> None:
+        self.name = name
+        self.maxsize = max(int(maxsize), 0)
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Any, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Any, default: Any = _MISSING) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                hit = False
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                hit = True
+        _count(self.name, hit)
+        return value if hit else default
+
+    def put(self, key: Any, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxSize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": (self.hits / total) if total else None,
+        }
+
+
+def _count(name: str, hit: bool) -> None:
+    try:
+        from .metrics import counter_inc
+        counter_inc("sql_compile_cache_hit_total" if hit else "sql_compile_cache_miss_total", {"cache": name})
+    except Exception:
+        pass
+
+
+_CACHES: dict[str, LRUCache] = {}
+
+
+def get_cache(name: str, maxsize: int) -> LRUCache:
+    cache = _CACHES.get(name)
+    if cache is None:
+        cache = _CACHES.setdefault(name, LRUCache(name, maxsize))
+    return cache
+
+
+def _canon(v: Any) -> Any:
+    if isinstance(v, dict):
+        return {str(k): _canon(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_canon(x) for x in v]
+    if isinstance(v, (set, frozenset)):
+        return sorted((_canon(x) for x in v), key=repr)
+    if v is None or isinstance(v, (str, int, float, bool)):
+        return v
+    return repr(v)
+
+
+def canonical_key(*parts: Any) -> str:
+    """SHA-1 of the canonical JSON form of *parts* (dict order does not matter)."""
+    blob = json.dumps(_canon(list(parts)), sort_keys=True, separators=(",", ":"), default=repr)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+def _fresh(v: Any) -> Any:
+    if isinstance(v, tuple):
+        return tuple(_fresh(x) for x in v)
+    if isinstance(v, list):
+        return list(v)
+    if isinstance(v, dict):
+        return dict(v)
+    return v
+
+
+def memoize_compile(
+    name: str,
+    *,
+    key_prefix: Optional[Callable[..., Any]] = None,
+    skip_if: Optional[Callable[..., bool]] = None,
+) -> Callable:
+    """Cache a builder's result by a canonical hash of all its arguments.
+
+    ``key_prefix(*args)`` can contribute extra state to the key; methods use
+    it to include ``self.dialect``, and ``self`` itself is left out.
+    ``skip_if(*args)`` bypasses the cache for calls with side effects.
+    """
+    def deco(fn: Callable) -> Callable:
+        cache = get_cache(name, COMPILE_CACHE_SIZE)
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if cache.maxsize <= 0 or (skip_if is not None and skip_if(*args)):
+                return fn(*args, **kwargs)
+            if key_prefix is not None:
+                prefix, key_args = key_prefix(*args), args[1:]
+            else:
+                prefix, key_args = None, args
+            try:
+                key = canonical_key(prefix, key_args, kwargs)
+            except Exception:
+                return fn(*args, **kwargs)
+            hit = cache.get(key)
+            if hit is not _MISSING:
+                return _fresh(hit)
+            out = fn(*args, **kwargs)
+            cache.put(key, _fresh(out))
+            return out
+
+        wrapper.cache = cache  # type: ignore[attr-defined]
+        return wrapper
+    return deco
+
+
+def memoize_expr(name: str) -> Callable:
+    """Bounded-LRU cache for pure per-expression helpers with hashable args.
+
+    Exceptions are not cached: invalid expressions re-raise on every call.
+    """
+    def deco(fn: Callable) -> Callable:
+        cache = get_cache(name, EXPR_CACHE_SIZE)
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if cache.maxsize <= 0:
+                return fn(*args, **kwargs)
+            try:
+                key = (args, tuple(sorted(kwargs.items())))
+                hash(key)
+            except TypeError:
+                return fn(*args, **kwargs)
+            hit = cache.get(key)
+            if hit is not _MISSING:
+                return hit
+            out = fn(*args, **kwargs)
+            cache.put(key, out)
+            return out
+
+        wrapper.cache = cache  # type: ignore[attr-defined]
+        return wrapper
+    return deco
+
+
+def stats() -> dict[str, dict[str, Any]]:
+    """Per-process size and hit rate of every compile / expression cache."""
+    return {name: c.stats() for name, c in sorted(_CACHES.items())}
+
+
+def clear() -> None:
+    for c in list(_CACHES.values()):
+        c.clear()
@@ -22,6 +22,9 @@ class Settings(BaseSettings):
 
     # Secrets — MUST be set via SECRET_KEY env var; app refuses to start with the placeholder
     secret_key: str = Field(default="BayanSecretKey-CHANGE-ME")
+    # Comma-separated retired keys still accepted for DECRYPTING stored credentials
+    # while migrate_secret_key.py re-encrypts them; new values use secret_key only.
+    secret_key_previous: str = Field(default="", validation_alias=AliasChoices("SECRET_KEY_PREVIOUS"))
 
     # Authentication enforcement. When False (default), endpoints fall back to the
     # legacy actorId query param so old clients keep working during rollout. When
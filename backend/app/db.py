@@ -124,6 +124,7 @@ import os
 from pathlib import Path
 import random
 import socket
+import threading
 import time
 import calendar
 from datetime import datetime, date
@@ -165,6 +166,7 @@ import re
 from sqlalchemy.engine import Engine
 
 from .config import settings
+from . import materialized as _materialized
 
 
 _DATA_DIR = Path(settings.duckdb_path).resolve().parent
@@ -209,6 +211,11 @@ _DUCK_ENGINE_PATH: str | None = None
 # Cache for external datasource engines, keyed by DSN (normalized)
 _ENGINE_CACHE: dict[str, Engine] = {}
 _ENGINE_REVERSE: dict[int, str] = {}
+# datasource id -> (credential version, _ENGINE_CACHE key). Lets the query path
+# reuse a ready engine without decrypting/normalizing the DSN per request.
+_DS_ENGINE_INDEX: dict[str, tuple[str, str]] = {}
+# Guards _DS_ENGINE_INDEX and the dispose decisions made from it
+_ENGINE_CACHE_LOCK = threading.RLock()
 _DUCK_CONFIGURED: bool = False
 
 # Single shared native DuckDB connection (Option A) — used for write paths
@@ -224,13 +231,29 @@ _DUCK_SHARED_ATTACHED: set[str] = set()
 # A simple thread-safe pool of independent duckdb.connect() handles.
 # Each handle is a full connection (not a cursor off the shared one)
 # which allows DuckDB's multi-reader concurrency.
+import collections as _collections
 import queue as _queue
 import threading as _threading
 
-_DUCK_READ_POOL: _queue.SimpleQueue | None = None
+from . import metrics as _metrics
+
+_DUCK_READ_POOL: "_DuckReadPool | None" = None
 _DUCK_READ_POOL_PATH: str | None = None
 _DUCK_READ_POOL_LOCK = _threading.Lock()
 _DUCK_READ_POOL_SIZE = int(os.environ.get("DUCKDB_READ_POOL_SIZE", "0") or "0") or 0  # 0 = sized at init
+# Checkout when every pooled connection is busy: wait up to
+# DUCKDB_READ_POOL_TIMEOUT seconds in FIFO order, then apply the overflow
+# policy — "wait" (raise DuckPoolExhausted -> HTTP 503), "ephemeral" (open a
+# throwaway connection for this query) or "reject" (raise without waiting).
+try:
+    _DUCK_READ_POOL_TIMEOUT = float(os.environ.get("DUCKDB_READ_POOL_TIMEOUT", "10") or "10")
+except Exception:
+    _DUCK_READ_POOL_TIMEOUT = 10.0
+_DUCK_READ_POOL_OVERFLOW = (os.environ.get("DUCKDB_READ_POOL_OVERFLOW", "wait") or "wait").strip().lower()
+# Pooled connections entered (``with``) by the current thread. A thread that already holds
+# one never blocks for another (it could be waiting on itself); it gets the
+# shared connection as before.
+_DUCK_POOL_HELD = _threading.local()
 
 # ── ATTACH registry ────────────────────────────────────────────────
 # Stores tuples of (alias, sql) for every successful ATTACH executed on
@@ -241,6 +264,121 @@ _DUCK_ATTACH_REGISTRY: list[tuple[str, str]] = []  # [(alias, full_attach_sql),
 _DUCK_ATTACH_REGISTRY_LOCK = _threading.Lock()
 
 
+class DuckPoolExhausted(RuntimeError):
+    """No pooled DuckDB read connection became free in time (mapped to HTTP 503)."""
+
+
+class _PoolWaiter:
+    __slots__ = ("event", "item")
+
+    def __init__(self):
+        self.event = _threading.Event()
+        self.item: "_TrackedConn | None" = None
+
+
+class _DuckReadPool:
+    """Bounded pool of ``_TrackedConn`` handles with FIFO blocking checkout.
+
+    Keeps the ``get_nowait()`` / ``put()`` surface of the SimpleQueue it
+    replaces. ``put()`` hands a returned connection straight to the oldest
+    waiter, so a burst of requests is served in arrival order and a late
+    arrival cannot overtake a thread that is already waiting. In-use, idle
+    and waiting counts are published as gauges on every change.
+    """
+
+    def __init__(self):
+        self._lock = _threading.Lock()
+        self._idle: "_collections.deque[_TrackedConn]" = _collections.deque()
+        self._waiters: "_collections.deque[_PoolWaiter]" = _collections.deque()
+        self.size = 0
+        self.in_use = 0
+        self.closed = False
+
+    def _publish(self) -> None:
+        try:
+            _metrics.gauge_set("duck_read_pool_connections", self.in_use, {"state": "in_use"})
+            _metrics.gauge_set("duck_read_pool_connections", len(self._idle), {"state": "idle"})
+            _metrics.gauge_set("duck_read_pool_waiting", len(self._waiters))
+        except Exception:
+            pass
+
+    def add(self, tracked: "_TrackedConn") -> None:
+        """Add a new connection to the pool (initial fill)."""
+        with self._lock:
+            self.size += 1
+            self._idle.append(tracked)
+            self._publish()
+
+    def get_nowait(self) -> "_TrackedConn":
+        """An idle connection, or ``queue.Empty`` (also while others wait)."""
+        return self.get(0)
+
+    def get(self, timeout: float) -> "_TrackedConn":
+        """Check out a connection, waiting up to *timeout* seconds in FIFO order."""
+        with self._lock:
+            if self.closed:
+                raise _queue.Empty
+            if self._idle and not self._waiters:
+                tracked = self._idle.popleft()
+                self.in_use += 1
+                self._publish()
+                return tracked
+            if timeout <= 0:
+                raise _queue.Empty
+            waiter = _PoolWaiter()
+            self._waiters.append(waiter)
+            self._publish()
+        waiter.event.wait(timeout)
+        with self._lock:
+            if waiter.item is None:
+                # Timed out, or woken by close(). put() may not hand it over any more.
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+                self._publish()
+                raise _queue.Empty
+            return waiter.item
+
+    def put(self, tracked: "_TrackedConn") -> None:
+        """Return a checked-out connection; RuntimeError once the pool is closed."""
+        with self._lock:
+            if self.closed:
+                raise RuntimeError("DuckDB read pool is closed")
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.item = tracked
+                waiter.event.set()
+            else:
+                self.in_use = max(0, self.in_use - 1)
+                self._idle.append(tracked)
+            self._publish()
+
+    def discard(self) -> None:
+        """Forget a checked-out connection that was closed and not replaced."""
+        with self._lock:
+            self.size = max(0, self.size - 1)
+            self.in_use = max(0, self.in_use - 1)
+            self._publish()
+
+    def close(self) -> "list[_TrackedConn]":
+        """Close the pool, wake every waiter and return the idle connections."""
+        with self._lock:
+            self.closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            for waiter in self._waiters:
+                waiter.event.set()
+            self._waiters.clear()
+            self.in_use = 0
+            self._publish()
+        return idle
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": self.size, "inUse": self.in_use, "idle": len(self._idle), "waiting": len(self._waiters)}
+
+
 class _TrackedConn:
     """Pool entry: a duckdb connection + the set of ATTACH aliases replayed onto it.
 
@@ -325,7 +463,7 @@ def _init_duck_read_pool(target: str, size: int = 0) -> None:
     # Default is capped so a big-core machine doesn't open a huge pool; an
     # explicit DUCKDB_READ_POOL_SIZE env override is intentionally uncapped.
     pool_size = size or _DUCK_READ_POOL_SIZE or min(16, max(4, (os.cpu_count() or 4) * 2))
-    _DUCK_READ_POOL = _queue.SimpleQueue()
+    _DUCK_READ_POOL = _DuckReadPool()
     _DUCK_READ_POOL_PATH = target
     for _ in range(pool_size):
         try:
@@ -339,7 +477,7 @@ def _init_duck_read_pool(target: str, size: int = 0) -> None:
             # ordering, which opens the RW shared conn before building this pool.
             c = _duckdb.connect(target)
             _apply_duck_pragmas(c)
-            _DUCK_READ_POOL.put(_TrackedConn(c))
+            _DUCK_READ_POOL.add(_TrackedConn(c))
         except Exception:
             pass
 
@@ -352,15 +490,61 @@ def _drain_duck_read_pool() -> None:
         return
     _DUCK_READ_POOL = None
     _DUCK_READ_POOL_PATH = None
-    while True:
+    # Checked-out connections are closed by their wrapper when put() refuses them.
+    for t in pool.close():
         try:
-            t = pool.get_nowait()
-            try:
-                t.conn.close()
-            except Exception:
-                pass
+            t.conn.close()
         except Exception:
-            break
+            pass
+
+
+def duck_read_pool_stats() -> dict:
+    """Size, in-use, idle and waiting counts of the read pool (admin/metrics)."""
+    pool = _DUCK_READ_POOL
+    out = pool.stats() if pool is not None else {"size": 0, "inUse": 0, "idle": 0, "waiting": 0}
+    out.update(timeoutSeconds=_DUCK_READ_POOL_TIMEOUT, overflow=_DUCK_READ_POOL_OVERFLOW)
+    return out
+
+
+def _checkout_duck_read(pool: "_DuckReadPool"):
+    """Borrow a pooled connection per the overflow policy.
+
+    Returns the ``_TrackedConn``, or None when the caller should use the
+    shared connection (pool closed underneath us, or this thread already
+    holds a pooled connection) or, under the "ephemeral" policy, an
+    ephemeral one (signalled by returning ``False``).
+    """
+    policy = _DUCK_READ_POOL_OVERFLOW
+    nested = getattr(_DUCK_POOL_HELD, "n", 0) > 0
+    timeout = 0.0 if (nested or policy == "reject") else max(_DUCK_READ_POOL_TIMEOUT, 0.0)
+    t0 = time.perf_counter()
+    try:
+        tracked = pool.get(timeout)
+        outcome = "pooled"
+    except _queue.Empty:
+        tracked = None
+        if pool.closed or nested:
+            outcome = "shared"
+        elif policy == "ephemeral":
+            outcome = "ephemeral"
+        else:
+            outcome = "rejected" if policy == "reject" else "timeout"
+    try:
+        _metrics.histogram_observe("duck_read_pool_checkout_wait_ms", (time.perf_counter() - t0) * 1000.0, {"outcome": outcome})
+        if outcome != "pooled":
+            _metrics.counter_inc("duck_read_pool_overflow_total", {"outcome": outcome})
+    except Exception:
+        pass
+    if tracked is not None:
+        return tracked
+    if outcome == "shared":
+        return None
+    if outcome == "ephemeral":
+        return False
+    raise DuckPoolExhausted(
+        f"DuckDB read pool exhausted ({pool.size} connections busy"
+        + (f", waited {_DUCK_READ_POOL_TIMEOUT:g}s)" if outcome == "timeout" else ")")
+    )
 
 
 class _PooledCursorWrap:
@@ -381,12 +565,13 @@ class _PooledCursorWrap:
     DuckDB connections expose the same API surface as cursors (``execute``,
     ``executemany``, ``fetchall``, ``fetchone``, ``fetchmany``,
     ``description``, ``commit``, ``close``), so all existing callers work
-    unchanged.
+    unchanged. Calling ``close()`` on the wrapper itself (callers that do not
+    use ``with``) returns the connection to the pool, like ``__exit__``.
     """
 
-    __slots__ = ("_tracked", "_pool")
+    __slots__ = ("_tracked", "_pool", "_entered", "_released")
 
-    def __init__(self, tracked: "_TrackedConn", pool: _queue.SimpleQueue):
+    def __init__(self, tracked: "_TrackedConn", pool: _DuckReadPool):
         self._tracked = tracked
         # Replay any registered ATTACH statements this connection is missing,
         # tracked by the holder's own set (survives borrow cycles).
@@ -395,12 +580,21 @@ class _PooledCursorWrap:
         except Exception:
             pass
         self._pool = pool
+        self._entered = False
+        self._released = False
 
     # Proxy attribute access to the connection
     def __getattr__(self, name):
         return getattr(self._tracked.conn, name)
 
+    def close(self) -> None:
+        """Return the connection to the pool (it stays open)."""
+        self._release(None)
+
     def __enter__(self):
+        if not self._entered:
+            self._entered = True
+            _DUCK_POOL_HELD.n = getattr(_DUCK_POOL_HELD, "n", 0) + 1
         # Register with the calling thread's cancel token (set by the
         # /query async wrapper) so a client disconnect can interrupt this
         # connection's running SQL via DuckDB's ``interrupt()``.
@@ -412,6 +606,15 @@ class _PooledCursorWrap:
         return self._tracked.conn
 
     def __exit__(self, exc_type, exc, tb):
+        self._release(exc_type)
+        return False
+
+    def _release(self, exc_type) -> None:
+        if self._released:
+            return
+        self._released = True
+        if self._entered:
+            _DUCK_POOL_HELD.n = max(0, getattr(_DUCK_POOL_HELD, "n", 0) - 1)
         # Drop the cancel-token registration first so a late cancel cannot
         # interrupt a connection that has already been returned to the pool
         # and potentially handed to another request.
@@ -439,11 +642,14 @@ class _PooledCursorWrap:
                     tracked = _TrackedConn(c)
                 except Exception:
                     # Could not open a replacement — drop it. The pool shrinks
-                    # by one; open_duck_native falls back to the shared conn
-                    # when the pool is empty.
+                    # by one.
                     tracked = None
         if tracked is None:
-            return False
+            try:
+                self._pool.discard()
+            except Exception:
+                pass
+            return
         # Return connection to pool (don't close it)
         try:
             self._pool.put(tracked)
@@ -453,7 +659,6 @@ class _PooledCursorWrap:
                 tracked.conn.close()
             except Exception:
                 pass
-        return False
 
 
 def _compute_duck_config() -> dict:
@@ -579,9 +784,14 @@ def open_duck_native(db_path: str | None = None):
     1. **Read pool** — if the target matches the pooled path, borrow a dedicated
        connection from the pool.  This is the fast-path for concurrent queries;
        each pool connection is independent so DuckDB can execute reads in parallel.
-    2. **Shared connection** — fallback when the pool is empty or not yet
-       initialised (e.g. during startup).  Cursors from the shared connection
-       execute *serially* under DuckDB's single-writer model.
+       When all are busy the checkout waits (FIFO, ``DUCKDB_READ_POOL_TIMEOUT``)
+       and then follows ``DUCKDB_READ_POOL_OVERFLOW``: raise
+       :class:`DuckPoolExhausted` ("wait", "reject") or open an ephemeral
+       connection ("ephemeral").
+    2. **Shared connection** — when the pool is not initialised (e.g. during
+       startup) or the calling thread already holds a pooled connection.
+       Cursors from the shared connection execute *serially* under DuckDB's
+       single-writer model.
     3. **Ephemeral connection** — when db_path differs from the shared/pool
        path, open a temporary connection that is closed on context exit.
     """
@@ -595,15 +805,16 @@ def open_duck_native(db_path: str | None = None):
     is_default_path = (_DUCK_SHARED_CONN is not None and _normalize_duck_path(_DUCK_SHARED_PATH or '') == target)
 
     # ── Strategy 1: read pool ────────────────────────────────────────
-    if is_default_path and _DUCK_READ_POOL is not None:
-        try:
-            tracked = _DUCK_READ_POOL.get_nowait()
-            return _PooledCursorWrap(tracked, _DUCK_READ_POOL)
-        except Exception:
-            pass  # pool exhausted — fall through
+    overflow = False
+    pool = _DUCK_READ_POOL
+    if is_default_path and pool is not None:
+        tracked = _checkout_duck_read(pool)
+        if tracked:
+            return _PooledCursorWrap(tracked, pool)
+        overflow = tracked is False
 
     # ── Strategy 2: shared connection (serial) ───────────────────────
-    if is_default_path:
+    if is_default_path and not overflow:
         con = _get_duck_shared(target)
         try:
             _replay_attaches_on_conn(con, _DUCK_SHARED_ATTACHED)
@@ -952,6 +1163,56 @@ def get_engine_from_dsn(dsn: str) -> Engine:
     return eng
 
 
+def get_engine_for_datasource(ds_id: str, version: str, resolve_dsn: Callable[[], Optional[str]]) -> Optional[Engine]:
+    """Engine for a datasource credential version; ``resolve_dsn`` is only called on a miss.
+
+    When a datasource is seen with a new credential version (connection edited or
+    key rotated) the engine built for the previous version is disposed.
+    """
+    with _ENGINE_CACHE_LOCK:
+        rec = _DS_ENGINE_INDEX.get(ds_id)
+        if rec is not None and rec[0] == version:
+            eng = _ENGINE_CACHE.get(rec[1])
+            if eng is not None:
+                return eng
+    dsn = resolve_dsn()
+    if not dsn:
+        return None
+    eng = get_engine_from_dsn(dsn)
+    key = _ENGINE_REVERSE.get(id(eng))
+    if key is None:
+        return eng
+    with _ENGINE_CACHE_LOCK:
+        rec = _DS_ENGINE_INDEX.get(ds_id)
+        _DS_ENGINE_INDEX[ds_id] = (version, key)
+        if rec is not None and rec[1] != key:
+            _dispose_if_unshared(rec[1])
+    return eng
+
+
+def _dispose_if_unshared(key: str) -> bool:
+    """Dispose the engine under *key* unless another datasource still maps to it.
+
+    Engines are cached per DSN, so datasources with the same connection string
+    share one pool. Caller holds ``_ENGINE_CACHE_LOCK``.
+    """
+    if any(rec[1] == key for rec in _DS_ENGINE_INDEX.values()):
+        return False
+    return dispose_engine_by_key(key)
+
+
+def forget_datasource_engine(ds_id: str, dispose: bool = True) -> bool:
+    """Drop the engine handle cached for *ds_id*; its pool is disposed by
+    default once no other datasource uses the same engine."""
+    with _ENGINE_CACHE_LOCK:
+        rec = _DS_ENGINE_INDEX.pop(str(ds_id), None)
+        if rec is None:
+            return False
+        if dispose:
+            _dispose_if_unshared(rec[1])
+    return True
+
+
 def test_engine_connection(engine: Engine) -> tuple[bool, Optional[str]]:
     try:
         with engine.connect() as conn:
@@ -1009,6 +1270,8 @@ def dispose_all_engines() -> int:
                 pass
         _ENGINE_CACHE.clear()
         _ENGINE_REVERSE.clear()
+        with _ENGINE_CACHE_LOCK:
+            _DS_ENGINE_INDEX.clear()
     except Exception:
         pass
     return count
@@ -1495,8 +1758,10 @@ def run_sequence_sync(source_engine: Engine, duck_engine: Engine, *,
                       select_columns: Optional[list[str]] = None,
                       should_abort: Optional[Callable[[], bool]] = None,
                       on_phase: Optional[Callable[[str], None]] = None,
-                      custom_query: Optional[str] = None) -> dict:
+                      custom_query: Optional[str] = None,
+                      materialize: Optional[list[dict]] = None) -> dict:
     """Incremental append+upsert by monotonic sequence. Naive row-by-row DML (MVP).
+    *materialize* custom columns are computed for each batch's new/changed rows.
     Returns {row_count, last_sequence_value}.
     """
     pk_columns = pk_columns or []
@@ -1591,6 +1856,9 @@ def run_sequence_sync(source_engine: Engine, duck_engine: Engine, *,
     reconnects = 0
 
     with _open_duck_write_conn(duck_engine) as duck:
+        if materialize and _table_exists(duck, dest_table):
+            # Backfill columns that are new or whose expression changed; rows past the watermark come below
+            _materialized.apply(duck, dest_table, materialize, since=(sequence_column, seq))
         src = _open_src_conn()
         logger.debug(f"[SYNC] Source connection opened")
         try:
@@ -1663,6 +1931,8 @@ def run_sequence_sync(source_engine: Engine, duck_engine: Engine, *,
                 inserted = _insert_rows(duck, dest_table, columns, sanitized_rows)
                 total_rows += inserted
                 copied += inserted
+                if materialize:
+                    _materialized.apply(duck, dest_table, materialize, since=(sequence_column, seq))
 
                 if on_progress:
                     try:
@@ -1705,8 +1975,10 @@ def run_snapshot_sync(source_engine: Engine, duck_engine: Engine, *,
                       select_columns: Optional[list[str]] = None,
                       should_abort: Optional[Callable[[], bool]] = None,
                       on_phase: Optional[Callable[[str], None]] = None,
-                      custom_query: Optional[str] = None) -> dict:
-    """Full rebuild into a staging table, then swap. Streams full result once via fetchmany to avoid O(N²) OFFSET re-scans."""
+                      custom_query: Optional[str] = None,
+                      materialize: Optional[list[dict]] = None) -> dict:
+    """Full rebuild into a staging table, then swap. Streams full result once via fetchmany to avoid O(N²) OFFSET re-scans.
+    *materialize* custom columns are computed on the staging table before the swap."""
     src_dialect = _dialect_name(source_engine)
     # Determine the FROM clause: custom query as derived table, or plain table reference
     if custom_query and custom_query.strip():
@@ -1814,6 +2086,8 @@ def run_snapshot_sync(source_engine: Engine, duck_engine: Engine, *,
                             return {"row_count": total_rows, "aborted": True}
                     except Exception:
                         pass
+            if materialize:
+                _materialized.apply(duck, stg, materialize)
             # Swap
             if _table_exists(duck, dest_table):
                 duck.exec_driver_sql(f"DROP TABLE {_quote_duck_ident(dest_table)}")
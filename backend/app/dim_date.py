@@ -0,0 +1,305 @@
+"""Managed date / workday dimension table in the local DuckDB.
+
+Period averages, working-day presets and week / month bucketing all need the
+same calendar facts: the ISO weekday, the week or month a day belongs to,
+whether it is a holiday, how many working days precede it. Computing them in
+SQL expressions per query repeats that work for every row scanned, and
+holiday checks become ever-growing ``NOT IN ('2024-01-01', ...)`` lists.
+
+This module keeps one row per calendar day in ``_bayan.dim_date`` so query
+builders can join instead (see :func:`join_sql`):
+
+======================  ====================================================
+``d``                   the day (DATE, primary key)
+``year`` .. ``day``     calendar parts, ``quarter``, ``day_of_year``
+``weekday``             ISO weekday, 1 = Monday .. 7 = Sunday
+``iso_year/iso_week``   ISO-8601 week numbering
+``week_start``          Monday of the week; ``month_start`` first of month
+``fiscal_year``         year in which the fiscal year *ends*
+``fiscal_quarter``      1..4, counted from ``FISCAL_YEAR_START_MONTH``
+``fiscal_period``       1..12, counted from ``FISCAL_YEAR_START_MONTH``
+``is_holiday``          from the ``HolidayRule`` table
+``is_workday_<mask>``   not a weekend under that convention and not a holiday
+``workday_ordinal_<mask>``  running count of working days up to ``d``
+======================  ====================================================
+
+``<mask>`` is each weekend convention of
+:data:`app.period_average.WEEKEND_MASKS` in lower case (``sat_sun``,
+``fri_sat``). Subtracting two workday ordinals counts the working days
+between two dates without scanning a range.
+
+The table covers ``DIM_DATE_YEARS_BACK`` (default 10) years before and
+``DIM_DATE_YEARS_AHEAD`` (default 2) years after the current year
+(:func:`covered_range`). Days outside it have no calendar row; callers fall
+back to their inline weekday / holiday computation for those days (see
+``calendar_range`` in :func:`app.period_average.compile_period_average`).
+
+Holidays come from the rules of one holiday region. The default region
+lives in ``_bayan.dim_date``; any other region a datasource names (option
+``holidayRegion``) gets its own ``_bayan.dim_date_<region>`` table
+(:func:`table_name`).
+
+A fingerprint of the holiday rules, the range and the fiscal start is stored
+in the table's ``_meta`` companion; :func:`ensure_dim_date` rebuilds the
+table when the fingerprint changes. Building never happens on the request
+path: :func:`table_for_query` only answers from the last background check
+and schedules one (:func:`refresh_in_background`) when that answer is
+missing or older than ``HOLIDAY_CACHE_TTL`` seconds. Until a check has
+succeeded, callers get None and use inline calendar SQL. The app warms the
+default table at startup. ``routers/holidays.py`` calls
+:func:`invalidate_dim_date` after each edit, which drops the answers and
+rebuilds the known tables in the background; other workers notice the
+change within ``HOLIDAY_CACHE_TTL`` seconds.
+
+Set ``DIM_DATE_ENABLED=0`` to keep query builders on inline calendar SQL.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date, datetime
+from typing import Optional, Sequence
+
+from .date_presets import materialize_holidays
+from .holiday_calendar import DEFAULT_REGION, HOLIDAY_CACHE_TTL
+from .period_average import WEEKEND_MASKS
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = "_bayan"
+TABLE = f"{SCHEMA}.dim_date"
+META_TABLE = f"{SCHEMA}.dim_date_meta"
+
+try:
+    YEARS_BACK = int(os.environ.get("DIM_DATE_YEARS_BACK", "10") or "10")
+except Exception:
+    YEARS_BACK = 10
+try:
+    YEARS_AHEAD = int(os.environ.get("DIM_DATE_YEARS_AHEAD", "2") or "2")
+except Exception:
+    YEARS_AHEAD = 2
+try:
+    FISCAL_YEAR_START_MONTH = min(max(int(os.environ.get("FISCAL_YEAR_START_MONTH", "1") or "1"), 1), 12)
+except Exception:
+    FISCAL_YEAR_START_MONTH = 1
+
+# (duck path, region) -> (checked_at monotonic, table name or None when unavailable)
+_BUILT: dict[tuple[str, str], tuple[float, Optional[str]]] = {}
+# (duck path, region) keys with a background check in flight
+_PENDING: set[tuple[str, str]] = set()
+# Bumped by invalidate_dim_date; a check started before the bump is redone.
+_GENERATION = 0
+_LOCK = threading.Lock()
+
+
+def enabled() -> bool:
+    return str(os.environ.get("DIM_DATE_ENABLED", "1")).strip().lower() not in ("0", "false", "no", "off")
+
+
+def year_range(today: Optional[date] = None) -> tuple[int, int]:
+    y = (today or datetime.now().date()).year
+    return y - max(YEARS_BACK, 0), y + max(YEARS_AHEAD, 0)
+
+
+def covered_range(today: Optional[date] = None) -> tuple[date, date]:
+    """First and last day of the table built for *today*."""
+    y0, y1 = year_range(today)
+    return date(y0, 1, 1), date(y1, 12, 31)
+
+
+def _region(region: Optional[str]) -> str:
+    return str(region or "").strip() or DEFAULT_REGION
+
+
+def table_name(region: Optional[str] = None) -> str:
+    """Calendar table for holiday *region* (``_bayan.dim_date`` for the default)."""
+    r = _region(region)
+    if r == DEFAULT_REGION:
+        return TABLE
+    return f"{TABLE}_" + (re.sub(r"[^a-z0-9_]", "_", r.lower()) or "x")
+
+
+def _meta_name(region: Optional[str] = None) -> str:
+    return META_TABLE if _region(region) == DEFAULT_REGION else f"{table_name(region)}_meta"
+
+
+def _rule_dicts(region: Optional[str] = None) -> list[dict]:
+    from .holiday_calendar import _load_rule_dicts
+    return _load_rule_dicts(_region(region))
+
+
+def fingerprint(rules: Sequence[dict], years: tuple[int, int], fiscal_start: int = FISCAL_YEAR_START_MONTH) -> str:
+    """Stable hash of everything the table content depends on."""
+    payload = json.dumps(
+        {
+            "rules": sorted(json.dumps(r, sort_keys=True, default=str) for r in rules),
+            "years": list(years),
+            "fiscal": fiscal_start,
+            "masks": {k: sorted(v) for k, v in WEEKEND_MASKS.items()},
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _ensure_meta(con, meta: str = META_TABLE) -> None:
+    con.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {meta} ("
+        "fingerprint VARCHAR, first_day DATE, last_day DATE, n_holidays BIGINT, "
+        "built_at TIMESTAMP DEFAULT current_timestamp)"
+    )
+
+
+def stored_fingerprint(con, region: Optional[str] = None) -> Optional[str]:
+    try:
+        row = con.execute(f"SELECT fingerprint FROM {_meta_name(region)} LIMIT 1").fetchone()
+    except Exception:
+        return None
+    return str(row[0]) if row else None
+
+
+def build_dim_date(
+    con,
+    rules: Optional[Sequence[dict]] = None,
+    *,
+    years: Optional[tuple[int, int]] = None,
+    fiscal_start: int = FISCAL_YEAR_START_MONTH,
+    region: Optional[str] = None,
+) -> str:
+    """(Re)create the calendar table of *region* on *con*; returns the new fingerprint."""
+    rules = list(_rule_dicts(region) if rules is None else rules)
+    table, meta = table_name(region), _meta_name(region)
+    y0, y1 = years or year_range()
+    holidays: set[str] = set()
+    for y in range(y0, y1 + 1):
+        holidays.update(materialize_holidays(rules, y))
+    fs = min(max(int(fiscal_start), 1), 12)
+    # Months since the fiscal year started: 0..11.
+    fm = f"((month(d) - {fs} + 12) % 12)"
+    mask_cols = []
+    for code, days in sorted(WEEKEND_MASKS.items()):
+        sfx = code.lower()
+        mask = ", ".join(str(x) for x in sorted(days))
+        wd = f"(isodow(d) NOT IN ({mask}) AND NOT is_holiday)"
+        mask_cols.append(f"{wd} AS is_workday_{sfx}")
+        mask_cols.append(f"SUM(CASE WHEN {wd} THEN 1 ELSE 0 END) OVER (ORDER BY d) AS workday_ordinal_{sfx}")
+
+    _ensure_meta(con, meta)
+    con.execute("CREATE OR REPLACE TEMP TABLE _dim_date_holidays (d DATE)")
+    if holidays:
+        con.executemany("INSERT INTO _dim_date_holidays VALUES (?)", [[h] for h in sorted(holidays)])
+    con.execute(
+        f"CREATE OR REPLACE TABLE {table} AS "
+        f"WITH days AS ("
+        f"SELECT CAST(g.d AS DATE) AS d, h.d IS NOT NULL AS is_holiday "
+        f"FROM generate_series(DATE '{y0:04d}-01-01', DATE '{y1:04d}-12-31', INTERVAL 1 DAY) AS g(d) "
+        f"LEFT JOIN (SELECT DISTINCT d FROM _dim_date_holidays) h ON h.d = CAST(g.d AS DATE)) "
+        f"SELECT d, year(d) AS year, quarter(d) AS quarter, month(d) AS month, day(d) AS day, "
+        f"dayofyear(d) AS day_of_year, isodow(d) AS weekday, isoyear(d) AS iso_year, week(d) AS iso_week, "
+        f"CAST(date_trunc('week', d) AS DATE) AS week_start, CAST(date_trunc('month', d) AS DATE) AS month_start, "
+        f"year(d) + CASE WHEN {fs} > 1 AND month(d) >= {fs} THEN 1 ELSE 0 END AS fiscal_year, "
+        f"{fm} // 3 + 1 AS fiscal_quarter, {fm} + 1 AS fiscal_period, "
+        f"is_holiday, {', '.join(mask_cols)} "
+        f"FROM days ORDER BY d"
+    )
+    con.execute("DROP TABLE IF EXISTS _dim_date_holidays")
+    fp = fingerprint(rules, (y0, y1), fs)
+    con.execute(f"DELETE FROM {meta}")
+    con.execute(
+        f"INSERT INTO {meta} (fingerprint, first_day, last_day, n_holidays) VALUES (?, ?, ?, ?)",
+        [fp, date(y0, 1, 1), date(y1, 12, 31), len(holidays)],
+    )
+    logger.debug("[dim_date] built %s %s..%s holidays=%d", table, y0, y1, len(holidays))
+    return fp
+
+
+def ensure_dim_date(con, rules: Optional[Sequence[dict]] = None, *, force: bool = False, region: Optional[str] = None) -> bool:
+    """Rebuild the calendar table of *region* on *con* when missing or stale. Returns True when rebuilt."""
+    rules = list(_rule_dicts(region) if rules is None else rules)
+    want = fingerprint(rules, year_range())
+    if not force and stored_fingerprint(con, region) == want:
+        return False
+    build_dim_date(con, rules, region=region)
+    return True
+
+
+def _store_key(duck_path: Optional[str]) -> str:
+    from .db import _normalize_duck_path, get_active_duck_path
+    try:
+        return _normalize_duck_path(duck_path) if duck_path else get_active_duck_path()
+    except Exception:
+        return duck_path or ""
+
+
+def _refresh(key: tuple[str, str], generation: int) -> None:
+    from .db import open_duck_native
+    table: Optional[str] = None
+    try:
+        with open_duck_native(key[0] or None) as con:
+            ensure_dim_date(con, region=key[1])
+        table = table_name(key[1])
+    except Exception as e:
+        logger.debug(f"[dim_date] unavailable: {e}")
+    finally:
+        with _LOCK:
+            _PENDING.discard(key)
+            current = generation == _GENERATION
+            if current:
+                _BUILT[key] = (time.monotonic(), table)
+    if not current:
+        refresh_in_background(key[0] or None, key[1])
+
+
+def refresh_in_background(duck_path: Optional[str] = None, region: Optional[str] = None) -> None:
+    """Check (and if needed rebuild) the calendar table of *region* on a daemon thread."""
+    if not enabled():
+        return
+    key = (_store_key(duck_path), _region(region))
+    with _LOCK:
+        if key in _PENDING:
+            return
+        _PENDING.add(key)
+        generation = _GENERATION
+    threading.Thread(target=_refresh, args=(key, generation), daemon=True, name="dim-date-refresh").start()
+
+
+def table_for_query(duck_path: Optional[str] = None, region: Optional[str] = None) -> Optional[str]:
+    """The calendar table of *region* if the last background check found it current.
+
+    Never builds on the calling thread: when there is no answer yet, or it is
+    older than ``HOLIDAY_CACHE_TTL`` seconds, a check is scheduled
+    (:func:`refresh_in_background`). Returns None when disabled, before the
+    first check completes, or when the table cannot be built, so callers
+    fall back to inline calendar SQL. Without *duck_path* the active DuckDB
+    store is used; answers are per resolved path, so switching the active
+    store checks the new file.
+    """
+    if not enabled():
+        return None
+    key = (_store_key(duck_path), _region(region))
+    rec = _BUILT.get(key)
+    if rec is None or (time.monotonic() - rec[0]) >= HOLIDAY_CACHE_TTL:
+        refresh_in_background(key[0] or None, key[1])
+    return rec[1] if rec else None
+
+
+def invalidate_dim_date() -> None:
+    """Drop the cached answers and re-check every known table in the background."""
+    global _GENERATION
+    with _LOCK:
+        _GENERATION += 1
+        keys = list(_BUILT)
+        _BUILT.clear()
+    for path, region in keys:
+        refresh_in_background(path or None, region)
+
+
+def join_sql(date_expr: str, alias: str = "_cal", table: str = TABLE) -> str:
+    """``LEFT JOIN`` fragment attaching the calendar row of *date_expr*."""
+    return f"LEFT JOIN {table} AS {alias} ON {alias}.d = CAST({date_expr} AS DATE)"
@@ -0,0 +1,169 @@
+"""Precomputed distinct-value dictionaries for filter dropdowns.
+
+Every filter dropdown calls ``/distinct``, which runs ``SELECT DISTINCT col``
+over the whole table. On wide fact tables that is the most frequent heavy
+query the API serves, and the answer only changes when the table is synced.
+
+This module keeps, per synced DuckDB table, one side table per low/medium
+cardinality column holding ``(v, n)`` — the value and its row count:
+
+* Side tables live in the ``_bayan`` schema (hidden from table listings) and
+  are indexed by ``_bayan.distinct_index``. They are rebuilt from scratch by
+  :func:`build_dictionaries` after every successful sync of the table; a
+  single ``GROUP BY`` per column is cheap next to the sync itself.
+* Columns whose approximate distinct count exceeds
+  ``DISTINCT_DICT_MAX_VALUES`` (default 10000) get no dictionary — a dropdown
+  with more values than that is served by the live query.
+* :func:`lookup` answers prefix / substring searches and top-N-by-frequency
+  from the side table. It returns ``None`` when no dictionary exists so the
+  caller falls back to the live query (also used whenever filters apply,
+  since counts are table-wide).
+
+Set ``DISTINCT_DICT_ENABLED=0`` to disable building new dictionaries.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = "_bayan"
+INDEX_TABLE = f"{SCHEMA}.distinct_index"
+
+try:
+    MAX_VALUES = int(os.environ.get("DISTINCT_DICT_MAX_VALUES", "10000") or "10000")
+except Exception:
+    MAX_VALUES = 10000
+
+# Types that never make useful dropdowns (or cannot be grouped cheaply).
+_SKIP_TYPES = ("blob", "bytea", "json", "struct", "map", "union", "bit", "[]")
+
+
+def enabled() -> bool:
+    return str(os.environ.get("DISTINCT_DICT_ENABLED", "1")).strip().lower() not in ("0", "false", "no", "off")
+
+
+def _q(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _norm(name: str) -> str:
+    n = str(name or "").replace('"', "").replace("`", "").replace("[", "").replace("]", "").strip().lower()
+    return n[5:] if n.startswith("main.") else n
+
+
+def dict_table_name(table: str, column: str) -> str:
+    """Side-table name for ``table.column`` (hashed: names may be long or odd)."""
+    h = hashlib.sha1(f"{_norm(table)}\x00{_norm(column)}".encode("utf-8")).hexdigest()[:16]
+    return f"{SCHEMA}.dd_{h}"
+
+
+def _ensure_index(con) -> None:
+    con.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ("
+        "table_name VARCHAR, column_name VARCHAR, dict_table VARCHAR, "
+        "n_values BIGINT, built_at TIMESTAMP DEFAULT current_timestamp)"
+    )
+
+
+def drop_dictionaries(con, table: str) -> None:
+    """Remove every dictionary registered for *table*."""
+    try:
+        rows = con.execute(
+            f"SELECT dict_table FROM {INDEX_TABLE} WHERE table_name = ?", [_norm(table)]
+        ).fetchall()
+    except Exception:
+        return
+    for (dt,) in rows:
+        try:
+            con.execute(f"DROP TABLE IF EXISTS {dt}")
+        except Exception:
+            pass
+    con.execute(f"DELETE FROM {INDEX_TABLE} WHERE table_name = ?", [_norm(table)])
+
+
+def build_dictionaries(con, table: str, max_values: Optional[int] = None) -> dict[str, int]:
+    """(Re)build dictionaries for every eligible column of *table*.
+
+    Returns ``{column: n_values}`` for the columns that got a dictionary.
+    """
+    limit = int(max_values if max_values is not None else MAX_VALUES)
+    qt = _q(table)
+    cols = [
+        (str(r[0]), str(r[1]).lower())
+        for r in con.execute(f"DESCRIBE {qt}").fetchall()
+    ]
+    cols = [(c, t) for c, t in cols if not any(s in t for s in _SKIP_TYPES)]
+    _ensure_index(con)
+    drop_dictionaries(con, table)
+    if not cols or limit <= 0:
+        return {}
+    # One scan for all cardinality estimates.
+    est = con.execute(
+        "SELECT " + ", ".join(f"approx_count_distinct({_q(c)})" for c, _ in cols) + f" FROM {qt}"
+    ).fetchone() or ()
+    built: dict[str, int] = {}
+    for (col, _t), approx in zip(cols, est):
+        # approx_count_distinct is a HyperLogLog estimate; leave headroom.
+        if approx is None or int(approx) > limit * 1.1:
+            continue
+        dt = dict_table_name(table, col)
+        con.execute(
+            f"CREATE OR REPLACE TABLE {dt} AS "
+            f"SELECT {_q(col)} AS v, COUNT(*) AS n FROM {qt} WHERE {_q(col)} IS NOT NULL GROUP BY 1"
+        )
+        n = int(con.execute(f"SELECT COUNT(*) FROM {dt}").fetchone()[0])
+        if n > limit:
+            con.execute(f"DROP TABLE IF EXISTS {dt}")
+            continue
+        con.execute(
+            f"INSERT INTO {INDEX_TABLE} (table_name, column_name, dict_table, n_values) VALUES (?, ?, ?, ?)",
+            [_norm(table), _norm(col), dt, n],
+        )
+        built[col] = n
+    return built
+
+
+def lookup(
+    con,
+    table: str,
+    column: str,
+    *,
+    search: Optional[str] = None,
+    prefix: bool = False,
+    limit: Optional[int] = None,
+    by_frequency: bool = False,
+) -> Optional[list[Any]]:
+    """Serve distinct values of ``table.column`` from its dictionary.
+
+    ``search`` matches case-insensitively as a substring (or as a prefix when
+    *prefix* is set). Values are ordered ascending, or by descending row count
+    when *by_frequency*. Returns ``None`` when no dictionary exists.
+    """
+    try:
+        row = con.execute(
+            f"SELECT dict_table FROM {INDEX_TABLE} WHERE table_name = ? AND column_name = ? LIMIT 1",
+            [_norm(table), _norm(column)],
+        ).fetchone()
+    except Exception:
+        return None
+    if not row:
+        return None
+    sql = f"SELECT v FROM {row[0]}"
+    params: list[Any] = []
+    if search:
+        pat = str(search).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        sql += " WHERE CAST(v AS VARCHAR) ILIKE ? ESCAPE '\\'"
+        params.append(f"{pat}%" if prefix else f"%{pat}%")
+    sql += " ORDER BY n DESC, v" if by_frequency else " ORDER BY v"
+    if limit is not None and int(limit) > 0:
+        sql += f" LIMIT {int(limit)}"
+    try:
+        return [r[0] for r in con.execute(sql, params).fetchall()]
+    except Exception as e:
+        logger.debug(f"[distinct-dict] lookup failed for {table}.{column}: {e}")
+        return None
@@ -0,0 +1,139 @@
+"""Server-side time-series downsampling for ``/query/spec`` (``maxPoints``).
+
+Line charts over minute- or second-level data can return hundreds of
+thousands of ``(x, [legend,] value)`` rows; the browser cannot draw more
+points than it has pixels anyway. With ``spec.maxPoints`` set, each series is
+reduced to at most that many points:
+
+* ``minmax`` (default) — split the series into ``(maxPoints - 2) / 2`` buckets of
+  consecutive points and keep the lowest and highest point of each, plus the
+  first and last point. Spikes and dips survive, which is what matters
+  visually. The SQLGlot path compiles this into the query itself
+  (``SQLGlotBuilder.wrap_downsample_minmax``) so only the kept rows leave
+  the database.
+* ``lttb`` — Largest-Triangle-Three-Buckets: per bucket keep the point that
+  forms the largest triangle with the previously kept point and the average
+  of the next bucket. This better preserves the shape of the line. It is
+  sequential by nature, so it always runs here on the fetched rows.
+
+:func:`downsample_rows` is also the fallback for paths that do not go
+through SQLGlot. It is a single O(n) pass per series in plain Python (numpy
+is not a dependency of this service). Rows whose value is NULL are dropped
+when a series is downsampled.
+"""
+from __future__ import annotations
+
+import datetime as _dt
+from typing import Any, Optional, Sequence
+
+METHODS = ("minmax", "lttb")
+
+
+def _num(v: Any) -> Optional[float]:
+    if v is None or isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        return float(v)
+    if isinstance(v, _dt.datetime):
+        return v.timestamp() if v.tzinfo else v.replace(tzinfo=_dt.timezone.utc).timestamp()
+    if isinstance(v, _dt.date):
+        return float(v.toordinal()) * 86400.0
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return _num(_dt.datetime.fromisoformat(str(v).replace("Z", "+00:00")))
+    except ValueError:
+        return None
+
+
+def minmax_indices(ys: Sequence[float], max_points: int) -> list[int]:
+    """Indices of the min and max point per bucket, plus first and last."""
+    n = len(ys)
+    if n <= max_points:
+        return list(range(n))
+    buckets = max(1, (max_points - 2) // 2)
+    keep = {0, n - 1}
+    for b in range(buckets):
+        lo, hi = (b * n) // buckets, ((b + 1) * n) // buckets
+        if lo >= hi:
+            continue
+        seg = range(lo, hi)
+        keep.add(min(seg, key=ys.__getitem__))
+        keep.add(max(seg, key=ys.__getitem__))
+    return sorted(keep)
+
+
+def lttb_indices(xs: Sequence[float], ys: Sequence[float], max_points: int) -> list[int]:
+    """Largest-Triangle-Three-Buckets selection (first and last always kept)."""
+    n = len(ys)
+    if n <= max_points or max_points < 3:
+        return list(range(n)) if n <= max_points else [0, n - 1]
+    every = (n - 2) / (max_points - 2)
+    out = [0]
+    a = 0
+    for i in range(max_points - 2):
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        nlo, nhi = hi, min(int((i + 2) * every) + 1, n)
+        if nhi <= nlo:
+            nlo, nhi = n - 1, n
+        cnt = nhi - nlo
+        ax, ay = xs[a], ys[a]
+        bx = sum(xs[nlo:nhi]) / cnt
+        by = sum(ys[nlo:nhi]) / cnt
+        best, best_area = lo, -1.0
+        for j in range(lo, min(hi, n - 1)):
+            area = abs((ax - bx) * (ys[j] - ay) - (ax - xs[j]) * (by - ay))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(best)
+        a = best
+    out.append(n - 1)
+    return out
+
+
+def downsample_rows(
+    columns: Sequence[str],
+    rows: list[list[Any]],
+    max_points: int,
+    method: Optional[str] = None,
+    x: str = "x",
+    value: str = "value",
+    series: str = "legend",
+) -> list[list[Any]]:
+    """Reduce each series in ``rows`` to at most ``max_points`` rows.
+
+    Rows are grouped by the ``series`` column when present and must already
+    be ordered by ``x`` within a series; kept rows stay in input order. Rows pass
+    through unchanged when there is no ``x``/``value`` column or no series
+    exceeds the budget.
+    """
+    cols = list(columns)
+    if not max_points or max_points <= 0 or x not in cols or value not in cols:
+        return rows
+    xi, vi = cols.index(x), cols.index(value)
+    si = cols.index(series) if series in cols else None
+    groups: dict[Any, list[int]] = {}
+    for i, r in enumerate(rows):
+        groups.setdefault(r[si] if si is not None else None, []).append(i)
+    if all(len(g) <= max_points for g in groups.values()):
+        return rows
+    use_lttb = (method or "minmax").lower() == "lttb"
+    kept: list[int] = []
+    for g in groups.values():
+        if len(g) <= max_points:
+            kept.extend(g)
+            continue
+        g = [i for i in g if _num(rows[i][vi]) is not None]
+        ys = [_num(rows[i][vi]) for i in g]
+        if use_lttb:
+            xs = [_num(rows[i][xi]) for i in g]
+            if any(v is None for v in xs):
+                xs = [float(k) for k in range(len(g))]
+            keep = lttb_indices(xs, ys, max_points)
+        else:
+            keep = minmax_indices(ys, max_points)
+        kept.extend(g[k] for k in keep)
+    return [rows[i] for i in sorted(kept)]
@@ -0,0 +1,260 @@
+"""Compiled WHERE fragments for dashboard filters, shared across widgets.
+
+A dashboard's global filters (date range, region, product, a customer list
+with thousands of ids) arrive unchanged with every widget request, and each
+request used to resolve the date presets and rebuild the same predicates
+from scratch. This module turns a filter dict into dialect-specific
+predicate fragments once and reuses them:
+
+* :func:`compile_where` compiles ``{key: value}`` into ``(clauses, params)``
+  with ``:name`` bind parameters, one clause per key, in key order. Each
+  clause is cached in a bounded LRU keyed by dialect, the left-hand SQL the
+  caller resolved for the column, the key and the value, so every widget
+  that filters the same column of the same source gets the compiled
+  fragment (and its bind dict) from the cache. Parameter names follow the
+  ``w_<key><suffix>`` scheme the routers used, so clause text is unchanged.
+  run_pivot and every ``/query/spec`` branch compile their filters here;
+  the spec path's case-insensitive string matching is the ``fold_case``
+  option (``LOWER(col)`` against lower-cased values).
+* A list filter with more than ``FILTER_VALUES_JOIN_THRESHOLD`` values
+  (default 200) compiles to a semi-join against a ``VALUES`` relation,
+  ``col IN (SELECT v FROM (VALUES (:p0), (:p1), ...) AS _fv(v))``, instead
+  of an IN list with thousands of entries: engines plan it as a hash join
+  rather than a long OR chain / per-row list probe. SQLite gets
+  ``col IN (VALUES ...)``; MySQL keeps the IN list (its VALUES syntax needs
+  ``ROW()`` and 8.0.19+, and it already binary-searches constant IN lists).
+  The VALUES column is typed from the bound values, not from the filtered
+  column (``'2024-01-01'`` is VARCHAR), so ``v`` is cast to the column's
+  declared type from the caller's ``types`` lookup; columns of unknown type
+  keep the bound IN list. Lists longer than ``FILTER_TEMP_TABLE_THRESHOLD``
+  are staged as a relation instead (:mod:`app.value_sets`).
+* :func:`resolve_presets` caches date-preset resolution per calendar day, so
+  ``"last_7_days"`` is resolved once per day and filter state rather than
+  once per widget.
+
+Set ``FILTER_FRAGMENT_CACHE_SIZE=0`` to compile every request afresh.
+"""
+from __future__ import annotations
+
+import os
+import re
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import value_sets
+from .compile_cache import canonical_key, get_cache
+
+try:
+    FILTER_FRAGMENT_CACHE_SIZE = int(os.environ.get("FILTER_FRAGMENT_CACHE_SIZE", "4096") or "4096")
+except Exception:
+    FILTER_FRAGMENT_CACHE_SIZE = 4096
+try:
+    VALUES_JOIN_THRESHOLD = int(os.environ.get("FILTER_VALUES_JOIN_THRESHOLD", "200") or "200")
+except Exception:
+    VALUES_JOIN_THRESHOLD = 200
+
+RANGE_KEYS = ("start", "startDate", "end", "endDate")
+_CMP_OPS = {"gte": ">=", "gt": ">", "lte": "<=", "lt": "<"}
+_LIKE_PATTERNS = {"contains": "%{}%", "startswith": "{}%", "endswith": "%{}"}
+
+_FRAGMENTS = get_cache("filter_fragments", FILTER_FRAGMENT_CACHE_SIZE)
+_PRESETS = get_cache("filter_presets", FILTER_FRAGMENT_CACHE_SIZE)
+
+Fragment = Tuple[str, Dict[str, Any]]
+
+
+def param_name(base: str, suffix: str = "") -> str:
+    """Bind parameter name for filter *base* (``w_<base><suffix>``)."""
+    return "w_" + re.sub(r"[^A-Za-z0-9_]", "_", str(base or "")) + suffix
+
+
+def _dialect(dialect: Optional[str]) -> str:
+    d = (dialect or "").lower()
+    for name in ("duckdb", "postgres", "mysql", "mariadb", "mssql", "sqlite"):
+        if name in d:
+            return "mysql" if name == "mariadb" else name
+    return d
+
+
+def in_predicate(dialect: Optional[str], lhs: str, pnames: List[str], negate: bool = False, cast: Optional[str] = None) -> str:
+    """``lhs [NOT] IN (...)`` over bind names, as a VALUES semi-join for long lists.
+
+    The semi-join needs *cast*, the SQL type of *lhs* (:func:`app.value_sets.cast_type`);
+    without it the list stays bound.
+    """
+    kw = "NOT IN" if negate else "IN"
+    d = _dialect(dialect)
+    if len(pnames) <= VALUES_JOIN_THRESHOLD or d == "mysql" or not cast:
+        return f"{lhs} {kw} ({', '.join(':' + p for p in pnames)})"
+    rows = ", ".join(f"(:{p})" for p in pnames)
+    if d == "sqlite":
+        return f"{lhs} {kw} (SELECT CAST(column1 AS {cast}) FROM (VALUES {rows}))"
+    return f"{lhs} {kw} (SELECT CAST(v AS {cast}) FROM (VALUES {rows}) AS _fv(v))"
+
+
+def _in_fragment(dialect: str, lhs: str, base: str, suffix: str, values: Any, negate: bool = False,
+                 col_type: Optional[str] = None) -> Fragment:
+    cast = value_sets.cast_type(dialect, col_type)
+    if value_sets.should_stage(values):
+        p = param_name(base, f"{suffix}_set")
+        return value_sets.semi_join_sql(dialect, lhs, p, negate=negate, cast=cast), {p: list(values)}
+    params = {param_name(base, f"{suffix}_{i}"): item for i, item in enumerate(values)}
+    return in_predicate(dialect, lhs, list(params), negate=negate, cast=cast), params
+
+
+def _needs_type(value: Any) -> bool:
+    """True when *value* compiles to a semi-join whose values must be cast."""
+    return isinstance(value, (list, tuple)) and (len(value) > VALUES_JOIN_THRESHOLD or value_sets.should_stage(value))
+
+
+def _lower(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return [v.lower() if isinstance(v, str) else v for v in value]
+    return value.lower() if isinstance(value, str) else value
+
+
+def _like_fragment(lhs: str, base: str, op: str, value: Any) -> Optional[Fragment]:
+    """``LIKE`` / ``NOT LIKE`` for one pattern, or each of a list (OR; AND for notcontains)."""
+    cmp, patt = ("NOT LIKE", "%{}%") if op == "notcontains" else ("LIKE", _LIKE_PATTERNS[op])
+    if not isinstance(value, (list, tuple)):
+        p = param_name(base, f"_{op}")
+        return f"{lhs} {cmp} :{p}", {p: patt.format(value)}
+    if len(value) == 0:
+        return None
+    params = {param_name(base, f"_{op}_{i}"): patt.format(v) for i, v in enumerate(value)}
+    joiner = " AND " if op == "notcontains" else " OR "
+    return "(" + joiner.join(f"{lhs} {cmp} :{p}" for p in params) + ")", params
+
+
+def _compile(dialect: str, key: str, value: Any, lhs: Callable[[str], str], null_lhs: Callable[[str], str],
+             col_type: Optional[str] = None, fold: bool = False) -> Optional[Fragment]:
+    if value is None:
+        return f"{null_lhs(key)} IS NULL", {}
+    # Case-folded keys compare LOWER(column) with lower-cased values (ranges excepted).
+    eq_lhs = (lambda n: f"LOWER({lhs(n)})") if fold else lhs
+    if "__" in key:
+        base, op = key.split("__", 1)
+        if op in _CMP_OPS:
+            # Comparison operators take a scalar; a list contributes its first element.
+            v = value[0] if isinstance(value, (list, tuple)) and len(value) > 0 else value
+            p = param_name(base, f"_{op}")
+            return f"{lhs(base)} {_CMP_OPS[op]} :{p}", {p: v}
+        if fold:
+            value = _lower(value)
+        if op == "ne":
+            if isinstance(value, (list, tuple)) and len(value) > 0:
+                return _in_fragment(dialect, eq_lhs(base), base, "_ne", value, negate=True, col_type=col_type)
+            p = param_name(base, "_ne")
+            return f"{eq_lhs(base)} != :{p}", {p: value}
+        if op == "notcontains" or op in _LIKE_PATTERNS:
+            return _like_fragment(eq_lhs(base), base, op, value)
+        p = param_name(key)
+        return f"{eq_lhs(key)} = :{p}", {p: value}
+    if fold:
+        value = _lower(value)
+    if isinstance(value, (list, tuple)):
+        if len(value) == 0:
+            return None
+        return _in_fragment(dialect, eq_lhs(key), key, "", value, col_type=col_type)
+    p = param_name(key)
+    return f"{eq_lhs(key)} = :{p}", {p: value}
+
+
+def compile_filter(
+    dialect: str,
+    key: str,
+    value: Any,
+    lhs: Callable[[str], str],
+    null_lhs: Optional[Callable[[str], str]] = None,
+    col_type: Optional[str] = None,
+    fold: bool = False,
+) -> Optional[Fragment]:
+    """Cached ``(clause, params)`` for one filter entry, or None when it adds no predicate.
+
+    *col_type* is the declared type of the filtered column, if known. With
+    *fold* equality, IN and LIKE filters match case-insensitively.
+    """
+    null_lhs = null_lhs or lhs
+    if FILTER_FRAGMENT_CACHE_SIZE <= 0 or value_sets.should_stage(value):
+        # Staged lists compile to one bind; hashing the values would cost more than that.
+        return _compile(dialect, key, value, lhs, null_lhs, col_type, fold)
+    base = key.split("__", 1)[0] if "__" in key else key
+    try:
+        ck = canonical_key(_dialect(dialect), lhs(base), null_lhs(key) if value is None else None, key, value, col_type, fold)
+    except Exception:
+        return _compile(dialect, key, value, lhs, null_lhs, col_type, fold)
+    hit = _FRAGMENTS.get(ck, None)
+    if hit is None:
+        frag = _compile(dialect, key, value, lhs, null_lhs, col_type, fold)
+        _FRAGMENTS.put(ck, frag if frag is not None else False)
+        hit = frag if frag is not None else False
+    if hit is False:
+        return None
+    return hit[0], dict(hit[1])
+
+
+def compile_where(
+    where: Optional[Dict[str, Any]],
+    dialect: str,
+    lhs: Callable[[str], str],
+    null_lhs: Optional[Callable[[str], str]] = None,
+    types: Optional[Callable[[str], Optional[str]]] = None,
+    fold_case: Optional[Callable[[str], bool]] = None,
+) -> Tuple[List[str], Dict[str, Any]]:
+    """WHERE clauses and binds for a filter dict.
+
+    Date-range keys (``start`` / ``end``) and internal ``__``-prefixed keys
+    are skipped; the caller applies those against its date field.
+    ``types(column)`` returns the declared type of a filtered column (or
+    None); it is only called for lists long enough to become a semi-join.
+    ``fold_case(column)`` is true for columns matched case-insensitively.
+    """
+    clauses: List[str] = []
+    params: Dict[str, Any] = {}
+    for k, v in (where or {}).items():
+        if k in RANGE_KEYS or (isinstance(k, str) and k.startswith("__")):
+            continue
+        base = str(k).split("__", 1)[0]
+        fold = bool(fold_case is not None and fold_case(base))
+        col_type = None
+        if fold and _needs_type(v):
+            col_type = "varchar"  # LOWER(column) is text whatever the column's type
+        elif types is not None and _needs_type(v):
+            try:
+                col_type = types(base)
+            except Exception:
+                col_type = None
+        frag = compile_filter(dialect, str(k), v, lhs, null_lhs, col_type, fold)
+        if frag is not None:
+            clauses.append(frag[0])
+            params.update(frag[1])
+    return clauses, params
+
+
+def resolve_presets(
+    where: Optional[Dict[str, Any]],
+    resolver: Callable[[Optional[Dict[str, Any]]], Any],
+    key_extra: Optional[Callable[[], Any]] = None,
+) -> Any:
+    """``resolver(where)`` cached per calendar day and filter state.
+
+    ``key_extra()`` adds other inputs of the resolver to the key (the
+    holiday calendar).
+    """
+    if not where or FILTER_FRAGMENT_CACHE_SIZE <= 0:
+        return resolver(where)
+    try:
+        ck = canonical_key(date.today().isoformat(), where, key_extra() if key_extra else None)
+    except Exception:
+        return resolver(where)
+    hit = _PRESETS.get(ck, None)
+    if hit is None:
+        hit = _copy(resolver(where))
+        _PRESETS.put(ck, hit)
+    return _copy(hit)
+
+
+def _copy(where: Any) -> Any:
+    if isinstance(where, dict):
+        return {k: (list(v) if isinstance(v, list) else dict(v) if isinstance(v, dict) else v) for k, v in where.items()}
+    return where
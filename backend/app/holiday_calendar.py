@@ -0,0 +1,196 @@
+"""Process-wide holiday calendar cache.
+
+Date preset resolution ("last working day", "this week to last working
+day", avg_wday holiday exclusion, ...) used to open a SQLAlchemy session and
+re-materialize every ``HolidayRule`` row on each call — several times per
+``/query/spec`` request and once per widget on a dashboard. Alert and report
+evaluation go through the same resolver, so a scheduled run with dozens of
+widgets paid that cost dozens of times.
+
+This module keeps one materialized :class:`HolidayCalendar` per region in
+memory. A calendar covers the previous, current and next year (the window
+cross-year presets need) and stores the holidays as a sorted array of date
+ordinals, so membership is O(1) and range counts / workday arithmetic are
+O(log n) via ``bisect``.
+
+Invalidation:
+
+* ``routers/holidays.py`` calls :func:`invalidate_holiday_calendar` after
+  every create / update / delete / upload.
+* Entries also expire after ``HOLIDAY_CACHE_TTL`` seconds (default 300) so
+  other gunicorn workers pick up edits made through a sibling worker.
+* A calendar built for a different current year is rebuilt automatically.
+
+``HolidayRule`` has no region column yet, so every region key currently
+resolves to the full rule set; the key exists so per-country calendars can
+be added without touching call sites.
+"""
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+
+from .date_presets import materialize_holidays
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGION = "default"
+
+try:
+    HOLIDAY_CACHE_TTL = float(os.environ.get("HOLIDAY_CACHE_TTL", "300") or "300")
+except Exception:
+    HOLIDAY_CACHE_TTL = 300.0
+
+
+def _as_date(d: date | datetime) -> date:
+    return d.date() if isinstance(d, datetime) else d
+
+
+class HolidayCalendar:
+    """Immutable, materialized holiday set with fast workday arithmetic.
+
+    ``dates`` is the frozenset of ``YYYY-MM-DD`` strings consumed by
+    :mod:`app.date_presets`; ``_ordinals`` is the same set as sorted
+    ``date.toordinal()`` values for range queries.
+    """
+
+    __slots__ = ("region", "years", "dates", "_ordinals")
+
+    def __init__(self, dates: Iterable[str], *, region: str = DEFAULT_REGION, years: tuple[int, ...] = ()) -> None:
+        ords: set[int] = set()
+        for s in dates:
+            try:
+                ords.add(date.fromisoformat(str(s)[:10]).toordinal())
+            except ValueError:
+                continue
+        self.region = region
+        self.years = tuple(years)
+        self._ordinals: tuple[int, ...] = tuple(sorted(ords))
+        self.dates: frozenset[str] = frozenset(date.fromordinal(o).isoformat() for o in self._ordinals)
+
+    def __len__(self) -> int:
+        return len(self._ordinals)
+
+    def __contains__(self, d: object) -> bool:
+        if isinstance(d, str):
+            return d[:10] in self.dates
+        if isinstance(d, (date, datetime)):
+            return self.is_holiday(d)
+        return False
+
+    def is_holiday(self, d: date | datetime) -> bool:
+        o = _as_date(d).toordinal()
+        i = bisect.bisect_left(self._ordinals, o)
+        return i < len(self._ordinals) and self._ordinals[i] == o
+
+    def is_workday(self, d: date | datetime, weekend_days: tuple[int, ...]) -> bool:
+        dd = _as_date(d)
+        return dd.weekday() not in weekend_days and not self.is_holiday(dd)
+
+    def holidays_between(self, start: date | datetime, end: date | datetime) -> list[date]:
+        """Holidays in the half-open range ``[start, end)``, ascending."""
+        lo = bisect.bisect_left(self._ordinals, _as_date(start).toordinal())
+        hi = bisect.bisect_left(self._ordinals, _as_date(end).toordinal())
+        return [date.fromordinal(o) for o in self._ordinals[lo:hi]]
+
+    def workdays_between(self, start: date | datetime, end: date | datetime, weekend_days: tuple[int, ...]) -> int:
+        """Number of working days in ``[start, end)`` (weekends and holidays excluded)."""
+        s, e = _as_date(start), _as_date(end)
+        n = (e - s).days
+        if n <= 0:
+            return 0
+        wk = set(weekend_days)
+        full_weeks, rem = divmod(n, 7)
+        count = full_weeks * (7 - len(wk))
+        count += sum(1 for i in range(rem) if (s.weekday() + i) % 7 not in wk)
+        # Holidays that fall on a weekend were never counted in the first place.
+        lo = bisect.bisect_left(self._ordinals, s.toordinal())
+        hi = bisect.bisect_left(self._ordinals, e.toordinal())
+        count -= sum(1 for o in self._ordinals[lo:hi] if date.fromordinal(o).weekday() not in wk)
+        return count
+
+    def add_workdays(self, d: date | datetime, n: int, weekend_days: tuple[int, ...]) -> date:
+        """Move *n* working days from *d* (negative *n* walks backwards).
+
+        ``n == 0`` returns *d* unchanged even when it is not a working day.
+        """
+        cur = _as_date(d)
+        step = 1 if n >= 0 else -1
+        remaining = abs(n)
+        while remaining:
+            cur += timedelta(days=step)
+            if self.is_workday(cur, weekend_days):
+                remaining -= 1
+        return cur
+
+
+# region -> (built_at monotonic, calendar)
+_CALENDARS: dict[str, tuple[float, HolidayCalendar]] = {}
+_LOCK = threading.Lock()
+
+
+def _window(today: Optional[date] = None) -> tuple[int, ...]:
+    y = (today or datetime.now().date()).year
+    return (y - 1, y, y + 1)
+
+
+def _load_rule_dicts(region: str) -> list[dict]:
+    from .models import HolidayRule, SessionLocal
+    db = SessionLocal()
+    try:
+        rules = db.query(HolidayRule).all()
+        return [
+            {
+                "rule_type": r.rule_type,
+                "specific_date": r.specific_date,
+                "recurrence_expr": r.recurrence_expr,
+            }
+            for r in rules
+        ]
+    finally:
+        db.close()
+
+
+def _build(region: str, years: tuple[int, ...]) -> HolidayCalendar:
+    rule_dicts = _load_rule_dicts(region)
+    all_dates: set[str] = set()
+    for y in years:
+        all_dates.update(materialize_holidays(rule_dicts, y))
+    return HolidayCalendar(all_dates, region=region, years=years)
+
+
+def get_holiday_calendar(region: Optional[str] = None) -> HolidayCalendar:
+    """Return the cached calendar for *region*, building it on first use."""
+    key = (region or DEFAULT_REGION).strip() or DEFAULT_REGION
+    years = _window()
+    now = time.monotonic()
+    rec = _CALENDARS.get(key)
+    if rec and rec[1].years == years and (now - rec[0]) < HOLIDAY_CACHE_TTL:
+        return rec[1]
+    with _LOCK:
+        rec = _CALENDARS.get(key)
+        if rec and rec[1].years == years and (time.monotonic() - rec[0]) < HOLIDAY_CACHE_TTL:
+            return rec[1]
+        cal = _build(key, years)
+        _CALENDARS[key] = (time.monotonic(), cal)
+        logger.debug("[Holidays] built calendar region=%s years=%s holidays=%d", key, years, len(cal))
+        return cal
+
+
+def load_holiday_dates(region: Optional[str] = None) -> frozenset[str]:
+    """Materialized ``YYYY-MM-DD`` holiday strings — the ``holidays_loader`` contract."""
+    return get_holiday_calendar(region).dates
+
+
+def invalidate_holiday_calendar(region: Optional[str] = None) -> None:
+    """Drop cached calendars (all regions when *region* is None)."""
+    with _LOCK:
+        if region is None:
+            _CALENDARS.clear()
+        else:
+            _CALENDARS.pop(region, None)
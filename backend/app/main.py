@@ -79,6 +79,19 @@ async def _invalid_expression_handler(request: Request, exc: InvalidExpression):
 async def _unknown_identifier_handler(request: Request, exc: UnknownIdentifier):
     return JSONResponse(status_code=400, content={"detail": "unknown field"})
 
+
+# DuckDB read pool checkout timed out / rejected: the server is saturated, not broken.
+from .db import DuckPoolExhausted
+
+
+@app.exception_handler(DuckPoolExhausted)
+async def _duck_pool_exhausted_handler(request: Request, exc: DuckPoolExhausted):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server busy: too many concurrent queries. Please retry in a moment."},
+        headers={"Retry-After": "5"},
+    )
+
 # CORS: always use explicit origins to ensure ACAO is set with credentials
 origins = settings.cors_origins_list
 app.add_middleware(
@@ -180,6 +193,12 @@ async def _startup():
     except Exception:
         # Non-fatal in dev; continue startup
         logger.warning("DuckDB shared init failed (continuing)", exc_info=True)
+    # Build / verify the calendar table off the request path
+    try:
+        from .dim_date import refresh_in_background
+        refresh_in_background()
+    except Exception:
+        logger.warning("dim_date warm-up failed (continuing)", exc_info=True)
     # Start background scheduler and load jobs from DB (sync + alerts)
     try:
         run_sched = str(os.getenv("RUN_SCHEDULER", "1")).strip().lower() in ("1", "true", "yes", "on")
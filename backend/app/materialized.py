@@ -0,0 +1,230 @@
+"""Custom columns computed once at sync time instead of on every query.
+
+A datasource custom column marked ``"materialized": true`` (regex
+extraction, CASE ladders over text, date parsing, ...) is stored as a real
+column of the synced DuckDB table:
+
+* :func:`apply` adds the column (typed from ``DESCRIBE SELECT <expr>``),
+  fills it with ``UPDATE <table> AS s SET "<name>" = (<expr>)`` and records
+  a fingerprint of the normalized expression in the column comment
+  (``materialized:<sha1>``). Columns are processed in configuration order, so
+  a materialized column may reference earlier materialized ones.
+* ``run_sequence_sync`` calls it after every batch with the batch's starting
+  watermark, so only rows with ``sequence_column > watermark`` (the new rows
+  and the deleted-and-reinserted changed rows) are computed. Before the first
+  batch it backfills the whole table when the column is missing or its
+  expression changed since the last sync. ``run_snapshot_sync`` computes it
+  on the staging table before the swap.
+* Expressions that do not resolve against the table alone (they read a join
+  column or a non-materialized custom column) are left virtual with a
+  warning, as is a name that collides with a real source column.
+
+On the query side :func:`drop_stored` removes a materialized custom column
+from the list handed to the SQL builders when the probed base columns
+already contain it *and* its stored fingerprint matches the current
+expression, so ``s.*`` supplies the stored value and expressions that
+reference it read the column instead of re-expanding it. Callers pass the
+base columns through :func:`with_stored`, which attaches the column
+comments of the local DuckDB table (cached for
+``MATERIALIZED_COMMENT_TTL_S`` seconds, cleared by :func:`apply`). After a
+user edits the expression the fingerprints differ and the expression is
+used until the next sync recomputes the column. Remote routes probe the
+remote table, which has no such column, and keep expanding the expression.
+
+Disable with ``MATERIALIZED_COLUMNS=0`` (sync stops maintaining the columns;
+queries fall back to the expression once the columns are gone).
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_COMMENT_PREFIX = "materialized:"
+_COLUMNS_SQL = "SELECT column_name, comment FROM duckdb_columns() WHERE lower(table_name) = lower(?) AND schema_name = 'main'"
+
+try:
+    MATERIALIZED_COMMENT_TTL_S = float(os.environ.get("MATERIALIZED_COMMENT_TTL_S", "30") or "30")
+except Exception:
+    MATERIALIZED_COMMENT_TTL_S = 30.0
+
+# table -> (monotonic time, lowercased column name -> comment) for the local DuckDB
+_COMMENTS: Dict[str, Tuple[float, Dict[str, Optional[str]]]] = {}
+_COMMENTS_LOCK = threading.Lock()
+
+
+def enabled() -> bool:
+    return str(os.environ.get("MATERIALIZED_COLUMNS", "1")).strip().lower() not in ("0", "false", "no", "off")
+
+
+def _q(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _norm_table(name: Any) -> str:
+    return str(name or "").strip().strip("[]").strip('"').strip("`").split(".")[-1].lower()
+
+
+def is_materialized(cc: Any) -> bool:
+    return isinstance(cc, dict) and bool(cc.get("materialized")) and bool(cc.get("name")) and bool(cc.get("expr"))
+
+
+def materialized_specs(transforms: Optional[Dict[str, Any]], *tables: str) -> List[Dict[str, Any]]:
+    """Materialized custom columns of a datasource that apply to any of *tables*."""
+    if not enabled() or not isinstance(transforms, dict):
+        return []
+    wanted = {_norm_table(t) for t in tables if t}
+    out = []
+    for cc in (transforms.get("customColumns") or []):
+        if not is_materialized(cc):
+            continue
+        sc = cc.get("scope") or {}
+        lvl = str(sc.get("level") or "").lower()
+        if lvl == "table" and _norm_table(sc.get("table")) not in wanted:
+            continue
+        if lvl and lvl not in ("datasource", "table"):
+            continue
+        out.append(cc)
+    return out
+
+
+def duck_expr(cc: Dict[str, Any]) -> str:
+    """The custom column's expression in DuckDB syntax (same path as build_sql)."""
+    from .sql_dialect_normalizer import normalize_sql_expression
+    from .sqlgen import _normalize_expr_idents, validate_expr
+    expr = str(cc.get("expr") or "")
+    validate_expr(expr, "duckdb")
+    normalized = _normalize_expr_idents("duckdb", expr, numericify=str(cc.get("type") or "").lower() == "number")
+    return normalize_sql_expression(normalized, "duckdb")
+
+
+def fingerprint(cc: Dict[str, Any]) -> Optional[str]:
+    """Column comment recorded for the custom column's current expression (None if it does not compile)."""
+    try:
+        return _COMMENT_PREFIX + hashlib.sha1(duck_expr(cc).encode("utf-8")).hexdigest()[:16]
+    except Exception:
+        return None
+
+
+def _comment_map(rows: Iterable[Any]) -> Dict[str, Optional[str]]:
+    return {str(r[0]).lower(): (str(r[1]) if r[1] is not None else None) for r in rows}
+
+
+def stored_columns(conn, table: str) -> Dict[str, Optional[str]]:
+    """Lowercased column name -> comment for *table* (empty if it does not exist)."""
+    return _comment_map(conn.exec_driver_sql(_COLUMNS_SQL, (str(table),)).fetchall())
+
+
+def local_comments(table: str) -> Dict[str, Optional[str]]:
+    """:func:`stored_columns` of *table* in the local DuckDB, briefly cached."""
+    key = _norm_table(table)
+    now = time.monotonic()
+    with _COMMENTS_LOCK:
+        hit = _COMMENTS.get(key)
+        if hit is not None and now - hit[0] < MATERIALIZED_COMMENT_TTL_S:
+            return hit[1]
+    from .db import open_duck_native
+    try:
+        with open_duck_native() as con:
+            comments = _comment_map(con.execute(_COLUMNS_SQL, [key]).fetchall())
+    except Exception as e:
+        logger.debug(f"[materialized] column comments of {key} unavailable: {e}")
+        comments = {}
+    with _COMMENTS_LOCK:
+        _COMMENTS[key] = (now, comments)
+    return comments
+
+
+def apply(conn, table: str, specs: Iterable[Dict[str, Any]], since: Optional[Tuple[str, Any]] = None) -> List[str]:
+    """Compute materialized columns on *table*; returns the names written.
+
+    With ``since=(column, value)`` only rows where ``column > value`` are
+    computed, unless the stored column is missing or was computed from a
+    different expression, in which case every row is.
+    """
+    if not enabled():
+        return []
+    specs = [cc for cc in (specs or []) if is_materialized(cc)]
+    if not specs:
+        return []
+    stored = stored_columns(conn, table)
+    if not stored:
+        return []
+    qt = _q(table)
+    written: List[str] = []
+    for cc in specs:
+        name = str(cc["name"]).strip()
+        qc = _q(name)
+        try:
+            expr = duck_expr(cc)
+            fp = fingerprint(cc)[len(_COMMENT_PREFIX):]
+            comment = stored.get(name.lower(), "")
+            if name.lower() in stored and not str(comment or "").startswith(_COMMENT_PREFIX):
+                logger.warning(f"[materialized] {table}.{name}: a source column has this name; left virtual")
+                continue
+            current = comment == _COMMENT_PREFIX + fp
+            where = ""
+            if not current:
+                typ = conn.exec_driver_sql(f"DESCRIBE SELECT ({expr}) AS v FROM {qt} AS s").fetchall()[0][1]
+                if name.lower() in stored:
+                    conn.exec_driver_sql(f"ALTER TABLE {qt} DROP COLUMN {qc}")
+                conn.exec_driver_sql(f"ALTER TABLE {qt} ADD COLUMN {qc} {typ}")
+            elif since is not None:
+                where = f" WHERE s.{_q(since[0])} > {int(since[1] or 0)}"
+            conn.exec_driver_sql(f"UPDATE {qt} AS s SET {qc} = ({expr}){where}")
+            if not current:
+                conn.exec_driver_sql(f"COMMENT ON COLUMN {qt}.{qc} IS '{_COMMENT_PREFIX}{fp}'")
+                stored[name.lower()] = _COMMENT_PREFIX + fp
+                with _COMMENTS_LOCK:
+                    _COMMENTS.pop(_norm_table(table), None)
+            written.append(name)
+        except Exception as e:
+            logger.warning(f"[materialized] {table}.{name} left virtual: {e}")
+    return written
+
+
+def with_stored(base_cols: Optional[Iterable[str]], table: Optional[str],
+                custom_columns: Optional[List[Dict[str, Any]]]) -> Any:
+    """*base_cols* as ``name -> column comment`` when it holds a materialized
+    custom column's name (the input for :func:`drop_stored`); unchanged otherwise."""
+    if not base_cols or not table or not enabled() or isinstance(base_cols, Mapping):
+        return base_cols
+    have = {str(c).strip().strip('"').lower() for c in base_cols}
+    if not any(is_materialized(cc) and str(cc.get("name")).strip().lower() in have for cc in (custom_columns or [])):
+        return base_cols
+    comments = local_comments(table)
+    return {c: comments.get(str(c).strip().strip('"').lower()) for c in base_cols}
+
+
+def drop_stored(custom_columns: Optional[List[Dict[str, Any]]], base_cols: Optional[Iterable[str]]) -> List[Dict[str, Any]]:
+    """*custom_columns* without the materialized ones already stored in *base_cols*.
+
+    Only a ``name -> comment`` mapping (:func:`with_stored`) proves a column
+    holds the current expression; a plain name set drops nothing.
+    """
+    ccs = list(custom_columns or [])
+    if not base_cols or not enabled() or not isinstance(base_cols, Mapping):
+        return ccs
+    have = {str(c).strip().strip('"').lower(): v for c, v in base_cols.items()}
+
+    def stored(cc: Dict[str, Any]) -> bool:
+        comment = have.get(str(cc.get("name")).strip().lower())
+        return comment is not None and comment == fingerprint(cc)
+
+    return [cc for cc in ccs if not (is_materialized(cc) and stored(cc))]
+
+
+def stale_stored(custom_columns: Optional[List[Dict[str, Any]]], base_cols: Optional[Iterable[str]]) -> List[str]:
+    """Names in *base_cols* of materialized custom columns :func:`drop_stored` kept.
+
+    Their stored values are stale; the builder projects the expression under
+    the same name, so the stored column must be left out of ``s.*``.
+    """
+    have = {str(c).strip().strip('"').lower(): str(c).strip().strip('"') for c in (base_cols or [])}
+    return [have[n] for n in (str(cc.get("name")).strip().lower() for cc in (custom_columns or []) if is_materialized(cc))
+            if n in have]
@@ -8,6 +8,7 @@ from typing import Any, Dict, Tuple
 from prometheus_client import (
     Counter,
     Gauge,
+    Histogram,
     Summary,
     CollectorRegistry,
     generate_latest,
@@ -17,7 +18,7 @@ from prometheus_client import multiprocess
 
 # Facade over prometheus_client that preserves the historical public API
 # (counter_inc/gauge_set/gauge_inc/gauge_dec/summary_observe/render_prometheus/
-# snapshot) so the ~40 existing call sites and admin.py's /metrics-live keep
+# snapshot, plus histogram_observe) so the ~40 existing call sites and admin.py's /metrics-live keep
 # working unchanged. Multi-worker-safe: when PROMETHEUS_MULTIPROC_DIR is set
 # (prod gunicorn), values aggregate across workers via mmap files and survive
 # worker recycles. Dev/single-process falls back to the default REGISTRY.
@@ -40,6 +41,10 @@ _LABELNAMES: Dict[str, Tuple[str, ...]] = {
     "query_semaphore_wait_ms": ("endpoint", "engine", "sem"),
 }
 
+# Bucket bounds for histograms; millisecond waits unless listed here.
+_MS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+_BUCKETS: Dict[str, Tuple[float, ...]] = {}
+
 
 def _get_or_create(name: str, kind: str, labels: Dict[str, str] | None):
     """Return (child, labelnames) for a metric, creating it on first use."""
@@ -52,6 +57,8 @@ def _get_or_create(name: str, kind: str, labels: Dict[str, str] | None):
             elif kind == "gauge":
                 # livesum: sum live workers, forget dead ones (inflight/active gauges).
                 metric = Gauge(name, name, labelnames, multiprocess_mode="livesum")
+            elif kind == "histogram":
+                metric = Histogram(name, name, labelnames, buckets=_BUCKETS.get(name, _MS_BUCKETS))
             else:  # summary
                 metric = Summary(name, name, labelnames)
             entry = (metric, labelnames)
@@ -102,6 +109,11 @@ def summary_observe(name: str, value: float, labels: Dict[str, str] | None = Non
     child.observe(float(value))
 
 
+def histogram_observe(name: str, value: float, labels: Dict[str, str] | None = None) -> None:
+    child, _ = _get_or_create(name, "histogram", labels)
+    child.observe(float(value))
+
+
 def _collect_registry() -> CollectorRegistry:
     """Registry to read from: aggregated multiprocess in prod, default otherwise."""
     if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
@@ -122,12 +134,14 @@ def _clean(labels: Dict[str, str]) -> Dict[str, str]:
 
 def snapshot() -> dict:
     """Programmatic snapshot in the legacy shape consumed by admin.py:
-    { counters:[{name,labels,value}], gauges:[...], summaries:[{name,labels,sum,count}] }.
+    { counters:[{name,labels,value}], gauges:[...], summaries:[{name,labels,sum,count}],
+      histograms:[{name,labels,sum,count,buckets:{le: cumulative count}}] }.
     Counter sample names keep the `_total` suffix; summary names use the base name.
     """
     out_c: list[dict] = []
     out_g: list[dict] = []
     out_s: list[dict] = []
+    out_h: list[dict] = []
     reg = _collect_registry()
     for fam in reg.collect():
         if fam.type == "counter":
@@ -156,4 +170,18 @@ def snapshot() -> dict:
                     "sum": float(vals.get("sum", 0.0)),
                     "count": int(vals.get("count", 0)),
                 })
-    return {"counters": out_c, "gauges": out_g, "summaries": out_s}
+        elif fam.type == "histogram":
+            hists: Dict[Tuple[Tuple[str, str], ...], Dict[str, Any]] = {}
+            for sm in fam.samples:
+                labels = _clean({k: v for k, v in sm.labels.items() if k != "le"})
+                row = hists.setdefault(tuple(sorted(labels.items())), {
+                    "name": fam.name, "labels": labels, "sum": 0.0, "count": 0, "buckets": {},
+                })
+                if sm.name.endswith("_bucket"):
+                    row["buckets"][sm.labels.get("le", "")] = int(sm.value)
+                elif sm.name.endswith("_sum"):
+                    row["sum"] = float(sm.value)
+                elif sm.name.endswith("_count"):
+                    row["count"] = int(sm.value)
+            out_h.extend(hists.values())
+    return {"counters": out_c, "gauges": out_g, "summaries": out_s, "histograms": out_h}
@@ -0,0 +1,185 @@
+"""Single-query compiler for the period-average aggregations of ``/query/spec``.
+
+``avg_daily``, ``avg_wday``, ``avg_weekly``, ``avg_monthly`` and
+``last_daily_sum`` used to be five hand-written SQL shapes in
+``run_query_spec``: a different nesting per aggregation, a separate inner
+query for distinct numerators, and a second scan of the source for
+``last_daily_sum`` on every engine except DuckDB. They all reduce to the same
+two steps, which :func:`compile_period_average` emits as one statement of
+nested derived tables:
+
+1. ``_pa_grain`` — one scan of the filtered source, grouped by the period
+   *grain* (the day for daily / workday / last-day aggregations, the week or
+   month otherwise), producing the per-period numerator ``_n`` (SUM, COUNT or
+   COUNT DISTINCT of the value).
+2. ``_pa_cal`` — a calendar over those periods that tags each one with
+   ``_wd`` (a working day: not in the weekend weekday mask; holidays are
+   removed by the WHERE clause) and ``_last`` (the latest period in the
+   window).
+
+The outer SELECT only sums and counts over ``_pa_cal``. The steps are
+derived tables rather than CTEs because ``run_query`` wraps SQL Server
+statements in another derived table for paging, and T-SQL does not allow a
+``WITH`` clause there.
+
+* avg_daily / avg_weekly / avg_monthly: ``SUM(_n) / COUNT(_p)``
+* avg_wday: ``SUM(_n) / SUM(_wd)``. Sum and count numerators keep weekend
+  rows in the numerator, as the previous implementation did. Distinct
+  numerators only count working days.
+* last_daily_sum: ``SUM(_n)`` of the ``_last`` day
+
+Weekday masks use ISO day numbers (1 = Monday .. 7 = Sunday) on every
+dialect, so the SQL Server form no longer depends on ``@@DATEFIRST``. On the
+local DuckDB, ``_pa_cal`` joins the materialized ``_bayan.dim_date`` table
+(:mod:`app.dim_date`) for weekdays and holidays instead of inlining them;
+days outside the table's range keep the inline computation.
+"""
+from __future__ import annotations
+
+from datetime import date
+from typing import Iterable, Optional
+
+PERIOD_AGGS = frozenset({"avg_daily", "avg_wday", "avg_weekly", "avg_monthly", "last_daily_sum"})
+
+# Weekend conventions accepted from the dashboard's ``__weekends`` filter meta.
+WEEKEND_MASKS = {
+    "SAT_SUN": frozenset({6, 7}),
+    "FRI_SAT": frozenset({5, 6}),
+}
+
+
+def _d(dialect: str) -> str:
+    d = (dialect or "").lower()
+    if "mssql" in d or "sqlserver" in d:
+        return "mssql"
+    if "mysql" in d or "mariadb" in d:
+        return "mysql"
+    if "postgre" in d:
+        return "postgres"
+    return "duckdb"
+
+
+def weekend_mask(code: Optional[str]) -> frozenset[int]:
+    return WEEKEND_MASKS.get(str(code or "SAT_SUN").upper(), WEEKEND_MASKS["SAT_SUN"])
+
+
+def iso_dow_sql(dialect: str, expr: str) -> str:
+    """ISO day of week (1 = Monday .. 7 = Sunday) of a DATE expression."""
+    d = _d(dialect)
+    if d == "mssql":
+        return f"(((DATEPART(weekday, {expr}) + @@DATEFIRST + 5) % 7) + 1)"
+    if d == "mysql":
+        return f"(WEEKDAY({expr}) + 1)"
+    if d == "postgres":
+        return f"EXTRACT(ISODOW FROM {expr})"
+    return f"isodow({expr})"
+
+
+def period_grain_sql(dialect: str, agg: str, date_expr: str) -> str:
+    """Grouping key for *agg*'s period (matches the previous per-dialect forms)."""
+    d = _d(dialect)
+    if agg == "avg_weekly":
+        if d == "mssql":
+            return f"DATEADD(week, DATEDIFF(week, 0, {date_expr}), 0)"
+        if d == "mysql":
+            # Excel WEEKNUM(date, 11): Monday-start weeks, week 1 always starts Jan 1.
+            return (
+                f"CONCAT(YEAR({date_expr}), '-',"
+                f" LPAD(CEIL((DAYOFYEAR({date_expr}) + WEEKDAY(MAKEDATE(YEAR({date_expr}), 1))) / 7), 2, '0'))"
+            )
+        return f"DATE_TRUNC('week', {date_expr})"
+    if agg == "avg_monthly":
+        if d == "mssql":
+            return f"YEAR({date_expr}) * 100 + MONTH({date_expr})"
+        if d == "mysql":
+            return f"DATE_FORMAT({date_expr}, '%Y-%m')"
+        return f"DATE_TRUNC('month', {date_expr})"
+    return f"CAST({date_expr} AS DATE)"
+
+
+def compile_period_average(
+    dialect: str,
+    agg: str,
+    *,
+    from_sql: str,
+    date_expr: str,
+    value_expr: str,
+    numeric_value_expr: Optional[str] = None,
+    numerator: str = "sum",
+    where_parts: Iterable[str] = (),
+    weekend_days: Iterable[int] = WEEKEND_MASKS["SAT_SUN"],
+    holidays: Iterable[str] = (),
+    calendar: Optional[str] = None,
+    calendar_range: Optional[tuple[date, date]] = None,
+) -> str:
+    """One-statement SQL for a period aggregation.
+
+    ``date_expr`` is the timestamp expression of the date column (epoch and
+    string dates already converted). ``value_expr`` is the raw value column
+    (COUNT / COUNT DISTINCT); ``numeric_value_expr`` the cleaned numeric form
+    used for SUM (defaults to ``value_expr``). ``where_parts`` are ANDed
+    predicates that may contain ``:named`` parameters; each appears once.
+    ``holidays`` are ``YYYY-MM-DD`` strings excluded from avg_wday. With
+    ``calendar`` (the ``_bayan.dim_date`` table, DuckDB only) avg_wday takes
+    weekdays and holidays from a join on that table instead. Days outside
+    ``calendar_range`` (the table's first and last day) have no row and keep
+    the inline computation: ISO weekday and the ``holidays`` that fall
+    outside the range; without a range every holiday is kept as fallback.
+
+    Returns ``num_val, den_val, value`` (``value`` only for last_daily_sum).
+    """
+    if agg not in PERIOD_AGGS:
+        raise ValueError(f"unsupported period aggregation: {agg}")
+    num = (numerator or "sum").lower() if agg != "last_daily_sum" else "sum"
+    if num == "count":
+        per_period = f"COUNT({value_expr})"
+    elif num == "distinct":
+        per_period = f"COUNT(DISTINCT {value_expr})"
+    else:
+        per_period = f"SUM({numeric_value_expr or value_expr})"
+
+    where = list(where_parts)
+    hol = sorted({str(h) for h in holidays}) if agg == "avg_wday" else []
+    use_cal = bool(calendar) and agg == "avg_wday"
+    if hol and not use_cal:
+        literals = ", ".join(f"'{h}'" for h in hol)
+        where.append(f"CAST({date_expr} AS DATE) NOT IN ({literals})")
+    mask = ", ".join(str(int(x)) for x in sorted(set(weekend_days))) or "0"
+    if agg == "avg_wday" and num == "distinct":
+        # Weekend periods never reach the numerator; skip them in the scan.
+        where.append(f"{iso_dow_sql(dialect, f'CAST({date_expr} AS DATE)')} NOT IN ({mask})")
+    where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+
+    grain = period_grain_sql(dialect, agg, date_expr)
+    if agg == "avg_wday":
+        wd = f"CASE WHEN _p IS NOT NULL AND {iso_dow_sql(dialect, '_p')} NOT IN ({mask}) THEN 1 ELSE 0 END"
+    else:
+        wd = "CASE WHEN _p IS NOT NULL THEN 1 ELSE 0 END"
+    last = "CASE WHEN _p = MAX(_p) OVER () THEN 1 ELSE 0 END" if agg == "last_daily_sum" else "0"
+
+    grain_sql = f"(SELECT {grain} AS _p, {per_period} AS _n FROM {from_sql}{where_sql} GROUP BY {grain})"
+    if use_cal:
+        dow = f"COALESCE(_c.weekday, {iso_dow_sql(dialect, '_g._p')})"
+        cal_sql = (
+            f"SELECT _g._p, _g._n, CASE WHEN _g._p IS NOT NULL AND {dow} NOT IN ({mask}) THEN 1 ELSE 0 END AS _wd, 0 AS _last "
+            f"FROM {grain_sql} AS _g LEFT JOIN {calendar} _c ON _c.d = _g._p"
+        )
+        if hol:
+            lo, hi = (d.isoformat() for d in calendar_range) if calendar_range else ("9999-12-31", "0001-01-01")
+            outside = ", ".join(f"'{h}'" for h in hol if h < lo or h > hi)
+            fallback = f"CAST(_g._p AS DATE) IN ({outside})" if outside else "FALSE"
+            cal_sql += f" WHERE _g._p IS NOT NULL AND NOT COALESCE(_c.is_holiday, {fallback})"
+    else:
+        cal_sql = f"SELECT _p, _n, {wd} AS _wd, {last} AS _last FROM {grain_sql} AS _pa_grain"
+    cal_from = f"FROM ({cal_sql}) AS _pa_cal"
+    if agg == "last_daily_sum":
+        return f"SELECT SUM(CASE WHEN _last = 1 THEN _n END) AS value {cal_from}"
+    if agg == "avg_wday":
+        num_sql = "SUM(CASE WHEN _wd = 1 THEN _n END)" if num == "distinct" else "SUM(_n)"
+        den_sql = "SUM(_wd)"
+    else:
+        num_sql, den_sql = "SUM(_n)", "COUNT(_p)"
+    return (
+        f"SELECT {num_sql} AS num_val, {den_sql} AS den_val, "
+        f"{num_sql} * 1.0 / NULLIF({den_sql}, 0) AS value {cal_from}"
+    )
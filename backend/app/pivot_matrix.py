@@ -0,0 +1,155 @@
+"""Server-side cross-tab reshape for ``/pivot`` (``format="matrix"``).
+
+``/pivot`` returns long-form rows ``[row_dims..., col_dims..., value]`` and the
+frontend used to pivot tens of thousands of those tuples into a matrix in
+JavaScript. :func:`to_matrix` does the reshape once on the server in a single
+columnar pass and returns a dense payload instead:
+
+* ``columns`` — row-dimension names followed by one label per column key;
+* ``rows`` — one dense array per row key: ``[row_key..., v1, v2, ...]`` with
+  ``None`` for empty cells;
+* ``matrix`` — the header: ``rowDims``, ``colDims``, ``colKeys`` (the column
+  key tuples behind each value column) and truncation info.
+
+Row and column keys beyond ``max_rows`` / ``max_cols`` are ranked by the
+absolute total of their cells; the smallest are folded into a single
+``"Other"`` row / column. Folding is exact for count, sum, min and max; for
+avg and distinct the overflow cells cannot be recombined and are ``None``
+(``otherExact`` is false).
+
+The long-form fetch itself is capped (``PIVOT_MATRIX_FETCH_LIMIT`` in the
+router); when the cap cut the input the caller passes ``truncated=True`` and
+the header says so, since the missing cells are not in any row or ``Other``.
+"""
+from __future__ import annotations
+
+from typing import Any, Optional, Sequence
+
+OTHER_LABEL = "Other"
+KEY_SEPARATOR = " / "
+
+_COMBINE = {
+    "count": lambda a, b: a + b,
+    "sum": lambda a, b: a + b,
+    "min": min,
+    "max": max,
+}
+
+
+def _num(v: Any) -> float:
+    try:
+        return abs(float(v))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _keep(totals: dict, order: list, limit: Optional[int]) -> tuple[list, set]:
+    """Keys to keep in original order, plus the folded remainder."""
+    if limit is None or limit <= 0 or len(order) <= limit:
+        return order, set()
+    ranked = sorted(order, key=lambda k: totals.get(k, 0.0), reverse=True)
+    kept = set(ranked[:limit])
+    return [k for k in order if k in kept], set(ranked[limit:])
+
+
+def to_matrix(
+    columns: Sequence[str],
+    rows: Sequence[Sequence[Any]],
+    n_row_dims: int,
+    n_col_dims: Optional[int] = None,
+    *,
+    agg: str = "count",
+    max_rows: Optional[int] = None,
+    max_cols: Optional[int] = None,
+    other_label: str = OTHER_LABEL,
+    truncated: bool = False,
+) -> dict:
+    """Reshape long-form pivot rows into ``{columns, rows, matrix}``.
+
+    The value is the column right after the ``n_row_dims + n_col_dims``
+    dimensions; anything after it (e.g. the ``__grouping`` subtotal flag) is
+    ignored. Without ``n_col_dims`` the last column is the value.
+    """
+    if n_col_dims is None:
+        n_dims = max(len(columns) - 1, 0)
+    else:
+        n_dims = max(0, min(n_row_dims + n_col_dims, len(columns) - 1))
+    n_r = max(0, min(n_row_dims, n_dims))
+    row_dims = list(columns[:n_r])
+    col_dims = list(columns[n_r:n_dims])
+    combine = _COMBINE.get((agg or "count").lower())
+
+    cells: dict[tuple, dict[tuple, Any]] = {}
+    row_order: list[tuple] = []
+    col_order: list[tuple] = []
+    col_seen: set[tuple] = set()
+    row_tot: dict[tuple, float] = {}
+    col_tot: dict[tuple, float] = {}
+    for r in rows:
+        rk = tuple(r[:n_r])
+        ck = tuple(r[n_r:n_dims])
+        v = r[n_dims] if len(r) > n_dims else None
+        line = cells.get(rk)
+        if line is None:
+            line = cells[rk] = {}
+            row_order.append(rk)
+        if ck not in col_seen:
+            col_seen.add(ck)
+            col_order.append(ck)
+        line[ck] = v
+        m = _num(v)
+        row_tot[rk] = row_tot.get(rk, 0.0) + m
+        col_tot[ck] = col_tot.get(ck, 0.0) + m
+
+    kept_rows, other_rows = _keep(row_tot, row_order, max_rows)
+    kept_cols, other_cols = _keep(col_tot, col_order, max_cols)
+    col_index = {ck: i for i, ck in enumerate(kept_cols)}
+    width = len(kept_cols) + (1 if other_cols else 0)
+
+    def _fold(acc: list, i: int, v: Any) -> None:
+        if v is None:
+            return
+        if combine is None:
+            acc[i] = None
+        elif acc[i] is None:
+            acc[i] = v
+        else:
+            acc[i] = combine(acc[i], v)
+
+    def _line(rk: tuple) -> list:
+        out: list[Any] = [None] * width
+        for ck, v in cells.get(rk, {}).items():
+            i = col_index.get(ck)
+            if i is not None:
+                out[i] = v
+            else:
+                _fold(out, width - 1, v)
+        return out
+
+    dense = [list(rk) + _line(rk) for rk in kept_rows]
+    if other_rows:
+        acc: list[Any] = [None] * width
+        for rk in other_rows:
+            for i, v in enumerate(_line(rk)):
+                _fold(acc, i, v)
+        dense.append([other_label] * n_r + acc)
+
+    def _label(ck: tuple) -> str:
+        return KEY_SEPARATOR.join("" if p is None else str(p) for p in ck) if ck else "value"
+
+    header = row_dims + [_label(ck) for ck in kept_cols] + ([other_label] if other_cols else [])
+    return {
+        "columns": header,
+        "rows": dense,
+        "matrix": {
+            "rowDims": row_dims,
+            "colDims": col_dims,
+            "colKeys": [list(ck) for ck in kept_cols],
+            "rowCount": len(row_order),
+            "colCount": len(col_order),
+            "otherRows": len(other_rows),
+            "otherCols": len(other_cols),
+            "otherExact": combine is not None or not (other_rows or other_cols),
+            "truncated": bool(truncated),
+        },
+    }
@@ -0,0 +1,162 @@
+"""Per-connection prepared statements for parameterized DuckDB queries.
+
+``SQLGlotBuilder.build_aggregation_template`` keeps filter values out of the
+SQL text, so a dashboard's widgets produce a handful of stable statements.
+Plain ``conn.execute(sql, params)`` still parses, binds and plans the
+statement on every call. :func:`duck_execute` instead runs
+``PREPARE _ps_<hash> AS <sql>`` the first time a connection sees a statement,
+then ``EXECUTE _ps_<hash>(<values>)`` on later calls. That roughly halves
+the per-call overhead of small aggregate queries.
+
+* The cache is per connection (DuckDB prepared statements are
+  connection-scoped). It is held in a ``WeakKeyDictionary`` keyed by the
+  connection object, so it lives as long as the read-pool connection does
+  and dies with it. Short-lived cursors simply never hit.
+* At most ``DUCK_PREPARED_CACHE_SIZE`` statements (default 64) per
+  connection; the least recently used one is ``DEALLOCATE``-d. Set it to 0
+  to disable.
+* DuckDB's ``EXECUTE`` does not accept ``?`` arguments, so values are passed
+  as SQL literals rendered by :func:`duck_literal`. Values it cannot render
+  safely (bytes, nested types), statements that cannot be prepared, and
+  failed ``EXECUTE`` calls fall back to ``conn.execute(sql, params)``.
+
+Remote engines get the same stable text with ``:name`` bind parameters
+through SQLAlchemy ``text()``. The drivers already prepare or parameterize
+it (``sp_executesql`` on SQL Server, server-side prepares after
+``prepare_threshold`` executions on psycopg 3), and SQLAlchemy's compiled
+cache keys on the text, so nothing extra is needed there.
+"""
+from __future__ import annotations
+
+import datetime as _dt
+import decimal
+import hashlib
+import logging
+import math
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+try:
+    PREPARED_CACHE_SIZE = int(os.environ.get("DUCK_PREPARED_CACHE_SIZE", "64") or "64")
+except Exception:
+    PREPARED_CACHE_SIZE = 64
+
+# conn -> OrderedDict[sql, statement name or None (cannot be prepared)]
+_PER_CONN: "weakref.WeakKeyDictionary[Any, OrderedDict[str, Optional[str]]]" = weakref.WeakKeyDictionary()
+_LOCK = threading.Lock()
+
+# duckdb exception classes that mean "the prepared form is unusable", not "the query failed".
+_RETRYABLE = frozenset({"BinderException", "InvalidInputException", "CatalogException"})
+
+
+class _Unrenderable(Exception):
+    pass
+
+
+def duck_literal(v: Any) -> str:
+    """DuckDB SQL literal for a bind value; raises ``_Unrenderable`` otherwise."""
+    if v is None:
+        return "NULL"
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    if isinstance(v, int):
+        return str(v)
+    if isinstance(v, float):
+        if not math.isfinite(v):
+            raise _Unrenderable(v)
+        return repr(v)
+    if isinstance(v, decimal.Decimal):
+        if not v.is_finite():
+            raise _Unrenderable(v)
+        return str(v)
+    if isinstance(v, _dt.datetime):
+        return f"TIMESTAMP '{v.isoformat(sep=' ')}'" if v.tzinfo is None else f"TIMESTAMPTZ '{v.isoformat(sep=' ')}'"
+    if isinstance(v, _dt.date):
+        return f"DATE '{v.isoformat()}'"
+    if isinstance(v, str):
+        if "\x00" in v:
+            raise _Unrenderable(v)
+        return "'" + v.replace("'", "''") + "'"
+    raise _Unrenderable(type(v).__name__)
+
+
+def statement_name(sql: str) -> str:
+    return "_ps_" + hashlib.sha1(sql.encode("utf-8")).hexdigest()[:20]
+
+
+def _count(name: str) -> None:
+    try:
+        from .metrics import counter_inc
+        counter_inc(name, {"engine": "duckdb"})
+    except Exception:
+        pass
+
+
+def _cache_for(conn: Any) -> Optional["OrderedDict[str, Optional[str]]"]:
+    try:
+        with _LOCK:
+            cache = _PER_CONN.get(conn)
+            if cache is None:
+                cache = OrderedDict()
+                _PER_CONN[conn] = cache
+            return cache
+    except TypeError:  # connection type without weakref support
+        return None
+
+
+def _prepare(conn: Any, cache: "OrderedDict[str, Optional[str]]", sql: str) -> Optional[str]:
+    if sql in cache:
+        cache.move_to_end(sql)
+        _count("duck_prepared_hit_total")
+        return cache[sql]
+    _count("duck_prepared_miss_total")
+    name: Optional[str] = statement_name(sql)
+    try:
+        conn.execute(f"PREPARE {name} AS {sql}")
+    except Exception as e:
+        logger.debug(f"[prepared] cannot prepare ({e}); executing directly")
+        if "can't be prepared" not in str(e):
+            return None  # e.g. missing table: try again next time
+        name = None
+    cache[sql] = name
+    while len(cache) > PREPARED_CACHE_SIZE:
+        _old_sql, old = cache.popitem(last=False)
+        if old:
+            try:
+                conn.execute(f"DEALLOCATE {old}")
+            except Exception:
+                pass
+    return name
+
+
+def duck_execute(conn: Any, sql: str, values: Optional[Sequence[Any]] = None):
+    """``conn.execute(sql, values)`` through the connection's prepared-statement cache."""
+    vals = list(values or [])
+    if not vals or PREPARED_CACHE_SIZE <= 0:
+        return conn.execute(sql, vals)
+    try:
+        args = ", ".join(duck_literal(v) for v in vals)
+    except _Unrenderable:
+        return conn.execute(sql, vals)
+    cache = _cache_for(conn)
+    if cache is None:
+        return conn.execute(sql, vals)
+    name = _prepare(conn, cache, sql)
+    if name is None:
+        return conn.execute(sql, vals)
+    try:
+        return conn.execute(f"EXECUTE {name}({args})")
+    except Exception as e:
+        # Parameter count/type mismatch or a statement dropped behind our back:
+        # forget it and run the plain form (which raises the real error, if any).
+        # Anything else (interrupts, conversion errors) is the query's own outcome.
+        if type(e).__name__ not in _RETRYABLE:
+            raise
+        logger.debug(f"[prepared] EXECUTE {name} failed ({e}); executing directly")
+        cache.pop(sql, None)
+        return conn.execute(sql, vals)
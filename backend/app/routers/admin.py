@@ -13,8 +13,9 @@ from ..schemas import BrandingUpdateIn, BrandingOut
 from ..config import settings
 from ..scheduler import list_jobs, schedule_all_jobs
 from ..metrics import snapshot as metrics_snapshot
+from ..compile_cache import stats as compile_cache_stats
 from ..metrics_state import get_recent_actors, get_open_dashboards
-from ..db import get_active_duck_path, set_active_duck_path
+from ..db import get_active_duck_path, set_active_duck_path, duck_read_pool_stats
 from ..security import decrypt_text
 from pydantic import BaseModel
 import re
@@ -120,6 +121,8 @@ async def metrics_live(db: Session = Depends(get_db), admin: User = Depends(requ
                 "total": inflight_total,
             },
             "cache": { "hits": cache_hits, "misses": cache_miss, "hitRatio": (cache_hits/(cache_hits+cache_miss)) if (cache_hits+cache_miss)>0 else None },
+            "compileCache": compile_cache_stats(),
+            "duckReadPool": duck_read_pool_stats(),
             "rateLimited": rate_limited,
             "durationsMs": { "sum": dur_sum, "count": dur_count, "avg": dur_avg },
         },
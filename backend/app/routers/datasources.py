@@ -20,7 +20,7 @@ from ..audit import audit
 from ..authz import is_admin as _authz_is_admin, datasource_permission, Permission, require_admin
 from ..db import get_duckdb_engine, get_engine_from_dsn, run_sequence_sync, run_snapshot_sync, open_duck_native, get_active_duck_path
 from ..api_ingest import run_api_sync
-from ..db import dispose_engine_by_key, dispose_all_engines, dispose_duck_engine
+from ..db import dispose_engine_by_key, dispose_all_engines, dispose_duck_engine, forget_datasource_engine
 from ..schemas import (
     DatasourceCreate,
     DatasourceOut,
@@ -52,8 +52,11 @@ from ..config import settings
 import re
 import time
 from datetime import datetime, timezone
-from ..security import encrypt_text, decrypt_text
+from ..security import encrypt_text, decrypt_text, purge_credentials
 from ..metrics import counter_inc, summary_observe
+from .. import column_semantics as _colsem
+from .. import distinct_dictionary as _distinct_dict
+from .. import materialized as _materialized
 import logging
 import os
 
@@ -403,6 +406,17 @@ def get_ds(ds_id: str, actorId: str | None = Depends(actor_id_optional), db: Ses
     )
 
 
+def _forget_credentials(ds_id: str) -> None:
+    """Drop cached plaintext DSN and engine handle after a credential change."""
+    purge_credentials(ds_id)
+    forget_datasource_engine(ds_id)
+    try:
+        from .query import _ds_cache
+        _ds_cache.pop(str(ds_id), None)
+    except Exception:
+        pass
+
+
 # Update datasource (edit dialog)
 @router.patch("/{ds_id}", response_model=DatasourceOut)
 def patch_ds(ds_id: str, payload: DatasourceUpdate, request: Request, actorId: str | None = Depends(actor_id_optional), db: Session = Depends(get_db)):
@@ -420,6 +434,7 @@ def patch_ds(ds_id: str, payload: DatasourceUpdate, request: Request, actorId: s
         ds.type = payload.type
     if payload.connectionUri is not None:
         ds.connection_encrypted = encrypt_text(payload.connectionUri) if payload.connectionUri else None
+        _forget_credentials(ds.id)
     if payload.options is not None:
         try:
             ds.options_json = json.dumps(payload.options)
@@ -928,25 +943,25 @@ def run_sync_now(
                         dest_name = f"{safe}__{t.dest_table_name}"
                     # Check if destination table exists and has data
                     if _duckdb is not None:
-                        con = open_duck_native(curr_duck_path)
-                        try:
-                            def _q_duck(name: str) -> str:
-                                return '"' + str(name).replace('"', '""') + '"'
-                            # Check if table exists
-                            check_sql = f"SELECT COUNT(*) FROM information_schema.tables WHERE table_name = '{dest_name}'"
-                            table_exists = con.execute(check_sql).fetchone()[0] > 0
-                            if table_exists:
-                                # Get MAX(sequence_column) from existing data
-                                max_sql = f"SELECT MAX({_q_duck(t.sequence_column)}) FROM {_q_duck(dest_name)}"
-                                row = con.execute(max_sql).fetchone()
-                                max_val = (row[0] if row else None)
-                                if max_val is not None:
-                                    st.last_sequence_value = int(max_val)
-                                    logger.debug(f"[SEQUENCE] Initialized watermark for task_id={t.id} from existing data: {max_val}")
-                        except Exception as e:
-                            logger.warning(f"[SEQUENCE] Could not initialize watermark from existing data: {e}")
-                            # Default to 0 for new sequence tasks without existing data
-                            st.last_sequence_value = 0
+                        with open_duck_native(curr_duck_path) as con:
+                            try:
+                                def _q_duck(name: str) -> str:
+                                    return '"' + str(name).replace('"', '""') + '"'
+                                # Check if table exists
+                                check_sql = f"SELECT COUNT(*) FROM information_schema.tables WHERE table_name = '{dest_name}'"
+                                table_exists = con.execute(check_sql).fetchone()[0] > 0
+                                if table_exists:
+                                    # Get MAX(sequence_column) from existing data
+                                    max_sql = f"SELECT MAX({_q_duck(t.sequence_column)}) FROM {_q_duck(dest_name)}"
+                                    row = con.execute(max_sql).fetchone()
+                                    max_val = (row[0] if row else None)
+                                    if max_val is not None:
+                                        st.last_sequence_value = int(max_val)
+                                        logger.debug(f"[SEQUENCE] Initialized watermark for task_id={t.id} from existing data: {max_val}")
+                            except Exception as e:
+                                logger.warning(f"[SEQUENCE] Could not initialize watermark from existing data: {e}")
+                                # Default to 0 for new sequence tasks without existing data
+                                st.last_sequence_value = 0
                 except Exception as e:
                     logger.warning(f"[SEQUENCE] Error initializing watermark for task_id={t.id}: {e}")
                     st.last_sequence_value = 0
@@ -1015,6 +1030,8 @@ def run_sync_now(
                 except Exception:
                     pass
                 results.append({"taskId": t.id, "mode": t.mode, "rowCount": st.last_row_count, "windowStart": res.get('windowStart'), "windowEnd": res.get('windowEnd')})
+                _refresh_column_semantics(curr_duck_path, t.dest_table_name, ds.id)
+                _refresh_distinct_dictionaries(curr_duck_path, t.dest_table_name)
             elif t.mode == "sequence":
                 # Optional user-scoped destination naming
                 dest_name = t.dest_table_name
@@ -1040,6 +1057,7 @@ def run_sync_now(
                     should_abort=lambda: _check_abort(st.id),
                     on_phase=lambda ph: _set_phase(db, st.id, ph),
                     custom_query=(t.custom_query or None),
+                    materialize=(_materialized.materialized_specs(ds_opts.get('transforms'), t.source_table, t.dest_table_name) or None),
                 )
                 st.last_sequence_value = res.get("last_sequence_value")
                 st.last_row_count = res.get("row_count")
@@ -1049,6 +1067,8 @@ def run_sync_now(
                 run.row_count = st.last_row_count
                 run.finished_at = st.last_run_at
                 results.append({"taskId": t.id, "mode": t.mode, "rowCount": st.last_row_count, "lastSeq": st.last_sequence_value})
+                _refresh_column_semantics(curr_duck_path, dest_name, ds.id)
+                _refresh_distinct_dictionaries(curr_duck_path, dest_name)
             else:  # snapshot
                 dest_name = t.dest_table_name
                 try:
@@ -1070,6 +1090,7 @@ def run_sync_now(
                     should_abort=lambda: _check_abort(st.id),
                     on_phase=lambda ph: _set_phase(db, st.id, ph),
                     custom_query=(t.custom_query or None),
+                    materialize=(_materialized.materialized_specs(ds_opts.get('transforms'), t.source_table, t.dest_table_name) or None),
                 )
                 st.last_row_count = res.get("row_count")
                 st.last_run_at = datetime.now(timezone.utc)
@@ -1078,14 +1099,15 @@ def run_sync_now(
                 run.row_count = st.last_row_count
                 run.finished_at = st.last_run_at
                 results.append({"taskId": t.id, "mode": t.mode, "rowCount": st.last_row_count})
+                _refresh_column_semantics(curr_duck_path, dest_name, ds.id)
+                _refresh_distinct_dictionaries(curr_duck_path, dest_name)
                 # After snapshot, set sequence tasks' watermark to MAX(sequence_column)
                 seq_tasks = db.query(SyncTask).filter(SyncTask.group_key == t.group_key, SyncTask.mode == "sequence").all()
                 try:
                     def _q_duck(name: str) -> str:
                         return '"' + str(name).replace('"', '""') + '"'
                     if _duckdb is not None:
-                        con = open_duck_native(curr_duck_path)
-                        try:
+                        with open_duck_native(curr_duck_path) as con:
                             for sq in seq_tasks:
                                 if not sq.sequence_column:
                                     continue
@@ -1108,11 +1130,6 @@ def run_sync_now(
                                         db.add(sst)
                                 except Exception:
                                     pass
-                        finally:
-                            try:
-                                con.close()
-                            except Exception:
-                                pass
                     else:
                         # Fallback to SQLAlchemy driver SQL with quoted identifiers
                         with duck_engine.connect() as conn:
@@ -1204,6 +1221,33 @@ def run_sync_now(
     return {"ok": True, "count": len(tasks_sorted), "results": results}
 
 
+def _refresh_column_semantics(duck_path: str | None, dest_table: str, ds_id: str | None) -> None:
+    """Invalidate cached date-column semantics for a synced table and re-seed the
+    declared types from DuckDB, so the next /query/spec skips the type probe."""
+    try:
+        _colsem.invalidate(ds_id)
+        _colsem.invalidate(_colsem.LOCAL_KEY, dest_table)
+        if _duckdb is None:
+            return
+        with open_duck_native(duck_path) as con:
+            rows = con.execute(f"DESCRIBE {quote_ident(dest_table, 'duckdb')}").fetchall()
+        _colsem.put_table(_colsem.LOCAL_KEY, dest_table, [(str(r[0]), str(r[1])) for r in rows])
+    except Exception as e:
+        logger.debug(f"[sync] column semantics refresh skipped for {dest_table}: {e}")
+
+
+def _refresh_distinct_dictionaries(duck_path: str | None, dest_table: str) -> None:
+    """Rebuild the /distinct value dictionaries for a freshly synced table."""
+    if _duckdb is None or not _distinct_dict.enabled():
+        return
+    try:
+        with open_duck_native(duck_path) as con:
+            built = _distinct_dict.build_dictionaries(con, dest_table)
+        logger.debug(f"[sync] distinct dictionaries for {dest_table}: {len(built)} columns")
+    except Exception as e:
+        logger.debug(f"[sync] distinct dictionary refresh skipped for {dest_table}: {e}")
+
+
 def _update_progress(db: Session, state_id: str, cur: int | None, tot: int | None) -> None:
     try:
         st = db.query(SyncState).filter(SyncState.id == state_id).first()
@@ -1554,6 +1598,7 @@ def flush_sync_task(ds_id: str, task_id: str, actorId: str | None = Depends(acto
                 for tbl in sorted(tables_to_drop):
                     try:
                         conn.execute(f"DROP TABLE IF EXISTS {_q_duck(tbl)}")
+                        _distinct_dict.drop_dictionaries(conn, tbl)
                         dropped += 1
                     except Exception:
                         # Best-effort per table
@@ -1723,6 +1768,7 @@ def drop_local_table(ds_id: str, payload: _DropLocalTableRequest, actorId: str |
         with open_duck_native(settings.duckdb_path) as conn:
             try:
                 conn.execute(f"DROP TABLE IF EXISTS {qtbl}")
+                _distinct_dict.drop_dictionaries(conn, tbl)
                 dropped = 1
             except Exception:
                 dropped = 0
@@ -1969,7 +2015,7 @@ def introspect_local_schema():
             col_rows = conn.execute(
                 "SELECT schema_name, table_name, column_name, CAST(data_type AS VARCHAR) "
                 "FROM duckdb_columns() "
-                "WHERE schema_name NOT IN ('information_schema', 'pg_catalog') "
+                "WHERE schema_name NOT IN ('information_schema', 'pg_catalog', '_bayan') "
                 "  AND lower(table_name) NOT LIKE 'duckdb_%' "
                 "  AND lower(table_name) NOT LIKE 'sqlite_%' "
                 "  AND lower(table_name) NOT LIKE 'pragma_%' "
@@ -2013,14 +2059,14 @@ def list_local_tables_only():
             rows = conn.execute(
                 """
                 SELECT schema_name, table_name FROM duckdb_tables()
-                WHERE schema_name NOT IN ('information_schema', 'pg_catalog')
+                WHERE schema_name NOT IN ('information_schema', 'pg_catalog', '_bayan')
                   AND lower(table_name) NOT LIKE 'duckdb_%'
                   AND lower(table_name) NOT LIKE 'sqlite_%'
                   AND lower(table_name) NOT LIKE 'pragma_%'
                   AND lower(table_name) NOT IN ('sqlite_master','sqlite_temp_master','sqlite_schema','sqlite_temp_schema')
                 UNION ALL
                 SELECT schema_name, table_name FROM duckdb_views()
-                WHERE schema_name NOT IN ('information_schema', 'pg_catalog')
+                WHERE schema_name NOT IN ('information_schema', 'pg_catalog', '_bayan')
                   AND lower(table_name) NOT LIKE 'duckdb_%'
                   AND lower(table_name) NOT LIKE 'sqlite_%'
                 ORDER BY schema_name, table_name
@@ -2182,7 +2228,7 @@ def introspect_schema(ds_id: str, db: Session = Depends(get_db)):
                         col_rows = conn.execute(
                             "SELECT schema_name, table_name, column_name, CAST(data_type AS VARCHAR) "
                             "FROM duckdb_columns() "
-                            "WHERE schema_name NOT IN ('information_schema', 'pg_catalog') "
+                            "WHERE schema_name NOT IN ('information_schema', 'pg_catalog', '_bayan') "
                             "  AND lower(table_name) NOT LIKE 'duckdb_%' "
                             "  AND lower(table_name) NOT LIKE 'sqlite_%' "
                             "  AND lower(table_name) NOT LIKE 'pragma_%' "
@@ -2247,7 +2293,7 @@ def introspect_schema(ds_id: str, db: Session = Depends(get_db)):
             col_rows = conn.execute(
                 "SELECT schema_name, table_name, column_name, CAST(data_type AS VARCHAR) "
                 "FROM duckdb_columns() "
-                "WHERE schema_name NOT IN ('information_schema', 'pg_catalog') "
+                "WHERE schema_name NOT IN ('information_schema', 'pg_catalog', '_bayan') "
                 "  AND lower(table_name) NOT LIKE 'duckdb_%' "
                 "  AND lower(table_name) NOT LIKE 'sqlite_%' "
                 "  AND lower(table_name) NOT LIKE 'pragma_%' "
@@ -2492,14 +2538,14 @@ def list_tables_only(ds_id: str, db: Session = Depends(get_db)):
                 rows = conn.execute(
                     """
                     SELECT table_schema, table_name FROM information_schema.tables
-                    WHERE table_schema <> 'information_schema'
+                    WHERE table_schema NOT IN ('information_schema', '_bayan')
                       AND lower(table_name) NOT LIKE 'duckdb_%'
                       AND lower(table_name) NOT LIKE 'sqlite_%'
                       AND lower(table_name) NOT LIKE 'pragma_%'
                       AND lower(table_name) NOT IN ('sqlite_master','sqlite_temp_master','sqlite_schema','sqlite_temp_schema')
                     UNION
                     SELECT table_schema, table_name FROM information_schema.views
-                    WHERE table_schema <> 'information_schema'
+                    WHERE table_schema NOT IN ('information_schema', '_bayan')
                       AND lower(table_name) NOT LIKE 'duckdb_%'
                       AND lower(table_name) NOT LIKE 'sqlite_%'
                       AND lower(table_name) NOT LIKE 'pragma_%'
@@ -2558,14 +2604,14 @@ def list_tables_only(ds_id: str, db: Session = Depends(get_db)):
             rows = conn.execute(
                 """
                 SELECT schema_name, table_name FROM duckdb_tables()
-                WHERE schema_name NOT IN ('information_schema', 'pg_catalog')
+                WHERE schema_name NOT IN ('information_schema', 'pg_catalog', '_bayan')
                   AND lower(table_name) NOT LIKE 'duckdb_%'
                   AND lower(table_name) NOT LIKE 'sqlite_%'
                   AND lower(table_name) NOT LIKE 'pragma_%'
                   AND lower(table_name) NOT IN ('sqlite_master','sqlite_temp_master','sqlite_schema','sqlite_temp_schema')
                 UNION ALL
                 SELECT schema_name, view_name AS table_name FROM duckdb_views()
-                WHERE schema_name NOT IN ('information_schema', 'pg_catalog')
+                WHERE schema_name NOT IN ('information_schema', 'pg_catalog', '_bayan')
                   AND lower(view_name) NOT LIKE 'duckdb_%'
                   AND lower(view_name) NOT LIKE 'sqlite_%'
                 ORDER BY schema_name, table_name
@@ -2592,14 +2638,14 @@ def list_tables_only(ds_id: str, db: Session = Depends(get_db)):
                         rows = conn2.execute(
                             """
                             SELECT schema_name, table_name FROM duckdb_tables()
-                            WHERE schema_name NOT IN ('information_schema', 'pg_catalog')
+                            WHERE schema_name NOT IN ('information_schema', 'pg_catalog', '_bayan')
                               AND lower(table_name) NOT LIKE 'duckdb_%'
                               AND lower(table_name) NOT LIKE 'sqlite_%'
                               AND lower(table_name) NOT LIKE 'pragma_%'
                               AND lower(table_name) NOT IN ('sqlite_master','sqlite_temp_master','sqlite_schema','sqlite_temp_schema')
                             UNION ALL
                             SELECT schema_name, view_name AS table_name FROM duckdb_views()
-                            WHERE schema_name NOT IN ('information_schema', 'pg_catalog')
+                            WHERE schema_name NOT IN ('information_schema', 'pg_catalog', '_bayan')
                               AND lower(view_name) NOT LIKE 'duckdb_%'
                               AND lower(view_name) NOT LIKE 'sqlite_%'
                             ORDER BY schema_name, table_name
@@ -2697,6 +2743,7 @@ def delete_ds(ds_id: str, request: Request, actorId: str | None = Depends(actor_
         _require_ds_perm(db, actorId, ds, Permission.EDIT)
         db.delete(ds)
         db.commit()
+        _forget_credentials(ds_id)
         audit("datasource.delete", actor_id=actorId, target_type="datasource", target_id=ds_id, request=request)
     # Idempotent: return 204 even if it wasn't found
     return Response(status_code=204)
@@ -2805,6 +2852,7 @@ def import_datasources(payload: DatasourceImportRequest, request: Request, actor
                 existing.options_json = "{}"
             db.add(existing)
             db.commit()
+            _forget_credentials(existing.id)
             db.refresh(existing)
             updated += 1
             out.append(DatasourceOut.model_validate(existing))
@@ -3060,6 +3108,7 @@ def import_sql_commit(
                         elif if_exists == "replace":
                             duck.execute(f"DROP TABLE IF EXISTS {qtbl}")
                             tbl_exists = False
+                    _distinct_dict.drop_dictionaries(duck, table_name)
                     created = False
                     while True:
                         batch = stream_res.fetchmany(50000)
@@ -3126,6 +3175,7 @@ def import_sql_commit(
             else:
                 conn.execute(f"CREATE TABLE {qtbl} AS ({wrapped})")
             row_count = conn.execute(f"SELECT COUNT(*) FROM {qtbl}").fetchone()[0]
+            _distinct_dict.drop_dictionaries(conn, table_name)
         return {"ok": True, "tableName": table_name, "rowCount": int(row_count)}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Import failed: {e}")
@@ -3307,6 +3357,7 @@ async def import_file_commit(
                 else:
                     conn.execute(f"CREATE TABLE {qtbl} AS {csv_src}")
             row_count = conn.execute(f"SELECT COUNT(*) FROM {qtbl}").fetchone()[0]
+            _distinct_dict.drop_dictionaries(conn, table_name)
         return {"ok": True, "tableName": table_name, "rowCount": int(row_count)}
     except HTTPException:
         raise
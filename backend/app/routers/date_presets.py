@@ -7,7 +7,8 @@ from typing import Optional
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, field_validator
 
-from ..date_presets import PresetConfig, materialize_holidays, resolve_preset
+from ..date_presets import PresetConfig, resolve_preset
+from ..holiday_calendar import load_holiday_dates
 from ..authz import require_user
 
 router = APIRouter(prefix="/date-presets", tags=["date-presets"])
@@ -69,27 +70,9 @@ def _format_label(gte: datetime, lt: datetime) -> str:
 
 
 def _load_holidays() -> frozenset[str]:
-    """Load materialized holidays for preview (reuses query.py pattern)."""
+    """Load materialized holidays for preview (shared process-wide calendar)."""
     try:
-        from ..models import HolidayRule, SessionLocal
-        db = SessionLocal()
-        try:
-            rules = db.query(HolidayRule).all()
-            rule_dicts = [
-                {
-                    "rule_type": r.rule_type,
-                    "specific_date": r.specific_date,
-                    "recurrence_expr": r.recurrence_expr,
-                }
-                for r in rules
-            ]
-            year = datetime.now().year
-            all_dates: set[str] = set()
-            for y in (year - 1, year, year + 1):
-                all_dates.update(materialize_holidays(rule_dicts, y))
-            return frozenset(all_dates)
-        finally:
-            db.close()
+        return load_holiday_dates()
     except Exception:
         return frozenset()
 
@@ -12,6 +12,8 @@ from sqlalchemy.orm import Session
 
 from ..models import HolidayRule, SessionLocal, User
 from ..authz import require_user, require_admin
+from ..holiday_calendar import invalidate_holiday_calendar
+from ..dim_date import invalidate_dim_date
 
 router = APIRouter(prefix="/holidays", tags=["holidays"])
 
@@ -55,6 +57,8 @@ def create_holiday(body: HolidayRuleCreate, db: Session = Depends(_get_db), admi
     rule = HolidayRule(id=str(uuid4()), **body.model_dump())
     db.add(rule)
     db.commit()
+    invalidate_holiday_calendar()
+    invalidate_dim_date()
     db.refresh(rule)
     return rule
 
@@ -67,6 +71,8 @@ def update_holiday(rule_id: str, body: HolidayRuleCreate, db: Session = Depends(
     for k, v in body.model_dump().items():
         setattr(rule, k, v)
     db.commit()
+    invalidate_holiday_calendar()
+    invalidate_dim_date()
     db.refresh(rule)
     return rule
 
@@ -78,6 +84,8 @@ def delete_holiday(rule_id: str, db: Session = Depends(_get_db), admin: User | N
         raise HTTPException(404, "Holiday rule not found")
     db.delete(rule)
     db.commit()
+    invalidate_holiday_calendar()
+    invalidate_dim_date()
     return {"ok": True}
 
 
@@ -99,4 +107,6 @@ async def upload_holidays(file: UploadFile = File(...), db: Session = Depends(_g
         db.add(rule)
         created.append(rule.id)
     db.commit()
+    invalidate_holiday_calendar()
+    invalidate_dim_date()
     return {"created": len(created), "ids": created}
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import time
-from typing import Optional, Any, Dict, Tuple
+from typing import Optional, Any, Callable, Dict, Tuple
 import decimal
 import binascii
 import re
@@ -13,31 +13,46 @@ import math
 import threading
 import asyncio
 import functools
+import contextlib
 
 logger = logging.getLogger(__name__)
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 
-from ..db import get_active_duck_path, get_duckdb_engine, get_engine_from_dsn, open_duck_native, _replay_attaches_on_conn
-from ..sqlgen import build_sql, build_distinct_sql
-from ..sqlgen_glot import SQLGlotBuilder, should_use_sqlglot
+from ..db import get_active_duck_path, get_duckdb_engine, get_engine_from_dsn, get_engine_for_datasource, open_duck_native, _replay_attaches_on_conn
+from ..sqlgen import build_sql, build_distinct_sql, build_pivot_grouping, build_moving_averages
+from ..sqlgen_glot import SQLGlotBuilder, should_use_sqlglot, TOP_N_FOLD, TOP_N_OTHERS_LABEL
 from ..sql_ident import quote_ident, quote_source, build_attach_string, scrub as _scrub_secrets
-from ..sql_dialect_normalizer import normalize_sql_expression
+from ..sql_dialect_normalizer import normalize_sql_expression, to_positional as _to_positional
 import json
 from dateutil import parser as date_parser
 from ..models import SessionLocal, Datasource, User, DatasourceShare, Dashboard, get_share_link_by_public, verify_share_link_token
 from ..authz import is_admin as is_admin_user
 from ..auth import actor_id_optional
-from ..schemas import QueryRequest, QueryResponse, QuerySpecRequest, DistinctRequest, DistinctResponse, PivotRequest
-from ..security import decrypt_text
+from ..schemas import QueryRequest, QueryResponse, QuerySpecRequest, DistinctRequest, DistinctResponse, DistinctBatchRequest, DistinctBatchResponse, PivotRequest, PivotResponse
+from ..security import decrypt_credential, credential_version
 from ..config import settings
 from urllib.parse import unquote, urlparse
 from ..metrics import counter_inc, summary_observe, gauge_inc, gauge_dec
 from ..metrics_state import touch_actor
+from .. import column_semantics as _colsem
+from .. import distinct_dictionary as _distinct_dict
+from .. import approximate as _approx
+from .. import period_average as _period_average
+from .. import dim_date as _dim_date
+from ..pivot_matrix import to_matrix as to_pivot_matrix
+from ..downsample import downsample_rows
 from ..query_pool import get_query_executor
+from ..prepared import duck_execute as _duck_execute_prepared
+from .. import sql_pushdown as _sql_pushdown
+from .. import spec_pruning as _spec_pruning
+from .. import materialized as _materialized
+from .. import filter_fragments as _filter_fragments
+from .. import value_sets as _value_sets
 from ..cancellation import CancelToken, set_current_token
 
 try:
@@ -96,7 +111,7 @@ except Exception:
 # Delegates to the composable date_presets module.  Supports both legacy
 # string presets and new structured PresetConfig dicts.
 from ..date_presets import resolve_date_presets as _resolve_date_presets_impl
-from ..date_presets import materialize_holidays as _materialize_holidays
+from ..holiday_calendar import load_holiday_dates
 
 
 def _strip_ui_op_keys(where: dict | None) -> dict | None:
@@ -106,34 +121,31 @@ def _strip_ui_op_keys(where: dict | None) -> dict | None:
     return {k: v for k, v in where.items() if not (isinstance(k, str) and k.endswith("__op"))}
 
 
-def _load_holidays() -> frozenset[str]:
-    """Load materialized holiday dates for current + surrounding years."""
-    from ..models import HolidayRule, SessionLocal
-    from datetime import datetime as _dt
-    db = SessionLocal()
+def _load_holidays(region: Optional[str] = None) -> frozenset[str]:
+    """Materialized holiday dates for current + surrounding years (process-wide cache)."""
+    return load_holiday_dates(region)
+
+
+def _holiday_region(ds: Any) -> Optional[str]:
+    """Holiday region a datasource names in its options (``holidayRegion``), if any."""
     try:
-        rules = db.query(HolidayRule).all()
-        rule_dicts = [
-            {
-                "rule_type": r.rule_type,
-                "specific_date": r.specific_date,
-                "recurrence_expr": r.recurrence_expr,
-            }
-            for r in rules
-        ]
-        year = _dt.now().year
-        # Materialize for current year and adjacent years (for cross-year presets)
-        all_dates: set[str] = set()
-        for y in (year - 1, year, year + 1):
-            all_dates.update(_materialize_holidays(rule_dicts, y))
-        return frozenset(all_dates)
-    finally:
-        db.close()
+        opts = json.loads(getattr(ds, 'options_json', None) or '{}')
+    except Exception:
+        return None
+    region = (opts or {}).get("holidayRegion") if isinstance(opts, dict) else None
+    return (str(region).strip() or None) if region else None
 
 
 def _resolve_date_presets(where: dict | None) -> dict | None:
-    """Thin wrapper delegating to the date_presets module with holidays support."""
-    return _resolve_date_presets_impl(where, holidays_loader=_load_holidays)
+    """Thin wrapper delegating to the date_presets module with holidays support.
+
+    Resolutions are shared across widgets for the day (app.filter_fragments).
+    """
+    return _filter_fragments.resolve_presets(
+        where,
+        lambda w: _resolve_date_presets_impl(w, holidays_loader=_load_holidays),
+        key_extra=lambda: hash(_load_holidays()),
+    )
 
 
 # SQLGlot helper functions (module-level to be reusable across endpoints)
@@ -177,8 +189,11 @@ def _build_expr_map_helper(ds: Any, source_name: str, ds_type: str, _apply_scope
         # Normalize available columns for comparison
         avail_lower = {c.lower() for c in (available_columns or set())} if available_columns else None
         
-        # From customColumns
-        custom_cols = ds_transforms.get("customColumns") or []
+        # From customColumns (materialized ones already stored on the table are plain columns)
+        custom_cols = _materialized.drop_stored(
+            ds_transforms.get("customColumns") or [],
+            _materialized.with_stored(available_columns, source_name, ds_transforms.get("customColumns")),
+        )
         for col in custom_cols:
             if isinstance(col, dict) and col.get("name") and col.get("expr"):
                 # If available_columns provided, validate that all referenced columns exist
@@ -494,7 +509,7 @@ def _apply_duck_mysql_attachments(conn, attachments: list, db_session) -> None:
                 conn.execute(f"LOAD {attach_type}")
             except Exception:
                 pass
-            dsn = decrypt_text(enc)
+            dsn = decrypt_credential(ref_ds_id, enc)
             info = _parse_mysql_dsn(dsn)
             if not info.get('host'):
                 continue
@@ -795,10 +810,15 @@ def _engine_for_datasource(db: Session, datasource_id: Optional[str], actor_id:
         if "duckdb" in typ:
             return get_duckdb_engine()
         raise HTTPException(status_code=400, detail="Datasource has no connection URI")
-    dsn = decrypt_text(ds_info.get("connection_encrypted") or "")
-    if not dsn:
+    enc = ds_info.get("connection_encrypted") or ""
+    eng = get_engine_for_datasource(
+        str(ds_info.get("id") or datasource_id),
+        credential_version(enc),
+        lambda: decrypt_credential(str(ds_info.get("id") or datasource_id), enc),
+    )
+    if eng is None:
         raise HTTPException(status_code=400, detail="Invalid connection secret")
-    return get_engine_from_dsn(dsn)
+    return eng
 
 
 # --- Simple in-memory TTL cache (process-local) ---
@@ -861,7 +881,7 @@ def bump_result_cache_generation() -> None:
 
 def _cache_key(prefix: str, datasource_id: Optional[str], sql_inner: str, params: Dict[str, Any]) -> str:
     ds = datasource_id or "__local__"
-    items = ",".join(f"{k}={repr(v)}" for k, v in sorted(params.items()))
+    items = ",".join(f"{k}={_value_sets.key_repr(v)}" for k, v in sorted(params.items()))
     return f"{prefix}|g{_cache_generation()}|{ds}|{sql_inner}|{items}"
 
 
@@ -941,6 +961,132 @@ def _ds_cache_set(ds_id: str, data: dict) -> None:
     _ds_cache[str(ds_id)] = (time.time(), data)
 
 
+# --- Date-column semantics (memoized probes, see app/column_semantics.py) ---
+def _probe_column_types(db: Session, ds_id: Optional[str], source: str, actor_id: Optional[str] = None) -> list[tuple[str, str]]:
+    """Declared (name, type) pairs for *source*: DESCRIBE on local DuckDB,
+    INFORMATION_SCHEMA.COLUMNS on remote engines. Empty list on failure."""
+    if not ds_id:
+        try:
+            with open_duck_native() as conn:
+                rows = conn.execute(f"DESCRIBE SELECT * FROM {quote_source(source, 'duckdb')}").fetchall()
+            return [(str(r[0]), str(r[1])) for r in rows]
+        except Exception as e:
+            logger.debug(f"[ColSem] DESCRIBE failed for {source}: {e}")
+            return []
+    parts = str(source or '').replace('`', '').replace('"', '').replace('[', '').replace(']', '').split('.')
+    tbl = parts[-1].strip().replace("'", "''")
+    sch = parts[-2].strip().replace("'", "''") if len(parts) > 1 else None
+    sql = (
+        "SELECT COLUMN_NAME, DATA_TYPE FROM information_schema.COLUMNS "
+        f"WHERE TABLE_NAME = '{tbl}'" + (f" AND TABLE_SCHEMA = '{sch}'" if sch else "")
+    )
+    try:
+        res = run_query(QueryRequest(sql=sql, datasourceId=ds_id, limit=1000), db, actorId=actor_id)
+        return [(str(r[0]), str(r[1])) for r in (res.rows or [])]
+    except Exception as e:
+        logger.warning(f"[ColSem] INFORMATION_SCHEMA probe failed for {source}: {e}")
+        return []
+
+
+def _date_column_semantics(db: Session, ds_id: Optional[str], source: str, column: str, dialect: str, actor_id: Optional[str] = None) -> Optional[_colsem.ColumnSemantics]:
+    """Semantics of a date field (timestamp / epoch+unit / YYYYMMDD / string+format).
+
+    Served from the process cache; probes the table types and a small value
+    sample only the first time a (datasource, table, column) is seen after a sync.
+    """
+    try:
+        sem = _colsem.get_column(ds_id, source, column)
+        if sem is None and _colsem.get_table(ds_id, source) is None:
+            if _colsem.recently_failed(ds_id, source):
+                return None
+            rows = _probe_column_types(db, ds_id, source, actor_id)
+            if not rows:
+                _colsem.mark_failed(ds_id, source)
+                return None
+            _colsem.put_table(ds_id, source, rows)
+            sem = _colsem.get_column(ds_id, source, column)
+        if sem is None or sem.sampled:
+            return sem
+        qd = 'duckdb' if not ds_id else dialect
+        qcol, qsrc = quote_ident(sem.name, qd), quote_source(source, qd)
+        if sem.kind == _colsem.NUMERIC:
+            res = run_query(QueryRequest(sql=f"SELECT MAX({qcol}) AS m FROM {qsrc}", datasourceId=ds_id, limit=1), db, actorId=actor_id)
+            sem = _colsem.classify_int_sample(sem, res.rows[0][0] if res.rows else None)
+        elif sem.kind == _colsem.STRING:
+            res = run_query(QueryRequest(sql=f"SELECT {qcol} FROM {qsrc} WHERE {qcol} IS NOT NULL", datasourceId=ds_id, limit=20), db, actorId=actor_id)
+            sem = _colsem.classify_string_sample(sem, [r[0] for r in (res.rows or [])])
+        _colsem.put_column(ds_id, source, sem)
+        logger.debug(f"[ColSem] {source}.{column}: kind={sem.kind} unit={sem.epoch_unit} fmt={sem.date_format}")
+        return sem
+    except Exception as e:
+        logger.warning(f"[ColSem] date-column probe failed for {source}.{column}: {e}")
+        return None
+
+
+def _filter_column_types(db: Session, ds_id: Optional[str], source: str, actor_id: Optional[str] = None) -> Callable[[str], Optional[str]]:
+    """Lazy ``column -> declared type`` lookup for value-list filters on *source*.
+
+    Long IN lists become semi-joins whose values must be cast to the column's
+    type (see app/value_sets.py). The table's types come from the same
+    memoized probe as the date-column semantics, fetched on first use only.
+    """
+    state: Dict[str, Any] = {}
+
+    def lookup(column: str) -> Optional[str]:
+        if "cols" not in state:
+            cols = _colsem.get_table(ds_id, source)
+            if cols is None and _colsem.recently_failed(ds_id, source):
+                cols = {}
+            elif cols is None:
+                rows = _probe_column_types(db, ds_id, source, actor_id)
+                if rows:
+                    cols = _colsem.put_table(ds_id, source, rows)
+                else:
+                    _colsem.mark_failed(ds_id, source)
+                    cols = {}
+            state["cols"] = cols
+        sem = state["cols"].get(str(column or "").strip().strip('`"[]').lower())
+        return sem.data_type if sem is not None else None
+
+    return lookup
+
+
+_DATEPART_KEY_RE = re.compile(r"^(.*)\s*\((Year|Quarter|Month|Month Name|Month Short|Week|Day|Day Name|Day Short)\)$", re.IGNORECASE)
+
+
+def _coerce_datepart_value(key: str, val: Any) -> Any:
+    """Filter value cast to the type a derived ``"Col (Part)"`` key evaluates to."""
+    m = _DATEPART_KEY_RE.match(str(key))
+    if not m or val is None:
+        return val
+    if isinstance(val, (list, tuple)):
+        return [_coerce_datepart_value(key, v) for v in val]
+    if m.group(2).strip().lower() in ('year', 'quarter', 'month', 'week', 'day'):
+        try:
+            return int(val)
+        except (ValueError, TypeError):
+            return val
+    return str(val)
+
+
+def _spec_where(
+    where: Optional[Dict[str, Any]],
+    dialect: str,
+    lhs: Callable[[str], str],
+    types: Optional[Callable[[str], Optional[str]]] = None,
+    fold_case: Optional[Callable[[str], bool]] = None,
+) -> tuple[list[str], Dict[str, Any]]:
+    """Spec-path WHERE clauses and binds through the shared fragment compiler
+    (app/filter_fragments.py), the same predicates run_pivot emits.
+
+    Derived date-part values are coerced first; ``key__op IS NULL`` tests the base column.
+    """
+    coerced = {k: _coerce_datepart_value(str(k).split("__", 1)[0], v) for k, v in (where or {}).items()}
+    return _filter_fragments.compile_where(
+        coerced, dialect, lhs, null_lhs=lambda k: lhs(str(k).split("__", 1)[0]), types=types, fold_case=fold_case,
+    )
+
+
 # --- Helpers ---
 # Pure result-shaping helpers extracted to app/query_shaping.py (spec 11, Phase A).
 # Re-imported here so existing bare-name call sites keep working unchanged.
@@ -1387,7 +1533,7 @@ def _resolve_table_name(ds: Any, source_table_id: str | None, source_name: str |
             joins=__joins_eff,
             defaults={},
             limit=None,
-            base_cols=__cols,
+            base_cols=_materialized.with_stored(__cols, payload.source, ds_transforms.get("customColumns")),
         )
         # Handle different return value formats (3 or 4 elements)
         if len(result) == 3:
@@ -1742,7 +1888,7 @@ async def run_query_endpoint(
 # NOTE: Sync implementation. Internal helpers in this module call this
 # directly (they're already running on the heavy-query pool thread, so
 # nested calls don't need to round-trip through the executor again).
-def run_query(payload: QueryRequest, db: Session = Depends(get_db), actorId: Optional[str] = None, publicId: Optional[str] = None, token: Optional[str] = None) -> QueryResponse:
+def run_query(payload: QueryRequest, db: Session = Depends(get_db), actorId: Optional[str] = None, publicId: Optional[str] = None, token: Optional[str] = None, pushdown: bool = False) -> QueryResponse:
     try:
         touch_actor(actorId)
     except Exception:
@@ -1794,6 +1940,10 @@ def run_query(payload: QueryRequest, db: Session = Depends(get_db), actorId: Opt
     # Important: some drivers (e.g., DuckDB via duckdb-engine) are unreliable with
     # bound parameters in LIMIT/OFFSET. Inline safe integer literals instead.
     sql_inner = payload.sql
+    # Move base-column filters below transform / custom-column subqueries. Only for SQL
+    # the spec / pivot builders generated (pushdown=True); raw user SQL runs as written.
+    if pushdown:
+        sql_inner = _sql_pushdown.maybe_pushdown(sql_inner, "duckdb" if route_duck else ds_type_lower)
     limit_lit = int(payload.limit) if payload.limit is not None else None
     offset_lit = int(payload.offset or 0)
     # Clamp limit to a safe maximum (only when a limit is set)
@@ -1808,7 +1958,7 @@ def run_query(payload: QueryRequest, db: Session = Depends(get_db), actorId: Opt
     __heavy = bool((limit_lit is None or limit_lit >= 5000) or bool(payload.includeTotal))
 
     # Collect named params referenced in the inner SQL
-    name_order = [m.group(1) for m in re.finditer(r":([A-Za-z_][A-Za-z0-9_]*)", sql_inner)]
+    inner_qm_all, name_order = _to_positional(sql_inner)
     name_set = set(name_order)
 
     # Build params for data query (exclude pagination since we inlined them)
@@ -1858,7 +2008,7 @@ def run_query(payload: QueryRequest, db: Session = Depends(get_db), actorId: Opt
                 # If this is a DuckDB datasource with a connection URI, try to extract the file path; else default to local
                 if ds_obj and getattr(ds_obj, "connection_encrypted", None):
                     try:
-                        dsn = decrypt_text(ds_obj.connection_encrypted)
+                        dsn = decrypt_credential(ds_obj.id, ds_obj.connection_encrypted)
                         p = urlparse(dsn) if dsn else None
                         try:
                             db_path = get_active_duck_path()
@@ -1957,7 +2107,15 @@ def run_query(payload: QueryRequest, db: Session = Depends(get_db), actorId: Opt
                             pass
 
             # Replace named params in the inner SQL with positional '?' for duckdb
-            inner_qm = re.sub(r":([A-Za-z_][A-Za-z0-9_]*)", "?", sql_inner)
+            inner_qm = inner_qm_all
+            # Opt-in approximate mode (sampling / sketches) for exploratory widgets
+            _approx_scope = _approx.active()
+            _data_key_sql = sql_inner
+            if _approx_scope is not None:
+                _approx_sql = _approx_scope.rewrite(inner_qm)
+                if _approx_sql != inner_qm:
+                    inner_qm = _approx_sql
+                    _data_key_sql = "approx:" + _approx_sql
             # Hoist ORDER BY from subquery to outer LIMIT/OFFSET so sort applies to the full
             # dataset before pagination (ORDER BY inside a subquery is not guaranteed by SQL
             # standard and may be silently dropped by the query optimizer).
@@ -1975,9 +2133,11 @@ def run_query(payload: QueryRequest, db: Session = Depends(get_db), actorId: Opt
                 sql_native = f"SELECT * FROM ({inner_qm}) AS _q LIMIT {limit_lit} OFFSET {offset_lit}"
             # Build positional values list in order of occurrence
             values = [params.get(nm) for nm in name_order]
+            # Long IN lists travel as one list each and are read as registered relations
+            _fv_lists = _value_sets.staged(inner_qm, params)
 
             # Cache lookup for data
-            key = _cache_key("sql", cache_ds, sql_inner, params)
+            key = _cache_key("sql", cache_ds, _data_key_sql, params)
             cached = _cache_get(key)
             if cached:
                 cols, rows = cached
@@ -2017,14 +2177,15 @@ def run_query(payload: QueryRequest, db: Session = Depends(get_db), actorId: Opt
                             logger.debug(f"[run_query/duck] Capped remote scan to {_inner_limit} rows for JOIN preview")
                             sql_native = _rewritten
                 logger.debug(f"[run_query/duck] SQL (first 800):\n{sql_native[:800]}")
-                with open_duck_native(db_path) as conn:
+                with open_duck_native(db_path) as conn, _value_sets.duck_relations(conn, _fv_lists):
                     _apply_duck_mysql_attachments(conn, _remote_attachments, db)
                     try:
                         _replay_attaches_on_conn(conn)
                     except Exception:
                         pass
                     try:
-                        cur = conn.execute(sql_native, values)
+                        # A prepared plan would keep reading the relation it was planned against
+                        cur = conn.execute(sql_native, values) if _fv_lists else _duck_execute_prepared(conn, sql_native, values)
                     except Exception as _duck_exec_err:
                         logger.warning(f"[run_query/duck] EXECUTE ERROR: {type(_duck_exec_err).__name__}: {_duck_exec_err}")
                         raise
@@ -2049,10 +2210,12 @@ def run_query(payload: QueryRequest, db: Session = Depends(get_db), actorId: Opt
                         logger.warning(f"[run_query/duck] FETCHMANY ERROR: {type(_fetch_err).__name__}: {_fetch_err}")
                         raise
                 _cache_set(key, cols, rows)
+            if _approx_scope is not None:
+                cols, rows = _approx_scope.collect(cols, rows)
 
             total_rows = None
             if payload.includeTotal:
-                cnt_key = _cache_key("count", cache_ds, sql_inner, params)
+                cnt_key = _cache_key("count", cache_ds, _data_key_sql, params)
                 cached_cnt = _cache_get(cnt_key)
                 if cached_cnt:
                     cnt_rows = cached_cnt[1]
@@ -2070,13 +2233,16 @@ def run_query(payload: QueryRequest, db: Session = Depends(get_db), actorId: Opt
                     except Exception:
                         pass
                     count_text_qm = f"SELECT COUNT(*) AS __cnt FROM ({inner_qm}) AS _q"
-                    with open_duck_native(db_path) as conn:
+                    with open_duck_native(db_path) as conn, _value_sets.duck_relations(conn, _fv_lists):
                         _apply_duck_mysql_attachments(conn, _remote_attachments, db)
                         try:
                             _replay_attaches_on_conn(conn)
                         except Exception:
                             pass
-                        cur = conn.execute(count_text_qm, values)
+                        if _fv_lists:
+                            cur = conn.execute(count_text_qm, values)
+                        else:
+                            cur = _duck_execute_prepared(conn, count_text_qm, values)
                         cnt_val = cur.fetchone()
                     total_rows = int(cnt_val[0]) if cnt_val and cnt_val[0] is not None else 0
                     _cache_set(cnt_key, ["__cnt"], [[total_rows]])
@@ -2208,8 +2374,15 @@ def run_query(payload: QueryRequest, db: Session = Depends(get_db), actorId: Opt
                     sql_text = text(f"SELECT * FROM ({_ob_base2}) AS _q ORDER BY {_ob_clause2} LIMIT {limit_lit} OFFSET {offset_lit}")
                 else:
                     sql_text = text(f"SELECT * FROM ({_si}) AS _q LIMIT {limit_lit} OFFSET {offset_lit}")
+            # Long IN lists are staged once per attempt as session temp tables
+            _fv_pending = _value_sets.staged(sql_inner, params)
+            _bind = _value_sets.bind_params(params, _fv_pending)
             try:
-                with engine.connect() as conn:
+                with engine.connect() as conn, contextlib.ExitStack() as _fv_stack:
+                    def _stage_lists() -> None:
+                        if _fv_pending:
+                            _fv_stack.enter_context(_value_sets.remote_temp_tables(conn, engine.dialect.name, dict(_fv_pending)))
+                            _fv_pending.clear()
                     # Cache lookup for data
                     key = _cache_key("sql", payload.datasourceId, sql_inner, params)
                     cached = _cache_get(key)
@@ -2233,7 +2406,8 @@ def run_query(payload: QueryRequest, db: Session = Depends(get_db), actorId: Opt
                                 conn.execute(text("SET LOCK_TIMEOUT 120000"))
                         except Exception:
                             pass
-                        result = conn.execution_options(stream_results=True).execute(sql_text, params)
+                        _stage_lists()
+                        result = conn.execution_options(stream_results=True).execute(sql_text, _bind)
                         raw_rows = result.fetchall()
                         cols = list(result.keys())
                         rows = [[_json_safe_cell(x) for x in r] for r in raw_rows]
@@ -2272,7 +2446,8 @@ def run_query(payload: QueryRequest, db: Session = Depends(get_db), actorId: Opt
                                 count_text = text(f"SELECT COUNT(*) AS __cnt FROM ({sql_inner}) AS _q")
                             else:
                                 count_text = text(f"SELECT COUNT(*) AS __cnt FROM ({sql_inner}) AS _q")
-                            cnt_res = conn.execute(count_text, params)
+                            _stage_lists()
+                            cnt_res = conn.execute(count_text, _bind)
                             cnt_val = cnt_res.scalar_one_or_none()
                             total_rows = int(cnt_val) if cnt_val is not None else 0
                             _cache_set(count_key, ["__cnt"], [[total_rows]])
@@ -2344,7 +2519,145 @@ async def run_query_spec_endpoint(
     _enforce_rate_limit(request, actorId, "spec")
     return await _run_cancellable_in_pool(
         request,
-        functools.partial(run_query_spec, payload, db, actorId, publicId, token),
+        functools.partial(_execute_spec_request, payload, db, actorId, publicId, token),
+    )
+
+
+try:
+    DOWNSAMPLE_FETCH_LIMIT = int(os.environ.get("DOWNSAMPLE_FETCH_LIMIT", "500000") or "500000")
+except Exception:
+    DOWNSAMPLE_FETCH_LIMIT = 500000
+
+
+def _legacy_top_n(sql: str, spec: Any, ds_type: str, agg: Optional[str], limit: Optional[int], category: str = "x") -> str:
+    """Apply ``spec.topN`` to SQL from the string (non-SQLGlot) spec builder.
+
+    Same Others bucket as the SQLGlot path (``SQLGlotBuilder.wrap_top_n``);
+    an explicit *limit* caps N. SQL the wrapper cannot take is rejected
+    rather than returned without the cut.
+    """
+    n = min(int(spec.topN), int(limit)) if limit and limit > 0 else int(spec.topN)
+    per_series = bool(spec.topNPerSeries or spec.series) and category == "x"
+    try:
+        return SQLGlotBuilder(dialect=ds_type).wrap_top_n(
+            sql, n, category=category, partition=["legend"] if per_series else None,
+            fold=TOP_N_FOLD.get(str(agg or "count").lower()), others_label=spec.othersLabel or TOP_N_OTHERS_LABEL,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"topN is not supported for this spec: {e}")
+
+
+def _spec_fetch_limit(limit: Optional[int], max_points: Optional[int]) -> Optional[int]:
+    """Row limit for a spec: downsampling needs the whole series, up to
+    DOWNSAMPLE_FETCH_LIMIT, unless the caller bounded the request itself."""
+    if not max_points:
+        return limit
+    return DOWNSAMPLE_FETCH_LIMIT if not limit else min(limit, DOWNSAMPLE_FETCH_LIMIT)
+
+
+def _execute_spec_request(payload: QuerySpecRequest, db: Session, actorId: Optional[str], publicId: Optional[str], token: Optional[str]) -> QueryResponse:
+    """run_query_spec plus the HTTP-level options: the approximate scope (set
+    inside the pool worker) and the ``maxPoints`` downsampling fallback."""
+    with _approx.approximate_scope(payload.approximate, payload.samplePercent) as scope:
+        res = _approx.annotate(run_query_spec(payload, db, actorId, publicId, token), scope)
+    max_points = payload.spec.maxPoints
+    if max_points and res.rows:
+        # Min/max is usually done in SQL already (then this is a no-op); LTTB
+        # and the non-SQLGlot paths are reduced here.
+        n_in = len(res.rows)
+        res.rows = downsample_rows(res.columns, res.rows, max_points, payload.spec.downsample)
+        if len(res.rows) < n_in:
+            try:
+                counter_inc("query_downsampled_total", {"endpoint": "spec", "method": (payload.spec.downsample or "minmax").lower()})
+            except Exception:
+                pass
+    return res
+
+
+try:
+    PROGRESSIVE_SAMPLE_PERCENT = float(os.environ.get("PROGRESSIVE_SAMPLE_PERCENT", "1") or "1")
+except Exception:
+    PROGRESSIVE_SAMPLE_PERCENT = 1.0
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/spec/progressive")
+async def run_query_spec_progressive(
+    payload: QuerySpecRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    publicId: Optional[str] = None,
+    token: Optional[str] = None,
+    actorId: Optional[str] = Depends(actor_id_optional),
+    _guard: None = Depends(_spec_concurrency_guard),
+) -> StreamingResponse:
+    """Coarse-then-exact /query/spec over Server-Sent Events.
+
+    The exact query and an approximate one (sampled at ``samplePercent``,
+    default PROGRESSIVE_SAMPLE_PERCENT) start together on the query pool.
+    The stream emits ``partial`` with the approximate result if it lands
+    first, then ``final`` with the exact one; ``error`` carries
+    ``{status, detail}``. When the spec cannot be approximated the coarse
+    run already is exact, so it is sent as ``final`` and the duplicate is
+    cancelled. Each phase has its own CancelToken: when the client goes away
+    Starlette cancels the stream and both tokens interrupt their DuckDB
+    connections.
+    """
+    _enforce_rate_limit(request, actorId, "spec")
+    actorId = _resolve_public_actor(db, actorId, publicId, token)
+    exact_payload = payload.model_copy(update={"approximate": False})
+    coarse_payload = payload.model_copy(update={
+        "approximate": True,
+        "samplePercent": payload.samplePercent or PROGRESSIVE_SAMPLE_PERCENT,
+    })
+
+    def _phase(p: QuerySpecRequest) -> QueryResponse:
+        # Both phases run concurrently: never share one Session across threads.
+        sdb = SessionLocal()
+        try:
+            return _execute_spec_request(p, sdb, actorId, None, None)
+        finally:
+            sdb.close()
+
+    async def _events():
+        exact = asyncio.ensure_future(_run_cancellable_in_pool(None, functools.partial(_phase, exact_payload)))
+        coarse = asyncio.ensure_future(_run_cancellable_in_pool(None, functools.partial(_phase, coarse_payload)))
+        try:
+            done, _pending = await asyncio.wait({exact, coarse}, return_when=asyncio.FIRST_COMPLETED)
+            if coarse in done and not exact.done() and coarse.exception() is None:
+                res = coarse.result()
+                if not res.approximate:
+                    yield _sse("final", res.model_dump())
+                    return
+                try:
+                    counter_inc("query_progressive_partial_total", {"endpoint": "spec"})
+                except Exception:
+                    pass
+                yield _sse("partial", res.model_dump())
+            try:
+                res = await exact
+            except HTTPException as e:
+                yield _sse("error", {"status": e.status_code, "detail": e.detail})
+                return
+            except Exception as e:
+                logger.warning(f"[spec/progressive] exact phase failed: {type(e).__name__}: {e}")
+                yield _sse("error", {"status": 500, "detail": str(e)})
+                return
+            yield _sse("final", res.model_dump())
+        finally:
+            for t in (exact, coarse):
+                if not t.done():
+                    t.cancel()
+                elif not t.cancelled():
+                    t.exception()  # mark retrieved; a failed coarse phase is not an error
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -2413,7 +2726,7 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                     ds = candidate
                     break
                 try:
-                    dsn = decrypt_text(candidate.connection_encrypted or "")
+                    dsn = decrypt_credential(candidate.id, candidate.connection_encrypted or "")
                     if dsn and settings.duckdb_path in dsn:
                         ds = candidate
                         break
@@ -2452,6 +2765,7 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
 
     lim = payload.spec.limit if payload.spec.limit is not None else payload.limit
     off = payload.spec.offset if payload.spec.offset is not None else payload.offset
+    lim = _spec_fetch_limit(lim, payload.spec.maxPoints)
     
     # Resolve table ID to current name (supports table renaming)
     source_table_id = getattr(payload.spec, 'sourceTableId', None)
@@ -2530,9 +2844,6 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
         return quote_ident(name, ds_type)
     def _q_source(name: str) -> str:
         return quote_source(name, ds_type)
-    def _pname(base: str, suffix: str = "") -> str:
-        core = re.sub(r"[^A-Za-z0-9_]", "_", str(base or ''))
-        return f"w_{core}{suffix}"
     def _derived_lhs(name: str) -> str:
         """If name matches "Base (Part)", return dialect-specific expr; else return quoted ident.
         Parts: Year, Quarter, Month, Month Name, Month Short, Week, Day, Day Name, Day Short."""
@@ -2995,12 +3306,13 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
     agg = (spec.agg or "none").lower()
 
     # ── Period-average early exit ──────────────────────────────────────────────
-    # avg_daily  → numerator / COUNT(DISTINCT DATE(date_col))
-    # avg_wday   → numerator / COUNT(DISTINCT CASE WHEN is_workday THEN DATE(date_col) END)
-    # avg_weekly → numerator / COUNT(DISTINCT DATE_TRUNC('week', date_col))
-    # avg_monthly→ numerator / COUNT(DISTINCT DATE_TRUNC('month', date_col))
-    _PERIOD_AGG = frozenset({'avg_daily', 'avg_wday', 'avg_weekly', 'avg_monthly', 'last_daily_sum'})
-    if agg in _PERIOD_AGG:
+    # avg_daily  → numerator / number of days with data
+    # avg_wday   → numerator / number of working days with data (weekend mask + holidays)
+    # avg_weekly → numerator / number of weeks with data
+    # avg_monthly→ numerator / number of months with data
+    # last_daily_sum → numerator on the latest day in the window
+    # All compile to one single-scan query via app/period_average.py.
+    if agg in _period_average.PERIOD_AGGS:
         val_field = getattr(spec, 'y', None)
         date_field = getattr(spec, 'avgDateField', None)
         # Fall back to the first x-axis field when avgDateField was not explicitly set
@@ -3070,7 +3382,7 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                         joins=_pav_joins,
                         defaults={},
                         limit=None,
-                        base_cols=_pav_cols,
+                        base_cols=_materialized.with_stored(_pav_cols, spec.source, _pav_tr_filt.get("customColumns")),
                     )
                     _pav_sql = _pav_res[0] if _pav_res else ""
                     if _pav_sql:
@@ -3079,118 +3391,20 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
             except Exception as _pav_e:
                 logger.warning(f"[AvgPeriod] Transform subquery build failed: {_pav_e}")
 
-        # ── Auto-detect Unix timestamp columns via INFORMATION_SCHEMA ──────────
-        _avg_is_unix = False
-        if 'mysql' in d:
-            try:
-                _src_parts = str(spec.source or '').replace('`', '').split('.')
-                _tbl_name = _src_parts[-1].strip()
-                _sch_name = _src_parts[-2].strip() if len(_src_parts) > 1 else None
-                _col_lower = str(date_field).strip().strip('`"[]').lower()
-                _probe_sql = (
-                    f"SELECT DATA_TYPE FROM information_schema.COLUMNS "
-                    f"WHERE TABLE_NAME = '{_tbl_name}' AND LOWER(COLUMN_NAME) = '{_col_lower}'"
-                    + (f" AND TABLE_SCHEMA = '{_sch_name}'" if _sch_name else "")
-                    + " LIMIT 1"
-                )
-                _probe_res = run_query(QueryRequest(sql=_probe_sql, datasourceId=payload.datasourceId, limit=1), db)
-                if _probe_res.rows:
-                    _col_dtype = str(_probe_res.rows[0][0]).lower()
-                    _avg_is_unix = _col_dtype in ('int', 'bigint', 'tinyint', 'smallint', 'mediumint', 'integer')
-                    logger.debug(f"[AvgPeriod] Col '{date_field}' DATA_TYPE={_col_dtype!r} → is_unix={_avg_is_unix}")
-                else:
-                    logger.debug(f"[AvgPeriod] INFORMATION_SCHEMA probe returned no rows for col '{date_field}'")
-            except Exception as _pe:
-                logger.warning(f"[AvgPeriod] Unix-detection probe failed: {_pe}")
-
-        # ── Wrap date column in unix→datetime if integer column ────────────────
-        if _avg_is_unix:
-            if 'mysql' in d:
-                dcol = f"FROM_UNIXTIME({_dcol_raw})"
-            elif 'mssql' in d or 'sqlserver' in d:
-                dcol = f"DATEADD(second, {_dcol_raw}, CAST('1970-01-01' AS DATETIME))"
-            elif 'postgres' in d or 'postgre' in d:
-                dcol = f"TO_TIMESTAMP({_dcol_raw})"
-            else:
-                dcol = f"to_timestamp({_dcol_raw})"
-        else:
-            dcol = _dcol_raw
+        # ── Date-column semantics (epoch / YYYYMMDD / string dates) ────────────
+        # Memoized per datasource+table; the probe only runs on first use after a sync.
+        _avg_ds_id = None if ('duckdb' in (ds_type or '')) or (prefer_local and _duck_has_table(spec.source) and not _explicit_non_duck) else payload.datasourceId
+        _avg_date_sem = _date_column_semantics(db, _avg_ds_id, spec.source, date_field, d, actorId)
+        _avg_is_unix = bool(_avg_date_sem and _avg_date_sem.kind == _colsem.EPOCH)
+        dcol = _colsem.to_timestamp_sql(_dcol_raw, _avg_date_sem, d)
 
         avg_numerator = (getattr(spec, 'avgNumerator', None) or 'sum').lower()
         # ── Holiday exclusion for avg_wday ─────────────────────────────────────
         apply_holidays = getattr(spec, 'applyHolidays', False) or False
         _holiday_dates: frozenset[str] | None = None
-        _holiday_date_literals: str = ""
+        _avg_region = _holiday_region(ds)
         if apply_holidays and agg == 'avg_wday':
-            _holiday_dates = _load_holidays()
-            if _holiday_dates:
-                _holiday_date_literals = ", ".join(f"'{d}'" for d in sorted(_holiday_dates))
-        # ── Numerator expression ───────────────────────────────────────────────
-        if avg_numerator == 'count':
-            num_expr = f"COUNT({vcol})"
-        elif avg_numerator == 'distinct':
-            num_expr = f"COUNT(DISTINCT {vcol})"
-        else:  # sum (default)
-            if 'duckdb' in d:
-                y_clean = f"COALESCE(try_cast(regexp_replace(CAST({vcol} AS VARCHAR), '[^0-9.-]', '') AS DOUBLE), try_cast({vcol} AS DOUBLE), 0.0)"
-                num_expr = f"SUM({y_clean})"
-            else:
-                num_expr = f"SUM({vcol})"
-
-        # ── Dialect-aware period bucket (denominator) ──────────────────────────
-        _wday_dow_expr: str | None = None   # saved for distinct subquery
-        _wday_wknd_days: str | None = None  # saved for distinct subquery
-        _day_cast: str | None = None        # saved for distinct subquery
-        if agg in ('avg_daily', 'avg_wday'):
-            day_cast = f"CAST({dcol} AS DATE)"
-            _day_cast = day_cast
-            if agg == 'avg_wday':
-                if 'duckdb' in d or 'postgres' in d or 'postgre' in d:
-                    dow_expr = f"dayofweek({dcol})" if 'duckdb' in d else f"EXTRACT(DOW FROM {dcol})"
-                    wknd_days = "(0, 6)" if _spec_weekends == 'SAT_SUN' else "(5, 6)"
-                elif 'mssql' in d or 'sqlserver' in d:
-                    dow_expr = f"DATEPART(weekday, {dcol})"
-                    wknd_days = "(1, 7)" if _spec_weekends == 'SAT_SUN' else "(6, 7)"
-                elif 'mysql' in d:
-                    dow_expr = f"DAYOFWEEK({dcol})"
-                    wknd_days = "(1, 7)" if _spec_weekends == 'SAT_SUN' else "(6, 7)"
-                else:
-                    dow_expr = f"dayofweek({dcol})"
-                    wknd_days = "(0, 6)" if _spec_weekends == 'SAT_SUN' else "(5, 6)"
-                _wday_dow_expr = dow_expr
-                _wday_wknd_days = wknd_days
-                if apply_holidays and _holiday_dates and _holiday_date_literals:
-                    date_trunc = f"CASE WHEN {dow_expr} NOT IN {wknd_days} AND CAST({day_cast} AS VARCHAR) NOT IN ({_holiday_date_literals}) THEN {day_cast} END"
-                else:
-                    date_trunc = f"CASE WHEN {dow_expr} NOT IN {wknd_days} THEN {day_cast} END"
-            else:
-                date_trunc = day_cast
-        elif agg == 'avg_weekly':
-            if 'duckdb' in d or 'postgres' in d or 'postgre' in d:
-                date_trunc = f"DATE_TRUNC('week', {dcol})"
-            elif 'mssql' in d or 'sqlserver' in d:
-                date_trunc = f"DATEADD(week, DATEDIFF(week, 0, {dcol}), 0)"
-            elif 'mysql' in d:
-                # Match Excel WEEKNUM(date, 11): Monday-start weeks, week 1 always starts Jan 1.
-                # Formula: CONCAT(YEAR, '-', CEIL((DAYOFYEAR + WEEKDAY(Jan1)) / 7))
-                # where WEEKDAY(Jan1) = 0 for Mon, 2 for Wed, etc.
-                date_trunc = (
-                    f"CONCAT(YEAR({dcol}), '-',"
-                    f" LPAD(CEIL((DAYOFYEAR({dcol}) + WEEKDAY(MAKEDATE(YEAR({dcol}), 1))) / 7), 2, '0'))"
-                )
-            else:
-                date_trunc = f"DATE_TRUNC('week', {dcol})"
-        else:  # avg_monthly
-            if 'duckdb' in d or 'postgres' in d or 'postgre' in d:
-                date_trunc = f"DATE_TRUNC('month', {dcol})"
-            elif 'mssql' in d or 'sqlserver' in d:
-                date_trunc = f"YEAR({dcol}) * 100 + MONTH({dcol})"
-            elif 'mysql' in d:
-                date_trunc = f"DATE_FORMAT({dcol}, '%Y-%m')"
-            else:
-                date_trunc = f"DATE_TRUNC('month', {dcol})"
-
-        den_expr = f"COUNT(DISTINCT {date_trunc})"
+            _holiday_dates = _load_holidays(_avg_region)
 
         # ── Build WHERE clause ─────────────────────────────────────────────────
         where_parts: list[str] = []
@@ -3200,110 +3414,50 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
         uses_pav_transform = "_pav_base" in _period_from_sql
         where_source = spec.where if uses_pav_transform else where_resolved
         if where_source:
-            for _wk, _wv in where_source.items():
-                _wbase = _wk.split('__')[0] if '__' in _wk else _wk
-                _wop   = _wk.split('__', 1)[1] if '__' in _wk else 'eq'
-                # Don't re-quote keys that are already resolved SQL expressions (e.g. "(LEFT(CAST(login AS CHAR), 2))")
-                _wcol  = _wbase if _wbase.startswith('(') else _q_ident(_wbase)
-                _pn    = _pname(_wbase, f"_{_wop}")
-                if isinstance(_wv, list):
-                    placeholders = ', '.join([f':{_pn}_{i}' for i in range(len(_wv))])
-                    where_parts.append(f"{_wcol} IN ({placeholders})")
-                    for _i, _v in enumerate(_wv): params_avg[f'{_pn}_{_i}'] = _v
-                elif _wop == 'gte': where_parts.append(f"{_wcol} >= :{_pn}"); params_avg[_pn] = _wv
-                elif _wop == 'gt':  where_parts.append(f"{_wcol} >  :{_pn}"); params_avg[_pn] = _wv
-                elif _wop == 'lte': where_parts.append(f"{_wcol} <= :{_pn}"); params_avg[_pn] = _wv
-                elif _wop == 'lt':  where_parts.append(f"{_wcol} <  :{_pn}"); params_avg[_pn] = _wv
-                elif _wop == 'ne':  where_parts.append(f"{_wcol} != :{_pn}"); params_avg[_pn] = _wv
-                else:               where_parts.append(f"{_wcol} =  :{_pn}"); params_avg[_pn] = _wv
-        where_clause = f" WHERE {' AND '.join(where_parts)}" if where_parts else ""
-
-        # ── Holiday exclusion in WHERE clause for avg_wday ─────────────────────
-        if apply_holidays and _holiday_dates and _holiday_date_literals and agg == 'avg_wday':
-            where_parts.append(f"CAST({dcol} AS DATE) NOT IN ({_holiday_date_literals})")
-            where_clause = f" WHERE {' AND '.join(where_parts)}"
-
-        # ── last_daily_sum early return ────────────────────────────────────────
-        # SUM(value) for all rows where CAST(date_col AS DATE) = MAX(CAST(date_col AS DATE)) within the filter window
+            # Don't re-quote keys that are already resolved SQL expressions (e.g. "(LEFT(CAST(login AS CHAR), 2))")
+            where_parts, params_avg = _spec_where(where_source, ds_type, lambda b: b if b.startswith('(') else _q_ident(b))
+
+        # ── One scan: per-period numerator + calendar flags (app/period_average.py) ──
+        if 'duckdb' in d:
+            _pa_num_value = f"COALESCE(try_cast(regexp_replace(CAST({vcol} AS VARCHAR), '[^0-9.-]', '') AS DOUBLE), try_cast({vcol} AS DOUBLE), 0.0)"
+        else:
+            _pa_num_value = vcol
+        # Local DuckDB: weekdays / holidays come from a join on _bayan.dim_date
+        # (the datasource's holiday region); days outside its range stay inline.
+        _pa_calendar = None
+        if agg == 'avg_wday' and 'duckdb' in d and _avg_ds_id is None:
+            _pa_calendar = _dim_date.table_for_query(region=_avg_region)
+        sql_avg = _period_average.compile_period_average(
+            d, agg,
+            from_sql=_period_from_sql,
+            date_expr=dcol,
+            value_expr=vcol,
+            numeric_value_expr=_pa_num_value,
+            numerator=avg_numerator,
+            where_parts=where_parts,
+            weekend_days=_period_average.weekend_mask(_spec_weekends),
+            holidays=_holiday_dates or (),
+            calendar=_pa_calendar,
+            calendar_range=_dim_date.covered_range() if _pa_calendar else None,
+        )
+
+        # ── last_daily_sum: SUM(value) on the latest day within the filter window ──
         if agg == 'last_daily_sum':
-            if 'mysql' in d:
-                _lds_date_expr = f"DATE({dcol})"
-            else:
-                _lds_date_expr = f"CAST({dcol} AS DATE)"
-            if 'duckdb' in d:
-                _lds_y_clean = f"COALESCE(try_cast(regexp_replace(CAST({vcol} AS VARCHAR), '[^0-9.-]', '') AS DOUBLE), try_cast({vcol} AS DOUBLE), 0.0)"
-                _lds_num = f"SUM({_lds_y_clean})"
-            else:
-                _lds_num = f"SUM({vcol})"
-            if 'duckdb' in d:
-                # Use a window function instead of a correlated subquery so the date-bound
-                # params (:w_*_gte / :w_*_lt) appear only once in the SQL.  DuckDB's
-                # positional-? binding can mis-map duplicate param occurrences that appear
-                # inside a nested subquery, causing the predicate to be ignored and all
-                # rows in the window to be summed.
-                _lds_inner_where = f" WHERE {' AND '.join(where_parts)}" if where_parts else ""
-                sql_lds = (
-                    f"SELECT SUM(_lds_v) AS value FROM ("
-                    f"SELECT {_lds_y_clean} AS _lds_v, {_lds_date_expr} AS _lds_d, "
-                    f"MAX({_lds_date_expr}) OVER () AS _lds_md "
-                    f"FROM {_period_from_sql}{_lds_inner_where}"
-                    f") WHERE _lds_d = _lds_md"
-                )
-            else:
-                _lds_max_sub = f"(SELECT MAX({_lds_date_expr}) FROM {_period_from_sql}{where_clause})"
-                _lds_pred = f"{_lds_date_expr} = {_lds_max_sub}"
-                if where_parts:
-                    _lds_where = f" WHERE {' AND '.join(where_parts)} AND {_lds_pred}"
-                else:
-                    _lds_where = f" WHERE {_lds_pred}"
-                sql_lds = f"SELECT {_lds_num} AS value FROM {_period_from_sql}{_lds_where}"
             logger.debug(f"[LastDailySum] val={val_field}, date={date_field}, is_unix={_avg_is_unix}")
-            logger.debug(f"[LastDailySum] SQL: {sql_lds[:800]}")
+            logger.debug(f"[LastDailySum] SQL: {sql_avg[:800]}")
             if params_avg:
                 logger.debug(f"[LastDailySum] params: { {k: v for k, v in list(params_avg.items())[:10]} }")
             _lds_ds_id = None if ('duckdb' in (ds_type or '')) or (prefer_local and _duck_has_table(spec.source)) else payload.datasourceId
-            _lds_req = QueryRequest(sql=sql_lds, datasourceId=_lds_ds_id, limit=1, offset=0, includeTotal=False, params=params_avg or None)
-            return run_query(_lds_req, db)
-        # ── End last_daily_sum ─────────────────────────────────────────────────
-
-        # ── Build final SQL (3 columns for debug logging) ──────────────────────
-        if avg_numerator == 'distinct':
-            # For distinct: count distinct per period → SUM those counts / number of periods.
-            # A single COUNT(DISTINCT col) would collapse across all periods giving the wrong answer.
-            # Inner query groups by period, outer query aggregates.
-            if agg == 'avg_wday':
-                # Filter weekends in WHERE; group by plain date (no CASE needed in inner query)
-                inner_period = _day_cast
-                inner_where_parts = list(where_parts)
-                inner_where_parts.append(f"{_wday_dow_expr} NOT IN {_wday_wknd_days}")
-                inner_where_clause = f" WHERE {' AND '.join(inner_where_parts)}"
-            else:
-                inner_period = date_trunc
-                inner_where_clause = where_clause
-            inner_sql = (
-                f"SELECT {inner_period} AS _period, COUNT(DISTINCT {vcol}) AS _cnt "
-                f"FROM {_period_from_sql}{inner_where_clause} "
-                f"GROUP BY {inner_period}"
-            )
-            sql_avg = (
-                f"SELECT SUM(_cnt) AS num_val, COUNT(*) AS den_val, "
-                f"SUM(_cnt) * 1.0 / NULLIF(COUNT(*), 0) AS value "
-                f"FROM ({inner_sql}) _avg_sub"
-            )
-        else:
-            sql_avg = (
-                f"SELECT {num_expr} AS num_val, {den_expr} AS den_val, "
-                f"{num_expr} * 1.0 / NULLIF({den_expr}, 0) AS value "
-                f"FROM {_period_from_sql}{where_clause}"
-            )
+            _lds_req = QueryRequest(sql=sql_avg, datasourceId=_lds_ds_id, limit=1, offset=0, includeTotal=False, params=params_avg or None)
+            return run_query(_lds_req, db, pushdown=True)
+
         logger.debug(f"[AvgPeriod] agg={agg}, source={spec.source}, val_col={val_field}, date_col={date_field}, is_unix={_avg_is_unix}, numerator={avg_numerator}, weekends={_spec_weekends}, holidays={len(_holiday_dates) if _holiday_dates else 0}")
         logger.debug(f"[AvgPeriod] SQL: {sql_avg[:800]}")
         if params_avg:
             logger.debug(f"[AvgPeriod] params: { {k: v for k, v in list(params_avg.items())[:10]} }")
 
-        _avg_ds_id = None if ('duckdb' in (ds_type or '')) or (prefer_local and _duck_has_table(spec.source) and not _explicit_non_duck) else payload.datasourceId
         _avg_req   = QueryRequest(sql=sql_avg, datasourceId=_avg_ds_id, limit=1, offset=0, includeTotal=False, params=params_avg or None)
-        _avg_res   = run_query(_avg_req, db)
+        _avg_res   = run_query(_avg_req, db, pushdown=True)
 
         # ── Log component values ───────────────────────────────────────────────
         try:
@@ -3354,6 +3508,10 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
 
         _ma_from_sql = _q_source(spec.source)
 
+        # Convert epoch / YYYYMMDD / non-ISO string date columns (memoized probe)
+        _ma_probe_ds_id = None if ('duckdb' in d) or (prefer_local and _duck_has_table(spec.source) and not _explicit_non_duck) else payload.datasourceId
+        dcol_raw = _colsem.to_timestamp_sql(dcol_raw, _date_column_semantics(db, _ma_probe_ds_id, spec.source, date_field, d, actorId), d)
+
         # ── Resolve computed val_field for MA path (same as avg period path) ───
         if ds is not None:
             try:
@@ -3396,7 +3554,7 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                         joins=_mav_joins,
                         defaults={},
                         limit=None,
-                        base_cols=_mav_cols,
+                        base_cols=_materialized.with_stored(_mav_cols, spec.source, _mav_tr_filt.get("customColumns")),
                     )
                     _mav_sql = _mav_bres[0] if _mav_bres else ""
                     if _mav_sql:
@@ -3408,24 +3566,9 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
         # ── Build WHERE from spec.where ────────────────────────────────────────
         _ma_where_parts: list[str] = []
         _ma_params: dict = {}
-        _ma_where_source = getattr(spec, 'where', None) or {}
-        for _wk, _wv in _ma_where_source.items():
-            if _wv is None:
-                continue
-            _wbase = _wk.split('__')[0] if '__' in _wk else _wk
-            _wop   = _wk.split('__', 1)[1] if '__' in _wk else 'eq'
-            _wcol  = _wbase if _wbase.startswith('(') else _q_ident(_wbase)
-            _pn    = _pname(_wbase, f"_{_wop}")
-            if isinstance(_wv, list):
-                phs = ', '.join([f':{_pn}_{i}' for i in range(len(_wv))])
-                _ma_where_parts.append(f"{_wcol} IN ({phs})")
-                for _i, _v in enumerate(_wv): _ma_params[f'{_pn}_{_i}'] = _v
-            elif _wop == 'gte': _ma_where_parts.append(f"{_wcol} >= :{_pn}"); _ma_params[_pn] = _wv
-            elif _wop == 'gt':  _ma_where_parts.append(f"{_wcol} >  :{_pn}"); _ma_params[_pn] = _wv
-            elif _wop == 'lte': _ma_where_parts.append(f"{_wcol} <= :{_pn}"); _ma_params[_pn] = _wv
-            elif _wop == 'lt':  _ma_where_parts.append(f"{_wcol} <  :{_pn}"); _ma_params[_pn] = _wv
-            elif _wop == 'ne':  _ma_where_parts.append(f"{_wcol} != :{_pn}"); _ma_params[_pn] = _wv
-            else:               _ma_where_parts.append(f"{_wcol} =  :{_pn}"); _ma_params[_pn] = _wv
+        _ma_where_source = {k: v for k, v in (getattr(spec, 'where', None) or {}).items() if v is not None}
+        if _ma_where_source:
+            _ma_where_parts, _ma_params = _spec_where(_ma_where_source, ds_type, lambda b: b if b.startswith('(') else _q_ident(b))
 
         _ma_where_clause = f" WHERE {' AND '.join(_ma_where_parts)}" if _ma_where_parts else ""
 
@@ -3459,8 +3602,8 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
 
         if _ma_is_series:
             # ── Time-series MA: rolling N-day average per day ──────────────────
-            # CTE aggregates daily totals first, then window AVG gives the
-            # per-day N-day trailing moving average.
+            # Daily totals first, then the N-calendar-day trailing average
+            # (app.sqlgen.build_moving_averages).
             _ma_where_clause_inner = f" WHERE {' AND '.join(_ma_where_parts)}" if _ma_where_parts else ""
             if 'duckdb' in d:
                 _ma_xd_expr = f"CAST({dcol_raw} AS DATE)"
@@ -3469,16 +3612,21 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
             else:  # mssql / postgres / default
                 _ma_xd_expr = f"CAST({dcol_raw} AS DATE)"
 
-            sql_ma = (
-                f"WITH _ma_daily AS ("
+            _ma_daily_sql = (
                 f"SELECT {_ma_xd_expr} AS _xd, {_ma_num_expr} AS _yv "
                 f"FROM {_ma_from_sql}{_ma_where_clause_inner} "
                 f"GROUP BY {_ma_xd_expr}"
-                f") "
-                f"SELECT _xd, "
-                f"AVG(_yv) OVER (ORDER BY _xd ROWS BETWEEN {_ma_window - 1} PRECEDING AND CURRENT ROW) AS value "
-                f"FROM _ma_daily ORDER BY _xd"
             )
+            _ma_windows = [w for w in (getattr(spec, 'maWindows', None) or []) if w and int(w) > 0]
+            # One scan + daily grouping with calendar-day frames. Multi-window mode
+            # returns every window (and the raw daily value) as its own column.
+            try:
+                if _ma_windows:
+                    sql_ma = build_moving_averages(d, _ma_daily_sql, [_ma_window] + _ma_windows)
+                else:
+                    sql_ma = build_moving_averages(d, _ma_daily_sql, [_ma_window], single=True)
+            except ValueError as _mw_e:
+                raise HTTPException(status_code=400, detail=str(_mw_e))
             _ma_limit = int(getattr(spec, 'limit', None) or payload.limit or 5000)
         else:
             # ── Scalar MA: SUM of last N days / N (KPI use case) ──────────────
@@ -3500,7 +3648,7 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
 
         _ma_ds_id = None if ('duckdb' in (ds_type or '')) or (prefer_local and _duck_has_table(spec.source) and not _explicit_non_duck) else payload.datasourceId
         _ma_req   = QueryRequest(sql=sql_ma, datasourceId=_ma_ds_id, limit=_ma_limit, offset=0, includeTotal=False, params=_ma_params or None)
-        return run_query(_ma_req, db)
+        return run_query(_ma_req, db, pushdown=True)
     # ── End moving-average early exit ─────────────────────────────────────────
 
     # ── End period-average early exit ─────────────────────────────────────────
@@ -3597,7 +3745,7 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
             joins=ds_transforms.get("joins", []),
             defaults=ds_transforms.get("defaults", {}),
             limit=None,
-            base_cols=_base_cols,
+            base_cols=_materialized.with_stored(_base_cols, spec.source, ds_transforms.get("customColumns")),
         )
         # Handle different return value formats
         if len(result) == 3:
@@ -3616,24 +3764,9 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
             base_from_sql = f" FROM {_q_source(spec.source)}"
 
         # Apply WHERE filters on top of transformed subquery
-        # Helpers: quote identifiers for WHERE and sanitize param names
+        # Helpers: quote identifiers for WHERE
         def _q_ident(name: str) -> str:
             return quote_ident(name, ds_type)
-        def _pname(base: str, suffix: str = "") -> str:
-            core = re.sub(r"[^A-Za-z0-9_]", "_", str(base or ''))
-            return f"w_{core}{suffix}"
-        def _coerce_filter_value(key: str, val: Any) -> Any:
-            """Convert filter values to match the type returned by the derived column."""
-            m = re.match(r"^(.*)\s*\((Year|Quarter|Month|Month Name|Month Short|Week|Day|Day Name|Day Short)\)$", str(key), flags=re.IGNORECASE)
-            if not m:
-                return val
-            part = m.group(2).strip().lower()
-            if part in ('year', 'quarter', 'month', 'week', 'day'):
-                try:
-                    return int(val)
-                except (ValueError, TypeError):
-                    return val
-            return str(val) if val is not None else val
         def _where_lhs(key: str) -> str:
             """Get SQL expression for WHERE clause. Expand derived date parts or use quoted column."""
             # If key starts with '(', it's already a resolved expression - but check if subquery has the column
@@ -3684,46 +3817,11 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
         where_to_use = (payload.spec.where if hasattr(payload, 'spec') and hasattr(payload.spec, 'where') else {}) if uses_transform_subquery else (where_resolved if where_resolved else (payload.spec.where if hasattr(payload, 'spec') and hasattr(payload.spec, 'where') else {}))
         logger.debug(f"[SPEC_DEBUG] Non-agg query: where_to_use keys = {list(where_to_use.keys()) if where_to_use else 'None'}, uses_transform_subquery = {uses_transform_subquery}")
         if where_to_use:
-            for k, v in where_to_use.items():
-                if k in ("start", "startDate", "end", "endDate"):
-                    continue
-                # Parse operator suffix FIRST (e.g., ClientCode__ne -> base=ClientCode, op=ne)
-                base_col = k
-                op_suffix = None
-                if isinstance(k, str) and "__" in k:
-                    base_col, op_suffix = k.split("__", 1)
-                if v is None:
-                    where_clauses.append(f"{_where_lhs(base_col)} IS NULL")
-                elif isinstance(v, (list, tuple)):
-                    if len(v) == 0:
-                        continue
-                    pnames = []
-                    for i, item in enumerate(v):
-                        pname = _pname(base_col, f"_{i}")
-                        params[pname] = _coerce_filter_value(base_col, item)
-                        pnames.append(f":{pname}")
-                    # Use NOT IN for __ne operator, IN otherwise
-                    in_op = "NOT IN" if op_suffix == "ne" else "IN"
-                    where_clauses.append(f"{_where_lhs(base_col)} {in_op} ({', '.join(pnames)})")
-                elif op_suffix:
-                    opname = None
-                    if op_suffix == "gte": opname = ">="
-                    elif op_suffix == "gt": opname = ">"
-                    elif op_suffix == "lte": opname = "<="
-                    elif op_suffix == "lt": opname = "<"
-                    elif op_suffix == "ne": opname = "!="
-                    if opname:
-                        pname = _pname(base_col, f"_{op_suffix}")
-                        params[pname] = _coerce_filter_value(base_col, v)
-                        where_clauses.append(f"{_where_lhs(base_col)} {opname} :{pname}")
-                    else:
-                        pname = _pname(base_col)
-                        where_clauses.append(f"{_where_lhs(base_col)} = :{pname}")
-                        params[pname] = _coerce_filter_value(base_col, v)
-                else:
-                    pname = _pname(base_col)
-                    where_clauses.append(f"{_where_lhs(base_col)} = :{pname}")
-                    params[pname] = _coerce_filter_value(base_col, v)
+            _col_types = _filter_column_types(db, None if ds_type == "duckdb" else payload.datasourceId, spec.source, actorId)
+            where_clauses, params = _spec_where(
+                where_to_use, ds_type, _where_lhs,
+                types=lambda k: _col_types(k) if _where_lhs(k) == _q_ident(k) else None,
+            )
         where_sql = f" WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
         _sort_col = getattr(spec, 'orderBy', None)
         _sort_dir = str(getattr(spec, 'order', None) or 'asc').upper()
@@ -3753,7 +3851,7 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
             preferLocalDuck=prefer_local,
             preferLocalTable=spec.source,
         )
-        return run_query(q, db)
+        return run_query(q, db, pushdown=True)
 
     if has_chart_semantics:
         # Load datasource-level transforms if any; prepare a FROM fragment
@@ -3806,12 +3904,26 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                 except Exception:
                     continue
 
+            # Drop custom columns, transforms, LEFT JOINs and base projections the widget never reads
+            __base_select = ["*"]
+            __cols = _materialized.with_stored(__cols, spec.source, ds_transforms.get("customColumns"))
+            __ccs_eff = _materialized.drop_stored(ds_transforms.get("customColumns", []), __cols)
+            __trs_eff = ds_transforms.get("transforms", [])
+            if _spec_pruning.enabled():
+                try:
+                    __ccs_eff, __trs_eff, __joins_eff, __base_select = _spec_pruning.prune_for_spec(
+                        __ccs_eff, __trs_eff, __joins_eff, _spec_pruning.spec_roots(spec), __cols,
+                    )
+                    logger.debug(f"[SpecPrune] custom={len(__ccs_eff)} transforms={len(__trs_eff)} joins={len(__joins_eff)} select={__base_select[:10]}")
+                except Exception as e:
+                    logger.debug(f"[SpecPrune] skipped: {e}")
+
             result2 = build_sql(
                 dialect=ds_type,
                 source=_q_source(spec.source),
-                base_select=["*"],
-                custom_columns=ds_transforms.get("customColumns", []),
-                transforms=ds_transforms.get("transforms", []),
+                base_select=__base_select,
+                custom_columns=__ccs_eff,
+                transforms=__trs_eff,
                 joins=__joins_eff,
                 defaults={},  # avoid sort/limit on base for aggregated queries
                 limit=None,
@@ -4185,17 +4297,6 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
         if not x_col and not (spec.legend or legend_orig):
             series_scalar = spec.series if hasattr(spec, 'series') and isinstance(spec.series, list) else None
 
-            def _coerce_filter_value(key: str, val: Any) -> Any:
-                m = re.match(r"^(.*)\s*\((Year|Quarter|Month|Month Name|Month Short|Week|Day|Day Name|Day Short)\)$", str(key), flags=re.IGNORECASE)
-                if not m:
-                    return val
-                part = m.group(2).strip().lower()
-                if part in ('year', 'quarter', 'month', 'week', 'day'):
-                    try:
-                        return int(val)
-                    except (ValueError, TypeError):
-                        return val
-                return str(val) if val is not None else val
 
             def _where_lhs(key: str) -> str:
                 if str(key).strip().startswith('('):
@@ -4234,56 +4335,11 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
             where_to_use = spec.where if uses_transform_subquery else (where_resolved if where_resolved else spec.where)
             logger.debug(f"[SPEC_DEBUG] Scalar agg path: where_to_use keys = {list(where_to_use.keys()) if where_to_use else 'None'}, where_resolved = {where_resolved is not None}, uses_transform_subquery = {uses_transform_subquery}")
             if where_to_use:
-                for k, v in where_to_use.items():
-                    if k in ("start", "startDate", "end", "endDate"):
-                        continue
-                    base_col = k
-                    op_suffix = None
-                    if isinstance(k, str) and "__" in k:
-                        base_col, op_suffix = k.split("__", 1)
-                    if v is None:
-                        where_clauses.append(f"{_where_lhs(base_col)} IS NULL")
-                    elif isinstance(v, (list, tuple)):
-                        if len(v) == 0:
-                            continue
-                        pnames = []
-                        for i, item in enumerate(v):
-                            pname = _pname(base_col, f"_{i}")
-                            params[pname] = _coerce_filter_value(base_col, item)
-                            pnames.append(f":{pname}")
-                        in_op = "NOT IN" if op_suffix == "ne" else "IN"
-                        where_clauses.append(f"{_where_lhs(base_col)} {in_op} ({', '.join(pnames)})")
-                    elif op_suffix:
-                        opname = None
-                        if op_suffix == "gte": opname = ">="
-                        elif op_suffix == "gt": opname = ">"
-                        elif op_suffix == "lte": opname = "<="
-                        elif op_suffix == "lt": opname = "<"
-                        elif op_suffix == "ne": opname = "!="
-                        if opname:
-                            pname = _pname(base_col, f"_{op_suffix}")
-                            params[pname] = _coerce_filter_value(base_col, v)
-                            where_clauses.append(f"{_where_lhs(base_col)} {opname} :{pname}")
-                        elif op_suffix in {"contains", "notcontains", "startswith", "endswith"}:
-                            if op_suffix == "notcontains":
-                                cmp = "NOT LIKE"; patt = f"%{v}%"
-                            elif op_suffix == "contains":
-                                cmp = "LIKE"; patt = f"%{v}%"
-                            elif op_suffix == "startswith":
-                                cmp = "LIKE"; patt = f"{v}%"
-                            else:
-                                cmp = "LIKE"; patt = f"%{v}"
-                            pname = _pname(base_col, "_like")
-                            params[pname] = patt
-                            where_clauses.append(f"{_where_lhs(base_col)} {cmp} :{pname}")
-                        else:
-                            pname = _pname(base_col, "_eq")
-                            where_clauses.append(f"{_where_lhs(base_col)} = :{pname}")
-                            params[pname] = _coerce_filter_value(base_col, v)
-                    else:
-                        pname = _pname(base_col)
-                        where_clauses.append(f"{_where_lhs(base_col)} = :{pname}")
-                        params[pname] = _coerce_filter_value(base_col, v)
+                _col_types = _filter_column_types(db, None if ds_type == "duckdb" else payload.datasourceId, spec.source, actorId)
+                where_clauses, params = _spec_where(
+                    where_to_use, ds_type, _where_lhs,
+                    types=lambda k: _col_types(k) if _where_lhs(k) == _q_ident(k) else None,
+                )
             where_sql = f" WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
             logger.debug(f"[SCALAR_AGG_DEBUG] where_sql: {where_sql[:300]}")
             logger.debug(f"[SCALAR_AGG_DEBUG] params: {params}")
@@ -4370,7 +4426,7 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                         preferLocalDuck=prefer_local,
                         preferLocalTable=spec.source,
                     )
-                    return run_query(q, db)
+                    return run_query(q, db, pushdown=True)
 
             # Fallback: simple total aggregation without x and without legend; label as 'total'
             # Build value_expr robustly (support measure and DuckDB numeric-cleaning)
@@ -4461,7 +4517,7 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                 preferLocalDuck=prefer_local,
                 preferLocalTable=spec.source,
             )
-            result = run_query(q, db)
+            result = run_query(q, db, pushdown=True)
             logger.debug(f"[SCALAR_AGG_RESULT] rows={len(result.rows)}, data={result.rows[:3]}")
             return result
 
@@ -4518,17 +4574,6 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
             legend_expr = _q_ident(str(legend_expr_raw)) if legend_expr_raw else None
             
             # Build WHERE clause
-            def _coerce_filter_value(key: str, val: Any) -> Any:
-                m = re.match(r"^(.*)\s*\((Year|Quarter|Month|Month Name|Month Short|Week|Day|Day Name|Day Short)\)$", str(key), flags=re.IGNORECASE)
-                if not m:
-                    return val
-                part = m.group(2).strip().lower()
-                if part in ('year', 'quarter', 'month', 'week', 'day'):
-                    try:
-                        return int(val)
-                    except (ValueError, TypeError):
-                        return val
-                return str(val) if val is not None else val
             
             where_clauses = []
             params: Dict[str, Any] = {}
@@ -4537,46 +4582,11 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
             uses_transform_subquery = "_base" in base_from_sql
             where_to_use = spec.where if uses_transform_subquery else (where_resolved if where_resolved else spec.where)
             if where_to_use:
-                for k, v in where_to_use.items():
-                    if k in ("start", "startDate", "end", "endDate"):
-                        continue
-                    # Parse operator suffix FIRST (e.g., ClientCode__ne -> base=ClientCode, op=ne)
-                    base_col = k
-                    op_suffix = None
-                    if isinstance(k, str) and "__" in k:
-                        base_col, op_suffix = k.split("__", 1)
-                    if v is None:
-                        where_clauses.append(f"{_derived_lhs(base_col)} IS NULL")
-                    elif isinstance(v, (list, tuple)):
-                        if len(v) == 0:
-                            continue
-                        pnames = []
-                        for i, item in enumerate(v):
-                            pname = _pname(base_col, f"_{i}")
-                            params[pname] = _coerce_filter_value(base_col, item)
-                            pnames.append(f":{pname}")
-                        # Use NOT IN for __ne operator, IN otherwise
-                        in_op = "NOT IN" if op_suffix == "ne" else "IN"
-                        where_clauses.append(f"{_derived_lhs(base_col)} {in_op} ({', '.join(pnames)})")
-                    elif op_suffix:
-                        opname = None
-                        if op_suffix == "gte": opname = ">="
-                        elif op_suffix == "gt": opname = ">"
-                        elif op_suffix == "lte": opname = "<="
-                        elif op_suffix == "lt": opname = "<"
-                        elif op_suffix == "ne": opname = "!="
-                        if opname:
-                            pname = _pname(base_col, f"_{op_suffix}")
-                            params[pname] = _coerce_filter_value(base_col, v)
-                            where_clauses.append(f"{_derived_lhs(base_col)} {opname} :{pname}")
-                        else:
-                            pname = _pname(base_col)
-                            where_clauses.append(f"{_derived_lhs(base_col)} = :{pname}")
-                            params[pname] = _coerce_filter_value(base_col, v)
-                    else:
-                        pname = _pname(base_col)
-                        where_clauses.append(f"{_derived_lhs(base_col)} = :{pname}")
-                        params[pname] = _coerce_filter_value(base_col, v)
+                _col_types = _filter_column_types(db, None if ds_type == "duckdb" else payload.datasourceId, spec.source, actorId)
+                where_clauses, params = _spec_where(
+                    where_to_use, ds_type, _derived_lhs,
+                    types=lambda k: _col_types(k) if _derived_lhs(k) == _q_ident(k) else None,
+                )
             # Filter out NULL legend values
             legend_filter_clauses = list(where_clauses) if where_clauses else []
             if legend_expr:
@@ -4668,7 +4678,7 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                         preferLocalDuck=prefer_local,
                         preferLocalTable=spec.source,
                     )
-                    return run_query(q, db)
+                    return run_query(q, db, pushdown=True)
             
             # Build SQL: For legend-only, return x='Total', legend=<category>, value=<count>
             # This allows the frontend to render as a bar/column chart with legend series
@@ -4680,6 +4690,10 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                 sql_inner = f"SELECT 'Total' as x, {legend_expr} as legend, {value_expr} as value {base_from_sql}{where_sql_with_legend} GROUP BY 2 ORDER BY 2"
             
             eff_limit = lim or 1000
+            if spec.topN:
+                # The Others row comes on top of N: let the wrapper bound the rows.
+                sql_inner = _legacy_top_n(sql_inner, spec, ds_type, agg, lim, category="legend")
+                eff_limit = max(eff_limit, 1000)
             q = QueryRequest(
                 sql=sql_inner,
                 datasourceId=(None if ('duckdb' in (ds_type or '')) or (prefer_local and _duck_has_table(spec.source)) else payload.datasourceId),
@@ -4690,7 +4704,7 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                 preferLocalDuck=prefer_local,
                 preferLocalTable=spec.source,
             )
-            return run_query(q, db)
+            return run_query(q, db, pushdown=True)
 
         # Aggregated query when agg != 'none' (with optional legend)
         if agg and agg != "none":
@@ -4762,7 +4776,20 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                     except Exception:
                         expr_map = _build_expr_map(ds, spec.source, ds_type)
                     
-                    builder = SQLGlotBuilder(dialect=ds_type)
+                    # Staged value lists are cast to the filtered column's declared type
+                    _exec_ds = None if ('duckdb' in (ds_type or '')) or (prefer_local and _duck_has_table(spec.source)) else payload.datasourceId
+                    _staged_types: Dict[str, str] = {}
+                    _staged = [str(k).rsplit("__", 1)[0] for k, v in (where_resolved or {}).items() if _value_sets.should_stage(v)]
+                    if _staged:
+                        _col_types = _filter_column_types(db, _exec_ds, spec.source, actorId)
+                        for _f in _staged:
+                            try:
+                                _t = _col_types(_f)
+                            except Exception:
+                                _t = None
+                            if _t:
+                                _staged_types[_f] = _t
+                    builder = SQLGlotBuilder(dialect=ds_type, column_types=_staged_types)
                     
                     # Handle multi-legend (legend could be string or array)
                     legend_field_val = spec.legend if hasattr(spec, 'legend') else None
@@ -4780,7 +4807,8 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                     # Pass x_raw (full array for multi-level X) instead of x_col (first element only)
                     x_field_for_builder = x_raw if x_raw else (spec.x if hasattr(spec, 'x') else None)
                     logger.debug(f"[SQLGlot] x_field_for_builder = {x_field_for_builder}, x_raw = {x_raw}, spec.x = {spec.x if hasattr(spec, 'x') else 'N/A'}")
-                    sql_inner = builder.build_aggregation_query(
+                    # Filter values become :_fb<n> binds so the SQL text is stable across selections
+                    sql_inner, _sg_binds = builder.build_aggregation_template(
                         source=spec.source,
                         x_field=x_field_for_builder,  # Pass full array for multi-level X support
                         y_field=spec.y if hasattr(spec, 'y') else None,
@@ -4797,15 +4825,25 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                         ds_type=ds_type,  # Pass dialect for date part resolution
                         series=series_val,  # Multi-series support
                         legend_fields=legend_fields_val,  # Multi-legend support
+                        top_n=spec.topN,
+                        top_n_per_series=bool(spec.topNPerSeries),
+                        others_label=spec.othersLabel or TOP_N_OTHERS_LABEL,
+                        max_points=spec.maxPoints,
+                        downsample=spec.downsample,
                     )
                     logger.info(f"[SQLGlot] Generated: {sql_inner[:150]}...")
                     logger.debug(f"[SQLGlot] Generated: {sql_inner[:150]}...")
+                    if _sg_binds:
+                        params = {**(params or {}), **_sg_binds}
                     
                     # Create query request and execute
                     eff_limit = lim or 1000
+                    if spec.topN:
+                        # The builder caps N at lim; the Others rows come on top.
+                        eff_limit = max(eff_limit, 1000)
                     q = QueryRequest(
                         sql=sql_inner,
-                        datasourceId=(None if ('duckdb' in (ds_type or '')) or (prefer_local and _duck_has_table(spec.source)) else payload.datasourceId),
+                        datasourceId=_exec_ds,
                         limit=eff_limit,
                         offset=off or 0,
                         includeTotal=payload.includeTotal,
@@ -4814,7 +4852,7 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                         preferLocalTable=spec.source,
                     )
                     counter_inc("sqlglot_queries_total", {"dialect": ds_type})
-                    return run_query(q, db)
+                    return run_query(q, db, pushdown=True)
                     
                 except Exception as e:
                     # SQLGlot failed, fall back to legacy
@@ -4884,22 +4922,6 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                 else:
                     value_expr = "COUNT(*)"
 
-            # Reuse helpers from above scope
-            def _coerce_filter_value(key: str, val: Any) -> Any:
-                """Convert filter values to match the type returned by _derived_lhs() for the given key."""
-                # Check if key is a derived date part
-                m = re.match(r"^(.*)\s*\((Year|Quarter|Month|Month Name|Month Short|Week|Day|Day Name|Day Short)\)$", str(key), flags=re.IGNORECASE)
-                if not m:
-                    return val
-                part = m.group(2).strip().lower()
-                # Numeric parts: Year, Quarter, Month, Week, Day return integers
-                if part in ('year', 'quarter', 'month', 'week', 'day'):
-                    try:
-                        return int(val)
-                    except (ValueError, TypeError):
-                        return val
-                # String parts: Month Name, Month Short, Day Name, Day Short return strings
-                return str(val) if val is not None else val
             
             def _where_lhs(key: str) -> str:
                 """Get SQL expression for WHERE clause. Expand derived date parts or use quoted column."""
@@ -4940,83 +4962,8 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
             where_to_use = spec.where if uses_transform_subquery else (where_resolved if where_resolved else spec.where)
             logger.debug(f"[SPEC_DEBUG] X+legend agg path: where_to_use keys = {list(where_to_use.keys()) if where_to_use else 'None'}, where_resolved = {where_resolved is not None}, uses_transform_subquery = {uses_transform_subquery}")
             if where_to_use:
-                for k, v in where_to_use.items():
-                    if k in ("start", "startDate", "end", "endDate"):
-                        continue
-                    if v is None:
-                        where_clauses.append(f"{_where_lhs(k)} IS NULL")
-                    elif isinstance(k, str) and "__" in k:
-                        base, op = k.split("__", 1)
-                        opname = None
-                        if op == "gte": opname = ">="
-                        elif op == "gt": opname = ">"
-                        elif op == "lte": opname = "<="
-                        elif op == "lt": opname = "<"
-                        if opname:
-                            # Numeric comparisons stay as-is
-                            pname = _pname(base, f"_{op}")
-                            params[pname] = _coerce_filter_value(base, v)
-                            where_clauses.append(f"{_where_lhs(base)} {opname} :{pname}")
-                        elif op == "ne":
-                            is_str = _is_string_filter(base)
-                            col_expr = f"LOWER({_where_lhs(base)})" if is_str else _where_lhs(base)
-                            # Support array for multiple ne values (AND logic: not A and not B)
-                            if isinstance(v, (list, tuple)):
-                                ne_conds = []
-                                for i, item in enumerate(v):
-                                    pname = _pname(base, f"_ne_{i}")
-                                    params[pname] = _coerce_filter_value(base, str(item).lower() if is_str and isinstance(item, str) else item)
-                                    ne_conds.append(f"{col_expr} <> :{pname}")
-                                where_clauses.append(f"({' AND '.join(ne_conds)})")
-                            else:
-                                pname = _pname(base, "_ne")
-                                params[pname] = _coerce_filter_value(base, str(v).lower() if is_str and isinstance(v, str) else v)
-                                where_clauses.append(f"{col_expr} <> :{pname}")
-                        elif op in {"contains", "notcontains", "startswith", "endswith"}:
-                            # LIKE operators: case-insensitive with LOWER(), support arrays with OR logic
-                            col_expr = f"LOWER({_where_lhs(base)})"
-                            # Support array for multiple values (OR logic: contains A or contains B)
-                            vals = v if isinstance(v, (list, tuple)) else [v]
-                            like_conds = []
-                            for i, item in enumerate(vals):
-                                if op == "notcontains":
-                                    cmp = "NOT LIKE"; patt = f"%{str(item).lower()}%"
-                                elif op == "contains":
-                                    cmp = "LIKE"; patt = f"%{str(item).lower()}%"
-                                elif op == "startswith":
-                                    cmp = "LIKE"; patt = f"{str(item).lower()}%"
-                                else:
-                                    cmp = "LIKE"; patt = f"%{str(item).lower()}"
-                                pname = _pname(base, f"_like_{i}")
-                                params[pname] = patt
-                                like_conds.append(f"{col_expr} {cmp} :{pname}")
-                            # OR for contains/startswith/endswith, AND for notcontains
-                            join_op = " AND " if op == "notcontains" else " OR "
-                            where_clauses.append(f"({join_op.join(like_conds)})")
-                        else:
-                            is_str = _is_string_filter(base)
-                            pname = _pname(base, "_eq")
-                            params[pname] = _coerce_filter_value(base, str(v).lower() if is_str and isinstance(v, str) else v)
-                            col_expr = f"LOWER({_where_lhs(base)})" if is_str else _where_lhs(base)
-                            where_clauses.append(f"{col_expr} = :{pname}")
-                    elif isinstance(v, (list, tuple)):
-                        # Regular field with multiple values (IN clause)
-                        if len(v) == 0:
-                            continue
-                        pnames = []
-                        is_str = _is_string_filter(k)
-                        for i, item in enumerate(v):
-                            pname = _pname(k, f"_{i}")
-                            params[pname] = _coerce_filter_value(k, str(item).lower() if is_str and isinstance(item, str) else item)
-                            pnames.append(f":{pname}")
-                        col_expr = f"LOWER({_where_lhs(k)})" if is_str else _where_lhs(k)
-                        where_clauses.append(f"{col_expr} IN ({', '.join(pnames)})")
-                    else:
-                        is_str = _is_string_filter(k)
-                        pname = _pname(k)
-                        params[pname] = _coerce_filter_value(k, str(v).lower() if is_str and isinstance(v, str) else v)
-                        col_expr = f"LOWER({_where_lhs(k)})" if is_str else _where_lhs(k)
-                        where_clauses.append(f"{col_expr} = :{pname}")
+                # String fields match case-insensitively here (LOWER on both sides).
+                where_clauses, params = _spec_where(where_to_use, ds_type, _where_lhs, fold_case=_is_string_filter)
             where_sql = f" WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
             
             # Filter out NULL legend values when legend is present
@@ -5435,6 +5382,9 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                         pass
 
             eff_limit = lim or 1000
+            if spec.topN:
+                sql_inner = _legacy_top_n(sql_inner, spec, ds_type, agg, lim)
+                eff_limit = max(eff_limit, 1000)
             if 'limit_override' in locals() and limit_override:
                 try:
                     eff_limit = min(int(eff_limit), int(limit_override))
@@ -5450,7 +5400,10 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
                 preferLocalDuck=prefer_local,
                 preferLocalTable=spec.source,
             )
-            return run_query(q, db)
+            return run_query(q, db, pushdown=True)
+
+        if spec.topN:
+            raise HTTPException(status_code=400, detail="topN needs an aggregated spec (agg != 'none')")
 
         # agg == 'none': passthrough raw columns via select/x/y, but derive/quote when needed
         def _select_part(c: str) -> str:
@@ -5479,18 +5432,6 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
         cols.append(_select_part(str(x_col)))
         if spec.y:
             cols.append(_select_part(str(spec.y)))
-        # Reuse helpers from above scope
-        def _coerce_filter_value(key: str, val: Any) -> Any:
-            m = re.match(r"^(.*)\s*\((Year|Quarter|Month|Month Name|Month Short|Week|Day|Day Name|Day Short)\)$", str(key), flags=re.IGNORECASE)
-            if not m:
-                return val
-            part = m.group(2).strip().lower()
-            if part in ('year', 'quarter', 'month', 'week', 'day'):
-                try:
-                    return int(val)
-                except (ValueError, TypeError):
-                    return val
-            return str(val) if val is not None else val
         
         def _where_lhs(key: str) -> str:
             """Get SQL expression for WHERE clause. Expand derived date parts or use quoted column."""
@@ -5525,61 +5466,11 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
         uses_transform_subquery = "_base" in base_from_sql
         where_to_use = spec.where if uses_transform_subquery else (where_resolved if where_resolved else spec.where)
         if where_to_use:
-            for k, v in where_to_use.items():
-                if k in ("start", "startDate", "end", "endDate"):
-                    continue
-                # Parse operator suffix FIRST (e.g., ClientCode__ne -> base=ClientCode, op=ne)
-                base_col = k
-                op_suffix = None
-                if isinstance(k, str) and "__" in k:
-                    base_col, op_suffix = k.split("__", 1)
-                if v is None:
-                    where_clauses.append(f"{_where_lhs(base_col)} IS NULL")
-                elif isinstance(v, (list, tuple)):
-                    if len(v) == 0:
-                        continue
-                    pnames = []
-                    for i, item in enumerate(v):
-                        pname = _pname(base_col, f"_{i}")
-                        params[pname] = _coerce_filter_value(base_col, item)
-                        pnames.append(f":{pname}")
-                    # Use NOT IN for __ne operator, IN otherwise
-                    in_op = "NOT IN" if op_suffix == "ne" else "IN"
-                    where_clauses.append(f"{_where_lhs(base_col)} {in_op} ({', '.join(pnames)})")
-                elif op_suffix:
-                    opname = None
-                    if op_suffix == "gte": opname = ">="
-                    elif op_suffix == "gt": opname = ">"
-                    elif op_suffix == "lte": opname = "<="
-                    elif op_suffix == "lt": opname = "<"
-                    if opname:
-                        pname = _pname(base_col, f"_{op_suffix}")
-                        params[pname] = _coerce_filter_value(base_col, v)
-                        where_clauses.append(f"{_where_lhs(base_col)} {opname} :{pname}")
-                    elif op_suffix == "ne":
-                        pname = _pname(base_col, "_ne")
-                        params[pname] = _coerce_filter_value(base_col, v)
-                        where_clauses.append(f"{_where_lhs(base_col)} <> :{pname}")
-                    elif op_suffix in {"contains", "notcontains", "startswith", "endswith"}:
-                        if op_suffix == "notcontains":
-                            cmp = "NOT LIKE"; patt = f"%{v}%"
-                        elif op_suffix == "contains":
-                            cmp = "LIKE"; patt = f"%{v}%"
-                        elif op_suffix == "startswith":
-                            cmp = "LIKE"; patt = f"{v}%"
-                        else:
-                            cmp = "LIKE"; patt = f"%{v}"
-                        pname = _pname(base_col, "_like")
-                        params[pname] = patt
-                        where_clauses.append(f"{_where_lhs(base_col)} {cmp} :{pname}")
-                    else:
-                        pname = _pname(base_col, "_eq")
-                        where_clauses.append(f"{_where_lhs(base_col)} = :{pname}")
-                        params[pname] = _coerce_filter_value(base_col, v)
-                else:
-                    pname = _pname(base_col)
-                    where_clauses.append(f"{_where_lhs(base_col)} = :{pname}")
-                    params[pname] = _coerce_filter_value(base_col, v)
+            _col_types = _filter_column_types(db, None if ds_type == "duckdb" else payload.datasourceId, spec.source, actorId)
+            where_clauses, params = _spec_where(
+                where_to_use, ds_type, _where_lhs,
+                types=lambda k: _col_types(k) if _where_lhs(k) == _q_ident(k) else None,
+            )
         where_sql = f" WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
         sql_inner = f"SELECT {', '.join(cols)}{base_from_sql}{where_sql}"
         q = QueryRequest(
@@ -5590,12 +5481,61 @@ def run_query_spec(payload: QuerySpecRequest, db: Session = Depends(get_db), act
             includeTotal=payload.includeTotal,
             params=params or None,
         )
-        return run_query(q, db)
+        return run_query(q, db, pushdown=True)
+
+
+def _distinct_duck_path(ds_id: Optional[str], ds_info: Optional[dict]) -> str:
+    """DuckDB file backing a /distinct request (the datasource DSN, else the default store)."""
+    db_path = settings.duckdb_path
+    if ds_id and ds_info and (ds_info.get("connection_encrypted")):
+        try:
+            dsn = decrypt_credential(ds_info.get("id"), ds_info.get("connection_encrypted"))
+            p = urlparse(dsn) if dsn else None
+            if p and (p.scheme or "").startswith("duckdb"):
+                _p = unquote(p.path or "")
+                if _p.startswith("///"):
+                    _p = _p[2:]
+                db_path = _p or db_path
+                if db_path and db_path != ":memory:" and db_path.startswith("/."):
+                    try:
+                        db_path = os.path.abspath(db_path[1:])
+                    except Exception:
+                        pass
+                if ":memory:" in (dsn or "").lower():
+                    db_path = ":memory:"
+        except Exception:
+            pass
+    return db_path
+
+
+def _narrow_distinct_values(values: list[Any], payload: DistinctRequest) -> list[Any]:
+    """Apply search/limit to live /distinct results (the dictionary path does this in SQL)."""
+    if payload.search:
+        needle = str(payload.search).lower()
+        if payload.searchMode == "prefix":
+            values = [v for v in values if str(v).lower().startswith(needle)]
+        else:
+            values = [v for v in values if needle in str(v).lower()]
+    if payload.limit is not None and int(payload.limit) > 0:
+        values = values[: int(payload.limit)]
+    return values
 
 
 @router.post("/distinct")
 def distinct_values(payload: DistinctRequest, request: Request, db: Session = Depends(get_db), actorId: Optional[str] = Depends(actor_id_optional), publicId: Optional[str] = None, token: Optional[str] = None) -> DistinctResponse:
+    """Return distinct values for a column (including derived date parts) with optional WHERE.
+
+    - Omits datasource defaults (TopN/sort) to ensure completeness
+    - Supports equality, IN, and range ops in WHERE
+    - Derived parts supported via sqlgen.build_distinct_sql
+    """
     _enforce_rate_limit(request, actorId, "distinct")
+    actorId = _resolve_public_actor(db, actorId, publicId, token)
+    return _distinct_values(payload, db, actorId)
+
+
+def _distinct_values(payload: DistinctRequest, db: Session, actorId: Optional[str]) -> DistinctResponse:
+    """Body of /distinct, shared with /distinct/batch (caller has rate-limited and resolved the actor)."""
     _validate_source(payload.source)
     # Resolve date presets at execution time
     if getattr(payload, 'where', None):
@@ -5608,13 +5548,6 @@ def distinct_values(payload: DistinctRequest, request: Request, db: Session = De
         gauge_inc("query_inflight", 1.0, {"endpoint": "distinct"})
     except Exception:
         pass
-    actorId = _resolve_public_actor(db, actorId, publicId, token)
-    """Return distinct values for a column (including derived date parts) with optional WHERE.
-
-    - Omits datasource defaults (TopN/sort) to ensure completeness
-    - Supports equality, IN, and range ops in WHERE
-    - Derived parts supported via sqlgen.build_distinct_sql
-    """
     if not payload.source or not payload.field:
         raise HTTPException(status_code=400, detail="source and field are required")
     # Resolve datasource transforms so alias names are valid in DISTINCT and WHERE
@@ -5661,7 +5594,7 @@ def distinct_values(payload: DistinctRequest, request: Request, db: Session = De
                     ds_obj = candidate
                     break
                 try:
-                    dsn = decrypt_text(candidate.connection_encrypted or "")
+                    dsn = decrypt_credential(candidate.id, candidate.connection_encrypted or "")
                     if dsn and settings.duckdb_path in dsn:
                         ds_obj = candidate
                         break
@@ -6082,6 +6015,30 @@ def distinct_values(payload: DistinctRequest, request: Request, db: Session = De
     except Exception:
         pass
     _start = time.perf_counter()
+    # Dictionary fast path: unfiltered DISTINCT over a base column of a synced
+    # local table is served from its precomputed side table (see distinct_dictionary).
+    _dist_where_eff = {k: v for k, v in (payload.where or {}).items()
+                       if k != str(payload.field) and k not in {"start", "startDate", "end", "endDate"}}
+    if route_duck and _duckdb is not None and base_from_sql is None and not _dist_where_eff:
+        try:
+            with open_duck_native(_distinct_duck_path(payload.datasourceId, ds_info)) as conn:
+                dd_values = _distinct_dict.lookup(
+                    conn, str(payload.source), str(payload.field),
+                    search=payload.search,
+                    prefix=(payload.searchMode == "prefix"),
+                    limit=payload.limit,
+                    by_frequency=(payload.orderBy == "frequency"),
+                )
+        except Exception:
+            dd_values = None
+        if dd_values is not None:
+            try:
+                counter_inc("query_cache_hit_total", {"endpoint": "distinct", "kind": "dictionary"})
+                summary_observe("query_duration_ms", int((time.perf_counter() - _start) * 1000), {"endpoint": "distinct"})
+                gauge_dec("query_inflight", 1.0, {"endpoint": "distinct"})
+            except Exception:
+                pass
+            return DistinctResponse(values=dd_values)
     key = _cache_key("distinct", payload.datasourceId, sql, params)
     cached = _cache_get(key)
     if cached:
@@ -6098,7 +6055,7 @@ def distinct_values(payload: DistinctRequest, request: Request, db: Session = De
             summary_observe("query_duration_ms", int((time.perf_counter() - _start) * 1000), {"endpoint": "distinct"})
         except Exception:
             pass
-        return DistinctResponse(values=[v for v in values_cached if v is not None])
+        return DistinctResponse(values=_narrow_distinct_values([v for v in values_cached if v is not None], payload))
 
     values: list[Any] = []
     _HEAVY_SEM.acquire()
@@ -6112,29 +6069,9 @@ def distinct_values(payload: DistinctRequest, request: Request, db: Session = De
     try:
         if route_duck and _duckdb is not None:
             # Execute with native DuckDB
-            name_order = [m.group(1) for m in re.finditer(r":([A-Za-z_][A-Za-z0-9_]*)", sql)]
-            sql_qm = re.sub(r":([A-Za-z_][A-Za-z0-9_]*)", "?", sql)
+            sql_qm, name_order = _to_positional(sql)
             vals = [params.get(nm) for nm in name_order]
-            # Resolve DB path
-            db_path = settings.duckdb_path
-            if payload.datasourceId and ds_info and (ds_info.get("connection_encrypted")):
-                try:
-                    dsn = decrypt_text(ds_info.get("connection_encrypted"))
-                    p = urlparse(dsn) if dsn else None
-                    if p and (p.scheme or "").startswith("duckdb"):
-                        _p = unquote(p.path or "")
-                        if _p.startswith("///"):
-                            _p = _p[2:]
-                        db_path = _p or db_path
-                        if db_path and db_path != ":memory:" and db_path.startswith("/."):
-                            try:
-                                db_path = os.path.abspath(db_path[1:])
-                            except Exception:
-                                pass
-                        if ":memory:" in (dsn or "").lower():
-                            db_path = ":memory:"
-                except Exception:
-                    pass
+            db_path = _distinct_duck_path(payload.datasourceId, ds_info)
             _distinct_remote_attachments: list = []
             try:
                 if ds_info:
@@ -6173,7 +6110,7 @@ def distinct_values(payload: DistinctRequest, request: Request, db: Session = De
                 summary_observe("query_duration_ms", int((time.perf_counter() - _start) * 1000), {"endpoint": "distinct"})
             except Exception:
                 pass
-            return DistinctResponse(values=values)
+            return DistinctResponse(values=_narrow_distinct_values(values, payload))
         else:
             # Execute with SQLAlchemy for external engines
             engine = _engine_for_datasource(db, payload.datasourceId, actorId)
@@ -6209,7 +6146,7 @@ def distinct_values(payload: DistinctRequest, request: Request, db: Session = De
                 summary_observe("query_duration_ms", int((time.perf_counter() - _start) * 1000), {"endpoint": "distinct"})
             except Exception:
                 pass
-            return DistinctResponse(values=values)
+            return DistinctResponse(values=_narrow_distinct_values(values, payload))
     finally:
         try:
             gauge_dec("query_inflight", 1.0, {"endpoint": "distinct"})
@@ -6223,10 +6160,96 @@ def distinct_values(payload: DistinctRequest, request: Request, db: Session = De
                 pass
 
 
+try:
+    DISTINCT_BATCH_MAX_FIELDS = int(os.environ.get("DISTINCT_BATCH_MAX_FIELDS", "32") or "32")
+except Exception:
+    DISTINCT_BATCH_MAX_FIELDS = 32
+
+
+@router.post("/distinct/batch", response_model=DistinctBatchResponse)
+async def distinct_values_batch(
+    payload: DistinctBatchRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    actorId: Optional[str] = Depends(actor_id_optional),
+    publicId: Optional[str] = None,
+    token: Optional[str] = None,
+) -> DistinctBatchResponse:
+    """Distinct values for several fields of one source in a single request.
+
+    The request is rate-limited and the public actor resolved once; each
+    field then runs the regular /distinct pipeline in parallel on the query
+    pool (own session, own cancel token). Because every field goes through
+    ``_distinct_values`` it hits the same dictionary fast path and the same
+    result-cache keys as the single-field endpoint, so a batch warms the cache
+    for later single-field calls and vice versa.
+    """
+    fields = list(dict.fromkeys(str(f) for f in (payload.fields or []) if str(f or "").strip()))
+    if not payload.source or not fields:
+        raise HTTPException(status_code=400, detail="source and fields are required")
+    if len(fields) > DISTINCT_BATCH_MAX_FIELDS:
+        raise HTTPException(status_code=400, detail=f"at most {DISTINCT_BATCH_MAX_FIELDS} fields per batch")
+    _enforce_rate_limit(request, actorId, "distinct")
+    actorId = _resolve_public_actor(db, actorId, publicId, token)
+    try:
+        counter_inc("query_requests_total", {"endpoint": "distinct_batch"})
+    except Exception:
+        pass
+
+    def _one(field: str) -> DistinctResponse:
+        sub = DistinctRequest(
+            source=payload.source,
+            field=field,
+            where=dict(payload.where) if payload.where else None,
+            datasourceId=payload.datasourceId,
+            widgetId=payload.widgetId,
+            search=payload.search,
+            searchMode=payload.searchMode,
+            limit=payload.limit,
+            orderBy=payload.orderBy,
+        )
+        sdb = SessionLocal()
+        try:
+            return _distinct_values(sub, sdb, actorId)
+        finally:
+            sdb.close()
+
+    results = await asyncio.gather(
+        *[_run_cancellable_in_pool(request, functools.partial(_one, f)) for f in fields],
+        return_exceptions=True,
+    )
+    values: dict[str, list[Any]] = {}
+    errors: dict[str, str] = {}
+    for field, res in zip(fields, results):
+        if isinstance(res, HTTPException) and res.status_code in (401, 403, 404, 429, 499):
+            # Auth/visibility and client-gone outcomes apply to the whole batch.
+            raise res
+        if isinstance(res, BaseException):
+            errors[field] = str(getattr(res, "detail", None) or res)
+            continue
+        values[field] = list(res.values)
+    return DistinctBatchResponse(values=values, errors=errors or None)
+
+
 # --- Period totals helper ---
 
 
-@router.post("/pivot", response_model=QueryResponse)
+# format="matrix": long-form cells fetched for the reshape, and default dense bounds
+try:
+    PIVOT_MATRIX_FETCH_LIMIT = int(os.environ.get("PIVOT_MATRIX_FETCH_LIMIT", "200000") or "200000")
+except Exception:
+    PIVOT_MATRIX_FETCH_LIMIT = 200000
+try:
+    PIVOT_MATRIX_MAX_ROWS = int(os.environ.get("PIVOT_MATRIX_MAX_ROWS", "1000") or "1000")
+except Exception:
+    PIVOT_MATRIX_MAX_ROWS = 1000
+try:
+    PIVOT_MATRIX_MAX_COLS = int(os.environ.get("PIVOT_MATRIX_MAX_COLS", "100") or "100")
+except Exception:
+    PIVOT_MATRIX_MAX_COLS = 100
+
+
+@router.post("/pivot", response_model=PivotResponse)
 def run_pivot(payload: PivotRequest, request: Request, db: Session = Depends(get_db), actorId: Optional[str] = None, publicId: Optional[str] = None, token: Optional[str] = None, _actor: Optional[str] = Depends(actor_id_optional)) -> QueryResponse:
     """Server-side pivot aggregation.
     Returns long-form grouped rows: [row_dims..., col_dims..., value].
@@ -6237,6 +6260,8 @@ def run_pivot(payload: PivotRequest, request: Request, db: Session = Depends(get
         actorId = _actor
     actorId = _resolve_public_actor(db, actorId, publicId, token)
     _validate_source(payload.source)
+    if payload.topN and payload.subtotals:
+        raise HTTPException(status_code=400, detail="topN cannot be combined with subtotals")
     import sys
     logger.debug(f"[PIVOT_START] datasourceId={payload.datasourceId}, widgetId={payload.widgetId}, source={payload.source}")
     # Resolve date presets at execution time
@@ -6990,79 +7015,13 @@ def run_pivot(payload: PivotRequest, request: Request, db: Session = Depends(get
             base_sql = result[0] if result else ""
         base_from_sql = f" FROM ({base_sql}) AS _base"
 
-    # WHERE
-    where_clauses = []
-    params: Dict[str, Any] = {}
-    def _pname(base: str, suffix: str = "") -> str:
-        core = re.sub(r"[^A-Za-z0-9_]", "_", str(base or ''))
-        return f"w_{core}{suffix}"
-    if payload.where:
-        for k, v in payload.where.items():
-            if k in ("start", "startDate", "end", "endDate"):
-                continue
-            if isinstance(k, str) and k.startswith('__'):
-                continue
-            if v is None:
-                where_clauses.append(f"{_q_ident(k)} IS NULL")
-            elif isinstance(k, str) and "__" in k:
-                # Check for operators FIRST before checking if value is array
-                base, op = k.split("__", 1)
-                opname = None
-                if op == "gte": opname = ">="
-                elif op == "gt": opname = ">"
-                elif op == "lte": opname = "<="
-                elif op == "lt": opname = "<"
-                if opname:
-                    pname = _pname(base, f"_{op}")
-                    # Extract first element if value is an array (operators expect scalar values)
-                    param_val = v[0] if isinstance(v, (list, tuple)) and len(v) > 0 else v
-                    params[pname] = param_val
-                    where_clauses.append(f"{_derived_lhs(base)} {opname} :{pname}")
-                elif op == "ne":
-                    # NOT EQUALS: use NOT IN to support multiple exclusions
-                    if isinstance(v, (list, tuple)) and len(v) > 0:
-                        pnames = []
-                        for i, item in enumerate(v):
-                            pname = _pname(base, f"_ne_{i}")
-                            params[pname] = item
-                            pnames.append(f":{pname}")
-                        where_clauses.append(f"{_derived_lhs(base)} NOT IN ({', '.join(pnames)})")
-                    else:
-                        pname = _pname(base, "_ne")
-                        params[pname] = v
-                        where_clauses.append(f"{_derived_lhs(base)} != :{pname}")
-                elif op == "notcontains":
-                    # DOESN'T CONTAIN: use NOT LIKE
-                    pname = _pname(base, "_notcontains")
-                    params[pname] = f"%{v}%"
-                    where_clauses.append(f"{_derived_lhs(base)} NOT LIKE :{pname}")
-                elif op in {"contains", "startswith", "endswith"}:
-                    # String matching operators
-                    pname = _pname(base, f"_{op}")
-                    if op == "contains":
-                        params[pname] = f"%{v}%"
-                    elif op == "startswith":
-                        params[pname] = f"{v}%"
-                    else:  # endswith
-                        params[pname] = f"%{v}"
-                    where_clauses.append(f"{_derived_lhs(base)} LIKE :{pname}")
-                else:
-                    pname = _pname(k)
-                    where_clauses.append(f"{_derived_lhs(k)} = :{pname}")
-                    params[pname] = v
-            elif isinstance(v, (list, tuple)):
-                if len(v) == 0:
-                    continue
-                pnames = []
-                for i, item in enumerate(v):
-                    pname = _pname(k, f"_{i}")
-                    params[pname] = item
-                    pnames.append(f":{pname}")
-                where_clauses.append(f"{_derived_lhs(k)} IN ({', '.join(pnames)})")
-            else:
-                pname = _pname(k)
-                where_clauses.append(f"{_derived_lhs(k)} = :{pname}")
-                params[pname] = v
+    # WHERE (compiled fragments are shared with other widgets filtering the same columns)
+    # Declared types for long value lists; derived "Col (Part)" keys are not the column's type.
+    _col_types = _filter_column_types(db, None if ds_type == "duckdb" else payload.datasourceId, payload.source, actorId)
+    where_clauses, params = _filter_fragments.compile_where(
+        payload.where, ds_type, _derived_lhs, null_lhs=_q_ident,
+        types=lambda k: _col_types(k) if _derived_lhs(k) == _q_ident(k) else None,
+    )
     # Store WHERE clauses and filter keys before building where_sql
     # We'll split them later based on dimensions
     where_filter_map: Dict[str, str] = {}  # key -> SQL clause
@@ -7956,7 +7915,7 @@ def run_pivot(payload: PivotRequest, request: Request, db: Session = Depends(get
                                     _db_path = get_active_duck_path()
                                     if _ds_obj and getattr(_ds_obj, "connection_encrypted", None):
                                         try:
-                                            _dsn = decrypt_text(_ds_obj.connection_encrypted)
+                                            _dsn = decrypt_credential(_ds_obj.id, _ds_obj.connection_encrypted)
                                             _p = urlparse(_dsn) if _dsn else None
                                             if _p and (_p.scheme or "").startswith("duckdb"):
                                                 _path = unquote(_p.path or "")
@@ -8244,6 +8203,9 @@ def run_pivot(payload: PivotRequest, request: Request, db: Session = Depends(get
                 ds_type=ds_type,
                 date_format=payload.dateFormat if hasattr(payload, 'dateFormat') else None,
                 date_columns=payload.dateColumns if hasattr(payload, 'dateColumns') else None,
+                subtotals=bool(payload.subtotals),
+                top_n=payload.topN,
+                others_label=payload.othersLabel or TOP_N_OTHERS_LABEL,
             )
             logger.debug(f"[SQLGlot] Pivot: Generated SQL: {inner[:150]}...")
             logger.debug(f"[DEBUG] Full generated SQL:\n{inner}")
@@ -8272,7 +8234,15 @@ def run_pivot(payload: PivotRequest, request: Request, db: Session = Depends(get
             sel = ", ".join(sel_parts + [f"{value_expr} AS value"]) or f"{value_expr} AS value"
         # Use ordinals for DuckDB/Postgres/MySQL/SQLite; use expressions only for SQL Server
         dim_count = len(r_exprs) + len(c_exprs)
-        if dim_count > 0:
+        if dim_count > 0 and payload.subtotals:
+            try:
+                grouping_sel, gb_sql, order_by = build_pivot_grouping(
+                    ds_type, [e for e, _ in (r_exprs + c_exprs)], len(r_exprs)
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            sel = f"{sel}, {grouping_sel}"
+        elif dim_count > 0:
             if 'mssql' in (ds_type or '') or 'sqlserver' in (ds_type or ''):
                 group_by = ", ".join([e for e, _ in (r_exprs + c_exprs)])
                 gb_sql = f" GROUP BY {group_by}"
@@ -8288,41 +8258,78 @@ def run_pivot(payload: PivotRequest, request: Request, db: Session = Depends(get
         logger.debug(f"[DEBUG] base_from_sql = {base_from_sql[:200]}")
         logger.debug(f"[DEBUG] ds_transforms exists = {bool(ds_transforms)}, custom_cols = {len(ds_transforms.get('customColumns', [])) if ds_transforms else 0}")
         inner = f"SELECT {sel}{base_from_sql}{where_sql}{gb_sql}{order_by}"
+        if payload.topN and dim_count > 0:
+            inner = SQLGlotBuilder(dialect=ds_type).wrap_top_n(
+                inner,
+                payload.topN,
+                fold=TOP_N_FOLD.get(str(agg or "count").lower()),
+                others_label=payload.othersLabel or TOP_N_OTHERS_LABEL,
+            )
 
     # Delegate execution to /query. If no explicit limit is provided, fetch all pages.
     import sys
     logger.debug(f"[DEBUG] Acquiring semaphore for query execution...")
     _HEAVY_SEM.acquire()
     try:
-        logger.debug(f"[DEBUG] Semaphore acquired, creating QueryRequest...")
-        if payload.limit is not None:
+        with _approx.approximate_scope(payload.approximate, payload.samplePercent) as _approx_scope:
+            logger.debug(f"[DEBUG] Semaphore acquired, creating QueryRequest...")
+            if payload.format == "matrix":
+                if payload.subtotals:
+                    raise HTTPException(status_code=400, detail="subtotals are not supported with format=matrix")
+                # The reshape needs every long-form cell; the dense output is bounded
+                # by maxRows x maxCols instead of the long-form row cap.
+                # One row past the cap tells whether the cap cut the input.
+                q = QueryRequest(
+                    sql=inner,
+                    datasourceId=payload.datasourceId,
+                    limit=PIVOT_MATRIX_FETCH_LIMIT + 1,
+                    offset=0,
+                    includeTotal=False,
+                    params=params or None,
+                )
+                res = run_query(q, db, actorId=actorId, publicId=publicId, token=token, pushdown=True)
+                truncated = len(res.rows) > PIVOT_MATRIX_FETCH_LIMIT
+                n_row_dims = len({str(d).lower() for d in r_dims})
+                n_col_dims = len({str(d).lower() for d in c_dims} - {str(d).lower() for d in r_dims})
+                m = to_pivot_matrix(
+                    res.columns, res.rows[:PIVOT_MATRIX_FETCH_LIMIT], n_row_dims, n_col_dims,
+                    agg=agg,
+                    max_rows=payload.maxRows or PIVOT_MATRIX_MAX_ROWS,
+                    max_cols=payload.maxCols or PIVOT_MATRIX_MAX_COLS,
+                    truncated=truncated,
+                )
+                return _approx.annotate(
+                    PivotResponse(columns=m["columns"], rows=m["rows"], elapsedMs=res.elapsedMs, matrix=m["matrix"]),
+                    _approx_scope,
+                )
+            if payload.limit is not None:
+                q = QueryRequest(
+                    sql=inner,
+                    datasourceId=payload.datasourceId,
+                    limit=payload.limit,
+                    offset=0,
+                    includeTotal=False,
+                    params=params or None,
+                )
+                logger.debug(f"[DEBUG] Calling run_query with limit={payload.limit}...")
+                return _approx.annotate(run_query(q, db, actorId=actorId, publicId=publicId, token=token, pushdown=True), _approx_scope)
+
+            # Default behavior: cap pivot results when limit is omitted to avoid buffering large results.
+            try:
+                pivot_default_limit = int(os.environ.get("PIVOT_DEFAULT_LIMIT", "2000") or "2000")
+            except Exception:
+                pivot_default_limit = 2000
+            if pivot_default_limit <= 0:
+                pivot_default_limit = 2000
             q = QueryRequest(
                 sql=inner,
                 datasourceId=payload.datasourceId,
-                limit=payload.limit,
+                limit=pivot_default_limit,
                 offset=0,
                 includeTotal=False,
                 params=params or None,
             )
-            logger.debug(f"[DEBUG] Calling run_query with limit={payload.limit}...")
-            return run_query(q, db, actorId=actorId, publicId=publicId, token=token)
-
-        # Default behavior: cap pivot results when limit is omitted to avoid buffering large results.
-        try:
-            pivot_default_limit = int(os.environ.get("PIVOT_DEFAULT_LIMIT", "2000") or "2000")
-        except Exception:
-            pivot_default_limit = 2000
-        if pivot_default_limit <= 0:
-            pivot_default_limit = 2000
-        q = QueryRequest(
-            sql=inner,
-            datasourceId=payload.datasourceId,
-            limit=pivot_default_limit,
-            offset=0,
-            includeTotal=False,
-            params=params or None,
-        )
-        return run_query(q, db, actorId=actorId, publicId=publicId, token=token)
+            return _approx.annotate(run_query(q, db, actorId=actorId, publicId=publicId, token=token, pushdown=True), _approx_scope)
     finally:
         _HEAVY_SEM.release()
 
@@ -8397,6 +8404,9 @@ def pivot_sql(payload: PivotRequest, db: Session = Depends(get_db), actorId: Opt
             ds_type=ds_type,
             date_format=payload.dateFormat if hasattr(payload, 'dateFormat') else None,
             date_columns=payload.dateColumns if hasattr(payload, 'dateColumns') else None,
+            subtotals=bool(payload.subtotals),
+            top_n=payload.topN,
+            others_label=payload.othersLabel or TOP_N_OTHERS_LABEL,
         )
         return {"sql": sql}
     except Exception as e:
@@ -8905,7 +8915,7 @@ def _period_totals_impl(payload: dict, db: Session = Depends(get_db), actorId: O
                     db_path = settings.duckdb_path
                     if ds and getattr(ds, "connection_encrypted", None):
                         try:
-                            dsn = decrypt_text(ds.connection_encrypted)
+                            dsn = decrypt_credential(ds.id, ds.connection_encrypted)
                             p = urlparse(dsn) if dsn else None
                             if p and (p.scheme or "").startswith("duckdb"):
                                 _p = unquote(p.path or "")
@@ -9373,14 +9383,13 @@ def _period_totals_impl(payload: dict, db: Session = Depends(get_db), actorId: O
     try:
         if route_duck and _duckdb is not None:
             # Native DuckDB execution
-            name_order = [m.group(1) for m in re.finditer(r":([A-Za-z_][A-Za-z0-9_]*)", sql_inner)]
-            sql_qm = re.sub(r":([A-Za-z_][A-Za-z0-9_]*)", "?", sql_inner)
+            sql_qm, name_order = _to_positional(sql_inner)
             vals = [params.get(nm) for nm in name_order]
             # Resolve DB path
             db_path = settings.duckdb_path
             if datasource_id and ds and getattr(ds, "connection_encrypted", None):
                 try:
-                    dsn = decrypt_text(ds.connection_encrypted)
+                    dsn = decrypt_credential(ds.id, ds.connection_encrypted)
                     p = urlparse(dsn) if dsn else None
                     if p and (p.scheme or "").startswith("duckdb"):
                         _p = unquote(p.path or "")
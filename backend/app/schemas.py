@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from pydantic import BaseModel, Field
 from pydantic.config import ConfigDict
-from typing import Optional, List, Dict, Any, Union
+from typing import Optional, List, Dict, Any, Union, Literal
 from datetime import datetime
 
 
@@ -129,6 +129,14 @@ class QueryResponse(BaseModel):
     rows: List[List[Any]]
     elapsedMs: Optional[int] = None
     totalRows: Optional[int] = None
+    # Set when an approximate request was actually sampled/sketched (see app/approximate.py)
+    approximate: Optional[bool] = None
+    approximation: Optional[Dict[str, Any]] = None
+
+
+class PivotResponse(QueryResponse):
+    # Set for format="matrix": rowDims, colDims, colKeys and overflow counts (see pivot_matrix)
+    matrix: Optional[Dict[str, Any]] = None
 
 
 # --- Distinct ---
@@ -138,12 +146,37 @@ class DistinctRequest(BaseModel):
     where: Optional[Dict[str, Any]] = None
     datasourceId: Optional[str] = None
     widgetId: Optional[str] = None
+    # Dropdown search: case-insensitive substring (prefix when searchMode='prefix')
+    search: Optional[str] = None
+    searchMode: Optional[Literal['substring', 'prefix']] = None
+    limit: Optional[int] = None
+    # 'frequency' returns the most common values first (dictionary-backed columns only)
+    orderBy: Optional[Literal['value', 'frequency']] = None
 
 
 class DistinctResponse(BaseModel):
     values: List[Any]
 
 
+class DistinctBatchRequest(BaseModel):
+    """Several /distinct fields over one source and filter context."""
+    source: str
+    fields: List[str]
+    where: Optional[Dict[str, Any]] = None
+    datasourceId: Optional[str] = None
+    widgetId: Optional[str] = None
+    search: Optional[str] = None
+    searchMode: Optional[Literal['substring', 'prefix']] = None
+    limit: Optional[int] = None
+    orderBy: Optional[Literal['value', 'frequency']] = None
+
+
+class DistinctBatchResponse(BaseModel):
+    values: Dict[str, List[Any]]
+    # field -> error detail for fields that failed; the rest still succeed
+    errors: Optional[Dict[str, str]] = None
+
+
 # --- Pivot (server-side aggregation for pivot grid) ---
 class PivotRequest(BaseModel):
     source: str
@@ -160,6 +193,14 @@ class PivotRequest(BaseModel):
     weekStart: Optional[str] = Field(default=None, description="mon|sun for week grouping")
     dateFormat: Optional[str] = Field(default=None, description="Date format string (e.g., 'DD-MM-YYYY', 'YYYY-MM-DD') for formatting date columns")
     dateColumns: Optional[List[str]] = Field(default=None, description="List of column names that should be formatted as dates")
+    subtotals: Optional[bool] = Field(default=False, description="Add database-computed subtotal/grand-total rows, tagged by a __grouping bitmask column")
+    format: Optional[Literal['long', 'matrix']] = Field(default="long", description="long: [row_dims..., col_dims..., value] rows; matrix: dense cross-tab")
+    maxRows: Optional[int] = Field(default=None, description="matrix: keep the largest N row keys, fold the rest into 'Other'")
+    maxCols: Optional[int] = Field(default=None, description="matrix: keep the largest N column keys, fold the rest into 'Other'")
+    topN: Optional[int] = Field(default=None, description="Keep the N largest values of the first row dimension; the rest become 'Others'")
+    othersLabel: Optional[str] = Field(default=None, description="Label for the folded tail row (default 'Others')")
+    approximate: Optional[bool] = Field(default=False, description="Exploratory mode: sample / sketch on DuckDB and report error bounds")
+    samplePercent: Optional[float] = Field(default=None, description="approximate: TABLESAMPLE percentage (default APPROX_SAMPLE_PERCENT)")
 
 
 # --- Dashboards ---
@@ -342,7 +383,15 @@ class QuerySpec(BaseModel):
     avgDateField: Optional[str] = Field(default=None, description="Date field for avg_daily/avg_weekly/avg_monthly period averaging")
     avgNumerator: Optional[str] = Field(default=None, description="Numerator aggregation for period averages: sum (default)|count|distinct")
     applyHolidays: Optional[bool] = Field(default=False, description="Exclude holiday dates from working-day count in avg_wday")
+    maWindows: Optional[List[int]] = Field(default=None, description="ma* with groupBy: extra N-day windows computed in the same query as ma<N> columns")
     ignoreTransforms: Optional[bool] = Field(default=False, description="Skip datasource-level transforms/joins (useful for timeout recovery)")
+    # Bounded category charts: keep the N largest x (or legend) values, fold the rest into one row
+    topN: Optional[int] = Field(default=None, description="Keep the N largest categories; the tail becomes an 'Others' row")
+    topNPerSeries: Optional[bool] = Field(default=False, description="Rank categories within each legend series instead of overall")
+    othersLabel: Optional[str] = Field(default=None, description="Label for the folded tail row (default 'Others')")
+    # Time-series downsampling: at most maxPoints rows per series (see app/downsample.py)
+    maxPoints: Optional[int] = Field(default=None, description="Downsample each series to at most this many points")
+    downsample: Optional[Literal['minmax', 'lttb']] = Field(default=None, description="minmax (default, in SQL when possible)|lttb")
 
 
 class QuerySpecRequest(BaseModel):
@@ -354,6 +403,9 @@ class QuerySpecRequest(BaseModel):
     widgetId: Optional[str] = None
     # Preference: route execution to local DuckDB when the base source exists locally
     preferLocalDuck: Optional[bool] = None
+    # Per-widget opt-in to approximate results (sampling / sketches, DuckDB only)
+    approximate: Optional[bool] = False
+    samplePercent: Optional[float] = None
 
 
 class BrandingOut(BaseModel):
@@ -634,6 +686,7 @@ class CustomColumn(BaseModel):
     name: str
     expr: str
     type: Optional[str] = None  # 'string'|'number'|'date'|'boolean'
+    materialized: Optional[bool] = None  # computed into the synced DuckDB table (app/materialized.py)
     scope: Optional[Scope] = None
 
 
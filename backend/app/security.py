@@ -2,10 +2,13 @@ from __future__ import annotations
 
 import base64
 import hashlib
+import os
+import threading
+from collections import OrderedDict
 from typing import Optional, Tuple
 import hmac
 import time
-from cryptography.fernet import Fernet, InvalidToken
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError, VerificationError, InvalidHashError
 
@@ -19,8 +22,33 @@ def _derive_key(secret: str) -> bytes:
     return base64.urlsafe_b64encode(digest)
 
 
-def _fernet() -> Fernet:
-    return Fernet(_derive_key(settings.secret_key))
+# --- Credential encryption ---
+# One MultiFernet per process: the primary SECRET_KEY encrypts, any keys in
+# SECRET_KEY_PREVIOUS still decrypt during a rotation window. The instance is
+# rebuilt (and the decrypted-credential cache purged) only when the key set
+# in settings changes.
+_fernet_lock = threading.Lock()
+_fernet_keys: Tuple[str, ...] = ()
+_fernet_inst: Optional[MultiFernet] = None
+
+
+def _key_set() -> Tuple[str, ...]:
+    prev = [k.strip() for k in str(getattr(settings, "secret_key_previous", "") or "").split(",") if k.strip()]
+    return (settings.secret_key, *[k for k in prev if k != settings.secret_key])
+
+
+def _fernet() -> MultiFernet:
+    global _fernet_keys, _fernet_inst
+    keys = _key_set()
+    inst = _fernet_inst
+    if inst is not None and keys == _fernet_keys:
+        return inst
+    with _fernet_lock:
+        if _fernet_inst is None or keys != _fernet_keys:
+            _fernet_inst = MultiFernet([Fernet(_derive_key(k)) for k in keys])
+            _fernet_keys = keys
+            purge_credentials()
+        return _fernet_inst
 
 
 def encrypt_text(plain: str) -> str:
@@ -37,6 +65,59 @@ def decrypt_text(token: str) -> Optional[str]:
         return None
 
 
+# Decrypted connection URIs, keyed by (datasource id, credential version).
+# The version is a digest of the ciphertext, so editing a datasource's
+# connection naturally misses the cache; purge_credentials() drops the stale
+# plaintext eagerly. Bounded LRU so plaintext secrets never accumulate.
+try:
+    CREDENTIAL_CACHE_MAX = int(os.environ.get("CREDENTIAL_CACHE_MAX", "256") or "256")
+except Exception:
+    CREDENTIAL_CACHE_MAX = 256
+_cred_lock = threading.Lock()
+_cred_cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+
+
+def credential_version(token: Optional[str]) -> str:
+    """Stable short fingerprint of an encrypted credential (never of the plaintext)."""
+    return hashlib.sha256((token or "").encode("utf-8")).hexdigest()[:16]
+
+
+def decrypt_credential(ds_id: Optional[str], token: Optional[str]) -> Optional[str]:
+    """decrypt_text() with a per-datasource cache. Failures are not cached."""
+    if not token:
+        return None
+    if not ds_id or CREDENTIAL_CACHE_MAX <= 0:
+        return decrypt_text(token)
+    _fernet()  # rebuilds + purges if the key set changed
+    key = (str(ds_id), credential_version(token))
+    with _cred_lock:
+        plain = _cred_cache.get(key)
+        if plain is not None:
+            _cred_cache.move_to_end(key)
+            return plain
+    plain = decrypt_text(token)
+    if plain is None:
+        return None
+    with _cred_lock:
+        # Only one live version per datasource: drop superseded plaintexts.
+        for k in [k for k in _cred_cache if k[0] == key[0] and k != key]:
+            _cred_cache.pop(k, None)
+        _cred_cache[key] = plain
+        while len(_cred_cache) > CREDENTIAL_CACHE_MAX:
+            _cred_cache.popitem(last=False)
+    return plain
+
+
+def purge_credentials(ds_id: Optional[str] = None) -> None:
+    """Forget cached plaintext credentials (one datasource, or all)."""
+    with _cred_lock:
+        if ds_id is None:
+            _cred_cache.clear()
+            return
+        for k in [k for k in _cred_cache if k[0] == str(ds_id)]:
+            _cred_cache.pop(k, None)
+
+
 # --- Password hashing (argon2id with automatic per-user salt) ---
 def hash_password(password: str) -> str:
     """Hash a password using argon2id with a random per-user salt."""
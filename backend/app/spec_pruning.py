@@ -0,0 +1,216 @@
+"""Projection pruning and join elimination for /query/spec transform subqueries.
+
+When a datasource has custom columns, transforms or joins, the chart path of
+``run_query_spec`` aggregates over ``FROM (<build_sql output>) AS _base``.
+That subquery used to be built with ``base_select=["*"]`` and every
+configured custom column, transform and join, so a widget that charts
+``SUM(Amount) BY Region`` still shipped every base column, evaluated every
+custom expression and joined every dimension table. For wide remote tables
+each projected column is network I/O, and each unused LEFT JOIN is an extra
+scan of the dimension table.
+
+:func:`prune_for_spec` works out what the widget actually reads:
+
+* the roots are the spec's x (each level; ``"Field (Month)"`` also roots
+  ``Field``), y, legend, avgDateField, the per-series x / y / legend, every
+  column named in ``measure`` / series measures, and every WHERE key (the
+  part before ``__``; resolved ``(expr)`` keys contribute their columns);
+* custom columns and computed / case / replace / translate / nullhandling
+  transforms are kept only when reachable from the roots, following
+  references between them transitively;
+* a LEFT JOIN is dropped when none of its output columns (column aliases,
+  raw column names that do not collide with base columns, the aggregate
+  alias) is a root or referenced by a kept expression. Aggregate joins are
+  grouped by their key, so dropping them never changes the row count; plain
+  column joins are treated as lookups into dimension tables whose target key
+  is unique, which is what the join editor configures. INNER / RIGHT /
+  LATERAL joins always stay (they filter or multiply rows), and no join is
+  dropped when a kept expression names a ``jN`` alias directly, because
+  dropping one renumbers the rest;
+* when the base columns are known (the router probes them), the subquery
+  projects the base columns that are roots plus the kept aliases instead of
+  ``s.*``. Columns read only inside custom expressions need no projection:
+  build_sql inlines those expressions against ``s``. When a kept alias has
+  the name of a base column (a case transform rewriting ``Status``), the
+  projection stays ``s.*``: next to the star the outer query resolves such
+  a name to the first duplicate on DuckDB, and pruning must not change
+  which one it sees.
+
+Column references are extracted lexically (bracketed, quoted, backticked and
+bare identifiers outside string literals), which over-approximates: a
+keyword that happens to match a column name keeps that column, never the
+other way round. Datasources with an unpivot transform are left untouched.
+
+Disable the whole pass with ``SPEC_PROJECTION_PRUNING=0``, or only the
+join elimination with ``SPEC_JOIN_ELIMINATION=0``.
+"""
+from __future__ import annotations
+
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+_DERIVED_PART = re.compile(
+    r"^(.*?)\s*\((Year|Quarter|Month|Month Name|Month Short|Week|Day|Day Name|Day Short)\)$", re.IGNORECASE
+)
+_STRING_LIT = re.compile(r"'(?:[^']|'')*'")
+_IDENT = re.compile(r'\[([^\]]+)\]|"([^"]+)"|`([^`]+)`|\b([A-Za-z_][A-Za-z0-9_]*)\b')
+_JOIN_ALIAS_REF = re.compile(r'(?<![\w.])["\[`]?j\d+["\]`]?\s*\.', re.IGNORECASE)
+_WHERE_GLOBALS = {"start", "startdate", "end", "enddate"}
+_TARGET_TRANSFORMS = {"case", "replace", "translate", "nullhandling"}
+
+
+def enabled() -> bool:
+    return str(os.environ.get("SPEC_PROJECTION_PRUNING", "1")).strip().lower() not in ("0", "false", "no", "off")
+
+
+def joins_enabled() -> bool:
+    return str(os.environ.get("SPEC_JOIN_ELIMINATION", "1")).strip().lower() not in ("0", "false", "no", "off")
+
+
+def _key(name: Any) -> str:
+    return str(name or "").strip().strip("[]").strip('"').strip("`").lower()
+
+
+def expr_refs(expr: Any) -> Set[str]:
+    """Lowercased identifiers an expression may reference (over-approximated)."""
+    refs: Set[str] = set()
+    for m in _IDENT.finditer(_STRING_LIT.sub(" ", str(expr or ""))):
+        refs.add(next(g for g in m.groups() if g is not None).strip().lower())
+    return refs
+
+
+def _add_field(roots: Set[str], name: Any) -> None:
+    if not isinstance(name, str) or not name.strip():
+        return
+    s = name.strip()
+    roots.add(_key(s))
+    m = _DERIVED_PART.match(s)
+    if m:
+        roots.add(_key(m.group(1)))
+
+
+def spec_roots(spec: Any) -> Set[str]:
+    """Lowercased names the chart query built from *spec* reads from ``_base``."""
+    roots: Set[str] = set()
+    xs = spec.x if isinstance(spec.x, list) else [spec.x]
+    for x in xs:
+        _add_field(roots, x)
+    for f in (spec.y, spec.legend, getattr(spec, "avgDateField", None)):
+        _add_field(roots, f)
+    if spec.measure:
+        roots |= expr_refs(spec.measure)
+    for s in (spec.series or []):
+        if not isinstance(s, dict):
+            continue
+        for f in ("x", "y", "legend"):
+            _add_field(roots, s.get(f))
+        if s.get("measure"):
+            roots |= expr_refs(s.get("measure"))
+    for k in (spec.where or {}).keys():
+        if not isinstance(k, str) or k.lower() in _WHERE_GLOBALS:
+            continue
+        if k.startswith("("):
+            roots |= expr_refs(k)
+        else:
+            _add_field(roots, k.split("__", 1)[0])
+    roots.discard("")
+    return roots
+
+
+def _output_name(item: Dict[str, Any]) -> Any:
+    return item.get("target") if str(item.get("type") or "").lower() in _TARGET_TRANSFORMS else item.get("name")
+
+
+def _item_node(item: Dict[str, Any]) -> Tuple[Optional[str], Set[str]]:
+    """(output name, referenced names) of a custom column or transform."""
+    if str(item.get("type") or "").lower() in _TARGET_TRANSFORMS:
+        target = item.get("target")
+        refs = expr_refs(target)
+        for c in (item.get("cases") or []):
+            if isinstance(c, dict):
+                refs |= expr_refs((c.get("when") or {}).get("left"))
+        return _key(target), refs
+    return _key(_output_name(item)), expr_refs(item.get("expr"))
+
+
+def _join_outputs(j: Dict[str, Any], base_lower: Set[str]) -> Set[str]:
+    out: Set[str] = set()
+    agg = j.get("aggregate")
+    if isinstance(agg, dict) and agg.get("alias"):
+        out.add(_key(agg.get("alias")))
+    for c in (j.get("columns") or []):
+        if not isinstance(c, dict):
+            continue
+        name, alias = _key(c.get("name")), _key(c.get("alias"))
+        if alias:
+            out.add(alias)
+        if name and (not alias or name not in base_lower):
+            out.add(name)
+    out.discard("")
+    return out
+
+
+def prune_for_spec(
+    custom_columns: Iterable[Dict[str, Any]],
+    transforms: Iterable[Dict[str, Any]],
+    joins: Iterable[Dict[str, Any]],
+    roots: Set[str],
+    base_cols: Optional[Iterable[str]] = None,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]], List[str]]:
+    """Keep only what *roots* need.
+
+    Returns ``(custom_columns, transforms, joins, base_select)`` for build_sql.
+    ``base_select`` is ``["*"]`` unless *base_cols* is known, in which case it
+    lists the root base columns and kept aliases.
+    """
+    ccs = [c for c in (custom_columns or []) if isinstance(c, dict)]
+    trs = [t for t in (transforms or []) if isinstance(t, dict)]
+    jns = [j for j in (joins or []) if isinstance(j, dict)]
+    if any(str(t.get("type") or "").lower() == "unpivot" for t in trs):
+        return ccs, trs, jns, ["*"]
+    base_by_key = {_key(c): str(c) for c in (base_cols or [])}
+
+    deps: Dict[str, Set[str]] = {}
+    for item in ccs + trs:
+        name, refs = _item_node(item)
+        if name:
+            deps.setdefault(name, set()).update(refs - {name})
+    needed = {r for r in roots if r in deps}
+    queue = list(needed)
+    while queue:
+        for dep in deps.get(queue.pop(), ()):
+            if dep in deps and dep not in needed:
+                needed.add(dep)
+                queue.append(dep)
+
+    kept_cc = [c for c in ccs if _key(c.get("name")) in needed]
+    kept_tr = [t for t in trs if _item_node(t)[0] in needed]
+    referenced = set(roots)
+    explicit_join_alias = False
+    for item in kept_cc + kept_tr:
+        referenced |= _item_node(item)[1]
+        text = " ".join(str(item.get(k) or "") for k in ("expr", "target"))
+        explicit_join_alias = explicit_join_alias or bool(_JOIN_ALIAS_REF.search(_STRING_LIT.sub(" ", text)))
+
+    kept_joins = jns
+    if joins_enabled() and not explicit_join_alias:
+        base_lower = set(base_by_key)
+        kept_joins = [
+            j for j in jns
+            if str(j.get("joinType") or "left").lower() != "left"
+            or j.get("lateral")
+            or (_join_outputs(j, base_lower) & referenced)
+        ]
+
+    base_select = ["*"]
+    # An alias that shadows a base column resolves to the base column next to s.* on
+    # some engines (DuckDB takes the first duplicate); keep s.* so results don't change.
+    if base_by_key and not any(k in base_by_key for k in needed):
+        cols = [base_by_key[k] for k in sorted(base_by_key) if k in roots]
+        aliases = [str(c.get("name")).strip() for c in kept_cc]
+        aliases += [str(_output_name(t)).strip() for t in kept_tr]
+        picked = list(dict.fromkeys(cols + aliases))
+        if picked:
+            base_select = picked
+    return kept_cc, kept_tr, kept_joins, base_select
@@ -1,12 +1,147 @@
 """
 SQL Dialect Normalizer
 Converts SQL expressions between different database dialects (SQL Server, DuckDB, MySQL, PostgreSQL)
+
+Expressions and statements are rewritten in a single pass over the tokens of
+sqlglot's tokenizer (configured to read ``"x"``, ```x``` and ``[x]`` as
+quoted identifiers), copying the text between tokens verbatim:
+
+* quoted identifiers are re-quoted for the target dialect (embedded quote
+  characters doubled);
+* SQL Server functions without a same-named equivalent are renamed when the
+  source is SQL Server (``ISNULL`` -> ``COALESCE``, ``LEN`` -> ``LENGTH``, ...);
+* CASE keywords glued to a neighbouring token (``'x'END``, ``THEN'y'``) get a
+  separating space;
+* :func:`to_positional` turns ``:name`` parameters into ``?`` and returns
+  the names in order of appearance.
+
+String literals, comments and ``::`` casts are single tokens or gaps, so
+their contents are never rewritten (``'12:30'`` is not a parameter). Results
+are memoized per input string. Input the tokenizer rejects (e.g. an
+unterminated quote) falls back to the older regex rules.
 """
 
 import re
-from typing import Optional
+from typing import Callable, Optional, Tuple
+
+from sqlglot.tokens import Tokenizer, TokenType
+
+from .compile_cache import memoize_compile, memoize_expr
+
+
+class _Tokenizer(Tokenizer):
+    IDENTIFIERS = ['"', '`', ("[", "]")]
+    QUOTES = ["'"]
+
+
+_CASE_KEYWORDS = {TokenType.CASE, TokenType.WHEN, TokenType.THEN, TokenType.ELSE, TokenType.END}
+_NO_SPACE_BEFORE = {TokenType.R_PAREN, TokenType.COMMA, TokenType.DOT}
+_NO_SPACE_AFTER = {TokenType.L_PAREN, TokenType.DOT}
+_NAME_TOKEN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# SQL Server function -> target-dialect function, applied when the source is SQL Server.
+_MSSQL_FUNCTIONS = {
+    "duckdb": {"ISNULL": "COALESCE", "LEN": "LENGTH", "GETDATE": "NOW"},
+    "postgres": {"ISNULL": "COALESCE", "LEN": "LENGTH", "GETDATE": "NOW"},
+    "mysql": {"ISNULL": "COALESCE", "LEN": "CHAR_LENGTH", "GETDATE": "NOW"},
+    "sqlite": {"ISNULL": "COALESCE", "LEN": "LENGTH"},
+}
+
+
+def _target(dialect: Optional[str]) -> str:
+    d = (dialect or "").lower()
+    if d.startswith("postgres"):
+        return "postgres"
+    if d.startswith("mysql") or d.startswith("mariadb"):
+        return "mysql"
+    if d.startswith("mssql") or d == "sqlserver":
+        return "mssql"
+    if d.startswith("duckdb"):
+        return "duckdb"
+    if d.startswith("sqlite"):
+        return "sqlite"
+    return d
+
+
+def quote_for(name: str, target_dialect: str) -> str:
+    """Quote one identifier segment for the target dialect."""
+    t = _target(target_dialect)
+    s = str(name).strip()
+    if t == "mysql":
+        return "`" + s.replace("`", "``") + "`"
+    if t == "mssql":
+        return "[" + s.replace("]", "]]") + "]"
+    return '"' + s.replace('"', '""') + '"'
+
+
+def _tokens(sql: str):
+    return _Tokenizer().tokenize(sql)
+
 
+def rewrite_expression(
+    expr: str,
+    target_dialect: str,
+    source_dialect: Optional[str] = None,
+    wrap_ident: Optional[Callable[[str], str]] = None,
+) -> str:
+    """One token pass: identifier quoting, function mapping and CASE spacing.
+
+    *wrap_ident*, if given, receives every identifier chain that contains a
+    quoted segment (``"s"."Amount"``) after re-quoting and returns its
+    replacement. Not memoized; see :func:`normalize_sql_expression`.
+    """
+    t = _target(target_dialect)
+    toks = _tokens(expr)
+    functions = _MSSQL_FUNCTIONS.get(t, {}) if _target(source_dialect) == "mssql" and t != "mssql" else {}
+    out: list[str] = []
+    pos = 0
+    i = 0
+    n = len(toks)
+    while i < n:
+        tok = toks[i]
+        out.append(expr[pos:tok.start])
+        prev = toks[i - 1] if i else None
+        if prev is not None and prev.end + 1 == tok.start and (
+            (tok.token_type in _CASE_KEYWORDS and prev.token_type not in _NO_SPACE_AFTER)
+            or (prev.token_type in _CASE_KEYWORDS and tok.token_type not in _NO_SPACE_BEFORE)
+        ):
+            out.append(" ")
+        if tok.token_type in (TokenType.IDENTIFIER, TokenType.VAR):
+            # Identifier chain a.b.c with adjacent dots
+            j = i
+            parts = []
+            quoted = False
+            while True:
+                cur = toks[j]
+                if cur.token_type == TokenType.IDENTIFIER:
+                    parts.append(quote_for(cur.text, t))
+                    quoted = True
+                else:
+                    parts.append(expr[cur.start:cur.end + 1])
+                if (j + 2 < n and toks[j + 1].token_type == TokenType.DOT
+                        and toks[j + 1].start == cur.end + 1 and toks[j + 2].start == toks[j + 1].end + 1
+                        and toks[j + 2].token_type in (TokenType.IDENTIFIER, TokenType.VAR)):
+                    j += 2
+                    continue
+                break
+            if j == i and not quoted and functions and i + 1 < n and toks[i + 1].token_type == TokenType.L_PAREN:
+                parts = [functions.get(tok.text.upper(), parts[0])]
+            chain = ".".join(parts)
+            out.append(wrap_ident(chain) if (quoted and wrap_ident) else chain)
+            pos = toks[j].end + 1
+            i = j + 1
+            continue
+        if functions and i + 1 < n and toks[i + 1].token_type == TokenType.L_PAREN and tok.text.upper() in functions:
+            out.append(functions[tok.text.upper()])
+        else:
+            out.append(expr[tok.start:tok.end + 1])
+        pos = tok.end + 1
+        i += 1
+    out.append(expr[pos:])
+    return "".join(out)
 
+
+@memoize_expr("normalize_sql_expression")
 def normalize_sql_expression(
     expr: str,
     target_dialect: str,
@@ -14,128 +149,91 @@ def normalize_sql_expression(
 ) -> str:
     """
     Normalize a SQL expression to the target dialect.
-    
+
     Args:
         expr: SQL expression to normalize
         target_dialect: Target database dialect (duckdb, mysql, postgres, mssql, sqlite)
         source_dialect: Source dialect hint (auto-detect if None)
-        
+
     Returns:
         Normalized SQL expression
     """
     if not expr or not isinstance(expr, str):
         return expr
-    
-    target = (target_dialect or "").lower()
-    result = str(expr)
-    
-    # Step 1: Normalize identifier quoting
-    result = _normalize_identifiers(result, target)
-    
-    # Step 2: Fix CASE/END spacing
-    result = _fix_case_end_spacing(result)
-    
-    # Step 3: Dialect-specific function conversions (if needed in future)
-    # result = _normalize_functions(result, target)
-    
-    return result
+    try:
+        return rewrite_expression(expr, target_dialect, source_dialect)
+    except Exception:
+        target = (target_dialect or "").lower()
+        return _fix_case_end_spacing(_normalize_identifiers(str(expr), target))
 
 
 def _normalize_identifiers(expr: str, target_dialect: str) -> str:
     """
-    Convert identifier quoting to match target dialect.
-    
+    Regex fallback: convert identifier quoting to match target dialect.
+
     Patterns:
     - SQL Server: [identifier] or [schema].[table].[column]
-    - DuckDB/PostgreSQL: "identifier" or schema."table"."column"  
+    - DuckDB/PostgreSQL: "identifier" or schema."table"."column"
     - MySQL: `identifier` or `schema`.`table`.`column`
-    - Unquoted: identifier (when safe)
     """
-    
-    # Replace SQL Server bracket notation: [s].[ClientID] → s."ClientID" or s.`ClientID`
     if target_dialect in ('duckdb', 'postgres', 'postgresql', 'sqlite'):
-        # Replace [identifier] with "identifier"
-        # Handle nested brackets like [schema].[table].[column]
-        def replace_brackets(match):
-            content = match.group(1)
-            # Unescape doubled brackets
-            content = content.replace(']]', ']')
-            return f'"{content}"'
-        
-        # Pattern: [anything_except_brackets] but handle escaped ]]
-        # Simple approach: replace [...]  with "..."
-        result = re.sub(r'\[([^\]]+)\]', replace_brackets, expr)
-        
-    elif target_dialect in ('mysql', 'mariadb'):
-        # Replace [identifier] with `identifier`
-        def replace_brackets(match):
-            content = match.group(1)
-            content = content.replace(']]', ']')
-            return f'`{content}`'
-        
-        result = re.sub(r'\[([^\]]+)\]', replace_brackets, expr)
-        
-    elif target_dialect in ('mssql', 'sqlserver', 'mssql+pymssql', 'mssql+pyodbc'):
-        # Already SQL Server syntax, but normalize double quotes to brackets
+        return re.sub(r'\[([^\]]+)\]', lambda m: '"' + m.group(1).replace(']]', ']') + '"', expr)
+    if target_dialect in ('mysql', 'mariadb'):
+        return re.sub(r'\[([^\]]+)\]', lambda m: '`' + m.group(1).replace(']]', ']') + '`', expr)
+    if target_dialect in ('mssql', 'sqlserver', 'mssql+pymssql', 'mssql+pyodbc'):
         result = re.sub(r'"([^"]+)"', r'[\1]', expr)
-        # Normalize backticks to brackets
-        result = re.sub(r'`([^`]+)`', r'[\1]', expr)
-    
-    else:
-        # Unknown dialect: prefer double quotes (most standard)
-        result = re.sub(r'\[([^\]]+)\]', r'"\1"', expr)
-        result = re.sub(r'`([^`]+)`', r'"\1"', expr)
-    
-    return result
+        return re.sub(r'`([^`]+)`', r'[\1]', result)
+    result = re.sub(r'\[([^\]]+)\]', r'"\1"', expr)
+    return re.sub(r'`([^`]+)`', r'"\1"', result)
 
 
 def _fix_case_end_spacing(expr: str) -> str:
     """
-    Ensure proper spacing around CASE/END keywords.
-    
+    Regex fallback: ensure spacing around CASE/END keywords.
+
     Common issue: CASE ... THENEND should be THEN...END
     Also: missing space before END
     """
-    # Add space before END if missing (but not in words like APPEND, SPEND, etc.)
-    # Look for: non-whitespace followed immediately by END (case-insensitive)
-    # But only if END is a keyword (followed by whitespace, comma, or end of string)
-    result = re.sub(
-        r'(\S)(END)(?=\s|,|$)', 
-        r'\1 \2', 
-        expr, 
-        flags=re.IGNORECASE
-    )
-    
-    # Ensure space after THEN if missing
-    result = re.sub(
-        r'(THEN)(\S)',
-        r'\1 \2',
-        result,
-        flags=re.IGNORECASE
-    )
-    
-    # Ensure space after ELSE if missing  
-    result = re.sub(
-        r'(ELSE)(\S)',
-        r'\1 \2',
-        result,
-        flags=re.IGNORECASE
-    )
-    
-    return result
-
-
-def _normalize_functions(expr: str, target_dialect: str) -> str:
-    """
-    Convert dialect-specific functions to target equivalents.
-    (Placeholder for future enhancements)
-    
-    Examples:
-    - MSSQL CONVERT → DuckDB CAST
-    - MySQL CONCAT_WS → Postgres string_agg
+    result = re.sub(r'(\S)(END)(?=\s|,|$)', r'\1 \2', expr, flags=re.IGNORECASE)
+    result = re.sub(r'(THEN)(\S)', r'\1 \2', result, flags=re.IGNORECASE)
+    return re.sub(r'(ELSE)(\S)', r'\1 \2', result, flags=re.IGNORECASE)
+
+
+_NAMED_PARAM = re.compile(r":([A-Za-z_][A-Za-z0-9_]*)")
+
+
+@memoize_compile("named_params")
+def to_positional(sql: str) -> Tuple[str, Tuple[str, ...]]:
+    """``(sql with :name replaced by ?, names in order of appearance)``.
+
+    ``:name`` inside string literals and comments and ``::`` casts are left
+    alone. Repeated names appear once per occurrence.
     """
-    # TODO: Implement function conversions if needed
-    return expr
+    if not sql or ":" not in sql:
+        return sql, ()
+    try:
+        toks = _tokens(sql)
+    except Exception:
+        return _NAMED_PARAM.sub("?", sql), tuple(m.group(1) for m in _NAMED_PARAM.finditer(sql))
+    out: list[str] = []
+    names: list[str] = []
+    pos = 0
+    i = 0
+    n = len(toks)
+    while i < n:
+        tok = toks[i]
+        if (tok.token_type == TokenType.COLON and i + 1 < n and toks[i + 1].start == tok.end + 1
+                and toks[i + 1].token_type != TokenType.IDENTIFIER
+                and _NAME_TOKEN.match(sql[toks[i + 1].start:toks[i + 1].end + 1])):
+            out.append(sql[pos:tok.start])
+            out.append("?")
+            names.append(sql[toks[i + 1].start:toks[i + 1].end + 1])
+            pos = toks[i + 1].end + 1
+            i += 2
+            continue
+        i += 1
+    out.append(sql[pos:])
+    return "".join(out), tuple(names)
 
 
 # Convenience functions for common cases
@@ -155,6 +253,7 @@ def mssql_to_mysql(expr: str) -> str:
     return normalize_sql_expression(expr, 'mysql', 'mssql')
 
 
+@memoize_expr("auto_normalize")
 def auto_normalize(expr: str, target_dialect: str) -> str:
     """
     Auto-detect source dialect and normalize to target.
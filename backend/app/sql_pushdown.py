@@ -0,0 +1,235 @@
+"""Push WHERE predicates below transform / custom-column subqueries.
+
+When a datasource has custom columns, transforms or joins, the routers run
+the widget query over ``FROM (<build_sql output>) AS _base`` and apply the
+widget filters on that outer layer::
+
+    SELECT ... FROM (SELECT s.*, <custom> AS "Net", j1.name AS "ClientName"
+                     FROM sales AS s LEFT JOIN clients AS j1 ON ...) AS _base
+    WHERE "Region" IN (:w_Region_0, :w_Region_1) AND "Net" > :w_Net
+
+Engines that do not push conditions into derived tables themselves (MySQL
+before 8.0.22 materializes them, some ATTACHed scanners only see the inner
+statement) then scan the whole base table. :func:`pushdown_predicates`
+rewrites the statement with sqlglot so that every top-level AND term that
+only reads base columns moves into the subquery's WHERE, next to the base
+table and its joins, repeatedly through nested layers::
+
+    ... FROM (SELECT s.*, ... FROM sales AS s LEFT JOIN clients AS j1 ON ...
+              WHERE s."Region" IN (:w_Region_0, :w_Region_1)) AS _base
+    WHERE "Net" > :w_Net
+
+A term moves only when it is safe without a schema:
+
+* the subquery is a plain projection (no GROUP BY / HAVING / DISTINCT /
+  LIMIT / window or aggregate functions / set-returning functions);
+* every column in the term resolves through the subquery's projection to a
+  column of its sources: either through the single ``*`` / ``s.*`` (and is
+  not also the name of an explicit projection, which would be ambiguous), or
+  through an explicit ``<column> AS name`` projection when there is no star
+  or a ``schema`` shows that the name cannot come from the star;
+* the term has no subqueries, aggregates or windows.
+
+Terms on computed columns stay where they are. The inner WHERE is evaluated
+after the subquery's own joins, so moving a term into it never changes LEFT
+JOIN semantics. Statements without a derived table in FROM are returned
+untouched without being parsed; results are memoized per statement.
+
+Only SQL the app generated is rewritten: the ``/query/spec`` and pivot
+builders call ``run_query(..., pushdown=True)``. Raw SQL posted to
+``/query`` runs exactly as written.
+
+Disable with ``SQL_PREDICATE_PUSHDOWN=0``.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+import sqlglot
+from sqlglot import exp
+
+from .compile_cache import memoize_compile
+from .sqlgen import _dialect_name, _sqlglot_dialect
+
+logger = logging.getLogger(__name__)
+
+_KNOWN_DIALECTS = {"duckdb", "postgres", "mysql", "mssql", "sqlite"}
+_DERIVED_FROM = re.compile(r"\bFROM\s*\(\s*SELECT\b", re.IGNORECASE)
+# Inner-select clauses that change which rows a filter would see.
+_BLOCKING_ARGS = ("group", "having", "qualify", "distinct", "limit", "offset", "windows", "connect", "sample")
+_BLOCKING_NODES = (exp.AggFunc, exp.Window, exp.Unnest, exp.Explode, exp.Subquery, exp.Select)
+
+
+def enabled() -> bool:
+    return str(os.environ.get("SQL_PREDICATE_PUSHDOWN", "1")).strip().lower() not in ("0", "false", "no", "off")
+
+
+def _conjuncts(e: Optional[exp.Expression]) -> List[exp.Expression]:
+    if e is None:
+        return []
+    if isinstance(e, exp.Paren) and isinstance(e.this, exp.And):
+        return _conjuncts(e.this)
+    if isinstance(e, exp.And):
+        return _conjuncts(e.left) + _conjuncts(e.right)
+    return [e]
+
+
+def _is_star(p: exp.Expression) -> bool:
+    return isinstance(p, exp.Star) or (isinstance(p, exp.Column) and isinstance(p.this, exp.Star))
+
+
+def _source_name(src: exp.Expression) -> str:
+    return (src.alias_or_name or "").lower()
+
+
+class _Layer:
+    """How a derived table's output columns map onto its own sources."""
+
+    def __init__(self, inner: exp.Select, schema: Optional[Dict[str, Iterable[str]]]) -> None:
+        self.inner = inner
+        from_ = inner.args.get("from_")
+        self.source = from_.this if from_ is not None else None
+        self.has_joins = bool(inner.args.get("joins"))
+        self.explicit: Dict[str, Optional[exp.Column]] = {}
+        stars = []
+        for p in inner.expressions:
+            if _is_star(p):
+                stars.append(p)
+                continue
+            target = p.this if isinstance(p, exp.Alias) else p
+            self.explicit[(p.alias_or_name or "").lower()] = target if isinstance(target, exp.Column) and not _is_star(target) else None
+        self.star_table: Optional[str] = None
+        self.star_ok = False
+        if len(stars) == 1:
+            star = stars[0]
+            qual = star.table if isinstance(star, exp.Column) else ""
+            if qual:
+                self.star_table, self.star_ok = qual, True
+            elif not self.has_joins and self.source is not None:
+                self.star_table, self.star_ok = (self.source.alias or None), True
+        # Columns behind the star, when the schema knows its table.
+        self.star_cols: Optional[set] = None
+        if self.star_ok and schema and isinstance(self.source, exp.Table):
+            if not self.has_joins or (self.star_table or "").lower() == _source_name(self.source):
+                cols = schema.get(self.source.name, schema.get(self.source.name.lower()))
+                self.star_cols = {str(c).lower() for c in cols} if cols is not None else None
+        self.multi_star = len(stars) > 1
+
+    def usable(self) -> bool:
+        if self.source is None or self.multi_star:
+            return False
+        if any(self.inner.args.get(a) for a in _BLOCKING_ARGS):
+            return False
+        return not any(p.find(*_BLOCKING_NODES) for p in self.inner.expressions)
+
+    def resolve(self, name: str, quoted: bool) -> Optional[exp.Expression]:
+        """Inner-scope expression for output column *name*, or None if unsafe."""
+        key = name.lower()
+        in_star = self.star_ok and (self.star_cols is None or key in self.star_cols)
+        if key in self.explicit:
+            col = self.explicit[key]
+            if col is None:
+                return None
+            if not self.star_ok or (self.star_cols is not None and key not in self.star_cols):
+                return col.copy()
+            # Same name through the star and an explicit projection: only safe if identical.
+            same = col.name.lower() == key and (not col.table or col.table.lower() == (self.star_table or "").lower())
+            return col.copy() if same else None
+        if not in_star:
+            return None
+        return exp.column(exp.to_identifier(name, quoted=quoted), table=self.star_table)
+
+
+def _push_into_from(outer: exp.Select, schema: Optional[Dict[str, Iterable[str]]]) -> bool:
+    from_ = outer.args.get("from_")
+    sub = from_.this if from_ is not None else None
+    if not isinstance(sub, exp.Subquery) or not isinstance(sub.this, exp.Select):
+        return False
+    terms = _conjuncts(outer.args["where"].this) if outer.args.get("where") else []
+    if not terms:
+        return False
+    layer = _Layer(sub.this, schema)
+    if not layer.usable():
+        return False
+    alias = (sub.alias or "").lower()
+    outer_joined = bool(outer.args.get("joins"))
+    keep, moved = [], []
+    for term in terms:
+        cols = list(term.find_all(exp.Column))
+        ok = bool(cols) and not term.find(*_BLOCKING_NODES, exp.Rand)
+        replacements = []
+        for col in cols if ok else ():
+            qual = (col.table or "").lower()
+            if (qual and qual != alias) or (not qual and outer_joined) or isinstance(col.this, exp.Star):
+                ok = False
+                break
+            repl = layer.resolve(col.name, bool(col.this.args.get("quoted")))
+            if repl is None:
+                ok = False
+                break
+            replacements.append((col, repl))
+        if not ok:
+            keep.append(term)
+            continue
+        pushed = term.copy()
+        mapping = {id(c): r for c, r in replacements}
+        for orig, copied in zip(term.find_all(exp.Column), list(pushed.find_all(exp.Column))):
+            copied.replace(mapping[id(orig)])
+        moved.append(pushed)
+    if not moved:
+        return False
+    for term in moved:
+        layer.inner.where(term, append=True, copy=False)
+    if keep:
+        outer.set("where", exp.Where(this=exp.and_(*keep, copy=False)))
+    else:
+        outer.set("where", None)
+    return True
+
+
+@memoize_compile("predicate_pushdown")
+def pushdown_predicates(sql: str, dialect: str, schema: Optional[Dict[str, List[str]]] = None) -> str:
+    """*sql* with base-column WHERE terms moved into its derived tables.
+
+    *schema* (table name -> column names) lets terms on explicitly projected
+    join columns move even when the subquery also selects ``s.*``. Returns
+    *sql* unchanged when nothing moves or the statement cannot be parsed.
+    """
+    d = _dialect_name(dialect)
+    if d not in _KNOWN_DIALECTS or not sql or not _DERIVED_FROM.search(sql) or not re.search(r"\bWHERE\b", sql, re.I):
+        return sql
+    read = _sqlglot_dialect(d)
+    try:
+        tree = sqlglot.parse_one(sql, read=read)
+    except Exception as e:
+        logger.debug(f"[pushdown] parse failed ({e}); leaving SQL as is")
+        return sql
+    changed = False
+    # Outermost first, so terms keep moving down through nested layers.
+    for sel in list(tree.find_all(exp.Select)):
+        try:
+            changed = _push_into_from(sel, schema) or changed
+        except Exception as e:
+            logger.debug(f"[pushdown] skipped a layer: {e}")
+    if not changed:
+        return sql
+    placeholders = {p.name for p in tree.find_all(exp.Placeholder) if p.name}
+    out = tree.sql(dialect=read)
+    if placeholders:
+        names = "|".join(re.escape(n) for n in sorted(placeholders, key=len, reverse=True))
+        out = re.sub(r"\$(" + names + r")\b|%\((" + names + r")\)s", lambda m: ":" + (m.group(1) or m.group(2)), out)
+    return out
+
+
+def maybe_pushdown(sql: str, dialect: Optional[str]) -> str:
+    """:func:`pushdown_predicates` if enabled; never raises."""
+    if not enabled():
+        return sql
+    try:
+        return pushdown_predicates(sql, dialect or "")
+    except Exception as e:
+        logger.debug(f"[pushdown] failed: {e}")
+        return sql
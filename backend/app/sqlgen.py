@@ -7,6 +7,8 @@ import sqlglot
 from sqlglot import exp
 from .sql_dialect_normalizer import normalize_sql_expression
 from .sql_ident import quote_ident, InvalidExpression
+from .compile_cache import memoize_compile, memoize_expr
+from .materialized import drop_stored, stale_stored
 
 logger = logging.getLogger(__name__)
 
@@ -48,6 +50,7 @@ def _sqlglot_dialect(dialect: str) -> str:
     return d if d in _SQLGLOT_DIALECTS else 'duckdb'
 
 
+@memoize_expr("validate_expr")
 def validate_expr(expr: str, dialect: str) -> str:
     """Validate a free-form custom-column/transform expression before it is
     inlined into SQL. Raises InvalidExpression on anything that is not a single
@@ -259,6 +262,7 @@ def _qualify_bare_col_refs(expr: str, base_cols: set, base_alias: str) -> str:
     return ''.join(result)
 
 
+@memoize_expr("normalize_expr_idents")
 def _normalize_expr_idents(dialect: str, expr: str, *, numericify: bool = False) -> str:
     """Normalize bracket-quoted identifiers inside free-form expressions
     to the correct quoting for the given dialect. This allows users to write
@@ -267,27 +271,16 @@ def _normalize_expr_idents(dialect: str, expr: str, *, numericify: bool = False)
 
     Notes:
     - Leaves content inside string literals ('...') untouched
-    - For non-MSSQL dialects, replaces [name] with properly quoted identifier using _quote_segment for the target dialect
+    - For non-MSSQL dialects, replaces [name] with properly quoted identifier for the target dialect
     - Also normalizes double-quoted/backtick-quoted identifiers to the dialect's quoting style
-    - If numericify=True, wraps identifiers with a numeric-cast wrapper suitable for the dialect
+    - If numericify=True, wraps quoted identifier chains with a numeric-cast wrapper suitable for the dialect
     - For MSSQL, returns the expression unchanged
     """
     d = _dialect_name(dialect)
     if d == 'mssql' or not expr:
         return expr
     
-    # First pass: Apply dialect normalizer for common fixes (bracket syntax, CASE/END spacing)
-    from .sql_dialect_normalizer import auto_normalize
-    expr = auto_normalize(expr, d)
-    s = str(expr)
-    out: list[str] = []
-    i = 0
-    L = len(s)
-    in_sq = False  # inside single-quoted string literal
-
     def _numwrap(ident_sql: str) -> str:
-        if not numericify:
-            return ident_sql
         if d == 'duckdb':
             return (
                 f"COALESCE(try_cast(regexp_replace(CAST({ident_sql} AS VARCHAR), '[^0-9\\.-]', '') AS DOUBLE), "
@@ -301,46 +294,15 @@ def _normalize_expr_idents(dialect: str, expr: str, *, numericify: bool = False)
             return f"CAST({ident_sql} AS REAL)"
         # default
         return f"CAST({ident_sql} AS DOUBLE)"
-    while i < L:
-        ch = s[i]
-        if ch == "'":
-            # toggle single-quoted string (handle escaped '')
-            out.append(ch)
-            i += 1
-            in_sq = not in_sq
-            # handle doubled quotes inside strings
-            if in_sq:
-                while i < L and s[i] == "'" and (i+1) < L and s[i+1] == "'":
-                    out.extend(["'", "'"])
-                    i += 2
-            continue
-        if ch == '[' and not in_sq:
-            j = s.find(']', i + 1)
-            if j != -1:
-                inner = s[i + 1 : j]
-                # Quote this segment for the target dialect
-                out.append(_numwrap(_quote_segment(d, inner)))
-                i = j + 1
-                continue
-        # Normalize double-quoted identifier tokens
-        if ch == '"' and not in_sq:
-            j = s.find('"', i + 1)
-            if j != -1:
-                inner = s[i + 1 : j]
-                out.append(_numwrap(_quote_segment(d, inner)))
-                i = j + 1
-                continue
-        # Normalize backtick-quoted identifier tokens
-        if ch == '`' and not in_sq:
-            j = s.find('`', i + 1)
-            if j != -1:
-                inner = s[i + 1 : j]
-                out.append(_numwrap(_quote_segment(d, inner)))
-                i = j + 1
-                continue
-        out.append(ch)
-        i += 1
-    return ''.join(out)
+
+    # One token pass (sql_dialect_normalizer): requote quoted identifiers, map SQL Server
+    # functions, fix CASE/END spacing; string literals are never touched.
+    from .sql_dialect_normalizer import auto_normalize, rewrite_expression
+    source = 'mssql' if ('[' in expr and ']' in expr) else ('mysql' if '`' in expr else None)
+    try:
+        return rewrite_expression(str(expr), d, source, wrap_ident=_numwrap if numericify else None)
+    except Exception:
+        return auto_normalize(expr, d)
 
 
 def _order_token(dialect: str, by: str) -> str:
@@ -468,6 +430,7 @@ def _agg_expr(dialect: str, fn: str, column: str) -> Tuple[str, str | None]:
     return f"{f.upper()}({col})", None
 
 
+@memoize_compile("build_sql")
 def build_sql(
     *,
     dialect: str,
@@ -482,6 +445,10 @@ def build_sql(
 ) -> Tuple[str, List[str], List[str]]:
     warnings: List[str] = []
     d = _dialect_name(dialect)
+    # Materialized custom columns already stored on the table come through s.*
+    custom_columns = drop_stored(custom_columns, base_cols)
+    # ... the others (edited since the last sync) shadow the stale stored column
+    shadowed = stale_stored(custom_columns, base_cols) if d == "duckdb" else []
 
     # Collect alias names produced by custom columns and transforms so we can
     # avoid selecting a same-named base column (e.g., when user selects a
@@ -538,7 +505,8 @@ def build_sql(
         # Normalize '*' to base-only star to avoid bringing in join columns implicitly
         if token == "*" or token.lower() == f"{base_alias}.*" or token.lower() == "s.*":
             if not has_star:
-                select_cols.append(f"{base_alias}.*")
+                exclude = f" EXCLUDE ({', '.join(_qal(d, n) for n in shadowed)})" if shadowed else ""
+                select_cols.append(f"{base_alias}.*{exclude}")
                 has_star = True
             continue
         # Skip non-column tokens that may leak from client WHERE composition
@@ -1664,3 +1632,117 @@ def build_distinct_sql(
     # Alias the output column to the original field name for stable client mapping
     sql = f"SELECT DISTINCT {qfield} AS {_qal(d, field)} FROM {qtable}{where_sql} ORDER BY 1"
     return sql, params
+
+
+# Pivot subtotals: output column carrying the GROUPING() bitmask of the row.
+PIVOT_GROUPING_COLUMN = "__grouping"
+
+
+def pivot_grouping_sets(n_rows: int, n_cols: int) -> List[Tuple[int, ...]]:
+    """Dimension-index sets for pivot subtotals, finest first.
+
+    Every row-dimension prefix crossed with every column-dimension prefix,
+    i.e. ``ROLLUP(rows) x ROLLUP(cols)``: leaf cells, row subtotals, column
+    subtotals and the grand total ``()``. Indices address ``rows + cols``.
+    """
+    sets: List[Tuple[int, ...]] = []
+    for i in range(n_rows, -1, -1):
+        for j in range(n_cols, -1, -1):
+            sets.append(tuple(range(i)) + tuple(n_rows + k for k in range(j)))
+    return sets
+
+
+def build_pivot_grouping(dialect: str, dim_exprs: List[str], n_rows: int) -> Tuple[str, str, str]:
+    """Return ``(grouping_select, group_by_sql, order_by_sql)`` for a subtotal pivot.
+
+    ``grouping_select`` is ``GROUPING(d1, .., dn) AS __grouping``: bit
+    ``1 << (n - 1 - i)`` is set when dimension *i* is rolled up (its NULL means
+    "all"). Rows are ordered by that mask descending so the grand total and
+    subtotals come first and survive an outer LIMIT. MySQL has no GROUPING
+    SETS, so it gets ``WITH ROLLUP`` (hierarchical over rows then cols).
+    """
+    d = _dialect_name(dialect)
+    if d == "sqlite":
+        raise ValueError("pivot subtotals are not supported on SQLite")
+    if not dim_exprs:
+        return "", "", ""
+    args = ", ".join(dim_exprs)
+    fn = "GROUPING_ID" if d == "mssql" else "GROUPING"
+    grouping_select = f"{fn}({args}) AS {PIVOT_GROUPING_COLUMN}"
+    if d == "mysql":
+        group_by_sql = f" GROUP BY {args} WITH ROLLUP"
+    else:
+        sets = pivot_grouping_sets(n_rows, len(dim_exprs) - n_rows)
+        group_by_sql = " GROUP BY GROUPING SETS (" + ", ".join(
+            "(" + ", ".join(dim_exprs[i] for i in s) + ")" for s in sets
+        ) + ")"
+    order_by_sql = f" ORDER BY {PIVOT_GROUPING_COLUMN} DESC, {args}"
+    return grouping_select, group_by_sql, order_by_sql
+
+
+def build_moving_averages(dialect: str, daily_sql: str, windows: List[int], single: bool = False) -> str:
+    """Raw daily series plus several N-day moving averages in one statement.
+
+    ``daily_sql`` must return one row per day as ``(_xd DATE, _yv)``; it is
+    scanned and grouped once. Each window becomes a column ``ma<N>``: the sum
+    of ``_yv`` over the N calendar days ending on ``_xd``, divided by N (or by
+    the days since the series starts, for the first N-1 days). The frames
+    are ranges over the date, so missing days count as zero instead of
+    pulling older rows into the window as ``ROWS BETWEEN`` would. SQL Server
+    has no interval RANGE frames: each day is fanned out to the days it
+    covers (a digits cross join, no second scan) and summed per target day.
+    The daily series is a derived table, not a CTE: ``run_query`` wraps SQL
+    Server statements in a derived table, where T-SQL does not allow ``WITH``.
+
+    Output columns: ``_xd, value, ma<N>...`` ordered by ``_xd``. With
+    ``single`` (exactly one window) it is ``_xd, value`` where ``value`` is
+    the moving average, the shape of the plain ``ma<N>`` time series.
+    """
+    d = _dialect_name(dialect)
+    if "sqlserver" in (dialect or "").lower():
+        d = "mssql"
+    wins = sorted({int(w) for w in windows if int(w) > 0})
+    if not wins:
+        raise ValueError("at least one positive moving-average window is required")
+    if single and len(wins) != 1:
+        raise ValueError("a single moving-average series takes exactly one window")
+
+    def select(raw: str, mas: List[str]) -> str:
+        if single:
+            return f"{mas[0]} AS value"
+        return ", ".join([f"{raw} AS value"] + [f"{m} AS ma{n}" for m, n in zip(mas, wins)])
+
+    if d == "mssql":
+        elapsed = "DATEDIFF(day, MIN(_first), _t) + 1"
+        mas = [
+            f"SUM(CASE WHEN _k < {n} THEN _yv END) * 1.0 / (CASE WHEN {elapsed} < {n} THEN {elapsed} ELSE {n} END)"
+            for n in wins
+        ]
+        places = len(str(wins[-1] - 1))
+        digits = " CROSS JOIN ".join(
+            f"(VALUES (0), (1), (2), (3), (4), (5), (6), (7), (8), (9)) AS _d{i}(k)" for i in range(places)
+        )
+        offsets = " + ".join(f"_d{i}.k * {10 ** i}" for i in range(places))
+        return (
+            f"SELECT _t AS _xd, {select('SUM(CASE WHEN _k = 0 THEN _yv END)', mas)} "
+            f"FROM (SELECT CAST(DATEADD(day, _n._k, a._xd) AS DATE) AS _t, _n._k AS _k, a._yv AS _yv, a._first AS _first "
+            f"FROM (SELECT _xd, _yv, MIN(_xd) OVER () AS _first FROM ({daily_sql}) AS _ma_daily) AS a "
+            f"CROSS JOIN (SELECT {offsets} AS _k FROM {digits}) AS _n WHERE _n._k < {wins[-1]}) AS _ma_spread "
+            f"GROUP BY _t HAVING SUM(CASE WHEN _k = 0 THEN 1 ELSE 0 END) > 0 ORDER BY _xd"
+        )
+
+    if d == "mysql":
+        elapsed = "DATEDIFF(_xd, MIN(_xd) OVER ()) + 1"
+        frame = "INTERVAL {k} DAY"
+    elif d == "postgres":
+        elapsed = "(_xd - MIN(_xd) OVER ()) + 1"
+        frame = "INTERVAL '{k} days'"
+    else:
+        elapsed = "date_diff('day', MIN(_xd) OVER (), _xd) + 1"
+        frame = "INTERVAL '{k} days'"
+    mas = [
+        f"SUM(_yv) OVER (ORDER BY _xd RANGE BETWEEN {frame.format(k=n - 1)} PRECEDING AND CURRENT ROW) * 1.0 / "
+        f"LEAST({n}, {elapsed})"
+        for n in wins
+    ]
+    return f"SELECT _xd, {select('_yv', mas)} FROM ({daily_sql}) AS _ma_daily ORDER BY _xd"
@@ -4,15 +4,50 @@ Runs side-by-side with SQLGlot-based SQL builder for multi-dialect query generat
 """
 import sys
 from typing import Any, Dict, Optional, List
+import inspect
 import logging
 import re
 import sqlglot
 from sqlglot import exp
 
+from . import value_sets
+from .compile_cache import COMPILE_CACHE_SIZE, canonical_key, get_cache, memoize_compile
+from .sqlgen import PIVOT_GROUPING_COLUMN, pivot_grouping_sets
+
 logger = logging.getLogger(__name__)
+
+TOP_N_OTHERS_LABEL = "Others"
+# How tail rows fold into the "Others" bucket, by chart aggregation. avg and
+# distinct cannot be recombined from per-group values, so those keep plain
+# top-N without an Others row.
+TOP_N_FOLD = {"count": "SUM", "sum": "SUM", "min": "MIN", "max": "MAX"}
+
+# Placeholder names used by build_aggregation_template.
+BIND_PREFIX = "_fb"
+_BIND_RENDERED = re.compile(r"\$(" + BIND_PREFIX + r"\d+)\b|%\((" + BIND_PREFIX + r"\d+)\)s")
+_BIND_USED = re.compile(r":(" + BIND_PREFIX + r"\d+)\b")
+# Shape templates are rendered with this LIMIT and patched with the real one.
+_LIMIT_SENTINEL = 987654321
+# Year/Month equality keys that _apply_where rewrites into date ranges.
+_DP_EQ_KEY = re.compile(r"^(.*)\s*\((Year|Month)\)$", re.IGNORECASE)
+_ISO_DATE_PREFIX = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
 logger.debug("[SQLGlot] module loaded; sqlglot version %s", sqlglot.__version__)
 
 
+def _output_idents(query: exp.Expression) -> Dict[str, exp.Identifier]:
+    """Output column name -> identifier, spelled (quoted or not) as *query* does.
+
+    Wrappers reference the inner columns through these so that case folding of
+    unquoted names matches on every dialect.
+    """
+    idents: Dict[str, exp.Identifier] = {}
+    for e in query.selects:
+        node = e.args.get("alias") if isinstance(e, exp.Alias) else (e.this if isinstance(e, exp.Column) else None)
+        idents[e.alias_or_name] = node if isinstance(node, exp.Identifier) else exp.to_identifier(e.alias_or_name)
+    return idents
+
+
 def _sg_norm_name(name: str) -> str:
     """Normalize identifier names for expr_map lookups.
 
@@ -25,6 +60,37 @@ def _sg_norm_name(name: str) -> str:
     return parts[-1].lower() if parts else s.lower()
 
 
+def _value_shape(value: Any) -> Any:
+    """What ``_apply_where`` branches on for a filter value, without the value."""
+    if value_sets.should_stage(value):
+        return ["staged", type(value).__name__]
+    if isinstance(value, (list, tuple)):
+        return [type(value).__name__, [_value_shape(v) for v in value]]
+    if isinstance(value, str):
+        s = value.strip()
+        return ["str", bool(_ISO_DATE_PREFIX.match(s)), s.isdigit()]
+    return type(value).__name__
+
+
+def _where_shape(where: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Filter dict with each value replaced by its shape.
+
+    Year/Month equality filters keep their values: they are expanded into a
+    variable number of date ranges.
+    """
+    out: Dict[str, Any] = {}
+    for k, v in (where or {}).items():
+        if isinstance(k, str) and "__" not in k and _DP_EQ_KEY.match(k.strip()):
+            out[k] = ["values", v]
+        else:
+            out[k] = _value_shape(v)
+    return out
+
+
+# shape key -> (template sql, bind count) or False when the shape cannot be reused
+_SHAPE_TEMPLATES = get_cache("sqlglot_shape_template", COMPILE_CACHE_SIZE)
+
+
 class SQLGlotBuilder:
     """
     Generate SQL using SQLGlot for multi-dialect support.
@@ -33,14 +99,19 @@ class SQLGlotBuilder:
     allowing gradual migration and A/B testing.
     """
     
-    def __init__(self, dialect: str = "duckdb"):
+    def __init__(self, dialect: str = "duckdb", column_types: Optional[Dict[str, str]] = None):
         """
         Initialize query builder.
         
         Args:
             dialect: Target SQL dialect (duckdb, postgres, mysql, mssql, sqlite)
+            column_types: Declared source column types (name -> type); staged
+                value lists are cast to the filtered column's type
         """
         self.dialect = self._normalize_dialect(dialect)
+        self.column_types = {str(k).lower(): str(v) for k, v in (column_types or {}).items()}
+        # Filter values collected by build_aggregation_template (None = inline literals)
+        self._binds: Optional[Dict[str, Any]] = None
     
     def _normalize_dialect(self, dialect: str) -> str:
         """
@@ -60,6 +131,11 @@ class SQLGlotBuilder:
         }
         return mapping.get(dialect.lower(), "duckdb")
     
+    @memoize_compile(
+        "sqlglot_aggregation",
+        key_prefix=lambda self, *a: self.dialect,
+        skip_if=lambda self, *a: self._binds is not None,
+    )
     def build_aggregation_query(
         self,
         source: str,
@@ -78,6 +154,11 @@ class SQLGlotBuilder:
         ds_type: Optional[str] = None,  # Dialect for date part resolution
         series: Optional[List[Dict[str, Any]]] = None,  # Multi-series support
         legend_fields: Optional[List[str]] = None,  # Multi-legend support
+        top_n: Optional[int] = None,  # Keep the N largest categories, fold the rest
+        top_n_per_series: bool = False,  # Rank categories within each legend series
+        others_label: str = TOP_N_OTHERS_LABEL,
+        max_points: Optional[int] = None,  # Downsample each series to this many points
+        downsample: Optional[str] = None,  # minmax (in SQL) | lttb (done by the caller)
     ) -> str:
         """
         Build aggregation query with multi-dialect support.
@@ -98,6 +179,14 @@ class SQLGlotBuilder:
             order: Sort order (asc, desc)
             limit: Result limit
             week_start: Week start day (mon, sun) for week grouping
+            top_n: Keep the N largest x categories (legend when there is no x)
+                and roll the rest into one ``others_label`` row; see ``wrap_top_n``.
+                An explicit ``limit`` caps N (``min(limit, top_n)``)
+            top_n_per_series: Rank categories separately within each legend.
+                Multi-series queries always rank each series by its own measure
+            max_points: With ``downsample`` minmax (default), keep the min and
+                max row per bucket so each series has at most this many points;
+                see ``wrap_downsample_minmax``. lttb is left to ``app.downsample``
             
         Returns:
             SQL string for target dialect
@@ -113,6 +202,36 @@ class SQLGlotBuilder:
             ...     group_by="month"
             ... )
         """
+        sql_downsample = bool(max_points and max_points > 0 and x_field and (downsample or "minmax") == "minmax")
+        if (top_n and top_n > 0) or sql_downsample:
+            # Rank / bucket over the complete aggregate: the inner query must not be truncated.
+            inner = self.build_aggregation_query(
+                source=source, x_field=x_field, y_field=y_field, legend_field=legend_field,
+                agg=agg, where=where, group_by=group_by, order_by=order_by, order=order,
+                limit=None, week_start=week_start, date_field=date_field, expr_map=expr_map,
+                ds_type=ds_type, series=series, legend_fields=legend_fields,
+            )
+            has_x = bool(x_field)
+            has_legend = bool(legend_field or legend_fields or series)
+            if not (top_n and top_n > 0):
+                return self.wrap_downsample_minmax(inner, max_points, partition=["legend"] if has_legend else None)
+            aggs = {str(s_.get("agg") or agg or "count").lower() for s_ in series} if series else {str(agg or "count").lower()}
+            folds = {TOP_N_FOLD.get(a) for a in aggs}
+            # Series measures (SUM vs COUNT, ...) are not comparable: rank within each series.
+            per_series = bool(top_n_per_series or series) and has_x and has_legend
+            sql = self.wrap_top_n(
+                inner,
+                min(top_n, limit) if limit and limit > 0 else top_n,
+                category="x" if has_x else "legend",
+                partition=["legend"] if per_series else None,
+                fold=folds.pop() if len(folds) == 1 else None,
+                others_label=others_label,
+            )
+            if sql_downsample:
+                # Cut to the top N first, then downsample what is left.
+                sql = self.wrap_downsample_minmax(sql, max_points, partition=["legend"] if has_legend else None)
+            return sql
+
         try:
             normalized_expr_map: Dict[str, str] = {}
             if expr_map:
@@ -502,6 +621,93 @@ class SQLGlotBuilder:
             logger.warning(f"[SQLGlot] ERROR generating SQL: {e}")
             raise
     
+    def build_aggregation_template(self, *args: Any, **kwargs: Any) -> tuple[str, Dict[str, Any]]:
+        """
+        ``build_aggregation_query`` with filter values as bind parameters.
+
+        Returns ``(sql, params)``. Every filter value becomes a ``:_fb<n>``
+        placeholder (numbered in order of appearance) and ``params`` maps
+        those names to the values, so widgets that differ only in their
+        filter selection share one SQL text. That text can be cached and
+        prepared once per connection (``app.prepared``). Same arguments as
+        ``build_aggregation_query``.
+
+        The text is cached per query *shape*: all arguments, with filter
+        values reduced to what the builder branches on (type, list length,
+        ISO-date-like strings) and an integer ``limit`` reduced to "set".
+        On a hit only ``_apply_where`` runs again, to collect the new bind
+        values; the SELECT, time buckets and aggregation are not rebuilt
+        and nothing is re-rendered.
+        """
+        try:
+            bound = _AGG_SIGNATURE.bind(self, *args, **kwargs)
+        except TypeError:
+            return self._build_template(args, kwargs)
+        call = dict(bound.arguments)
+        call.pop("self", None)
+        where = call.pop("where", None)
+        limit = call.pop("limit", None)
+        # With top_n the limit caps N inside the query; it is part of the shape then.
+        limit_var = isinstance(limit, int) and not isinstance(limit, bool) and limit > 0 and not call.get("top_n")
+        try:
+            key = canonical_key(self.dialect, self.column_types, call, _where_shape(where), "var" if limit_var else limit)
+        except Exception:
+            return self._build_template(args, kwargs)
+
+        where_args = (where, call.get("date_field") or call.get("x_field"), call.get("expr_map"))
+        entry = _SHAPE_TEMPLATES.get(key, None)
+        if entry:
+            sql, n_binds = entry
+            binds = self._where_binds(*where_args)
+            if binds is not None and len(binds) == n_binds:
+                return self._finish_template(sql, binds, limit if limit_var else None)
+        if entry is not None:
+            return self._build_template(args, kwargs)
+
+        if limit_var:
+            bound.arguments["limit"] = _LIMIT_SENTINEL
+        sql, binds = self._build_template(bound.args[1:], bound.kwargs)
+        # Reusable only if re-running _apply_where alone reproduces every bind
+        # (not so for multi-series UNIONs) and the LIMIT can be patched.
+        reusable = sql.count(str(_LIMIT_SENTINEL)) <= (1 if limit_var else 0) and self._where_binds(*where_args) == binds
+        _SHAPE_TEMPLATES.put(key, (sql, len(binds)) if reusable else False)
+        if not reusable and limit_var:
+            return self._build_template(args, kwargs)
+        return self._finish_template(sql, binds, limit if limit_var else None)
+
+    @memoize_compile("sqlglot_aggregation_template", key_prefix=lambda self, *a: (self.dialect, self.column_types))
+    def _build_template(self, args: Any, kwargs: Dict[str, Any]) -> tuple[str, Dict[str, Any]]:
+        """Full build in bind mode; returns the :name SQL and every bind collected."""
+        self._binds = {}
+        try:
+            sql = self.build_aggregation_query(*args, **kwargs)
+            binds = self._binds
+        finally:
+            self._binds = None
+        # sqlglot renders placeholders per dialect ($name, %(name)s, :name);
+        # the executors expect :name everywhere.
+        return _BIND_RENDERED.sub(lambda m: ":" + (m.group(1) or m.group(2)), sql), binds
+
+    def _where_binds(self, where: Optional[Dict[str, Any]], date_field: Any, expr_map: Any) -> Optional[Dict[str, Any]]:
+        """Bind values ``_apply_where`` collects for *where*, in placeholder order."""
+        if not where:
+            return {}
+        self._binds = {}
+        try:
+            self._apply_where(exp.Select(), where, date_field=date_field, expr_map=expr_map)
+            return self._binds
+        except Exception:
+            return None
+        finally:
+            self._binds = None
+
+    @staticmethod
+    def _finish_template(sql: str, binds: Dict[str, Any], limit: Optional[int]) -> tuple[str, Dict[str, Any]]:
+        if limit is not None:
+            sql = sql.replace(str(_LIMIT_SENTINEL), str(int(limit)))
+        used = set(_BIND_USED.findall(sql)) | set(value_sets.referenced(sql))
+        return sql, {k: v for k, v in binds.items() if k in used}
+    
     def build_distinct_query(
         self,
         source: str,
@@ -1058,8 +1264,8 @@ class SQLGlotBuilder:
                     col = exp.Column(this=exp.Identifier(this=base_col, quoted=True))
                     range_conds = []
                     for start_dt, end_dt in ranges:
-                        lit_start = exp.Cast(this=exp.Literal.string(start_dt.isoformat()), to=exp.DataType.build("DATE"))
-                        lit_end = exp.Cast(this=exp.Literal.string(end_dt.isoformat()), to=exp.DataType.build("DATE"))
+                        lit_start = exp.Cast(this=self._to_literal(start_dt.isoformat()), to=exp.DataType.build("DATE"))
+                        lit_end = exp.Cast(this=self._to_literal(end_dt.isoformat()), to=exp.DataType.build("DATE"))
                         # col >= start AND col < end
                         range_conds.append(exp.And(this=(col >= lit_start), expression=(col < lit_end)))
                     
@@ -1217,11 +1423,11 @@ class SQLGlotBuilder:
                                 iso = value.strip()[:10]
                                 if "duckdb" in (self.dialect or "").lower():
                                     value_expr = exp.Cast(
-                                        this=exp.Literal.string(iso),
+                                        this=self._to_literal(iso),
                                         to=exp.DataType.build("DATE"),
                                     )
                                 else:
-                                    value_expr = exp.Literal.string(iso)
+                                    value_expr = self._to_literal(iso)
                                 logger.debug(
                                     "[SQLGlot] _apply_where: Using base date column for %s__%s (iso date bound %s)", field, operator, iso
                                 )
@@ -1268,7 +1474,14 @@ class SQLGlotBuilder:
                     
                     # Build condition expression
                     condition = None
-                    lit_value = value_expr if value_expr is not None else self._to_literal(value)
+                    if value_expr is not None:
+                        lit_value = value_expr
+                    elif operator not in {"gte", "gt", "lte", "lt", "ne"} or (
+                        operator == "ne" and isinstance(value, (list, tuple)) and len(value) > 0
+                    ):
+                        lit_value = None  # the branches below bind their own values
+                    else:
+                        lit_value = self._to_literal(value)
                     if operator == "gte":
                         condition = col >= lit_value
                         logger.debug(f"[SQLGlot] _apply_where: Applied {field} >= {value}")
@@ -1284,8 +1497,7 @@ class SQLGlotBuilder:
                     elif operator == "ne":
                         # NOT EQUALS: use NOT IN for arrays, != for scalars
                         if isinstance(value, (list, tuple)) and len(value) > 0:
-                            literals = [self._to_literal(v) for v in value]
-                            condition = ~col.isin(*literals)
+                            condition = ~self._in_condition(col, value)
                             logger.debug(f"[SQLGlot] _apply_where: Applied {field} NOT IN {value}")
                         else:
                             condition = col != lit_value
@@ -1380,8 +1592,7 @@ class SQLGlotBuilder:
             elif isinstance(value, list):
                 # IN clause
                 if len(value) > 0:
-                    literals = [self._to_literal(v) for v in value]
-                    conditions.append(col.isin(*literals))
+                    conditions.append(self._in_condition(col, value))
             else:
                 # Equality
                 conditions.append(col.eq(self._to_literal(value)))
@@ -1477,8 +1688,24 @@ class SQLGlotBuilder:
         # Fallback
         return f"EXTRACT(month FROM {q})"
     
-    def _to_literal(self, value: Any) -> exp.Literal:
-        """Convert Python value to SQL literal"""
+    def _in_condition(self, col: exp.Expression, values: Any) -> exp.Expression:
+        """``col IN (...)``; in template mode a long list is one bind read as a staged relation."""
+        if self._binds is not None and value_sets.should_stage(values):
+            name = f"{BIND_PREFIX}{len(self._binds)}"
+            self._binds[name] = list(values)
+            rel = value_sets.relation_name(name, self.dialect)
+            declared = self.column_types.get(col.name.lower()) if isinstance(col, exp.Column) else None
+            cast = value_sets.cast_type(self.dialect, declared)
+            v = f"CAST(v AS {cast})" if cast else "v"
+            return col.isin(query=sqlglot.parse_one(f"SELECT {v} FROM {rel}", dialect=self.dialect))
+        return col.isin(*[self._to_literal(v) for v in values])
+
+    def _to_literal(self, value: Any) -> exp.Expression:
+        """Convert Python value to SQL literal (a bind placeholder in template mode)"""
+        if self._binds is not None:
+            name = f"{BIND_PREFIX}{len(self._binds)}"
+            self._binds[name] = value
+            return exp.Placeholder(this=name)
         if isinstance(value, (int, float)):
             return exp.Literal.number(value)
         elif isinstance(value, bool):
@@ -1501,11 +1728,19 @@ class SQLGlotBuilder:
         ds_type: Optional[str] = None,
         date_format: Optional[str] = None,
         date_columns: Optional[List[str]] = None,
+        subtotals: bool = False,
+        top_n: Optional[int] = None,
+        others_label: str = TOP_N_OTHERS_LABEL,
     ) -> str:
         """
         Build pivot query for server-side aggregation.
         
         Returns long-form data: [row_dims..., col_dims..., value]
+
+        With ``subtotals`` the query groups by ``ROLLUP(rows) x ROLLUP(cols)``
+        (``WITH ROLLUP`` on MySQL) and appends a ``__grouping`` bitmask column,
+        so subtotals and the grand total are computed by the database (exact
+        for distinct counts and averages) and sort first.
         
         Args:
             source: Table name
@@ -1519,6 +1754,9 @@ class SQLGlotBuilder:
             limit: Optional row limit
             expr_map: Custom column mapping
             ds_type: Dialect for resolution
+            subtotals: Add subtotal / grand-total rows tagged by ``__grouping``
+            top_n: Keep the N largest values of the first row dimension and roll
+                the rest into an ``others_label`` row (see ``wrap_top_n``)
             
         Returns:
             SQL string for pivot aggregation
@@ -1533,6 +1771,17 @@ class SQLGlotBuilder:
             ...     agg="sum"
             ... )
         """
+        if top_n and top_n > 0 and rows:
+            if subtotals:
+                raise ValueError("top-N cannot be combined with pivot subtotals")
+            inner = self.build_pivot_query(
+                source=source, rows=rows, cols=cols, value_field=value_field, agg=agg,
+                where=where, group_by=group_by, week_start=week_start, limit=None,
+                expr_map=expr_map, ds_type=ds_type, date_format=date_format,
+                date_columns=date_columns,
+            )
+            return self.wrap_top_n(inner, top_n, fold=TOP_N_FOLD.get(str(agg or "count").lower()), others_label=others_label)
+
         try:
             # Normalize dialect name for SQLGlot
             normalized_dialect = self._normalize_dialect(ds_type or self.dialect)
@@ -1770,6 +2019,19 @@ class SQLGlotBuilder:
                 value_expr = exp.Count(this=exp.Star())
             
             select_exprs.append(value_expr.as_("value"))
+
+            # Subtotals group by the dimension expressions themselves (positions
+            # are not allowed inside GROUPING SETS).
+            dim_nodes = [
+                (e.this if isinstance(e, exp.Alias) else e) for e in select_exprs[:len(all_dims)]
+            ]
+            if subtotals and dim_nodes:
+                if normalized_dialect == 'sqlite':
+                    raise ValueError("pivot subtotals are not supported on SQLite")
+                grouping_fn = "GROUPING_ID" if normalized_dialect == 'tsql' else "GROUPING"
+                select_exprs.append(
+                    exp.Anonymous(this=grouping_fn, expressions=[n.copy() for n in dim_nodes]).as_(PIVOT_GROUPING_COLUMN)
+                )
             
             # Build final query
             final_query = exp.select(*select_exprs).from_(table_expr)
@@ -1782,7 +2044,21 @@ class SQLGlotBuilder:
                 final_query = self._apply_where(final_query, where, expr_map=expr_map or {})
             
             # Add GROUP BY (use columns for SQL Server, positions for others)
-            if group_positions:
+            if subtotals and dim_nodes:
+                n_rows = len({str(r).lower() for r in rows})
+                if normalized_dialect == 'mysql':
+                    group = exp.Group(expressions=[n.copy() for n in dim_nodes], rollup=[exp.Rollup()])
+                else:
+                    group = exp.Group(expressions=[exp.GroupingSets(expressions=[
+                        exp.Tuple(expressions=[dim_nodes[i].copy() for i in gs])
+                        for gs in pivot_grouping_sets(n_rows, len(dim_nodes) - n_rows)
+                    ])])
+                final_query.set("group", group)
+                final_query = final_query.order_by(
+                    exp.Ordered(this=exp.column(PIVOT_GROUPING_COLUMN), desc=True),
+                    *[exp.Literal.number(i) for i in group_positions],
+                )
+            elif group_positions:
                 if normalized_dialect == 'tsql':
                     # SQL Server requires actual column references, not positions
                     # Use string-based GROUP BY to force column names instead of positions
@@ -1796,7 +2072,7 @@ class SQLGlotBuilder:
                     final_query = final_query.group_by(*[exp.Literal.number(i) for i in group_positions])
             
             # Add ORDER BY (by position for all dialects - ORDER BY supports positions everywhere)
-            if group_positions and not limit:
+            if group_positions and not limit and not subtotals:
                 final_query = final_query.order_by(*[exp.Literal.number(i) for i in group_positions])
             
             # Add LIMIT
@@ -1831,6 +2107,170 @@ class SQLGlotBuilder:
             logger.warning(f"[SQLGlot] Pivot query error: {e}")
             raise
     
+    def wrap_top_n(
+        self,
+        sql: str,
+        n: int,
+        category: Optional[str] = None,
+        partition: Optional[List[str]] = None,
+        fold: Optional[str] = "SUM",
+        others_label: str = TOP_N_OTHERS_LABEL,
+        value: str = "value",
+    ) -> str:
+        """
+        Keep the ``n`` largest categories of an aggregated query and roll the rest
+        into a single ``others_label`` row, all in the database.
+
+        ``sql`` must produce dimension columns plus ``value``. Categories are
+        ranked by their total value (within each ``partition`` group, e.g. per
+        legend series) with a window function; tail rows are re-aggregated with
+        ``fold`` (SUM/MIN/MAX). With ``fold=None`` the tail is dropped instead.
+        The category column becomes text so it can hold the Others label.
+
+        Example (duckdb, ``n=2``, one x dimension)::
+
+            SELECT CASE WHEN _rn <= 2 THEN CAST(x AS TEXT) ELSE 'Others' END AS x,
+                   SUM(value) AS value
+            FROM (SELECT *, DENSE_RANK() OVER (ORDER BY _tot DESC, x) AS _rn
+                  FROM (SELECT *, SUM(value) OVER (PARTITION BY x) AS _tot
+                        FROM (<sql>) AS _a) AS _b) AS _c
+            GROUP BY CASE ... END ORDER BY MIN(_rn)
+        """
+        inner = sqlglot.parse_one(sql, read=self.dialect)
+        inner.set("order", None)
+        inner.set("limit", None)
+        idents = _output_idents(inner)
+        names = list(idents)
+        dims = [c for c in names if c != value]
+        if not dims or value not in names:
+            raise ValueError("top-N needs dimension columns and a value column")
+        category = category or dims[0]
+        part = [p for p in (partition or []) if p in dims and p != category]
+        rest = [d for d in dims if d != category]
+
+        def col(name: str) -> exp.Column:
+            return exp.Column(this=idents[name].copy())
+
+        def window(func: exp.Expression, parts: List[str], order: Optional[List[exp.Expression]] = None) -> exp.Window:
+            w = exp.Window(this=func, partition_by=[col(p) for p in parts])
+            if order:
+                w.set("order", exp.Order(expressions=order))
+            return w
+
+        totals = exp.select(
+            exp.Star(),
+            window(exp.Sum(this=col(value)), part + [category]).as_("_tot"),
+        ).from_(inner.subquery("_a"))
+        ranked = exp.select(
+            exp.Star(),
+            window(
+                exp.Anonymous(this="DENSE_RANK"),
+                part,
+                [exp.Ordered(this=exp.column("_tot"), desc=True), exp.Ordered(this=col(category))],
+            ).as_("_rn"),
+        ).from_(totals.subquery("_b"))
+        in_top = exp.LTE(this=exp.column("_rn"), expression=exp.Literal.number(int(n)))
+
+        if fold is None:
+            query = (
+                exp.select(*[col(c) for c in names])
+                .from_(ranked.subquery("_c"))
+                .where(in_top)
+                .order_by(*[col(p) for p in part], exp.column("_rn"), *[col(r) for r in rest if r not in part])
+            )
+        else:
+            bucket = exp.Case(
+                ifs=[exp.If(this=in_top, true=exp.Cast(this=col(category), to=exp.DataType.build("TEXT")))],
+                default=exp.Literal.string(others_label),
+            )
+            selects = []
+            for c in names:
+                if c == category:
+                    selects.append(exp.alias_(bucket.copy(), idents[c].copy()))
+                elif c == value:
+                    selects.append(exp.alias_(exp.Anonymous(this=fold, expressions=[col(value)]), idents[value].copy()))
+                else:
+                    selects.append(col(c))
+            query = (
+                exp.select(*selects)
+                .from_(ranked.subquery("_c"))
+                .group_by(*[(bucket.copy() if d == category else col(d)) for d in dims])
+                .order_by(
+                    *[col(p) for p in part],
+                    exp.Min(this=exp.column("_rn")),
+                    *[col(r) for r in rest if r not in part],
+                )
+            )
+        out = query.sql(dialect=self.dialect, pretty=False)
+        logger.debug(f"[SQLGlot] Top-{n} wrap ({self.dialect}): {out[:300]}")
+        return out
+
+    def wrap_downsample_minmax(
+        self,
+        sql: str,
+        max_points: int,
+        x: str = "x",
+        value: str = "value",
+        partition: Optional[List[str]] = None,
+    ) -> str:
+        """
+        Min/max-per-bucket downsampling of a time series, in the database.
+
+        Each series (``partition`` group) is numbered in ``x`` order and split
+        into ``(max_points - 2) / 2`` buckets of consecutive rows; the lowest and
+        highest row of every bucket plus the first and last row survive.
+        Series already within ``max_points`` pass through, and NULL values
+        are dropped. See ``app.downsample`` for the Python equivalent.
+        """
+        inner = sqlglot.parse_one(sql, read=self.dialect)
+        inner.set("order", None)
+        inner.set("limit", None)
+        idents = _output_idents(inner)
+        if x not in idents or value not in idents:
+            raise ValueError("downsampling needs x and value columns")
+        part = [p for p in (partition or []) if p in idents and p != x]
+        buckets = max(1, (int(max_points) - 2) // 2)
+
+        def col(name: str) -> exp.Column:
+            return exp.Column(this=idents[name].copy())
+
+        def window(func: exp.Expression, parts: List[exp.Expression], order: Optional[List[exp.Expression]] = None) -> exp.Window:
+            w = exp.Window(this=func, partition_by=parts)
+            if order:
+                w.set("order", exp.Order(expressions=order))
+            return w
+
+        part_cols = [col(p) for p in part]
+        numbered = exp.select(
+            exp.Star(),
+            window(exp.Anonymous(this="ROW_NUMBER"), part_cols, [exp.Ordered(this=col(x))]).as_("_i"),
+            window(exp.Count(this=exp.Star()), [c.copy() for c in part_cols]).as_("_cnt"),
+        ).from_(inner.subquery("_a")).where(exp.Not(this=exp.Is(this=col(value), expression=exp.Null())))
+        bucket = exp.Floor(this=exp.Div(
+            this=exp.Mul(this=exp.Cast(this=exp.Sub(this=exp.column("_i"), expression=exp.Literal.number(1)), to=exp.DataType.build("DOUBLE")), expression=exp.Literal.number(buckets)),
+            expression=exp.column("_cnt"),
+        ))
+        bucketed = exp.select(exp.Star(), bucket.as_("_bk")).from_(numbered.subquery("_b"))
+        in_bucket = [c.copy() for c in part_cols] + [exp.column("_bk")]
+        ranked = exp.select(
+            exp.Star(),
+            window(exp.Anonymous(this="ROW_NUMBER"), in_bucket, [exp.Ordered(this=col(value)), exp.Ordered(this=col(x))]).as_("_lo"),
+            window(exp.Anonymous(this="ROW_NUMBER"), [c.copy() for c in in_bucket], [exp.Ordered(this=col(value), desc=True), exp.Ordered(this=col(x))]).as_("_hi"),
+        ).from_(bucketed.subquery("_c"))
+        keep = exp.or_(
+            "_lo = 1", "_hi = 1", "_i = 1", "_i = _cnt",
+            exp.LTE(this=exp.column("_cnt"), expression=exp.Literal.number(int(max_points))),
+        )
+        query = (
+            exp.select(*[col(c) for c in idents])
+            .from_(ranked.subquery("_d"))
+            .where(keep)
+            .order_by(*[col(p) for p in part], col(x))
+        )
+        out = query.sql(dialect=self.dialect, pretty=False)
+        logger.debug(f"[SQLGlot] Min/max downsample to {max_points} ({self.dialect}): {out[:300]}")
+        return out
+
     def _build_multi_series_query(
         self,
         source: str,
@@ -1862,7 +2302,7 @@ class SQLGlotBuilder:
             ]
             
             Result:
-            SELECT * FROM (
+            SELECT x, legend, value FROM (
                 SELECT x, 'Revenue' as legend, SUM(SalesAmount) as value FROM ...
                 UNION ALL
                 SELECT x, 'Cost' as legend, SUM(CostAmount) as value FROM ...
@@ -1968,8 +2408,9 @@ class SQLGlotBuilder:
         combined = " UNION ALL ".join(queries)
         logger.debug(f"[SQLGlot] Combined query (first 500 chars): {combined[:500]}")
         
-        # Add ORDER BY and LIMIT to outer query
-        final_sql = f"SELECT * FROM ({combined}) AS _multi_series"
+        # Add ORDER BY and LIMIT to outer query. Explicit columns (not *) so
+        # wrappers such as wrap_top_n can see the x / legend / value outputs.
+        final_sql = f"SELECT x, legend, value FROM ({combined}) AS _multi_series"
         
         # Check if queries already have seasonality ordering (ORDER BY _xo inside)
         # If so, don't add outer ORDER BY as it would override the correct month order
@@ -1997,6 +2438,9 @@ class SQLGlotBuilder:
         return final_sql
 
 
+_AGG_SIGNATURE = inspect.signature(SQLGlotBuilder.build_aggregation_query)
+
+
 def should_use_sqlglot(user_id: Optional[str] = None) -> bool:
     """
     Determine if SQLGlot should be used for this request.
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""Compile and execution benchmark: legacy ``sqlgen`` vs ``SQLGlotBuilder``.
+
+Runs a corpus of dashboard-like specs (aggregations, time buckets, legends,
+multi-series, pivots, distinct, period totals, heavy custom columns) through
+both SQL builders and records, per case / builder / dialect:
+
+* ``compile_ms_cold`` - mean compile time with the compile caches cleared
+  before every call (``app.compile_cache``),
+* ``compile_ms_warm`` - mean compile time with the caches warm,
+* ``alloc_peak_kib`` - tracemalloc peak during one cold compile,
+* ``exec_ms`` / ``rows`` - (DuckDB only) median execution time and row count
+  of the generated SQL against a synthetic in-memory ``sales`` table.
+
+The legacy routers assemble aggregations, pivots and period totals as
+strings around ``build_sql`` (custom columns / transforms),
+``build_distinct_sql`` and ``build_pivot_grouping``; ``legacy_compile``
+reproduces that assembly so both sides produce a complete statement.
+
+    python scripts/bench_compile.py [--rows N] [--repeats N] [--out results.json]
+    python scripts/bench_compile.py --compare baseline.json [--threshold 0.25]
+
+With ``--compare`` the new run is matched against a saved JSON by case,
+builder and dialect; cold compile or execution times slower by more than
+``--threshold`` (relative) are listed and the exit status is 1.
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import duckdb  # noqa: E402
+import sqlglot  # noqa: E402
+
+from app import compile_cache as cc  # noqa: E402
+from app.sqlgen import _agg_expr, _lit, _qcol, build_distinct_sql, build_pivot_grouping, build_sql  # noqa: E402
+from app.sqlgen_glot import SQLGlotBuilder  # noqa: E402
+
+DIALECTS = ("duckdb", "postgres", "mssql")
+BASE_COLS = {"OrderDate", "Amount", "Discount", "Qty", "Region", "Client", "Status", "Cost"}
+CUSTOM = [
+    {"name": "Net", "expr": "[Amount] - [Discount]"},
+    {"name": "Margin", "expr": "CASE WHEN [Amount] = 0 THEN 0 ELSE ([Amount] - [Cost]) / [Amount] END"},
+    {"name": "ClientCode", "expr": "LEFT(CAST([Client] AS VARCHAR), 3)"},
+    {"name": "Size", "expr": "CASE WHEN [Qty] > 40 THEN 'bulk' WHEN [Qty] > 10 THEN 'mid' ELSE 'retail' END"},
+    {"name": "NetPerUnit", "expr": "([Amount] - [Discount]) / NULLIF([Qty], 0)"},
+    {"name": "Gross", "expr": "[Amount] + [Discount]"},
+]
+WHERE = {"Region": ["North", "South", "East"], "Status": "Open"}
+WINDOW = ("2024-01-01", "2024-07-01")
+
+# name, kind, spec. Specs use widget-spec field names; customColumns switches
+# both builders to the custom-column variant (build_sql / expr_map).
+CORPUS = [
+    ("bar_by_region", "aggregation", dict(x="Region", y="Amount", agg="sum", where=WHERE)),
+    ("count_by_client", "aggregation", dict(x="Client", agg="count", orderBy="value", order="desc", limit=50)),
+    ("line_monthly_legend", "aggregation", dict(x="OrderDate", y="Amount", legend="Status", agg="sum", groupBy="month", where=WHERE)),
+    ("line_weekly_avg", "aggregation", dict(x="OrderDate", y="Qty", agg="avg", groupBy="week")),
+    ("multi_series_monthly", "multi_series", dict(x="OrderDate", groupBy="month", series=[
+        {"name": "Sales", "y": "Amount", "agg": "sum"},
+        {"name": "Units", "y": "Qty", "agg": "sum"},
+        {"name": "Orders", "agg": "count"},
+    ])),
+    ("pivot_region_status", "pivot", dict(rows=["Region"], cols=["Status"], y="Amount", agg="sum", where=WHERE)),
+    ("pivot_subtotals", "pivot", dict(rows=["Region", "Client"], cols=["Status"], y="Qty", agg="sum", subtotals=True)),
+    ("distinct_client", "distinct", dict(field="Client", where={"Region": ["North", "West"]})),
+    ("period_total", "period_totals", dict(y="Amount", agg="sum", dateField="OrderDate", window=WINDOW, where=WHERE)),
+    ("period_total_legend", "period_totals", dict(y="Amount", agg="sum", dateField="OrderDate", window=WINDOW, legend="Region")),
+    ("custom_margin_by_size", "custom_columns", dict(x="Size", y="Margin", agg="avg", customColumns=CUSTOM)),
+    ("custom_net_monthly", "custom_columns", dict(x="OrderDate", y="Net", legend="Size", agg="sum", groupBy="month",
+                                                  customColumns=CUSTOM, where={"Region": ["North"]})),
+]
+
+
+# ---------------------------------------------------------------------------
+# Builders
+# ---------------------------------------------------------------------------
+def _legacy_base(dialect, spec):
+    sql, _cols, _warn = build_sql(
+        dialect=dialect, source="sales", base_select=["*"], custom_columns=spec.get("customColumns") or [],
+        transforms=[], joins=[], defaults={}, limit=None, base_cols=BASE_COLS,
+    )
+    return f"({sql}) AS _s"
+
+
+def _legacy_where(dialect, where, extra=()):
+    parts = list(extra)
+    for k, v in (where or {}).items():
+        if isinstance(v, list):
+            parts.append(f"{_qcol(dialect, k)} IN ({', '.join(_lit(x) for x in v)})")
+        else:
+            parts.append(f"{_qcol(dialect, k)} = {_lit(v)}")
+    return (" WHERE " + " AND ".join(parts)) if parts else ""
+
+
+def _legacy_bucket(dialect, col, group_by):
+    if not group_by:
+        return col
+    if dialect == "mssql":
+        return f"DATEADD({group_by}, DATEDIFF({group_by}, 0, {col}), 0)"
+    return f"DATE_TRUNC('{group_by}', {col})"
+
+
+def _legacy_select(dialect, spec, y=None, agg=None):
+    y, agg = y or spec.get("y"), agg or spec.get("agg") or "count"
+    value, _ = _agg_expr(dialect, agg, _qcol(dialect, y) if y else "*")
+    sel = [f"{_legacy_bucket(dialect, _qcol(dialect, spec['x']), spec.get('groupBy'))} AS x"]
+    if spec.get("legend"):
+        sel.append(f"{_qcol(dialect, spec['legend'])} AS legend")
+    dims = ", ".join(s.rsplit(" AS ", 1)[0] for s in sel)
+    return f"SELECT {', '.join(sel)}, {value} AS value", dims
+
+
+def legacy_compile(dialect, kind, spec):
+    """Statement the legacy (string) routers would run for *spec*."""
+    if kind == "distinct":
+        sql, params = build_distinct_sql(dialect=dialect, source="sales", field=spec["field"], where=spec.get("where"))
+        return sql, params
+    src = _legacy_base(dialect, spec)
+    if kind == "period_totals":
+        date_col = _qcol(dialect, spec["dateField"])
+        value, _ = _agg_expr(dialect, spec["agg"], _qcol(dialect, spec["y"]))
+        where = _legacy_where(dialect, spec.get("where"), [f"{date_col} >= :start", f"{date_col} < :end"])
+        params = {"start": spec["window"][0], "end": spec["window"][1]}
+        if spec.get("legend"):
+            leg = _qcol(dialect, spec["legend"])
+            return f"SELECT {leg} AS k, {value} AS v FROM {src}{where} GROUP BY {leg}", params
+        return f"SELECT {value} AS v FROM {src}{where}", params
+    if kind == "pivot":
+        dims = [_qcol(dialect, c) for c in spec["rows"] + spec["cols"]]
+        value, _ = _agg_expr(dialect, spec.get("agg") or "count", _qcol(dialect, spec["y"]) if spec.get("y") else "*")
+        sel = ", ".join(dims + [f"{value} AS value"])
+        if spec.get("subtotals"):
+            grouping, group_by, order_by = build_pivot_grouping(dialect, dims, len(spec["rows"]))
+            sel = f"{sel}, {grouping}"
+        else:
+            group_by, order_by = f" GROUP BY {', '.join(dims)}", f" ORDER BY {', '.join(dims)}"
+        return f"SELECT {sel} FROM {src}{_legacy_where(dialect, spec.get('where'))}{group_by}{order_by}", {}
+    where = _legacy_where(dialect, spec.get("where"))
+    if kind == "multi_series":
+        parts = []
+        for s in spec["series"]:
+            sel, dims = _legacy_select(dialect, spec, y=s.get("y"), agg=s.get("agg"))
+            parts.append(f"SELECT x, {_lit(s['name'])} AS legend, value FROM ({sel} FROM {src}{where} GROUP BY {dims}) AS _p")
+        return " UNION ALL ".join(parts) + " ORDER BY 1, 2", {}
+    sel, dims = _legacy_select(dialect, spec)
+    sql = f"{sel} FROM {src}{where} GROUP BY {dims} ORDER BY {'value DESC' if spec.get('orderBy') == 'value' else '1'}"
+    if spec.get("limit"):
+        sql += f" LIMIT {int(spec['limit'])}" if dialect != "mssql" else f" OFFSET 0 ROWS FETCH NEXT {int(spec['limit'])} ROWS ONLY"
+    return sql, {}
+
+
+def glot_compile(dialect, kind, spec):
+    """Statement ``SQLGlotBuilder`` generates for *spec*."""
+    b = SQLGlotBuilder(dialect)
+    expr_map = {c["name"]: c["expr"] for c in spec.get("customColumns") or []} or None
+    if kind == "distinct":
+        return b.build_distinct_query(source="sales", field=spec["field"], where=spec.get("where")), {}
+    if kind == "period_totals":
+        return b.build_period_totals_query(
+            source="sales", y_field=spec["y"], agg=spec["agg"], date_field=spec["dateField"],
+            start=spec["window"][0], end=spec["window"][1], where=spec.get("where"),
+            legend_field=spec.get("legend"), expr_map=expr_map, ds_type=dialect,
+        ), {}
+    if kind == "pivot":
+        return b.build_pivot_query(
+            source="sales", rows=spec["rows"], cols=spec["cols"], value_field=spec.get("y"),
+            agg=spec.get("agg") or "count", where=spec.get("where"), expr_map=expr_map, ds_type=dialect,
+            subtotals=bool(spec.get("subtotals")),
+        ), {}
+    return b.build_aggregation_query(
+        source="sales", x_field=spec.get("x"), y_field=spec.get("y"), legend_field=spec.get("legend"),
+        agg=spec.get("agg") or "count", where=spec.get("where"), group_by=spec.get("groupBy"),
+        order_by=spec.get("orderBy"), order=spec.get("order") or "asc", limit=spec.get("limit"),
+        expr_map=expr_map, ds_type=dialect, series=spec.get("series"),
+    ), {}
+
+
+BUILDERS = {"legacy": legacy_compile, "sqlglot": glot_compile}
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+def make_dataset(rows):
+    con = duckdb.connect(":memory:")
+    con.execute(f"""
+        CREATE TABLE sales AS
+        SELECT TIMESTAMP '2023-01-01' + to_minutes(CAST((i * 7919) % 1051200 AS BIGINT)) AS "OrderDate",
+               CAST(10 + (i * 37) % 990 AS DOUBLE) AS "Amount",
+               CAST((i * 13) % 40 AS DOUBLE) AS "Discount",
+               CAST(1 + (i * 11) % 60 AS INTEGER) AS "Qty",
+               ['North', 'South', 'East', 'West', 'Central'][1 + i % 5] AS "Region",
+               'client_' || lpad(CAST((i * 7919) % 500 AS VARCHAR), 3, '0') AS "Client",
+               ['Open', 'Closed', 'Pending'][1 + (i // 5) % 3] AS "Status",
+               CAST(5 + (i * 29) % 700 AS DOUBLE) AS "Cost"
+        FROM range({int(rows)}) t(i)
+    """)
+    return con
+
+
+def _mean_ms(fn, repeats, before=None):
+    samples = []
+    for _ in range(repeats):
+        if before:
+            before()
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.mean(samples) * 1000
+
+
+def _alloc_peak_kib(fn):
+    peaks = []
+    for _ in range(3):
+        cc.clear()
+        tracemalloc.start()
+        try:
+            fn()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    return statistics.median(peaks) / 1024
+
+
+def _execute(con, sql, params, repeats):
+    names = re.findall(r"(?<!:):([A-Za-z_][A-Za-z0-9_]*)", sql)
+    qm = re.sub(r"(?<!:):([A-Za-z_][A-Za-z0-9_]*)", "?", sql)
+    values = [params[n] for n in names]
+    samples, n_rows = [], 0
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        n_rows = len(con.execute(qm, values).fetchall())
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000, n_rows
+
+
+def run(rows, repeats, exec_repeats):
+    con = make_dataset(rows)
+    results = []
+    for name, kind, spec in CORPUS:
+        for builder, compile_fn in BUILDERS.items():
+            for dialect in DIALECTS:
+                rec = {"case": name, "kind": kind, "builder": builder, "dialect": dialect}
+                call = lambda: compile_fn(dialect, kind, spec)  # noqa: E731
+                try:
+                    sql, params = call()
+                    rec["compile_ms_cold"] = round(_mean_ms(call, repeats, before=cc.clear), 4)
+                    rec["compile_ms_warm"] = round(_mean_ms(call, repeats), 4)
+                    rec["alloc_peak_kib"] = round(_alloc_peak_kib(call), 1)
+                    rec["sql_chars"] = len(sql)
+                    if dialect == "duckdb":
+                        rec["exec_ms"], rec["rows"] = _execute(con, sql, params, exec_repeats)
+                        rec["exec_ms"] = round(rec["exec_ms"], 3)
+                except Exception as e:
+                    rec["error"] = f"{type(e).__name__}: {e}"[:300]
+                results.append(rec)
+    return results
+
+
+def print_table(results):
+    hdr = f"{'case':<24}{'builder':<9}{'dialect':<10}{'cold ms':>9}{'warm ms':>9}{'peak KiB':>10}{'exec ms':>9}{'rows':>7}"
+    print(hdr)
+    print("-" * len(hdr))
+    for r in results:
+        if "error" in r:
+            print(f"{r['case']:<24}{r['builder']:<9}{r['dialect']:<10}  ERROR {r['error'][:60]}")
+            continue
+        ex = f"{r['exec_ms']:>9.2f}{r['rows']:>7}" if "exec_ms" in r else ""
+        print(f"{r['case']:<24}{r['builder']:<9}{r['dialect']:<10}{r['compile_ms_cold']:>9.3f}"
+              f"{r['compile_ms_warm']:>9.3f}{r['alloc_peak_kib']:>10.1f}{ex}")
+    for builder in BUILDERS:
+        cold = [r["compile_ms_cold"] for r in results if r["builder"] == builder and "compile_ms_cold" in r]
+        if cold:
+            print(f"{builder}: mean cold compile {statistics.mean(cold):.3f} ms over {len(cold)} compiles")
+
+
+def compare(results, baseline_path, threshold):
+    """Regressions of *results* against a saved run; returns their descriptions."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        base = {(r["case"], r["builder"], r["dialect"]): r for r in json.load(f).get("results", [])}
+    out = []
+    for r in results:
+        old = base.get((r["case"], r["builder"], r["dialect"]))
+        if not old:
+            continue
+        if "error" in r and "error" not in old:
+            out.append(f"{r['case']}/{r['builder']}/{r['dialect']}: now fails ({r['error'][:80]})")
+            continue
+        for metric in ("compile_ms_cold", "exec_ms"):
+            a, b = old.get(metric), r.get(metric)
+            if a and b and b > a * (1 + threshold):
+                out.append(f"{r['case']}/{r['builder']}/{r['dialect']}: {metric} {a:.3f} -> {b:.3f} ({b / a - 1:+.0%})")
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--rows", type=int, default=200_000, help="rows in the synthetic sales table")
+    ap.add_argument("--repeats", type=int, default=20, help="compiles per measurement")
+    ap.add_argument("--exec-repeats", type=int, default=5, help="executions per DuckDB measurement")
+    ap.add_argument("--out", help="write results as JSON to this path")
+    ap.add_argument("--compare", help="baseline JSON from an earlier --out run")
+    ap.add_argument("--threshold", type=float, default=0.25, help="relative slowdown reported as a regression")
+    args = ap.parse_args()
+
+    results = run(args.rows, args.repeats, args.exec_repeats)
+    print_table(results)
+    if args.out:
+        doc = {
+            "meta": {
+                "timestamp": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "sqlglot": sqlglot.__version__,
+                "duckdb": duckdb.__version__,
+                "rows": args.rows,
+                "repeats": args.repeats,
+                "execRepeats": args.exec_repeats,
+            },
+            "results": results,
+        }
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+        print(f"wrote {args.out}")
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"no regressions over {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
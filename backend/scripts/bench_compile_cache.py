@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Cold vs warm SQL compilation with app/compile_cache.py.
+
+Compiles a dashboard-like mix of specs with ``build_sql`` (transforms and
+custom columns) and ``SQLGlotBuilder.build_aggregation_query`` (filters,
+time buckets, legends). It reports the mean time per compile with the caches
+cleared before every call (cold), with only the whole-compile cache cleared
+(per-expression LRU warm), and fully warm.
+
+    python scripts/bench_compile_cache.py [repeats]
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from app import compile_cache as cc  # noqa: E402
+from app.sqlgen import build_sql  # noqa: E402
+from app.sqlgen_glot import SQLGlotBuilder  # noqa: E402
+
+BASE_COLS = {"OrderDate", "Amount", "Discount", "Qty", "Region", "Client", "Status", "Cost"}
+CUSTOM = [
+    {"name": "Net", "expr": "[Amount] - [Discount]"},
+    {"name": "Margin", "expr": "CASE WHEN [Amount] = 0 THEN 0 ELSE ([Amount] - [Cost]) / [Amount] END"},
+    {"name": "ClientCode", "expr": "LEFT(CAST([Client] AS VARCHAR), 3)"},
+    {"name": "Big", "expr": "CASE WHEN [Qty] > 100 THEN 'bulk' ELSE 'retail' END"},
+]
+TRANSFORMS = [
+    {"type": "case", "target": "Status", "cases": [{"when": {"op": "eq", "left": "Status", "right": "A"}, "then": "Active"}], "else": "Other"},
+    {"type": "nullhandling", "target": "Discount", "mode": "coalesce", "value": 0},
+    {"type": "computed", "name": "Gross", "expr": "[Amount] + [Discount]"},
+]
+
+
+def legacy_specs():
+    for lim in (None, 1000):
+        yield dict(dialect="duckdb", source="main.sales", base_select=["*"], custom_columns=CUSTOM,
+                   transforms=TRANSFORMS, joins=[], defaults={}, limit=lim, base_cols=BASE_COLS)
+        yield dict(dialect="postgres", source="public.sales", base_select=["*"], custom_columns=CUSTOM,
+                   transforms=TRANSFORMS, joins=[], defaults={}, limit=lim, base_cols=BASE_COLS)
+
+
+def glot_specs():
+    where = {"OrderDate__gte": "2024-01-01", "OrderDate__lt": "2025-01-01", "Region": ["N", "S", "E"]}
+    for x, group in (("OrderDate", "month"), ("OrderDate", "week"), ("Region", None), ("Client", None)):
+        for agg, y in (("sum", "Amount"), ("count", None), ("avg", "Qty")):
+            yield dict(source="sales", x_field=x, y_field=y, legend_field="Status" if group else None,
+                       agg=agg, where=where, group_by=group, order_by="x", limit=500)
+
+
+def run(label, clear_compile, clear_expr, repeats):
+    legacy, glot = list(legacy_specs()), list(glot_specs())
+    builders = {d: SQLGlotBuilder(d) for d in ("duckdb", "mssql")}
+    samples = []
+    for _ in range(repeats):
+        for spec in legacy:
+            if clear_compile:
+                cc.get_cache("build_sql", 0).clear()
+            if clear_expr:
+                for n in ("validate_expr", "normalize_expr_idents", "auto_normalize"):
+                    cc.get_cache(n, 0).clear()
+            t0 = time.perf_counter()
+            build_sql(**spec)
+            samples.append(time.perf_counter() - t0)
+        for spec in glot:
+            for b in builders.values():
+                if clear_compile:
+                    cc.get_cache("sqlglot_aggregation", 0).clear()
+                t0 = time.perf_counter()
+                b.build_aggregation_query(**spec)
+                samples.append(time.perf_counter() - t0)
+    print(f"{label:<26}{statistics.mean(samples) * 1000:>9.3f} ms/compile  ({len(samples)} compiles)")
+
+
+def main() -> None:
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    cc.clear()
+    run("cold", True, True, repeats)
+    run("expression LRU warm", True, False, repeats)
+    cc.clear()
+    run("warm (compile cache)", False, False, repeats)
+    for name, st in cc.stats().items():
+        print(f"  {name:<24} hitRate={st['hitRate']:.3f} size={st['size']}" if st["hitRate"] is not None else f"  {name:<24} unused")
+
+
+if __name__ == "__main__":
+    main()
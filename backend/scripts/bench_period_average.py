@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Compare the period-average SQL shapes before/after app/period_average.py.
+
+Builds an in-memory DuckDB fact table, runs each aggregation with the
+previous hand-written SQL and with ``compile_period_average`` and prints the
+number of table scans in the plan plus the median wall time.
+
+    python scripts/bench_period_average.py [rows] [repeats]
+"""
+import os
+import statistics
+import sys
+import time
+
+import duckdb
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from app import period_average as pa  # noqa: E402
+
+D, V = '"day"', '"amount"'
+WHERE = f"{D} >= TIMESTAMP '2023-03-01'"
+HOL = "'2023-05-01', '2023-12-25'"
+
+
+def legacy(agg: str, numerator: str, generic_last: bool = False) -> str:
+    day, dow = f"CAST({D} AS DATE)", f"dayofweek({D})"
+    if agg == "last_daily_sum":
+        if generic_last:  # MySQL / Postgres / MSSQL form: second scan for MAX(date)
+            return f"SELECT SUM({V}) FROM sales WHERE {WHERE} AND {day} = (SELECT MAX({day}) FROM sales WHERE {WHERE})"
+        return (f"SELECT SUM(_v) FROM (SELECT {V} AS _v, {day} AS _d, MAX({day}) OVER () AS _md "
+                f"FROM sales WHERE {WHERE}) WHERE _d = _md")
+    where = WHERE + (f" AND {day} NOT IN ({HOL})" if agg == "avg_wday" else "")
+    trunc = {"avg_daily": day, "avg_wday": f"CASE WHEN {dow} NOT IN (0, 6) AND CAST({day} AS VARCHAR) NOT IN ({HOL}) THEN {day} END",
+             "avg_weekly": f"DATE_TRUNC('week', {D})", "avg_monthly": f"DATE_TRUNC('month', {D})"}[agg]
+    if numerator == "distinct":
+        per, w = (day, f"{where} AND {dow} NOT IN (0, 6)") if agg == "avg_wday" else (trunc, where)
+        return (f"SELECT SUM(_c), COUNT(*), SUM(_c) * 1.0 / NULLIF(COUNT(*), 0) FROM "
+                f"(SELECT {per} AS _p, COUNT(DISTINCT cust) AS _c FROM sales WHERE {w} GROUP BY {per}) s")
+    return (f"SELECT SUM({V}), COUNT(DISTINCT {trunc}), SUM({V}) * 1.0 / NULLIF(COUNT(DISTINCT {trunc}), 0) "
+            f"FROM sales WHERE {where}")
+
+
+def new(agg: str, numerator: str) -> str:
+    return pa.compile_period_average(
+        "duckdb", agg, from_sql="sales", date_expr=D, value_expr="cust" if numerator == "distinct" else V,
+        numerator=numerator, where_parts=[WHERE], holidays=["2023-05-01", "2023-12-25"],
+    )
+
+
+def scans(con, sql: str) -> int:
+    return sum(r[1].count("SEQ_SCAN") for r in con.execute("EXPLAIN " + sql).fetchall())
+
+
+def timed(con, sql: str, repeats: int) -> float:
+    out = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        con.execute(sql).fetchall()
+        out.append(time.perf_counter() - t0)
+    return statistics.median(out) * 1000.0
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    con = duckdb.connect(":memory:")
+    con.execute(
+        f"CREATE TABLE sales AS SELECT TIMESTAMP '2023-01-01' + INTERVAL (i % 525600) MINUTE AS day, "
+        f"(i % 97) * 1.5 AS amount, i % 5000 AS cust FROM range({rows}) t(i)"
+    )
+    cases = [(a, n, False) for a in ("avg_daily", "avg_wday", "avg_weekly", "avg_monthly") for n in ("sum", "distinct")]
+    cases += [("last_daily_sum", "sum", False), ("last_daily_sum", "sum", True)]
+    print(f"{'case':<34}{'scans old/new':>14}{'ms old':>10}{'ms new':>10}")
+    for agg, num, generic in cases:
+        old_sql, new_sql = legacy(agg, num, generic), new(agg, num)
+        label = f"{agg}/{num}" + (" (non-duck form)" if generic else "")
+        print(f"{label:<34}{scans(con, old_sql):>7}/{scans(con, new_sql):<6}"
+              f"{timed(con, old_sql, repeats):>10.1f}{timed(con, new_sql, repeats):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Predicate pushdown (app/sql_pushdown.py) against a remote-style engine.
+
+Builds the usual ``FROM (<build_sql with custom columns and a join>) AS _base``
+widget queries with filters on indexed base columns, then runs each one
+through SQLAlchemy (the remote-datasource path) as generated and after
+``pushdown_predicates``. Reports the median execution time of both, the
+rewrite cost, and whether the engine's plan uses the index.
+
+By default the engine is a temporary SQLite file with indexes on Region and
+OrderDate. SQLite flattens simple derived tables itself, so expect similar
+times there; point ``--url`` at a scratch Postgres / MySQL database (the
+script creates and drops ``bench_sales`` / ``bench_clients``) to measure an
+engine that materializes derived tables.
+
+    python scripts/bench_pushdown.py [--rows N] [--repeats N] [--url sqlalchemy-url]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from sqlalchemy import create_engine, text  # noqa: E402
+
+from app import compile_cache as cc  # noqa: E402
+from app.sql_pushdown import pushdown_predicates  # noqa: E402
+from app.sqlgen import _dialect_name, build_sql  # noqa: E402
+
+CUSTOM = [
+    {"name": "Net", "expr": "[Amount] - [Discount]"},
+    {"name": "Size", "expr": "CASE WHEN [Qty] > 40 THEN 'bulk' ELSE 'retail' END"},
+]
+JOINS = [{"joinType": "left", "targetTable": "bench_clients", "sourceKey": "Client", "targetKey": "id",
+          "columns": [{"name": "name", "alias": "ClientName"}]}]
+BASE_COLS = {"OrderDate", "Amount", "Discount", "Qty", "Region", "Client"}
+REGIONS = ["North", "South", "East", "West", "Central"]
+
+
+def populate(engine, rows):
+    with engine.begin() as conn:
+        for t in ("bench_sales", "bench_clients"):
+            conn.execute(text(f"DROP TABLE IF EXISTS {t}"))
+        conn.execute(text(
+            "CREATE TABLE bench_sales (OrderDate DATE, Amount FLOAT, Discount FLOAT, Qty INTEGER, "
+            "Region VARCHAR(16), Client VARCHAR(16))"
+        ))
+        conn.execute(text("CREATE TABLE bench_clients (id VARCHAR(16) PRIMARY KEY, name VARCHAR(32))"))
+        conn.execute(text("CREATE INDEX ix_bench_region ON bench_sales (Region)"))
+        conn.execute(text("CREATE INDEX ix_bench_date ON bench_sales (OrderDate)"))
+        conn.execute(
+            text("INSERT INTO bench_clients VALUES (:id, :name)"),
+            [{"id": f"c{i}", "name": f"Client {i}"} for i in range(500)],
+        )
+        batch = []
+        for i in range(rows):
+            batch.append({
+                "d": f"2023-{1 + i % 12:02d}-{1 + i % 28:02d}", "a": float(10 + i % 990), "x": float(i % 40),
+                "q": 1 + i % 60, "r": REGIONS[(i * 7) % 5] if i % 50 else "Rare", "c": f"c{(i * 7919) % 500}",
+            })
+            if len(batch) == 5000 or i == rows - 1:
+                conn.execute(text("INSERT INTO bench_sales VALUES (:d, :a, :x, :q, :r, :c)"), batch)
+                batch = []
+
+
+def queries(dialect):
+    base, _cols, _w = build_sql(
+        dialect=dialect, source="bench_sales", base_select=["*"], custom_columns=CUSTOM, transforms=[],
+        joins=JOINS, defaults={}, limit=None, base_cols=BASE_COLS,
+    )
+    q = (lambda n: f"`{n}`") if dialect == "mysql" else (lambda n: f"[{n}]") if dialect == "mssql" else (lambda n: f'"{n}"')
+    src = f"({base}) AS _base"
+    return {
+        "rare_region_sum": (f"SELECT {q('Size')}, SUM({q('Net')}) FROM {src} WHERE {q('Region')} = :r GROUP BY {q('Size')}",
+                            {"r": "Rare"}),
+        "date_window_count": (f"SELECT COUNT(*) FROM {src} WHERE {q('OrderDate')} >= :d0 AND {q('OrderDate')} < :d1 "
+                              f"AND {q('Net')} > :n", {"d0": "2023-03-01", "d1": "2023-03-03", "n": 5}),
+        "region_in_legend": (f"SELECT {q('ClientName')}, COUNT(*) FROM {src} WHERE {q('Region')} IN (:r0, :r1) "
+                             f"GROUP BY {q('ClientName')}", {"r0": "Rare", "r1": "Missing"}),
+    }
+
+
+def median_ms(engine, sql, params, repeats):
+    samples = []
+    with engine.connect() as conn:
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            conn.execute(text(sql), params).fetchall()
+            samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def plan_summary(engine, sql, params):
+    if engine.dialect.name != "sqlite":
+        return ""
+    with engine.connect() as conn:
+        rows = conn.execute(text("EXPLAIN QUERY PLAN " + sql), params).fetchall()
+    return "; ".join(r[3] for r in rows if "bench_sales" in r[3] or " s " in f" {r[3]} ")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--rows", type=int, default=300_000)
+    ap.add_argument("--repeats", type=int, default=5)
+    ap.add_argument("--url", help="SQLAlchemy URL of a scratch database (default: temporary SQLite file)")
+    args = ap.parse_args()
+
+    tmp = None
+    if not args.url:
+        tmp = tempfile.NamedTemporaryFile(suffix=".sqlite", delete=False)
+        tmp.close()
+    engine = create_engine(args.url or f"sqlite:///{tmp.name}")
+    dialect = _dialect_name(engine.dialect.name)
+    try:
+        populate(engine, args.rows)
+        print(f"engine={engine.dialect.name} rows={args.rows}")
+        for name, (sql, params) in queries(dialect).items():
+            cc.clear()
+            t0 = time.perf_counter()
+            pushed = pushdown_predicates(sql, dialect)
+            rewrite_ms = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter()
+            pushdown_predicates(sql, dialect)
+            cached_ms = (time.perf_counter() - t0) * 1000
+            before = median_ms(engine, sql, params, args.repeats)
+            after = median_ms(engine, pushed, params, args.repeats)
+            print(f"{name:<20} as generated {before:9.2f} ms   pushed {after:9.2f} ms   "
+                  f"rewrite {rewrite_ms:.2f} ms (cached {cached_ms:.3f} ms)   moved={'yes' if pushed != sql else 'no'}")
+            plan_b, plan_a = plan_summary(engine, sql, params), plan_summary(engine, pushed, params)
+            if plan_b or plan_a:
+                print(f"  plan before: {plan_b}\n  plan after:  {plan_a}")
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS bench_sales"))
+            conn.execute(text("DROP TABLE IF EXISTS bench_clients"))
+        engine.dispose()
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Shape templates vs full builds in SQLGlotBuilder.
+
+Simulates a dashboard whose widgets share a few query shapes while the user
+changes filter selections and date windows: every call uses new filter
+values, so the per-argument compile cache never hits. Compares
+
+* ``build_aggregation_query`` (full AST build and render per call),
+* ``build_aggregation_template`` with the shape cache cleared before every
+  call (full build in bind mode), and
+* ``build_aggregation_template`` with the shape cache warm (only the WHERE
+  binds are recollected).
+
+    python scripts/bench_sqlglot_templates.py [repeats]
+"""
+import datetime as dt
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from app import compile_cache as cc  # noqa: E402
+from app.sqlgen_glot import SQLGlotBuilder  # noqa: E402
+
+EXPR_MAP = {"Net": "[Amount] - [Discount]", "Margin": "([Amount] - [Cost]) / NULLIF([Amount], 0)"}
+REGIONS = ["N", "S", "E", "W", "C"]
+
+
+def shapes():
+    yield dict(source="sales", x_field="OrderDate", y_field="Amount", legend_field="Region", agg="sum",
+               group_by="month", order_by="x", limit=500)
+    yield dict(source="sales", x_field="Region", y_field="Net", agg="sum", order_by="value", order="desc",
+               limit=20, top_n=10)
+    yield dict(source="sales", x_field="OrderDate", y_field="Qty", agg="avg", group_by="week", max_points=200)
+    yield dict(source="sales", x_field="Client", agg="count", limit=100)
+
+
+def where_for(i):
+    start = dt.date(2023, 1, 1) + dt.timedelta(days=i % 300)
+    return {
+        "start": start.isoformat(),
+        "end": (start + dt.timedelta(days=90)).isoformat(),
+        "Region": [REGIONS[i % 5], REGIONS[(i + 2) % 5]],
+        "Net__gte": i % 50,
+        "Client__contains": f"c{i}",
+    }
+
+
+def run(label, fn, repeats, clear):
+    samples = []
+    for i in range(repeats):
+        for spec in shapes():
+            kw = dict(spec, where=where_for(i), expr_map=EXPR_MAP)
+            if clear:
+                cc.clear()
+            t0 = time.perf_counter()
+            fn(kw)
+            samples.append(time.perf_counter() - t0)
+    print(f"{label:<30}{statistics.mean(samples) * 1000:>9.3f} ms/call  (p50 {statistics.median(samples) * 1000:.3f})")
+
+
+def main() -> None:
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    for dialect in ("duckdb", "mssql"):
+        b = SQLGlotBuilder(dialect)
+        print(f"[{dialect}]")
+        run("full build (literals)", lambda kw: b.build_aggregation_query(**kw), repeats, False)
+        run("template, shape cache cold", lambda kw: b.build_aggregation_template(**kw), repeats, True)
+        cc.clear()
+        run("template, shape cache warm", lambda kw: b.build_aggregation_template(**kw), repeats, False)
+        st = cc.stats()["sqlglot_shape_template"]
+        print(f"  shape cache hitRate={st['hitRate']:.3f} size={st['size']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import duckdb
+
+from app import approximate as ap
+from app.schemas import QueryResponse
+
+
+def _con():
+    con = duckdb.connect(":memory:")
+    con.execute("CREATE TABLE sales AS SELECT i % 4 AS region, i % 1000 AS cust, 1.0 AS amount FROM range(200000) t(i)")
+    return con
+
+
+def test_sample_mode_scales_sum_and_count_and_reports_bounds():
+    con = _con()
+    scope = ap.ApproxScope(percent=20, method="bernoulli")
+    sql = scope.rewrite("SELECT region, SUM(amount) AS s, COUNT(*) AS c FROM sales GROUP BY 1 ORDER BY 1")
+    assert "TABLESAMPLE" in sql.upper() and ap.SAMPLE_N_COLUMN in sql
+    cur = con.execute(sql)
+    cols, rows = scope.collect([d[0] for d in cur.description], [list(r) for r in cur.fetchall()])
+    assert cols == ["region", "s", "c"]
+    for _, s, c in rows:
+        assert abs(s - 50000) / 50000 < 0.05 and abs(c - 50000) / 50000 < 0.05
+    info = scope.metadata()["statements"][0]
+    assert info["method"] == "sample" and info["samplePercent"] == 20
+    assert 0 < info["maxRelativeError"] < 0.05 and info["minSampleRows"] > 0
+
+
+def test_block_sampling_reports_no_row_level_bound():
+    con = _con()
+    scope = ap.ApproxScope(percent=20, method="system")
+    sql = scope.rewrite("SELECT region, COUNT(*) AS c FROM sales GROUP BY 1")
+    cur = con.execute(sql)
+    scope.collect([d[0] for d in cur.description], [list(r) for r in cur.fetchall()])
+    info = scope.metadata()["statements"][0]
+    assert info["sampleMethod"] == "system" and info["maxRelativeError"] is None and info["errorBound"]
+
+
+def test_sketch_mode_for_distinct_and_quantiles():
+    con = _con()
+    scope = ap.ApproxScope()
+    sql = scope.rewrite("SELECT region, COUNT(DISTINCT cust) AS d, MEDIAN(cust) AS m, MAX(cust) AS x FROM sales GROUP BY 1")
+    assert "TABLESAMPLE" not in sql.upper()
+    assert "APPROX_COUNT_DISTINCT" in sql.upper() and "APPROX_QUANTILE" in sql.upper()
+    for _, d, m, x in con.execute(sql).fetchall():
+        assert abs(d - 250) < 75 and abs(m - 500) < 50 and x >= 996
+    assert scope.metadata()["statements"] == [{"method": "sketch", "functions": 2}]
+
+
+def test_unsupported_shapes_run_exact():
+    scope = ap.ApproxScope()
+    for sql in (
+        "SELECT region FROM sales",
+        "SELECT region, MAX(amount) FROM sales GROUP BY 1",
+        "WITH a AS (SELECT region, SUM(amount) s FROM sales GROUP BY 1) SELECT AVG(s) FROM a",
+    ):
+        assert scope.rewrite(sql) == sql
+    assert scope.metadata() is None
+
+
+def test_scope_is_opt_in_and_annotates_response():
+    with ap.approximate_scope(False) as scope:
+        assert scope is None and ap.active() is None
+    with ap.approximate_scope(True, 5) as scope:
+        assert ap.active() is scope and scope.percent == 5
+        scope.rewrite("SELECT COUNT(*) FROM sales")
+    assert ap.active() is None
+    res = ap.annotate(QueryResponse(columns=["c"], rows=[[1]]), scope)
+    assert res.approximate is True and res.approximation["statements"][0]["method"] == "sample"
@@ -0,0 +1,97 @@
+"""Date-column semantics cache: classification, SQL wrapping, invalidation."""
+from __future__ import annotations
+
+import duckdb
+
+from app import column_semantics as cs
+
+
+def test_classify_declared_types():
+    assert cs.classify_type("d", "TIMESTAMP WITH TIME ZONE").kind == cs.TIMESTAMP
+    assert cs.classify_type("d", "datetime").sampled is True
+    assert cs.classify_type("d", "BIGINT").kind == cs.NUMERIC
+    assert cs.classify_type("d", "varchar(32)").kind == cs.STRING
+    assert cs.classify_type("d", "DECIMAL(18,2)").kind == cs.OTHER
+
+
+def test_int_sample_units_and_yyyymmdd():
+    base = cs.classify_type("d", "BIGINT")
+    assert cs.classify_int_sample(base, 1_700_000_000).epoch_unit == "s"
+    assert cs.classify_int_sample(base, 1_700_000_000_000).epoch_unit == "ms"
+    assert cs.classify_int_sample(base, 1_700_000_000_000_000).epoch_unit == "us"
+    ymd = cs.classify_int_sample(base, 20240115)
+    assert ymd.kind == cs.INT_DATE and ymd.date_format == "%Y%m%d"
+
+
+def test_infer_string_format():
+    assert cs.infer_date_format(["2024-01-15", "2024-02-01"]) == "%Y-%m-%d"
+    assert cs.infer_date_format(["2024-01-15 10:00:00.123"]) == "%Y-%m-%d %H:%M:%S"
+    assert cs.infer_date_format(["15/01/2024", "31/12/2024"]) == "%d/%m/%Y"
+    assert cs.infer_date_format(["not a date"]) is None
+
+
+def test_to_timestamp_sql_runs_on_duckdb():
+    con = duckdb.connect(":memory:")
+    try:
+        con.execute("CREATE TABLE t(e BIGINT, ms BIGINT, ymd INTEGER, s VARCHAR)")
+        con.execute("INSERT INTO t VALUES (1705276800, 1705276800000, 20240115, '15/01/2024')")
+        base_i = cs.classify_type("e", "BIGINT")
+        exprs = [
+            cs.to_timestamp_sql('"e"', cs.classify_int_sample(base_i, 1705276800), "duckdb"),
+            cs.to_timestamp_sql('"ms"', cs.classify_int_sample(base_i, 1705276800000), "duckdb"),
+            cs.to_timestamp_sql('"ymd"', cs.classify_int_sample(base_i, 20240115), "duckdb"),
+            cs.to_timestamp_sql('"s"', cs.classify_string_sample(cs.classify_type("s", "VARCHAR"), ["15/01/2024"]), "duckdb"),
+        ]
+        row = con.execute("SELECT " + ", ".join(f"CAST({e} AS DATE)::VARCHAR" for e in exprs) + " FROM t").fetchone()
+        assert set(row) == {"2024-01-15"}
+    finally:
+        con.close()
+
+
+def test_iso_and_native_columns_left_untouched():
+    ts = cs.classify_type("d", "TIMESTAMP")
+    iso = cs.classify_string_sample(cs.classify_type("d", "VARCHAR"), ["2024-01-15"])
+    assert cs.to_timestamp_sql('"d"', ts, "mysql") == '"d"'
+    assert cs.to_timestamp_sql('"d"', iso, "duckdb") == '"d"'
+    assert cs.to_timestamp_sql('"d"', None, "duckdb") == '"d"'
+
+
+def test_cache_put_get_invalidate():
+    cs.invalidate()
+    cs.put_table(None, '"main"."Sales"', [("OrderDate", "BIGINT"), ("Amount", "DOUBLE")])
+    assert cs.get_column(cs.LOCAL_KEY, "main.sales", "orderdate").kind == cs.NUMERIC
+    cs.put_column(None, "main.sales", cs.classify_int_sample(cs.get_column(None, "main.sales", "OrderDate"), 1705276800))
+    assert cs.get_column(None, "main.sales", "OrderDate").kind == cs.EPOCH
+    cs.put_table("ds1", "orders", [("created", "int")])
+    cs.invalidate("ds1")
+    assert cs.get_table("ds1", "orders") is None
+    assert cs.get_table(None, "main.sales") is not None
+    cs.invalidate(cs.LOCAL_KEY, "main.sales")
+    assert cs.get_table(None, "main.sales") is None
+
+
+def test_failed_probe_is_remembered_briefly(monkeypatch):
+    cs.invalidate()
+    assert not cs.recently_failed("ds1", "orders")
+    cs.mark_failed("ds1", '"Orders"')
+    assert cs.recently_failed("ds1", "orders")
+    monkeypatch.setattr(cs, "NEGATIVE_TTL_S", 0.0)
+    assert not cs.recently_failed("ds1", "orders")
+    monkeypatch.undo()
+    cs.mark_failed("ds1", "orders")
+    cs.put_table("ds1", "orders", [("created", "int")])
+    assert not cs.recently_failed("ds1", "orders")
+    cs.mark_failed("ds1", "orders")
+    cs.invalidate("ds1")
+    assert not cs.recently_failed("ds1", "orders")
+
+
+def test_filter_types_do_not_reprobe_a_failing_source(monkeypatch):
+    from app.routers import query as q
+
+    cs.invalidate()
+    calls = []
+    monkeypatch.setattr(q, "_probe_column_types", lambda *a, **k: calls.append(a) or [])
+    for _ in range(3):
+        assert q._filter_column_types(None, "ds1", "orders")("created") is None
+    assert len(calls) == 1
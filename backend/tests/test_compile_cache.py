@@ -0,0 +1,68 @@
+import pytest
+
+from app import compile_cache as cc
+from app.sql_ident import InvalidExpression
+from app.sqlgen import build_sql, validate_expr
+from app.sqlgen_glot import SQLGlotBuilder
+
+CUSTOM = [{"name": "Net", "expr": "[Amount] - [Discount]"}]
+
+
+def _build(**over):
+    kw = dict(
+        dialect="duckdb", source="sales", base_select=["*"], custom_columns=CUSTOM,
+        transforms=[], joins=[], defaults={}, limit=None, base_cols={"Amount", "Discount"},
+    )
+    kw.update(over)
+    return build_sql(**kw)
+
+
+@pytest.fixture(autouse=True)
+def _clean():
+    cc.clear()
+    yield
+    cc.clear()
+
+
+def test_canonical_key_ignores_dict_and_set_order():
+    assert cc.canonical_key({"a": 1, "b": [1, {"y": 2, "x": 1}]}, {"p", "q"}) == \
+        cc.canonical_key({"b": [1, {"x": 1, "y": 2}], "a": 1}, {"q", "p"})
+    assert cc.canonical_key({"a": 1}) != cc.canonical_key({"a": 2})
+
+
+def test_lru_evicts_least_recently_used():
+    lru = cc.LRUCache("t", 2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1
+    lru.put("c", 3)
+    assert lru.get("b", None) is None and lru.get("a") == 1 and lru.get("c") == 3
+    assert lru.stats()["hits"] == 3 and lru.stats()["misses"] == 1
+
+
+def test_build_sql_hits_cache_and_returns_fresh_lists():
+    first = _build()
+    first[2].append("mutated")
+    second = _build(base_cols={"Discount", "Amount"})
+    assert second[0] == first[0] and "mutated" not in second[2]
+    st = cc.stats()["build_sql"]
+    assert st["hits"] == 1 and st["misses"] == 1
+    # Editing a transform changes the key.
+    assert _build(custom_columns=[{"name": "Net", "expr": "[Amount] + [Discount]"}])[0] != first[0]
+
+
+def test_sqlglot_key_includes_dialect():
+    q1 = SQLGlotBuilder("duckdb").build_aggregation_query("sales", x_field="region", y_field="amount", agg="sum")
+    q2 = SQLGlotBuilder("mssql").build_aggregation_query("sales", x_field="region", y_field="amount", agg="sum")
+    q3 = SQLGlotBuilder("duckdb").build_aggregation_query(source="sales", x_field="region", y_field="amount", agg="sum")
+    assert q1 != q2
+    assert cc.stats()["sqlglot_aggregation"]["misses"] >= 2
+    assert q3 == q1
+
+
+def test_expression_errors_are_not_cached():
+    for _ in range(2):
+        with pytest.raises(InvalidExpression):
+            validate_expr("1; DROP TABLE x", "duckdb")
+    assert validate_expr("a + 1", "duckdb") == validate_expr("a + 1", "duckdb")
+    assert cc.stats()["validate_expr"]["hits"] >= 1
@@ -0,0 +1,137 @@
+import time
+from datetime import date
+
+import duckdb
+
+from app import dim_date as dd
+from app import period_average as pa
+from app.date_presets import materialize_holidays
+from app.holiday_calendar import HolidayCalendar
+
+RULES = [
+    {"rule_type": "specific", "specific_date": "2024-03-05", "recurrence_expr": None},
+    {"rule_type": "recurring", "specific_date": None, "recurrence_expr": "DEC-25"},
+]
+YEARS = (2023, 2025)
+
+
+def _built(fiscal_start=1):
+    con = duckdb.connect(":memory:")
+    dd.build_dim_date(con, RULES, years=YEARS, fiscal_start=fiscal_start)
+    return con
+
+
+def test_calendar_columns_and_holidays():
+    con = _built(fiscal_start=7)
+    n, first, last = con.execute(f"SELECT COUNT(*), MIN(d), MAX(d) FROM {dd.TABLE}").fetchone()
+    assert (first, last) == (date(2023, 1, 1), date(2025, 12, 31)) and n == 365 + 366 + 365
+    row = con.execute(
+        f"SELECT weekday, iso_year, iso_week, week_start, month_start, quarter, fiscal_year, fiscal_quarter, "
+        f"fiscal_period, is_holiday, is_workday_sat_sun FROM {dd.TABLE} WHERE d = DATE '2024-12-25'"
+    ).fetchone()
+    assert row == (3, 2024, 52, date(2024, 12, 23), date(2024, 12, 1), 4, 2025, 2, 6, True, False)
+    assert con.execute(f"SELECT COUNT(*) FROM {dd.TABLE} WHERE is_holiday").fetchone()[0] == 4
+
+
+def test_workday_ordinals_match_holiday_calendar():
+    con = _built()
+    hol = set()
+    for y in range(YEARS[0], YEARS[1] + 1):
+        hol |= materialize_holidays(RULES, y)
+    cal = HolidayCalendar(hol)
+    for code, wk in (("sat_sun", (5, 6)), ("fri_sat", (4, 5))):
+        a, b = con.execute(
+            f"SELECT MAX(CASE WHEN d = DATE '2024-01-31' THEN workday_ordinal_{code} END), "
+            f"MAX(CASE WHEN d = DATE '2024-12-31' THEN workday_ordinal_{code} END) FROM {dd.TABLE}"
+        ).fetchone()
+        assert b - a == cal.workdays_between(date(2024, 2, 1), date(2025, 1, 1), wk)
+
+
+def test_ensure_rebuilds_only_when_rules_change(monkeypatch):
+    monkeypatch.setattr(dd, "year_range", lambda today=None: YEARS)
+    con = duckdb.connect(":memory:")
+    assert dd.ensure_dim_date(con, RULES) is True
+    assert dd.ensure_dim_date(con, RULES) is False
+    changed = RULES + [{"rule_type": "specific", "specific_date": "2024-07-04", "recurrence_expr": None}]
+    assert dd.ensure_dim_date(con, changed) is True
+    assert con.execute(f"SELECT is_holiday FROM {dd.TABLE} WHERE d = DATE '2024-07-04'").fetchone()[0] is True
+
+
+def test_period_average_joins_calendar():
+    con = _built()
+    con.execute(
+        "CREATE TABLE s AS SELECT CAST(DATE '2024-02-20' + CAST(i % 30 AS INTEGER) AS TIMESTAMP) AS day, "
+        "i % 7 AS v FROM range(600) t(i)"
+    )
+    con.execute("INSERT INTO s VALUES (NULL, 3)")
+    hol = sorted(materialize_holidays(RULES, 2024))
+    for numerator in ("sum", "distinct"):
+        kw = dict(from_sql="s", date_expr="day", value_expr="v", numerator=numerator, holidays=hol)
+        inline = con.execute(pa.compile_period_average("duckdb", "avg_wday", **kw)).fetchone()
+        joined_sql = pa.compile_period_average("duckdb", "avg_wday", calendar=dd.TABLE,
+                                               calendar_range=(date(2023, 1, 1), date(2025, 12, 31)), **kw)
+        assert "2024-03-05" not in joined_sql and dd.TABLE in joined_sql
+        assert con.execute(joined_sql).fetchone() == inline
+    assert dd.join_sql("t.day") == f"LEFT JOIN {dd.TABLE} AS _cal ON _cal.d = CAST(t.day AS DATE)"
+
+
+def test_days_outside_the_table_keep_inline_holidays():
+    con = _built()
+    con.execute(
+        "CREATE TABLE s AS SELECT CAST(DATE '2022-02-20' + CAST(i % 30 AS INTEGER) AS TIMESTAMP) AS day, "
+        "i % 7 AS v FROM range(600) t(i)"
+    )
+    hol = ["2022-03-07", "2024-03-05"]
+    kw = dict(from_sql="s", date_expr="day", value_expr="v", holidays=hol)
+    inline = con.execute(pa.compile_period_average("duckdb", "avg_wday", **kw)).fetchone()
+    joined_sql = pa.compile_period_average("duckdb", "avg_wday", calendar=dd.TABLE,
+                                           calendar_range=(date(2023, 1, 1), date(2025, 12, 31)), **kw)
+    assert "2022-03-07" in joined_sql and "2024-03-05" not in joined_sql
+    assert con.execute(joined_sql).fetchone() == inline
+    # Without the range every holiday stays as fallback.
+    assert "2024-03-05" in pa.compile_period_average("duckdb", "avg_wday", calendar=dd.TABLE, **kw)
+
+
+def test_regions_get_their_own_table():
+    assert dd.table_name() == dd.table_name("default") == dd.TABLE
+    assert dd.table_name("IL") == "_bayan.dim_date_il"
+    con = _built()
+    dd.build_dim_date(con, RULES[:1], years=YEARS, region="IL")
+    assert con.execute(f"SELECT COUNT(*) FROM {dd.table_name('IL')} WHERE is_holiday").fetchone()[0] == 1
+    assert con.execute(f"SELECT COUNT(*) FROM {dd.TABLE} WHERE is_holiday").fetchone()[0] == 4
+    assert dd.stored_fingerprint(con, "IL") != dd.stored_fingerprint(con)
+
+
+def _wait_for_table(**kw):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        table = dd.table_for_query(**kw)
+        if table:
+            return table
+        time.sleep(0.01)
+    return None
+
+
+def test_table_for_query_builds_in_the_background_per_active_store(tmp_path, monkeypatch):
+    from app import db
+
+    monkeypatch.setattr(dd, "_rule_dicts", lambda region=None: RULES)
+    monkeypatch.setattr(dd, "year_range", lambda today=None: YEARS)
+    monkeypatch.setattr(dd, "_BUILT", {})
+    paths = [str(tmp_path / "a.duckdb"), str(tmp_path / "b.duckdb")]
+    active = {"path": paths[0]}
+    monkeypatch.setattr(db, "get_active_duck_path", lambda: active["path"])
+    try:
+        for p in paths:
+            active["path"] = p
+            # The first call only schedules the build; the request falls back to inline SQL.
+            assert dd.table_for_query() is None
+            assert _wait_for_table() == dd.TABLE
+            # The table exists in the file that is active now, not only in the first one.
+            with db.open_duck_native(p) as con:
+                assert con.execute(f"SELECT COUNT(*) FROM {dd.TABLE}").fetchone()[0] > 0
+        assert sorted(dd._BUILT) == sorted((p, "default") for p in paths)
+        dd.invalidate_dim_date()
+        assert _wait_for_table() == dd.TABLE
+    finally:
+        db.close_duck_shared()
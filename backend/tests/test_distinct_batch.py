@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.routers import query as q
+from app.schemas import DistinctBatchRequest, DistinctResponse
+
+
+class _NullSession:
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def _stub(monkeypatch):
+    monkeypatch.setattr(q, "SessionLocal", _NullSession)
+    calls = []
+    monkeypatch.setattr(q, "_enforce_rate_limit", lambda req, actor, ep: calls.append(ep))
+    yield calls
+
+
+def _run(payload):
+    return asyncio.run(q.distinct_values_batch(payload, None, db=None, actorId="u1"))
+
+
+def test_batch_fans_out_per_field_and_charges_one_token(monkeypatch, _stub):
+    seen = []
+
+    def fake(sub, db, actor):
+        seen.append((sub.field, sub.search, actor))
+        if sub.field == "bad":
+            raise HTTPException(status_code=400, detail="no such column")
+        return DistinctResponse(values=[f"{sub.field}-1", f"{sub.field}-2"])
+
+    monkeypatch.setattr(q, "_distinct_values", fake)
+    res = _run(DistinctBatchRequest(source="sales", fields=["region", "product", "region", "bad"], search="x"))
+    assert res.values == {"region": ["region-1", "region-2"], "product": ["product-1", "product-2"]}
+    assert res.errors == {"bad": "no such column"}
+    assert sorted(f for f, _, _ in seen) == ["bad", "product", "region"]
+    assert all(s == "x" and a == "u1" for _, s, a in seen)
+    assert _stub == ["distinct"]
+
+
+def test_batch_forbidden_fails_whole_request(monkeypatch):
+    def fake(sub, db, actor):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    monkeypatch.setattr(q, "_distinct_values", fake)
+    with pytest.raises(HTTPException) as ei:
+        _run(DistinctBatchRequest(source="sales", fields=["region"]))
+    assert ei.value.status_code == 403
+
+
+def test_batch_field_limit(monkeypatch):
+    monkeypatch.setattr(q, "DISTINCT_BATCH_MAX_FIELDS", 2)
+    with pytest.raises(HTTPException) as ei:
+        _run(DistinctBatchRequest(source="sales", fields=["a", "b", "c"]))
+    assert ei.value.status_code == 400
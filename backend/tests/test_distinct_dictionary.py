@@ -0,0 +1,52 @@
+import duckdb
+
+from app import distinct_dictionary as dd
+from app.routers.query import _narrow_distinct_values
+from app.schemas import DistinctRequest
+
+
+def _con():
+    con = duckdb.connect(":memory:")
+    con.execute("CREATE TABLE sales (region VARCHAR, product VARCHAR, id INTEGER, payload BLOB)")
+    rows = [("North", "Apple", i, None) for i in range(5)]
+    rows += [("South", "Banana", 10 + i, None) for i in range(3)]
+    rows += [("Northeast", "Apricot", 20, None), (None, "Cherry", 21, None)]
+    con.executemany("INSERT INTO sales VALUES (?, ?, ?, ?)", rows)
+    return con
+
+
+def test_build_skips_high_cardinality_and_blob_columns():
+    con = _con()
+    built = dd.build_dictionaries(con, "sales", max_values=5)
+    assert built == {"region": 3, "product": 4}
+    assert dd.lookup(con, "sales", "id") is None
+    assert dd.lookup(con, "sales", "payload") is None
+
+
+def test_lookup_search_and_frequency():
+    con = _con()
+    dd.build_dictionaries(con, "sales")
+    assert dd.lookup(con, "sales", "region") == ["North", "Northeast", "South"]
+    assert dd.lookup(con, "main.sales", "REGION", by_frequency=True, limit=2) == ["North", "South"]
+    assert dd.lookup(con, "sales", "product", search="ap") == ["Apple", "Apricot"]
+    assert dd.lookup(con, "sales", "product", search="an", prefix=True) == []
+    assert dd.lookup(con, "sales", "product", search="%") == []
+
+
+def test_rebuild_and_drop():
+    con = _con()
+    dd.build_dictionaries(con, "sales")
+    con.execute("INSERT INTO sales VALUES ('West', 'Date', 30, NULL)")
+    assert "West" not in dd.lookup(con, "sales", "region")
+    dd.build_dictionaries(con, "sales")
+    assert "West" in dd.lookup(con, "sales", "region")
+    dd.drop_dictionaries(con, "sales")
+    assert dd.lookup(con, "sales", "region") is None
+    assert con.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = '_bayan' AND table_name LIKE 'dd_%'").fetchone()[0] == 0
+
+
+def test_narrow_live_values():
+    p = DistinctRequest(source="sales", field="region", search="NORTH", limit=1)
+    assert _narrow_distinct_values(["North", "Northeast", "South"], p) == ["North"]
+    p = DistinctRequest(source="sales", field="region", search="east", searchMode="prefix")
+    assert _narrow_distinct_values(["North", "Northeast"], p) == []
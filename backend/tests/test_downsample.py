@@ -0,0 +1,75 @@
+import datetime as dt
+import math
+
+import duckdb
+
+from app.downsample import downsample_rows, lttb_indices, minmax_indices
+from app.routers import query as q
+from app.sqlgen_glot import SQLGlotBuilder
+
+N = 5000
+YS = [math.sin(i / 50) + (5 if i == 777 else 0) - (4 if i == 3210 else 0) for i in range(N)]
+
+
+def test_minmax_keeps_extremes_and_budget():
+    keep = minmax_indices(YS, 200)
+    assert len(keep) <= 200 and keep == sorted(keep)
+    assert {0, 777, 3210, N - 1} <= set(keep)
+    assert minmax_indices(YS[:10], 200) == list(range(10))
+
+
+def test_lttb_exact_budget_and_spike():
+    keep = lttb_indices(list(range(N)), YS, 300)
+    assert len(keep) == 300 and keep[0] == 0 and keep[-1] == N - 1
+    assert 777 in keep and 3210 in keep
+
+
+def test_rows_per_series_in_input_order():
+    t0 = dt.datetime(2024, 1, 1)
+    rows = [[t0 + dt.timedelta(minutes=i), "ab"[i % 2], YS[i]] for i in range(N)]
+    out = downsample_rows(["x", "legend", "value"], rows, 100, "lttb")
+    assert sum(1 for r in out if r[1] == "a") == 100 and sum(1 for r in out if r[1] == "b") == 100
+    assert [r[0] for r in out] == sorted(r[0] for r in out)
+    small = rows[:150]
+    assert downsample_rows(["x", "legend", "value"], small, 100) is small
+    assert downsample_rows(["region", "total"], rows, 10) is rows
+
+
+def test_sql_minmax_matches_budget_and_keeps_spike():
+    con = duckdb.connect(":memory:")
+    con.execute(
+        "CREATE TABLE m AS SELECT TIMESTAMP '2024-01-01' + to_minutes(i) AS ts, "
+        "CAST(sin(i / 50.0) + CASE WHEN i = 777 THEN 5 ELSE 0 END AS DOUBLE) AS v FROM range(20000) t(i)"
+    )
+    sql = SQLGlotBuilder("duckdb").build_aggregation_query(
+        source="m", x_field="ts", y_field="v", agg="max", max_points=100, limit=10,
+    )
+    rows = con.execute(sql).fetchall()
+    assert len(rows) <= 100
+    assert max(r[1] for r in rows) > 5.0
+    assert [r[0] for r in rows] == sorted(r[0] for r in rows)
+
+
+def _minutes(con):
+    con.execute(
+        "CREATE TABLE m AS SELECT TIMESTAMP '2024-01-01' + to_minutes(i) AS ts, "
+        "CAST(sin(i / 50.0) + CASE WHEN i = 777 THEN 5 ELSE 0 END AS DOUBLE) AS v FROM range(20000) t(i)"
+    )
+
+
+def test_top_n_is_cut_before_downsampling():
+    con = duckdb.connect(":memory:")
+    _minutes(con)
+    sql = SQLGlotBuilder("duckdb").build_aggregation_query(
+        source="m", x_field="ts", y_field="v", agg="max", top_n=5000, max_points=100,
+    )
+    rows = con.execute(sql).fetchall()
+    assert 0 < len(rows) <= 100
+    assert max(r[1] for r in rows) > 5.0
+
+
+def test_explicit_limit_bounds_the_downsample_fetch():
+    assert q._spec_fetch_limit(50, 100) == 50
+    assert q._spec_fetch_limit(None, 100) == q.DOWNSAMPLE_FETCH_LIMIT
+    assert q._spec_fetch_limit(10 * q.DOWNSAMPLE_FETCH_LIMIT, 100) == q.DOWNSAMPLE_FETCH_LIMIT
+    assert q._spec_fetch_limit(50, None) == 50
@@ -0,0 +1,153 @@
+"""DuckDB read pool: bounded FIFO checkout, overflow policies and wait metrics."""
+import threading
+import time
+
+import pytest
+
+from app import db
+from app.metrics import snapshot
+
+
+@pytest.fixture
+def duck(tmp_path, monkeypatch):
+    path = str(tmp_path / "pool.duckdb")
+    db.init_duck_shared(path)
+    db._drain_duck_read_pool()
+    db._init_duck_read_pool(db._DUCK_SHARED_PATH, 2)
+    monkeypatch.setattr(db, "_DUCK_READ_POOL_TIMEOUT", 5.0)
+    yield path
+    db.close_duck_shared()
+
+
+def _gauge(name, **labels):
+    for g in snapshot()["gauges"]:
+        if g["name"] == name and all(g["labels"].get(k) == v for k, v in labels.items()):
+            return g["value"]
+    return None
+
+
+def _in_thread(fn):
+    """Run *fn* on another thread (the caller's own checkouts never wait)."""
+    out = {}
+
+    def run():
+        t0 = time.perf_counter()
+        try:
+            out["value"] = fn()
+        except Exception as e:
+            out["error"] = e
+        out["elapsed"] = time.perf_counter() - t0
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+    return out
+
+
+def _hist_count(outcome):
+    return sum(h["count"] for h in snapshot()["histograms"]
+               if h["name"] == "duck_read_pool_checkout_wait_ms" and h["labels"].get("outcome") == outcome)
+
+
+def test_waiters_are_served_in_arrival_order():
+    pool = db._DuckReadPool()
+    pool.add(db._TrackedConn(object()))
+    held = pool.get(0)
+    order = []
+
+    def waiter(i):
+        order.append((i, pool.get(5)))
+
+    threads = []
+    for i in range(3):
+        t = threading.Thread(target=waiter, args=(i,))
+        t.start()
+        threads.append(t)
+        while pool.stats()["waiting"] < i + 1:
+            time.sleep(0.001)
+    # A newcomer does not overtake the queue.
+    with pytest.raises(Exception):
+        pool.get_nowait()
+    item = held
+    for i in range(3):
+        pool.put(item)
+        while len(order) < i + 1:
+            time.sleep(0.001)
+        item = order[-1][1]
+    for t in threads:
+        t.join()
+    assert [i for i, _ in order] == [0, 1, 2]
+    pool.put(item)
+    assert pool.stats() == {"size": 1, "inUse": 0, "idle": 1, "waiting": 0}
+
+
+def test_checkout_waits_then_raises(duck, monkeypatch):
+    monkeypatch.setattr(db, "_DUCK_READ_POOL_TIMEOUT", 0.05)
+    timeouts = _hist_count("timeout")
+    a, b = db.open_duck_native(duck), db.open_duck_native(duck)
+    with a, b:
+        assert _gauge("duck_read_pool_connections", state="in_use") == 2
+        assert _gauge("duck_read_pool_connections", state="idle") == 0
+        out = _in_thread(lambda: db.open_duck_native(duck))
+        assert isinstance(out["error"], db.DuckPoolExhausted) and out["elapsed"] >= 0.05
+    assert _hist_count("timeout") == timeouts + 1
+    assert db.duck_read_pool_stats()["idle"] == 2
+
+
+def test_blocked_checkout_gets_the_returned_connection(duck):
+    a, b = db.open_duck_native(duck), db.open_duck_native(duck)
+    got = []
+    with b:
+        with a as conn_a:
+            t = threading.Thread(target=lambda: got.append(db.open_duck_native(duck)))
+            t.start()
+            while db.duck_read_pool_stats()["waiting"] < 1:
+                time.sleep(0.001)
+            assert _gauge("duck_read_pool_waiting") == 1
+        t.join()
+        with got[0] as conn:
+            assert conn is conn_a
+            assert conn.execute("SELECT 42").fetchone() == (42,)
+
+
+def test_reject_and_ephemeral_policies(duck, monkeypatch):
+    a, b = db.open_duck_native(duck), db.open_duck_native(duck)
+    with a, b:
+        monkeypatch.setattr(db, "_DUCK_READ_POOL_OVERFLOW", "reject")
+        out = _in_thread(lambda: db.open_duck_native(duck))
+        assert isinstance(out["error"], db.DuckPoolExhausted) and out["elapsed"] < 1.0
+        monkeypatch.setattr(db, "_DUCK_READ_POOL_OVERFLOW", "ephemeral")
+        monkeypatch.setattr(db, "_DUCK_READ_POOL_TIMEOUT", 0.01)
+
+        def query():
+            with db.open_duck_native(duck) as cur:
+                return cur.execute("SELECT 1").fetchone()
+
+        assert _in_thread(query)["value"] == (1,)
+    # The ephemeral connection never joined the pool.
+    assert db.duck_read_pool_stats()["size"] == 2
+
+
+def test_nested_checkout_on_the_same_thread_does_not_wait(duck):
+    with db.open_duck_native(duck), db.open_duck_native(duck):
+        t0 = time.perf_counter()
+        # Both pooled connections belong to this thread: it gets the shared connection.
+        with db.open_duck_native(duck) as cur:
+            assert cur.execute("SELECT 1").fetchone() == (1,)
+        assert time.perf_counter() - t0 < 1.0
+
+
+def test_close_without_with_returns_the_connection(duck):
+    # Ingest-style callers: open_duck_native(); ...; con.close()
+    for _ in range(3):
+        con = db.open_duck_native(duck)
+        con.execute("SELECT 1")
+        con.close()
+        con.close()  # idempotent
+    stats = db.duck_read_pool_stats()
+    assert (stats["inUse"], stats["idle"]) == (0, 2)
+    assert getattr(db._DUCK_POOL_HELD, "n", 0) == 0
+    out = _in_thread(lambda: db.open_duck_native(duck).close())
+    assert "error" not in out
+    with db.open_duck_native(duck) as conn:
+        assert conn.execute("SELECT 2").fetchone() == (2,)
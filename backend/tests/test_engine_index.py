@@ -0,0 +1,32 @@
+from app import db
+
+
+def _fresh(monkeypatch):
+    monkeypatch.setattr(db, "_ENGINE_CACHE", {})
+    monkeypatch.setattr(db, "_ENGINE_REVERSE", {})
+    monkeypatch.setattr(db, "_DS_ENGINE_INDEX", {})
+
+
+def test_forgetting_one_datasource_keeps_a_shared_engine(monkeypatch, tmp_path):
+    _fresh(monkeypatch)
+    dsn = f"sqlite:///{tmp_path / 'shared.sqlite'}"
+    a = db.get_engine_for_datasource("a", "v1", lambda: dsn)
+    b = db.get_engine_for_datasource("b", "v1", lambda: dsn)
+    assert a is b
+    assert db.forget_datasource_engine("a")
+    # "b" still maps to the same DSN: its pool is not disposed.
+    assert db.get_engine_for_datasource("b", "v1", lambda: None) is b
+    assert db.forget_datasource_engine("b") and dsn not in db._ENGINE_CACHE
+    assert not db.forget_datasource_engine("b")
+
+
+def test_new_credential_version_disposes_an_unshared_engine(monkeypatch, tmp_path):
+    _fresh(monkeypatch)
+    old = f"sqlite:///{tmp_path / 'old.sqlite'}"
+    new = f"sqlite:///{tmp_path / 'new.sqlite'}"
+    db.get_engine_for_datasource("a", "v1", lambda: old)
+    db.get_engine_for_datasource("c", "v1", lambda: old)
+    db.get_engine_for_datasource("a", "v2", lambda: new)
+    assert old in db._ENGINE_CACHE  # still used by "c"
+    db.get_engine_for_datasource("c", "v2", lambda: new)
+    assert old not in db._ENGINE_CACHE and new in db._ENGINE_CACHE
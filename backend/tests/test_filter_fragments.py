@@ -0,0 +1,145 @@
+import sqlite3
+
+import duckdb
+import pytest
+
+from app import filter_fragments as ff
+from app.compile_cache import get_cache
+from app.sql_dialect_normalizer import to_positional
+
+
+def _lhs(name):
+    return '"' + name + '"'
+
+
+def test_compiles_the_router_predicates():
+    where = {
+        "start": "2024-01-01", "__internal": 1, "Region": ["N", "S"], "Status": "A", "Notes": None,
+        "Amount__gte": [10], "Client__ne": ["c1", "c2"], "Name__contains": "ab", "Name__notcontains": "zz",
+        "Tags": [],
+    }
+    clauses, params = ff.compile_where(where, "duckdb", _lhs)
+    assert clauses == [
+        '"Region" IN (:w_Region_0, :w_Region_1)',
+        '"Status" = :w_Status',
+        '"Notes" IS NULL',
+        '"Amount" >= :w_Amount_gte',
+        '"Client" NOT IN (:w_Client_ne_0, :w_Client_ne_1)',
+        '"Name" LIKE :w_Name_contains',
+        '"Name" NOT LIKE :w_Name_notcontains',
+    ]
+    assert params == {
+        "w_Region_0": "N", "w_Region_1": "S", "w_Status": "A", "w_Amount_gte": 10,
+        "w_Client_ne_0": "c1", "w_Client_ne_1": "c2", "w_Name_contains": "%ab%", "w_Name_notcontains": "%zz%",
+    }
+
+
+def test_fragments_are_shared_and_binds_are_copies():
+    cache = get_cache("filter_fragments", 0)
+    where = {"Region": ["N", "S", "E"]}
+    ff.compile_where(where, "duckdb", _lhs)
+    hits = cache.hits
+    clauses, params = ff.compile_where(dict(where), "duckdb", _lhs)
+    assert cache.hits == hits + 1
+    params["w_Region_0"] = "changed"
+    assert ff.compile_where(where, "duckdb", _lhs)[1]["w_Region_0"] == "N"
+    # A different left-hand side (another source's derived expression) is a different fragment.
+    assert ff.compile_where(where, "duckdb", lambda n: f"s.{n}")[0] == ["s.Region IN (:w_Region_0, :w_Region_1, :w_Region_2)"]
+
+
+@pytest.mark.parametrize("dialect", ["duckdb", "sqlite"])
+def test_long_lists_become_a_values_semi_join(dialect):
+    values = [f"c{i}" for i in range(0, 3000, 3)]
+    clauses, params = ff.compile_where({"Client": values, "Region__ne": ["x"] * 300}, dialect, _lhs,
+                                       types=lambda k: "VARCHAR")
+    assert "VALUES" in clauses[0] and "VALUES" in clauses[1] and "NOT IN" in clauses[1]
+    sql, names = to_positional("SELECT COUNT(*) FROM t WHERE " + " AND ".join(clauses))
+    args = [params[n] for n in names]
+    if dialect == "duckdb":
+        con = duckdb.connect(":memory:")
+        con.execute("CREATE TABLE t AS SELECT 'c' || i AS \"Client\", 'N' AS \"Region\" FROM range(5000) r(i)")
+    else:
+        con = sqlite3.connect(":memory:")
+        con.execute('CREATE TABLE t ("Client" TEXT, "Region" TEXT)')
+        con.executemany("INSERT INTO t VALUES (?, 'N')", [(f"c{i}",) for i in range(5000)])
+    assert con.execute(sql, args).fetchone()[0] == 1000
+    con.close()
+    assert "VALUES" not in ff.compile_where({"Client": values}, "mysql", _lhs, types=lambda k: "VARCHAR")[0][0]
+
+
+@pytest.mark.parametrize("dialect", ["duckdb", "sqlite"])
+def test_values_semi_join_casts_string_values_to_the_column_type(dialect):
+    where = {"Id": [str(i) for i in range(0, 3000, 3)],
+             "Day__ne": [f"2020-01-{d:02d}" for d in range(1, 32)] * 10}
+    types = {"Id": "INTEGER", "Day": "DATE"}
+    clauses, params = ff.compile_where(where, dialect, _lhs, types=types.get)
+    assert "VALUES" in clauses[0] and "VALUES" in clauses[1]
+    sql, names = to_positional("SELECT COUNT(*) FROM t WHERE " + " AND ".join(clauses))
+    args = [params[n] for n in names]
+    if dialect == "duckdb":
+        con = duckdb.connect(":memory:")
+        con.execute("CREATE TABLE t AS SELECT i AS \"Id\", DATE '2020-01-01' + CAST(i % 60 AS INTEGER) AS \"Day\" "
+                    "FROM range(5000) r(i)")
+    else:
+        con = sqlite3.connect(":memory:")
+        con.execute('CREATE TABLE t ("Id" INTEGER, "Day" DATE)')
+        con.executemany("INSERT INTO t VALUES (?, date('2020-01-01', ? || ' days'))", [(i, i % 60) for i in range(5000)])
+    # multiples of 3 below 3000 whose day falls outside January
+    assert con.execute(sql, args).fetchone()[0] == len([i for i in range(0, 3000, 3) if i % 60 >= 31])
+    con.close()
+
+
+def test_values_semi_join_needs_a_known_type():
+    where = {"Id": [str(i) for i in range(300)]}
+    clauses, _ = ff.compile_where(where, "duckdb", _lhs)
+    assert clauses[0].startswith('"Id" IN (:w_Id_0, :w_Id_1')
+    clauses, _ = ff.compile_where(where, "duckdb", _lhs, types=lambda k: None)
+    assert "VALUES" not in clauses[0]
+    assert ff.in_predicate("duckdb", "x", [f"p{i}" for i in range(300)], cast="BIGINT").startswith(
+        "x IN (SELECT CAST(v AS BIGINT) FROM (VALUES (:p0)")
+
+
+
+def test_case_folded_filters_and_like_lists():
+    where = {"Region": ["North", "s"], "Status__ne": "Open", "Name__contains": ["Ab", "cd"],
+             "Name__notcontains": ["x", "y"], "Amount__gte": 5, "Year": "2024"}
+    clauses, params = ff.compile_where(where, "duckdb", _lhs, fold_case=lambda k: k != "Year")
+    assert clauses == [
+        'LOWER("Region") IN (:w_Region_0, :w_Region_1)',
+        'LOWER("Status") != :w_Status_ne',
+        '(LOWER("Name") LIKE :w_Name_contains_0 OR LOWER("Name") LIKE :w_Name_contains_1)',
+        '(LOWER("Name") NOT LIKE :w_Name_notcontains_0 AND LOWER("Name") NOT LIKE :w_Name_notcontains_1)',
+        '"Amount" >= :w_Amount_gte',
+        '"Year" = :w_Year',
+    ]
+    assert params["w_Region_0"] == "north" and params["w_Status_ne"] == "open"
+    assert params["w_Name_contains_0"] == "%ab%" and params["w_Year"] == "2024"
+    # Folded and exact fragments are cached apart.
+    assert ff.compile_where({"Region": ["North", "s"]}, "duckdb", _lhs)[0] == ['"Region" IN (:w_Region_0, :w_Region_1)']
+
+
+def test_spec_path_uses_the_shared_compiler():
+    from app.routers import query as q
+
+    where = {"OrderDate (Year)": ["2023", "2024"], "OrderDate (Month Name)__ne": 3, "Client__ne": None, "end": "x"}
+    clauses, params = q._spec_where(where, "duckdb", _lhs)
+    assert clauses == [
+        '"OrderDate (Year)" IN (:w_OrderDate__Year__0, :w_OrderDate__Year__1)',
+        '"OrderDate (Month Name)" != :w_OrderDate__Month_Name__ne',
+        '"Client" IS NULL',
+    ]
+    assert params == {"w_OrderDate__Year__0": 2023, "w_OrderDate__Year__1": 2024, "w_OrderDate__Month_Name__ne": "3"}
+
+def test_presets_resolve_once_per_day_and_state():
+    calls = []
+
+    def resolver(w):
+        calls.append(dict(w))
+        return {"OrderDate__gte": "2024-01-01", "Region": ["N"]}
+
+    first = ff.resolve_presets({"OrderDate": "last_7_days_unique"}, resolver)
+    first["Region"].append("S")
+    assert ff.resolve_presets({"OrderDate": "last_7_days_unique"}, resolver) == {"OrderDate__gte": "2024-01-01", "Region": ["N"]}
+    assert len(calls) == 1
+    ff.resolve_presets({"OrderDate": "last_7_days_unique"}, resolver, key_extra=lambda: "other calendar")
+    assert len(calls) == 2
@@ -91,3 +91,59 @@ class TestMaterializeHolidays:
         rules = [{"rule_type": "specific", "specific_date": "2026-01-01"}]
         result = materialize_holidays(rules, year=2026)
         assert isinstance(result, frozenset)
+
+
+# ── Process-wide calendar cache ──────────────────────────────────────────
+
+
+class TestHolidayCalendar:
+    def test_workday_arithmetic(self):
+        from datetime import date
+        from app.holiday_calendar import HolidayCalendar
+        # 2026-12-25 is a Friday, 2026-12-26 a Saturday (weekend holiday).
+        cal = HolidayCalendar(["2026-12-25", "2026-12-26"])
+        sat_sun = (5, 6)
+        assert cal.is_holiday(date(2026, 12, 25))
+        assert "2026-12-25" in cal
+        assert not cal.is_workday(date(2026, 12, 25), sat_sun)
+        # Mon 21 .. Sun 27 Dec: 5 weekdays minus the Friday holiday.
+        assert cal.workdays_between(date(2026, 12, 21), date(2026, 12, 28), sat_sun) == 4
+        assert cal.add_workdays(date(2026, 12, 24), 1, sat_sun) == date(2026, 12, 28)
+        assert cal.add_workdays(date(2026, 12, 28), -1, sat_sun) == date(2026, 12, 24)
+        assert cal.holidays_between(date(2026, 12, 1), date(2027, 1, 1)) == [
+            date(2026, 12, 25), date(2026, 12, 26),
+        ]
+
+    def test_workdays_between_matches_day_walk(self):
+        from datetime import date, timedelta
+        from app.holiday_calendar import HolidayCalendar
+        cal = HolidayCalendar(["2026-01-01", "2026-03-20", "2026-03-21", "2026-05-01"])
+        start = date(2025, 12, 29)
+        for span in (0, 1, 6, 7, 13, 40, 150):
+            end = start + timedelta(days=span)
+            walked = sum(
+                1 for i in range(span)
+                if cal.is_workday(start + timedelta(days=i), (4, 5))
+            )
+            assert cal.workdays_between(start, end, (4, 5)) == walked
+
+    def test_cache_reused_until_invalidated(self, monkeypatch):
+        from app import holiday_calendar as hc
+        calls = []
+
+        def fake_rules(region):
+            calls.append(region)
+            return [{"rule_type": "recurring", "recurrence_expr": "DEC-25"}]
+
+        monkeypatch.setattr(hc, "_load_rule_dicts", fake_rules)
+        hc.invalidate_holiday_calendar()
+        year = datetime.now().year
+        first = hc.load_holiday_dates()
+        second = hc.load_holiday_dates()
+        assert f"{year}-12-25" in first and f"{year - 1}-12-25" in first
+        assert first is second
+        assert len(calls) == 1
+        hc.invalidate_holiday_calendar()
+        hc.load_holiday_dates()
+        assert len(calls) == 2
+        hc.invalidate_holiday_calendar()
@@ -0,0 +1,114 @@
+import duckdb
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import db as appdb
+from app import materialized
+from app.sqlgen import build_sql
+
+SPECS = [
+    {"name": "Code", "expr": "regexp_extract([Notes], 'ref-(\\d+)', 1)", "materialized": True},
+    {"name": "Band", "expr": "CASE WHEN [Amount] >= 50 THEN 'high' ELSE 'low' END", "materialized": True},
+    {"name": "Virtual", "expr": "[Amount] * 2"},
+]
+
+
+@pytest.fixture()
+def duck(monkeypatch):
+    con = duckdb.connect(":memory:")
+
+    def _write_conn(_engine):
+        adapter = appdb._DuckSharedAdapter.__new__(appdb._DuckSharedAdapter)
+        adapter._con = con
+        return adapter
+
+    monkeypatch.setattr(appdb, "_open_duck_write_conn", _write_conn)
+    yield con
+    con.close()
+
+
+@pytest.fixture()
+def source(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'src.sqlite'}")
+    with eng.begin() as c:
+        c.execute(text("CREATE TABLE src (id INTEGER PRIMARY KEY, Notes TEXT, Amount REAL)"))
+    yield eng
+    eng.dispose()
+
+
+def _add(eng, lo, hi):
+    with eng.begin() as c:
+        c.execute(text("INSERT INTO src VALUES (:i, :n, :a)"),
+                  [{"i": i, "n": f"Order ref-{i * 3} ok", "a": float(i % 100)} for i in range(lo, hi)])
+
+
+def _sync(eng, last):
+    return appdb.run_sequence_sync(eng, None, source_schema=None, source_table="src", dest_table="sales",
+                                   sequence_column="id", pk_columns=["id"], batch_size=40,
+                                   last_sequence_value=last, materialize=SPECS)
+
+
+def test_sequence_sync_computes_only_new_rows(duck, source):
+    _add(source, 1, 101)
+    res = _sync(source, 0)
+    assert duck.execute('SELECT "Code", "Band" FROM sales WHERE id = 20').fetchone() == ("60", "low")
+    assert duck.execute('SELECT COUNT(*) FROM sales WHERE "Code" IS NULL OR "Band" IS NULL').fetchone()[0] == 0
+    cols = [r[0] for r in duck.execute("DESCRIBE sales").fetchall()]
+    assert "Virtual" not in cols
+
+    # Rows at or below the watermark are not recomputed by an incremental sync.
+    duck.execute("UPDATE sales SET \"Code\" = 'stale' WHERE id = 5")
+    _add(source, 101, 151)
+    _sync(source, res["last_sequence_value"])
+    assert duck.execute('SELECT "Code" FROM sales WHERE id = 5').fetchone()[0] == "stale"
+    assert duck.execute('SELECT "Code", "Band" FROM sales WHERE id = 150').fetchone() == ("450", "high")
+    assert duck.execute('SELECT COUNT(*) FROM sales WHERE "Code" IS NULL').fetchone()[0] == 0
+
+    # A changed expression recomputes every row.
+    changed = [dict(SPECS[0], expr="upper([Notes])")]
+    assert materialized.apply(appdb._open_duck_write_conn(None), "sales", changed, since=("id", 150)) == ["Code"]
+    assert duck.execute('SELECT "Code" FROM sales WHERE id = 5').fetchone()[0] == "ORDER REF-15 OK"
+
+
+def test_snapshot_sync_and_unresolvable_columns(duck, source):
+    _add(source, 1, 31)
+    specs = SPECS + [{"name": "Joined", "expr": "[ClientName] || 'x'", "materialized": True},
+                     {"name": "Notes", "expr": "lower([Notes])", "materialized": True}]
+    appdb.run_snapshot_sync(source, None, source_schema=None, source_table="src", dest_table="snap",
+                            batch_size=7, materialize=specs)
+    cols = {r[0]: r[1] for r in duck.execute("DESCRIBE snap").fetchall()}
+    assert cols["Band"] == "VARCHAR" and "Joined" not in cols
+    assert duck.execute('SELECT "Notes" FROM snap WHERE id = 1').fetchone()[0] == "Order ref-3 ok"
+    assert duck.execute('SELECT COUNT(DISTINCT "Code") FROM snap').fetchone()[0] == 30
+
+
+def test_builders_read_the_stored_column():
+    base = {"id": None, "Notes": None, "Amount": None,
+            "Code": materialized.fingerprint(SPECS[0]), "Band": materialized.fingerprint(SPECS[1])}
+    sql = build_sql(dialect="duckdb", source="sales", base_select=["*"], custom_columns=SPECS, transforms=[],
+                    joins=[], defaults={}, limit=None, base_cols=base)[0]
+    assert "regexp_extract" not in sql and "CASE" not in sql and '"Virtual"' in sql
+    remote = build_sql(dialect="duckdb", source="sales", base_select=["*"], custom_columns=SPECS, transforms=[],
+                       joins=[], defaults={}, limit=None, base_cols={"id", "Notes", "Amount"})[0]
+    assert "regexp_extract" in remote
+    assert materialized.materialized_specs(
+        {"customColumns": SPECS + [dict(SPECS[0], name="Other", scope={"level": "table", "table": "elsewhere"})]},
+        "src", "sales") == SPECS[:2]
+
+
+def test_edited_expression_is_not_read_from_the_stale_column(duck, source, monkeypatch):
+    _add(source, 1, 21)
+    _sync(source, 0)
+    stored = materialized.stored_columns(appdb._open_duck_write_conn(None), "sales")
+    assert [cc["name"] for cc in materialized.drop_stored(SPECS, stored)] == ["Virtual"]
+    # Names alone do not prove the stored values are current.
+    assert materialized.drop_stored(SPECS, set(stored)) == SPECS
+
+    edited = [dict(SPECS[0], expr="upper([Notes])")] + SPECS[1:]
+    assert [cc["name"] for cc in materialized.drop_stored(edited, stored)] == ["Code", "Virtual"]
+    monkeypatch.setattr(materialized, "local_comments", lambda table: stored)
+    base = materialized.with_stored(set(stored), "sales", edited)
+    sql = build_sql(dialect="duckdb", source="sales", base_select=["*"], custom_columns=edited, transforms=[],
+                    joins=[], defaults={}, limit=None, base_cols=base)[0]
+    row = duck.execute(f'SELECT "Code", "Band" FROM ({sql}) AS q WHERE id = 2').fetchone()
+    assert row == ("ORDER REF-6 OK", "low")
@@ -0,0 +1,74 @@
+import duckdb
+import pytest
+
+from app.sqlgen import build_moving_averages
+
+DAILY = "SELECT CAST(d AS DATE) AS _xd, SUM(v) AS _yv FROM s GROUP BY 1"
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect(":memory:")
+    # A sale of 10 every other day: calendar gaps between all rows.
+    con.execute("CREATE TABLE s AS SELECT DATE '2024-01-01' + CAST(i * 2 AS INTEGER) AS d, 10.0 AS v FROM range(30) t(i)")
+    return con
+
+
+def test_windows_share_one_query_and_count_gaps_as_zero(con):
+    sql = build_moving_averages("duckdb", DAILY, [7, 3, 7])
+    assert sql.count("FROM s") == 1
+    cur = con.execute(sql)
+    assert [c[0] for c in cur.description] == ["_xd", "value", "ma3", "ma7"]
+    rows = cur.fetchall()
+    assert len(rows) == 30
+    # Steady state: 4 sales in any 7-day span, 1-2 in any 3-day span.
+    assert rows[-1][3] == pytest.approx(40 / 7)
+    assert rows[-1][2] == pytest.approx(20 / 3)
+    # Warm-up divides by the days covered so far.
+    assert rows[0][2] == pytest.approx(10.0) and rows[1][3] == pytest.approx(20 / 3)
+
+
+def test_dialect_frames():
+    assert "RANGE BETWEEN INTERVAL 6 DAY PRECEDING" in build_moving_averages("mysql", DAILY, [7])
+    assert "INTERVAL '29 days' PRECEDING" in build_moving_averages("postgresql", DAILY, [30])
+    mssql = build_moving_averages("mssql+pyodbc", DAILY, [7, 30])
+    assert "RANGE" not in mssql and "_n._k < 30" in mssql
+    # The daily series is fanned out, not joined to a second scan of itself.
+    assert mssql.count("FROM s") == 1 and " JOIN (SELECT CAST" not in mssql
+    with pytest.raises(ValueError):
+        build_moving_averages("duckdb", DAILY, [0])
+
+
+def test_mssql_form_has_no_cte_and_matches_the_range_frames(con):
+    import re
+
+    import sqlglot
+    from sqlglot import exp
+
+    mssql = build_moving_averages("mssql", DAILY, [3, 7])
+    assert "WITH " not in mssql.upper()
+    # run_query hoists the trailing ORDER BY and pages SELECT * FROM (<sql>) AS _q.
+    m = re.search(r"\sORDER BY (.+)$", mssql)
+    wrapped = f"SELECT * FROM ({mssql[:m.start()]}) AS _q ORDER BY {m.group(1)} OFFSET 0 ROWS FETCH NEXT 10 ROWS ONLY"
+    assert not list(sqlglot.parse_one(wrapped, read="tsql").find_all(exp.With))
+    got = con.execute(sqlglot.transpile(mssql, read="tsql", write="duckdb")[0]).fetchall()
+    want = con.execute(build_moving_averages("duckdb", DAILY, [3, 7])).fetchall()
+    assert [r[0] for r in got] == [r[0] for r in want]
+    assert [(pytest.approx(float(r[2])), pytest.approx(float(r[3]))) for r in got] == [(r[2], r[3]) for r in want]
+
+
+@pytest.mark.parametrize("dialect", ["duckdb", "mssql"])
+def test_single_series_is_the_calendar_day_average(con, dialect):
+    sql = build_moving_averages(dialect, DAILY, [7], single=True)
+    if dialect == "mssql":
+        import sqlglot
+
+        assert "WITH " not in sql.upper()
+        sql = sqlglot.transpile(sql, read="tsql", write="duckdb")[0]
+    cur = con.execute(sql)
+    assert [c[0] for c in cur.description] == ["_xd", "value"]
+    rows = cur.fetchall()
+    # Gaps count as zero: 4 sales of 10 in the last 7 calendar days, not 7 rows of 10.
+    assert float(rows[-1][1]) == pytest.approx(40 / 7)
+    with pytest.raises(ValueError):
+        build_moving_averages(dialect, DAILY, [3, 7], single=True)
@@ -0,0 +1,51 @@
+from app.pivot_matrix import to_matrix
+
+COLS = ["region", "category", "value"]
+ROWS = [
+    ["N", "A", 10], ["N", "B", 1], ["N", "C", 2],
+    ["S", "A", 5], ["S", "C", 7],
+    ["W", "B", 1],
+]
+
+
+def test_dense_reshape_keeps_order_and_fills_gaps():
+    m = to_matrix(COLS, ROWS, 1, agg="sum")
+    assert m["columns"] == ["region", "A", "B", "C"]
+    assert m["rows"] == [["N", 10, 1, 2], ["S", 5, None, 7], ["W", None, 1, None]]
+    assert m["matrix"]["colKeys"] == [["A"], ["B"], ["C"]]
+    assert m["matrix"]["otherRows"] == 0 and m["matrix"]["otherExact"]
+
+
+def test_overflow_folds_into_other_for_additive_aggs():
+    m = to_matrix(COLS, ROWS, 1, agg="sum", max_rows=2, max_cols=2)
+    # Largest columns: A (15), C (9); B folds into Other. Smallest row W folds too.
+    assert m["columns"] == ["region", "A", "C", "Other"]
+    assert m["rows"] == [["N", 10, 2, 1], ["S", 5, 7, None], ["Other", None, None, 1]]
+    assert m["matrix"]["otherRows"] == 1 and m["matrix"]["otherCols"] == 1
+
+
+def test_overflow_not_combinable_for_avg():
+    m = to_matrix(COLS, ROWS, 1, agg="avg", max_cols=2)
+    assert [r[-1] for r in m["rows"]] == [None, None, None]
+    assert m["matrix"]["otherExact"] is False
+
+
+def test_multi_column_dims_and_no_column_dims():
+    cols = ["region", "category", "year", "value"]
+    m = to_matrix(cols, [["N", "A", 2024, 1], ["N", "A", 2025, 2]], 1)
+    assert m["columns"] == ["region", "A / 2024", "A / 2025"]
+    assert m["matrix"]["colDims"] == ["category", "year"]
+    m = to_matrix(["region", "value"], [["N", 3], ["S", 4]], 1)
+    assert m["columns"] == ["region", "value"] and m["rows"] == [["N", 3], ["S", 4]]
+
+
+def test_extra_columns_after_the_value_are_ignored():
+    cols = ["region", "category", "value", "__grouping"]
+    m = to_matrix(cols, [["N", "A", 1, 0], ["N", "B", 2, 0]], 1, 1)
+    assert m["columns"] == ["region", "A", "B"] and m["rows"] == [["N", 1, 2]]
+    assert m["matrix"]["colDims"] == ["category"]
+
+
+def test_truncated_input_is_flagged():
+    assert to_matrix(COLS, ROWS, 1)["matrix"]["truncated"] is False
+    assert to_matrix(COLS, ROWS, 1, truncated=True)["matrix"]["truncated"] is True
@@ -0,0 +1,85 @@
+import re
+from datetime import date, datetime
+from decimal import Decimal
+
+import duckdb
+import pytest
+
+from app import compile_cache as cc
+from app import prepared
+from app.sqlgen_glot import SQLGlotBuilder
+
+
+@pytest.fixture(autouse=True)
+def _clean():
+    cc.clear()
+    yield
+    cc.clear()
+
+
+def _template(dialect, where):
+    return SQLGlotBuilder(dialect).build_aggregation_template(
+        source="sales", x_field="region", y_field="amount", agg="sum", where=where,
+    )
+
+
+def _inline(sql, binds):
+    return re.sub(r":(_fb\d+)\b", lambda m: prepared.duck_literal(binds[m.group(1)]), sql)
+
+
+def test_template_text_is_stable_across_filter_values():
+    sql1, b1 = _template("duckdb", {"region": ["N", "S"], "amount__gte": 10})
+    sql2, b2 = _template("duckdb", {"region": ["E", "W"], "amount__gte": 99})
+    assert sql1 == sql2
+    assert list(b1.values()) == ["N", "S", 10] and list(b2.values()) == ["E", "W", 99]
+    assert "'N'" not in sql1 and ":_fb0" in sql1
+    # Placeholders are rendered as :name for every dialect.
+    for d in ("postgres", "mssql", "mysql"):
+        sql, binds = _template(d, {"region": "N"})
+        assert ":_fb0" in sql and binds == {"_fb0": "N"}
+    # Literal mode is unaffected by template calls on the same builder.
+    b = SQLGlotBuilder("duckdb")
+    b.build_aggregation_template(source="sales", x_field="region", agg="count", where={"region": "N"})
+    assert "'N'" in b.build_aggregation_query(source="sales", x_field="region", agg="count", where={"region": "N"})
+
+
+def test_template_matches_literal_query_results():
+    con = duckdb.connect(":memory:")
+    con.execute(
+        "CREATE TABLE sales AS SELECT ['N','S','E'][1 + i % 3] AS region, i AS amount, "
+        "DATE '2024-01-01' + CAST(i % 60 AS INTEGER) AS day FROM range(300) t(i)"
+    )
+    where = {"region": ["N", "E"], "amount__gte": 20, "day__gte": "2024-01-15", "region__ne": "S"}
+    kw = dict(source="sales", x_field="region", y_field="amount", agg="sum", where=where, order_by="x")
+    literal = SQLGlotBuilder("duckdb").build_aggregation_query(**kw)
+    sql, binds = SQLGlotBuilder("duckdb").build_aggregation_template(**kw)
+    names = re.findall(r":(_fb\d+)\b", sql)
+    bound = con.execute(re.sub(r":_fb\d+\b", "?", sql), [binds[n] for n in names]).fetchall()
+    assert bound == con.execute(literal).fetchall() == con.execute(_inline(sql, binds)).fetchall()
+
+
+def test_duck_literal_escapes_and_rejects():
+    assert prepared.duck_literal("O'Brien") == "'O''Brien'"
+    assert prepared.duck_literal(None) == "NULL" and prepared.duck_literal(True) == "TRUE"
+    assert prepared.duck_literal(Decimal("1.50")) == "1.50"
+    assert prepared.duck_literal(date(2024, 2, 29)) == "DATE '2024-02-29'"
+    assert prepared.duck_literal(datetime(2024, 2, 29, 8, 30)) == "TIMESTAMP '2024-02-29 08:30:00'"
+    for bad in (float("nan"), b"x", [1], "a\x00b"):
+        with pytest.raises(prepared._Unrenderable):
+            prepared.duck_literal(bad)
+
+
+def test_duck_execute_prepares_once_per_connection():
+    con = duckdb.connect(":memory:")
+    con.execute("CREATE TABLE t AS SELECT i, 'v' || i AS s FROM range(10) r(i)")
+    sql = "SELECT COUNT(*) FROM t WHERE i >= ? AND s <> ?"
+    assert prepared.duck_execute(con, sql, [3, "v5"]).fetchone()[0] == 6
+    assert prepared.duck_execute(con, sql, [8, "it's"]).fetchone()[0] == 2
+    assert list(prepared._PER_CONN[con]) == [sql]
+    # Unrenderable values and binder errors fall back to the plain form.
+    assert prepared.duck_execute(con, "SELECT octet_length(?)", [b"abc"]).fetchone()[0] == 3
+    con.execute("DROP TABLE t")
+    con.execute("CREATE TABLE t AS SELECT CAST(i AS VARCHAR) AS i, 'x' AS s FROM range(4) r(i)")
+    assert prepared.duck_execute(con, sql, ["2", "y"]).fetchone()[0] == 2
+    with pytest.raises(duckdb.CatalogException):
+        prepared.duck_execute(con, "SELECT * FROM missing WHERE a = ?", [1])
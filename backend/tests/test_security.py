@@ -73,3 +73,63 @@ def test_embed_token_tampered():
     token, _ = sign_embed_token("pub-abc", ttl_seconds=3600)
     assert verify_embed_token(token[:-2] + "xx", "pub-abc") is False
     assert verify_embed_token("", "pub-abc") is False
+
+
+# --- Credential encryption + cache ---
+def test_encrypt_decrypt_roundtrip_reuses_fernet():
+    from app import security
+    tok = security.encrypt_text("mysql://u:p@h/db")
+    assert security.decrypt_text(tok) == "mysql://u:p@h/db"
+    assert security._fernet() is security._fernet()
+    assert security.decrypt_text("garbage") is None
+
+
+def test_previous_key_still_decrypts(monkeypatch):
+    from app import security
+    settings = security.settings  # app.config may be reloaded by other tests
+    old_tok = security.encrypt_text("dsn-old")
+    monkeypatch.setattr(settings, "secret_key_previous", settings.secret_key)
+    monkeypatch.setattr(settings, "secret_key", settings.secret_key + "-rotated")
+    assert security.decrypt_text(old_tok) == "dsn-old"
+    new_tok = security.encrypt_text("dsn-new")
+    monkeypatch.setattr(settings, "secret_key_previous", "")
+    assert security.decrypt_text(new_tok) == "dsn-new"
+    assert security.decrypt_text(old_tok) is None
+
+
+def test_credential_cache_versions_and_purge(monkeypatch):
+    from app import security
+    calls = []
+    real = security.decrypt_text
+
+    def counting(tok):
+        calls.append(tok)
+        return real(tok)
+
+    monkeypatch.setattr(security, "decrypt_text", counting)
+    security.purge_credentials()
+    t1 = security.encrypt_text("dsn-1")
+    assert security.decrypt_credential("ds-a", t1) == "dsn-1"
+    assert security.decrypt_credential("ds-a", t1) == "dsn-1"
+    assert len(calls) == 1
+    # Edited connection -> new ciphertext -> new version, old plaintext dropped.
+    t2 = security.encrypt_text("dsn-2")
+    assert security.credential_version(t1) != security.credential_version(t2)
+    assert security.decrypt_credential("ds-a", t2) == "dsn-2"
+    assert [k for k in security._cred_cache if k[0] == "ds-a"] == [("ds-a", security.credential_version(t2))]
+    security.purge_credentials("ds-a")
+    assert security.decrypt_credential("ds-a", t2) == "dsn-2"
+    assert len(calls) == 3
+    assert security.decrypt_credential("ds-a", "bogus") is None
+    security.purge_credentials()
+
+
+def test_credential_cache_is_bounded(monkeypatch):
+    from app import security
+    monkeypatch.setattr(security, "CREDENTIAL_CACHE_MAX", 3)
+    security.purge_credentials()
+    tok = security.encrypt_text("x")
+    for i in range(10):
+        security.decrypt_credential(f"ds-{i}", tok)
+    assert len(security._cred_cache) == 3
+    security.purge_credentials()
@@ -0,0 +1,75 @@
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.routers import query as q
+from app.schemas import QueryResponse, QuerySpecRequest
+
+
+class _NullSession:
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def _stub(monkeypatch):
+    monkeypatch.setattr(q, "SessionLocal", _NullSession)
+    monkeypatch.setattr(q, "_enforce_rate_limit", lambda req, actor, ep: None)
+
+
+def _events(payload):
+    async def _collect():
+        res = await q.run_query_spec_progressive(payload, None, db=None, actorId="u1")
+        assert res.media_type == "text/event-stream"
+        return [chunk async for chunk in res.body_iterator]
+
+    out = []
+    for chunk in asyncio.run(_collect()):
+        head, data = chunk.strip().split("\n")
+        out.append((head.split(": ", 1)[1], json.loads(data.split(": ", 1)[1])))
+    return out
+
+
+def _payload(**kw):
+    return QuerySpecRequest(spec={"source": "sales"}, **kw)
+
+
+def test_partial_then_final(monkeypatch):
+    def fake(p, db, actor, public_id, token):
+        if p.approximate:
+            return QueryResponse(columns=["v"], rows=[[9]], approximate=True, approximation={"statements": []})
+        time.sleep(0.2)
+        return QueryResponse(columns=["v"], rows=[[10]])
+
+    monkeypatch.setattr(q, "_execute_spec_request", fake)
+    ev = _events(_payload())
+    assert [e for e, _ in ev] == ["partial", "final"]
+    assert ev[0][1]["approximate"] is True and ev[1][1]["rows"] == [[10]]
+
+
+def test_unapproximable_spec_sends_single_final(monkeypatch):
+    seen = []
+
+    def fake(p, db, actor, public_id, token):
+        seen.append((p.approximate, p.samplePercent))
+        if not p.approximate:
+            time.sleep(0.2)
+        return QueryResponse(columns=["v"], rows=[[1]])
+
+    monkeypatch.setattr(q, "_execute_spec_request", fake)
+    ev = _events(_payload(samplePercent=5))
+    assert [e for e, _ in ev] == ["final"]
+    assert (True, 5.0) in seen
+
+
+def test_exact_error_is_reported_in_stream(monkeypatch):
+    def fake(p, db, actor, public_id, token):
+        if p.approximate:
+            raise RuntimeError("sample failed")
+        raise HTTPException(status_code=400, detail="bad spec")
+
+    monkeypatch.setattr(q, "_execute_spec_request", fake)
+    assert _events(_payload()) == [("error", {"status": 400, "detail": "bad spec"})]
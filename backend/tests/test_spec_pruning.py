@@ -0,0 +1,111 @@
+import duckdb
+import pytest
+
+from app.schemas import QuerySpec
+from app.spec_pruning import expr_refs, prune_for_spec, spec_roots
+from app.sqlgen import build_sql
+
+BASE = ["OrderDate", "Region", "Amount", "Discount", "Cost", "Client", "Status", "Notes"]
+CUSTOM = [
+    {"name": "Net", "expr": "[Amount] - [Discount]"},
+    {"name": "Margin", "expr": "([Net] - [Cost]) / NULLIF([Amount], 0)"},
+    {"name": "Label", "expr": "'Net ' || [ClientName]"},
+]
+TRANSFORMS = [
+    {"type": "computed", "name": "Big", "expr": "CASE WHEN [Amount] > 100 THEN 1 ELSE 0 END"},
+    {"type": "case", "target": "Status", "cases": [{"when": {"op": "eq", "left": "Status", "right": "A"}, "then": "Active"}],
+     "else": "Other"},
+]
+JOINS = [
+    {"joinType": "left", "targetTable": "clients", "sourceKey": "Client", "targetKey": "id",
+     "columns": [{"name": "name", "alias": "ClientName"}]},
+    {"joinType": "left", "targetTable": "returns", "sourceKey": "Client", "targetKey": "client",
+     "aggregate": {"fn": "sum", "column": "qty", "alias": "Returned"}},
+]
+
+
+def _prune(spec, joins=JOINS, base=BASE):
+    return prune_for_spec(CUSTOM, TRANSFORMS, joins, spec_roots(spec), base)
+
+
+def test_roots_cover_spec_fields():
+    spec = QuerySpec(
+        source="sales", x=["OrderDate (Month)", "Region"], y="Amount", agg="sum",
+        measure="SUM([Margin]) / COUNT(*)", series=[{"y": "Net", "legend": "Status"}],
+        where={"start": "2024-01-01", "Big__gte": 1, "Client": ["c1"]},
+    )
+    roots = spec_roots(spec)
+    assert {"orderdate (month)", "orderdate", "region", "amount", "margin", "net", "status", "big", "client"} <= roots
+    assert "start" not in roots
+    assert "x" not in expr_refs("'x' || [Col]") and "col" in expr_refs("'x' || [Col]")
+
+
+def test_unreferenced_items_and_joins_are_dropped():
+    ccs, trs, joins, select = _prune(QuerySpec(source="sales", x="Region", y="Amount", agg="sum"))
+    assert ccs == [] and trs == [] and joins == []
+    assert select == ["Amount", "Region"]
+
+
+def test_dependencies_are_followed():
+    spec = QuerySpec(source="sales", x="Status", y="Margin", agg="sum", legend="Label")
+    ccs, trs, joins, select = _prune(spec)
+    assert [c["name"] for c in ccs] == ["Net", "Margin", "Label"]
+    assert [t["type"] for t in trs] == ["case"]
+    # Label reads ClientName from the first join; the aggregate join stays unused.
+    assert [j["targetTable"] for j in joins] == ["clients"]
+    # The case transform shadows the base Status column, so s.* stays.
+    assert select == ["*"]
+    spec = QuerySpec(source="sales", x="Region", y="Margin", agg="sum", legend="Label")
+    assert _prune(spec)[3] == ["Region", "Net", "Margin", "Label"]
+
+
+def test_joins_that_filter_or_are_addressed_by_alias_stay():
+    spec = QuerySpec(source="sales", x="Region", agg="count")
+    inner = [dict(JOINS[0], joinType="inner"), JOINS[1]]
+    assert [j["joinType"] for j in _prune(spec, joins=inner)[2]] == ["inner"]
+    aliased = [{"name": "Tag", "expr": '"j2"."Returned" > 0'}]
+    spec = QuerySpec(source="sales", x="Tag", agg="count")
+    assert prune_for_spec(aliased, [], JOINS, spec_roots(spec), BASE)[2] == JOINS
+
+
+def test_unknown_schema_keeps_star_and_unpivot_is_untouched(monkeypatch):
+    spec = QuerySpec(source="sales", x="Region", agg="count")
+    assert _prune(spec, base=None)[3] == ["*"]
+    unpivot = TRANSFORMS + [{"type": "unpivot", "sourceColumns": ["Amount"], "keyColumn": "k", "valueColumn": "v"}]
+    assert prune_for_spec(CUSTOM, unpivot, JOINS, spec_roots(spec), BASE) == (CUSTOM, unpivot, JOINS, ["*"])
+    monkeypatch.setenv("SPEC_JOIN_ELIMINATION", "0")
+    assert _prune(spec)[2] == JOINS
+
+
+@pytest.fixture()
+def duck():
+    con = duckdb.connect(":memory:")
+    con.execute(
+        "CREATE TABLE sales AS SELECT DATE '2024-01-01' + CAST(i % 90 AS INTEGER) AS \"OrderDate\", "
+        "['N','S','E'][1 + i % 3] AS \"Region\", CAST(i AS DOUBLE) AS \"Amount\", CAST(i % 7 AS DOUBLE) AS \"Discount\", "
+        "CAST(i % 5 AS DOUBLE) AS \"Cost\", 'c' || (i % 11) AS \"Client\", ['A','B'][1 + i % 2] AS \"Status\", "
+        "repeat('x', 50) AS \"Notes\" FROM range(400) t(i)"
+    )
+    con.execute("CREATE TABLE clients AS SELECT 'c' || i AS id, 'name' || i AS name FROM range(11) t(i)")
+    con.execute("CREATE TABLE returns AS SELECT 'c' || (i % 11) AS client, i AS qty FROM range(50) t(i)")
+    yield con
+    con.close()
+
+
+@pytest.mark.parametrize("spec,outer", [
+    (QuerySpec(source="sales", x="Region", y="Net", agg="sum"),
+     'SELECT "Region", SUM("Net") FROM ({}) AS _base GROUP BY 1'),
+    (QuerySpec(source="sales", x="Region", agg="count", where={"Big": 1}),
+     'SELECT "Region", COUNT(*) FROM ({}) AS _base WHERE "Big" = 1 GROUP BY 1'),
+    (QuerySpec(source="sales", x="Label", y="Margin", agg="avg"),
+     'SELECT "Label", ROUND(AVG("Margin"), 9) FROM ({}) AS _base GROUP BY 1'),
+])
+def test_pruned_subquery_matches_full_results(duck, spec, outer):
+    def base_sql(ccs, trs, joins, select):
+        return build_sql(dialect="duckdb", source="sales", base_select=select, custom_columns=ccs, transforms=trs,
+                         joins=joins, defaults={}, limit=None, base_cols=set(BASE))[0]
+
+    full = base_sql(CUSTOM, TRANSFORMS, JOINS, ["*"])
+    pruned = base_sql(*_prune(spec))
+    assert "s.*" not in pruned and "Notes" not in pruned and "returns" not in pruned
+    assert sorted(duck.execute(outer.format(pruned)).fetchall()) == sorted(duck.execute(outer.format(full)).fetchall())
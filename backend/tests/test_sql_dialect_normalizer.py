@@ -32,3 +32,40 @@ def test_complex_bracket_idents_duckdb_and_mysql():
     assert duck == '"schema"."table"."column" = "s"."ClientID"'
     mysql = auto_normalize(expr, "mysql")
     assert mysql == "`schema`.`table`.`column` = `s`.`ClientID`"
+
+
+def test_string_literals_and_comments_are_not_rewritten():
+    from app.sql_dialect_normalizer import normalize_sql_expression
+    expr = "regexp_matches([Code], '[0-9]+') AND [Note] <> 'a\"b' -- [x]"
+    out = normalize_sql_expression(expr, "duckdb", "mssql")
+    assert out == "regexp_matches(\"Code\", '[0-9]+') AND \"Note\" <> 'a\"b' -- [x]"
+
+
+def test_mssql_functions_mapped_only_from_mssql():
+    from app.sql_dialect_normalizer import normalize_sql_expression
+    assert normalize_sql_expression("ISNULL([a], 0) + LEN([b])", "duckdb", "mssql") == 'COALESCE("a", 0) + LENGTH("b")'
+    assert normalize_sql_expression("LEN([b])", "mysql", "mssql") == "CHAR_LENGTH(`b`)"
+    assert normalize_sql_expression("len(x)", "duckdb") == "len(x)"
+
+
+def test_embedded_quotes_are_doubled():
+    from app.sql_dialect_normalizer import normalize_sql_expression
+    assert normalize_sql_expression('[say "hi"]', "duckdb", "mssql") == '"say ""hi"""'
+
+
+def test_to_positional_skips_strings_comments_and_casts():
+    from app.sql_dialect_normalizer import to_positional
+    sql = ("SELECT '12:30' AS t, x::int FROM t /* :nope */ "
+           "WHERE d >= :start AND d < :end AND c = :c1 OR c = :c1 -- :gone")
+    out, names = to_positional(sql)
+    assert names == ("start", "end", "c1", "c1")
+    assert out == ("SELECT '12:30' AS t, x::int FROM t /* :nope */ "
+                   "WHERE d >= ? AND d < ? AND c = ? OR c = ? -- :gone")
+    assert to_positional("SELECT 1") == ("SELECT 1", ())
+
+
+def test_numericify_wraps_whole_identifier_chains():
+    from app.sqlgen import _normalize_expr_idents
+    out = _normalize_expr_idents("duckdb", "[s].[Amount] * 2 + '[x]'", numericify=True)
+    assert out.startswith('COALESCE(try_cast(regexp_replace(CAST("s"."Amount" AS VARCHAR)')
+    assert '"s".COALESCE' not in out and out.endswith(" * 2 + '[x]'")
@@ -0,0 +1,132 @@
+import json
+import re
+import sqlite3
+
+import duckdb
+import pytest
+
+from app import compile_cache as cc
+from app.sql_pushdown import maybe_pushdown, pushdown_predicates
+
+INNER = (
+    'SELECT s.*, ("Amount" - "Discount") AS "Net", CASE WHEN "Status" = \'A\' THEN \'Active\' ELSE \'Other\' END AS "Status", '
+    '"j1"."name" AS "ClientName" FROM "sales" AS s LEFT JOIN "clients" AS j1 ON "s"."Client" = "j1"."id"'
+)
+
+
+@pytest.fixture(autouse=True)
+def _clean():
+    cc.clear()
+    yield
+    cc.clear()
+
+
+@pytest.fixture()
+def duck():
+    con = duckdb.connect(":memory:")
+    con.execute(
+        "CREATE TABLE sales AS SELECT ['N','S','E'][1 + i % 3] AS \"Region\", CAST(i AS DOUBLE) AS \"Amount\", "
+        "CAST(i % 7 AS DOUBLE) AS \"Discount\", 'c' || (i % 11) AS \"Client\", ['A','B'][1 + i % 2] AS \"Status\" "
+        "FROM range(500) t(i)"
+    )
+    con.execute("CREATE TABLE clients AS SELECT 'c' || i AS id, 'name' || i AS name FROM range(6) t(i)")
+    yield con
+    con.close()
+
+
+def _run(con, sql, params):
+    names = re.findall(r":([A-Za-z_]\w*)", sql)
+    return sorted(con.execute(re.sub(r":([A-Za-z_]\w*)", "?", sql), [params[n] for n in names]).fetchall())
+
+
+CASES = [
+    (f'SELECT "Region", SUM("Net") FROM ({INNER}) AS _base WHERE "Region" IN (:r0, :r1) AND "Net" > :n GROUP BY 1',
+     {"r0": "N", "r1": "E", "n": 3}, ['s."Region" IN']),
+    (f'SELECT COUNT(*) FROM ({INNER}) AS _base WHERE _base."Client" = :c OR "Amount" < :a',
+     {"c": "c3", "a": 20}, ['s."Client" = ', 's."Amount" <']),
+    (f'SELECT COUNT(*), SUM(n2) FROM (SELECT _b.*, "Net" * 2 AS n2 FROM ({INNER}) AS _b) AS _base '
+     f'WHERE "Region" = :r AND n2 > :m AND "ClientName" IS NULL',
+     {"r": "S", "m": 100}, ['WHERE s."Region" = ']),
+]
+
+
+@pytest.mark.parametrize("sql,params,expect", CASES)
+def test_pushdown_keeps_results(duck, sql, params, expect):
+    pushed = pushdown_predicates(sql, "duckdb")
+    assert pushed != sql
+    for frag in expect:
+        inner_part = pushed[pushed.index('FROM "sales"'):]
+        assert frag in inner_part
+    assert _run(duck, pushed, params) == _run(duck, sql, params)
+
+
+def test_unsafe_terms_stay_outside():
+    # Computed column, a transform that shadows the base "Status", a join column next to s.*.
+    sql = f'SELECT COUNT(*) FROM ({INNER}) AS _base WHERE "Net" > 1 AND "Status" = :s AND "ClientName" = :c'
+    assert pushdown_predicates(sql, "duckdb") == sql
+    for inner in (
+        'SELECT s.*, ROW_NUMBER() OVER () AS rn FROM sales AS s',
+        'SELECT "Region", SUM("Amount") AS "Amount" FROM sales GROUP BY 1',
+        'SELECT DISTINCT * FROM sales',
+        'SELECT * FROM sales LIMIT 10',
+        'SELECT * FROM sales AS s JOIN clients AS j ON s."Client" = j.id',
+    ):
+        sql = f'SELECT * FROM ({inner}) AS _base WHERE "Region" = :r'
+        assert pushdown_predicates(sql, "duckdb") == sql
+    sql = 'SELECT * FROM sales WHERE "Region" = :r'
+    assert maybe_pushdown(sql, "duckdb") is sql
+
+
+def test_schema_allows_join_columns(duck):
+    sql = f'SELECT COUNT(*) FROM ({INNER}) AS _base WHERE "ClientName" = :c'
+    pushed = pushdown_predicates(sql, "duckdb", {"sales": ["Region", "Amount", "Discount", "Client", "Status"]})
+    assert '"j1"."name" = :c)' in pushed
+    assert _run(duck, pushed, {"c": "name3"}) == _run(duck, sql, {"c": "name3"})
+
+
+@pytest.mark.parametrize("dialect,quote", [("postgres", '"'), ("mssql", "["), ("mysql", "`")])
+def test_placeholders_survive_rendering(dialect, quote):
+    q = (lambda n: f"[{n}]") if quote == "[" else (lambda n: f"{quote}{n}{quote}")
+    sql = (f"SELECT {q('Region')} FROM (SELECT s.*, {q('Amount')} * 2 AS {q('A2')} FROM {q('sales')} AS s) AS _base "
+           f"WHERE {q('Region')} = :w_Region AND {q('A2')} > :w_A2")
+    pushed = pushdown_predicates(sql, dialect)
+    assert f"s.{q('Region')} = :w_Region" in pushed and f"{q('A2')} > :w_A2" in pushed
+
+
+def test_explain_plans_filter_at_base_scan(duck):
+    sql = f'SELECT "Region", SUM("Net") FROM ({INNER}) AS _base WHERE "Region" = \'N\' AND "Net" > 3 GROUP BY 1'
+    pushed = pushdown_predicates(sql, "duckdb")
+    plan = json.loads(duck.execute("EXPLAIN (FORMAT json) " + pushed).fetchone()[1])
+    scans = {}
+    stack = list(plan)
+    while stack:
+        node = stack.pop()
+        stack.extend(node.get("children", []))
+        if node.get("name", "").strip() == "SEQ_SCAN":
+            scans[node["extra_info"]["Table"].rsplit(".", 1)[-1]] = node["extra_info"]
+    assert scans["sales"].get("Filters") == "Region='N'"
+
+    lite = sqlite3.connect(":memory:")
+    lite.executescript(
+        'CREATE TABLE sales ("Region" TEXT, "Amount" REAL, "Discount" REAL, "Client" TEXT, "Status" TEXT);'
+        'CREATE INDEX ix_region ON sales ("Region");'
+        'CREATE TABLE clients (id TEXT PRIMARY KEY, name TEXT);'
+    )
+    lite_sql = pushdown_predicates(sql, "sqlite")
+    assert lite_sql.index("WHERE s.\"Region\" = 'N'") < lite_sql.index(") AS _base")
+    detail = " | ".join(r[3] for r in lite.execute("EXPLAIN QUERY PLAN " + lite_sql).fetchall())
+    assert "USING INDEX ix_region" in detail
+
+
+def test_run_query_rewrites_only_builder_sql(monkeypatch):
+    from app import sql_pushdown
+    from app.routers import query as q
+    from app.schemas import QueryRequest
+
+    seen = []
+    monkeypatch.setattr(sql_pushdown, "maybe_pushdown", lambda sql, dialect: seen.append(sql) or sql)
+    sql = "SELECT a FROM (SELECT * FROM (SELECT 1 AS a) AS t) AS _base WHERE a = 1"
+    assert q.run_query(QueryRequest(sql=sql, limit=5), None).rows == [[1]]
+    assert seen == []
+    assert q.run_query(QueryRequest(sql=sql, limit=5), None, pushdown=True).rows == [[1]]
+    assert seen == [sql]
@@ -319,6 +319,90 @@ class TestValidateSQL:
         assert error is not None
         assert len(error) > 0
 
+class TestTopN:
+    """Top-N with an Others bucket, executed on DuckDB"""
+
+    @pytest.fixture
+    def con(self):
+        import duckdb
+        con = duckdb.connect(":memory:")
+        con.execute(
+            "CREATE TABLE sales AS SELECT 'c' || (i % 20) AS cat, 'L' || (i % 3) AS leg, "
+            "CAST(i AS DOUBLE) AS amount FROM range(1000) t(i)"
+        )
+        return con
+
+    def test_tail_folds_into_others(self, con):
+        sql = SQLGlotBuilder("duckdb").build_aggregation_query(
+            source="sales", x_field="cat", agg="count", top_n=3, limit=2,
+        )
+        rows = con.execute(sql).fetchall()
+        # The explicit limit caps N: min(limit, top_n) categories plus Others.
+        assert [r[0] for r in rows] == ["c0", "c1", "Others"]
+        assert sum(r[1] for r in rows) == 1000
+
+    def test_per_series_ranking(self, con):
+        sql = SQLGlotBuilder("duckdb").build_aggregation_query(
+            source="sales", x_field="cat", y_field="amount", legend_field="leg",
+            agg="sum", top_n=2, top_n_per_series=True, others_label="Rest",
+        )
+        rows = con.execute(sql).fetchall()
+        assert len(rows) == 9
+        assert [r[0] for r in rows if r[1] == "L0"] == ["c19", "c16", "Rest"]
+        assert {r[1] for r in rows if r[0] == "Rest"} == {"L0", "L1", "L2"}
+
+    def test_avg_keeps_plain_top_n(self, con):
+        sql = SQLGlotBuilder("duckdb").build_aggregation_query(
+            source="sales", x_field="cat", y_field="amount", agg="avg", top_n=3,
+        )
+        rows = con.execute(sql).fetchall()
+        assert [r[0] for r in rows] == ["c19", "c18", "c17"]
+
+    @pytest.mark.parametrize("per_series", [False, True])
+    def test_multi_series(self, con, per_series):
+        series = [{"name": "Amount", "y": "amount", "agg": "sum"}, {"name": "Orders", "y": "amount", "agg": "count"}]
+        sql = SQLGlotBuilder("duckdb").build_aggregation_query(
+            source="sales", x_field="cat", series=series, top_n=2, top_n_per_series=per_series,
+        )
+        rows = con.execute(sql).fetchall()
+        # SUM and COUNT both fold by SUM: each series keeps an Others bucket.
+        assert len(rows) == 6 and {r[1] for r in rows if r[0] == "Others"} == {"Amount", "Orders"}
+        assert [r[0] for r in rows if r[1] == "Amount"] == ["c19", "c18", "Others"]
+        # Each series is ranked by its own measure: every category has 50 orders,
+        # so Orders ties (broken by x) instead of following the Amount ranking.
+        assert [r[0] for r in rows if r[1] == "Orders"] == ["c0", "c1", "Others"]
+        assert sum(r[2] for r in rows if r[1] == "Orders") == 1000
+
+    def test_template_keeps_the_limit_cap(self, con):
+        b = SQLGlotBuilder("duckdb")
+        kw = dict(source="sales", x_field="cat", agg="count", top_n=5)
+        for limit in (2, 3):
+            sql, binds = b.build_aggregation_template(**kw, limit=limit)
+            assert len(con.execute(sql).fetchall()) == limit + 1
+
+    def test_legacy_spec_sql(self, con):
+        from fastapi import HTTPException
+        from app.routers.query import _legacy_top_n
+        from app.schemas import QuerySpec
+
+        spec = QuerySpec(source="sales", x="cat", agg="count", topN=3, othersLabel="Rest")
+        sql = _legacy_top_n("SELECT cat AS x, COUNT(*) AS value FROM sales GROUP BY 1 ORDER BY 1 LIMIT 2",
+                            spec, "duckdb", "count", 2)
+        assert [r[0] for r in con.execute(sql).fetchall()] == ["c0", "c1", "Rest"]
+        with pytest.raises(HTTPException):
+            _legacy_top_n("SELECT COUNT(*) FROM sales", spec, "duckdb", "count", None)
+
+    def test_pivot_first_row_dimension(self, con):
+        sql = SQLGlotBuilder("duckdb").build_pivot_query(
+            source="sales", rows=["cat"], cols=["leg"], value_field="amount", agg="sum", top_n=2,
+        )
+        rows = con.execute(sql).fetchall()
+        assert [r[0] for r in rows] == ["c19"] * 3 + ["c18"] * 3 + ["Others"] * 3
+        with pytest.raises(ValueError):
+            SQLGlotBuilder("duckdb").build_pivot_query(
+                source="sales", rows=["cat"], cols=[], agg="count", top_n=2, subtotals=True,
+            )
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
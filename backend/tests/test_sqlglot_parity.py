@@ -23,7 +23,7 @@ import datetime as _dt
 import duckdb
 import pytest
 
-from app.sqlgen import build_distinct_sql
+from app.sqlgen import build_distinct_sql, build_pivot_grouping, pivot_grouping_sets
 from app.sqlgen_glot import SQLGlotBuilder, validate_sql
 
 TOL = 1e-9
@@ -330,5 +330,61 @@ def test_cross_dialect_parses(dialect, bucket):
     assert ok, f"{dialect} SQL failed to parse: {err}\n{sql}"
 
 
+# ---------------------------------------------------------------------------
+# Pivot subtotals: ROLLUP(rows) x ROLLUP(cols) computed in the database. Totals
+# of a non-additive measure (distinct count) must match a direct query, and the
+# legacy string helper must agree with the SQLGlot builder.
+# ---------------------------------------------------------------------------
+def test_pivot_grouping_sets_shape():
+    assert pivot_grouping_sets(2, 1) == [(0, 1, 2), (0, 1), (0, 2), (0,), (2,), ()]
+    assert pivot_grouping_sets(0, 0) == [()]
+
+
+def test_pivot_subtotals_exact_for_distinct(conn):
+    sql = SQLGlotBuilder("duckdb").build_pivot_query(
+        source="t", rows=["category"], cols=['Order Count'],
+        value_field="amount", agg="distinct", subtotals=True,
+    )
+    rows = conn.execute(sql).fetchall()
+    # Grand total sorts first: both dims rolled up -> mask 0b11.
+    assert rows[0][3] == 3 and rows[0][:2] == (None, None)
+    assert rows[0][2] == conn.execute("SELECT COUNT(DISTINCT amount) FROM t").fetchone()[0]
+    per_cat = {r[0]: r[2] for r in rows if r[3] == 1}
+    ref = dict(conn.execute("SELECT category, COUNT(DISTINCT amount) FROM t GROUP BY 1").fetchall())
+    assert per_cat == ref
+    masks = [r[3] for r in rows]
+    assert masks == sorted(masks, reverse=True)
+
+
+def test_pivot_subtotals_legacy_matches_sqlglot(conn):
+    dims = ["category", '"Order Count"']
+    grouping_sel, gb_sql, order_sql = build_pivot_grouping("duckdb", dims, 1)
+    legacy = f"SELECT {', '.join(dims)}, SUM(amount) AS value, {grouping_sel} FROM t{gb_sql}{order_sql}"
+    glot = SQLGlotBuilder("duckdb").build_pivot_query(
+        source="t", rows=["category"], cols=["Order Count"],
+        value_field="amount", agg="sum", subtotals=True,
+    )
+    a = conn.execute(legacy).fetchall()
+    b = conn.execute(glot).fetchall()
+    assert len(a) == len(b)
+    key = lambda r: (r[3], str(r[0]), str(r[1]))  # noqa: E731
+    for x, y in zip(sorted(a, key=key), sorted(b, key=key)):
+        assert x[:2] == y[:2] and x[3] == y[3] and abs(x[2] - y[2]) < TOL
+
+
+@pytest.mark.parametrize("dialect,needle", [
+    ("postgres", "GROUPING SETS"), ("mssql", "GROUPING_ID("), ("mysql", "WITH ROLLUP"),
+])
+def test_pivot_subtotals_other_dialects(dialect, needle):
+    sql = SQLGlotBuilder(dialect).build_pivot_query(
+        source="t", rows=["category"], cols=["region"], value_field="amount",
+        agg="avg", subtotals=True, ds_type=dialect,
+    )
+    assert needle in sql
+    assert needle in "".join(build_pivot_grouping(dialect, ["category", "region"], 1))
+    with pytest.raises(ValueError):
+        build_pivot_grouping("sqlite", ["category"], 1)
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,68 @@
+import pytest
+
+from app import compile_cache as cc
+from app.sqlgen_glot import SQLGlotBuilder
+
+EXPR_MAP = {"Net": "[Amount] - [Discount]"}
+
+
+@pytest.fixture(autouse=True)
+def _clean():
+    cc.clear()
+    yield
+    cc.clear()
+
+
+def _kw(where, limit=500, **over):
+    kw = dict(source="sales", x_field="OrderDate", y_field="Amount", legend_field="Region", agg="sum",
+              where=where, group_by="month", order_by="x", limit=limit, expr_map=EXPR_MAP)
+    kw.update(over)
+    return kw
+
+
+def _fresh(dialect, kw):
+    cc.get_cache("sqlglot_aggregation_template", 0).clear()
+    return SQLGlotBuilder._finish_template(*SQLGlotBuilder(dialect)._build_template((), kw), None)
+
+
+WHERES = [
+    ({"Region": ["N", "S"], "start": "2024-01-01", "end": "2024-03-31", "Net__gte": 10, "Client__contains": "ac"},
+     {"Region": ["E", "W"], "start": "2023-06-01", "end": "2023-12-31", "Net__gte": 3, "Client__contains": "o'k"}),
+    ({"OrderDate (Year)": [2024], "OrderDate (Month)__gte": "3", "Status__ne": ["x", "y"], "Qty": None},
+     {"OrderDate (Year)": [2024], "OrderDate (Month)__gte": "11", "Status__ne": ["p", "q"], "Qty": None}),
+    ({"OrderDate (Month Name)__lt": "2025-12-01", "Region": "N"},
+     {"OrderDate (Month Name)__lt": "2024-02-01", "Region": "S"}),
+]
+
+
+@pytest.mark.parametrize("dialect", ["duckdb", "postgres", "mssql"])
+@pytest.mark.parametrize("first,second", WHERES)
+def test_shape_hit_matches_fresh_build(dialect, first, second):
+    b = SQLGlotBuilder(dialect)
+    assert b.build_aggregation_template(**_kw(first)) == _fresh(dialect, _kw(first))
+    hits = cc.stats()["sqlglot_shape_template"]["hits"]
+    got = b.build_aggregation_template(**_kw(second, limit=25))
+    assert cc.stats()["sqlglot_shape_template"]["hits"] == hits + 1
+    assert got == _fresh(dialect, _kw(second, limit=25))
+
+
+def test_value_shape_changes_miss():
+    b = SQLGlotBuilder("duckdb")
+    b.build_aggregation_template(**_kw({"Region": ["N", "S"]}))
+    sql3, binds3 = b.build_aggregation_template(**_kw({"Region": ["N", "S", "E"]}))
+    assert list(binds3.values()) == ["N", "S", "E"] and ":_fb2" in sql3
+    # Digit strings compare as numbers against date parts, ISO dates against the base column.
+    b.build_aggregation_template(**_kw({"OrderDate (Year)__gte": "2024"}))
+    sql_iso, binds_iso = b.build_aggregation_template(**_kw({"OrderDate (Year)__gte": "2024-01-01"}))
+    assert binds_iso == {"_fb0": "2024-01-01"} and sql_iso == _fresh("duckdb", _kw({"OrderDate (Year)__gte": "2024-01-01"}))[0]
+    assert cc.stats()["sqlglot_shape_template"]["hits"] == 0
+
+
+def test_multi_series_is_not_shape_cached():
+    series = [{"y": "Amount", "agg": "sum", "name": "a"}, {"y": "Qty", "agg": "sum", "name": "b"}]
+    kw = dict(source="sales", x_field="Region", series=series, where={"Region": ["N"]}, limit=10)
+    b = SQLGlotBuilder("duckdb")
+    first = b.build_aggregation_template(**kw)
+    kw["where"] = {"Region": ["S"]}
+    assert b.build_aggregation_template(**kw) == _fresh("duckdb", kw)
+    assert first[0] == b.build_aggregation_template(**kw)[0]
@@ -0,0 +1,126 @@
+from datetime import date, timedelta
+
+import duckdb
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import compile_cache as cc
+from app import filter_fragments as ff
+from app import value_sets
+from app.sql_dialect_normalizer import to_positional
+from app.sqlgen_glot import SQLGlotBuilder
+
+N = 100_000
+CLIENTS = [f"c{i}" for i in range(0, 2 * N, 2)]  # every other client id
+
+
+@pytest.fixture(scope="module")
+def duck():
+    con = duckdb.connect(":memory:")
+    con.execute(
+        "CREATE TABLE sales AS SELECT 'c' || i AS \"Client\", i AS \"Id\", CAST(i % 7 AS DOUBLE) AS \"Amount\", "
+        "['N','S'][1 + i % 2] AS \"Region\" FROM range(300000) r(i)"
+    )
+    yield con
+    con.close()
+
+
+def _run_duck(con, sql, params):
+    lists = value_sets.staged(sql, params)
+    qm, names = to_positional(sql)
+    cur = con.cursor()
+    with value_sets.duck_relations(cur, lists):
+        return cur.execute(qm, [params[n] for n in names]).fetchall()
+
+
+def test_fragment_stages_long_lists(duck):
+    clauses, params = ff.compile_where({"Client": CLIENTS, "Id__ne": list(range(10_000)), "Region": ["N"]}, "duckdb",
+                                       lambda n: f'"{n}"')
+    assert clauses[:2] == ['"Client" IN (SELECT v FROM _fv_w_Client_set)', '"Id" NOT IN (SELECT v FROM _fv_w_Id_ne_set)']
+    assert len(params["w_Client_set"]) == N and len(params) == 3
+    sql = "SELECT COUNT(*) FROM sales WHERE " + " AND ".join(clauses)
+    # even ids are "N"; ids >= 10000 among the 100k selected even ids
+    assert _run_duck(duck, sql, params) == [(N - 5_000,)]
+    assert value_sets.key_repr(params["w_Client_set"]).startswith(f"list[{N}]:")
+
+
+def test_sqlglot_template_reads_a_staged_relation(duck):
+    cc.clear()
+    b = SQLGlotBuilder("duckdb")
+    kw = dict(source="sales", x_field="Region", y_field="Amount", agg="count", where={"Client": CLIENTS})
+    sql, binds = b.build_aggregation_template(**kw)
+    assert "_fv__fb0" in sql and list(binds) == ["_fb0"] and len(binds["_fb0"]) == N
+    assert _run_duck(duck, sql, binds) == [("N", N)]
+    # Another 100k-value selection reuses the shape template.
+    hits = cc.stats()["sqlglot_shape_template"]["hits"]
+    sql2, binds2 = b.build_aggregation_template(**dict(kw, where={"Client": [f"c{i}" for i in range(1, 2 * N, 2)]}))
+    assert sql2 == sql and cc.stats()["sqlglot_shape_template"]["hits"] == hits + 1
+    assert _run_duck(duck, sql2, binds2) == [("S", N)]
+
+
+def test_string_values_are_cast_to_the_column_type(duck):
+    duck.execute(
+        "CREATE OR REPLACE TABLE typed AS SELECT 'all' AS \"G\", i AS \"Id\", "
+        "DATE '2020-01-01' + CAST(i AS INTEGER) AS \"Day\" FROM range(5000) r(i)"
+    )
+    where = {"Id": [str(i) for i in range(0, 5000, 2)],
+             "Day": [(date(2020, 1, 1) + timedelta(days=i)).isoformat() for i in range(0, 5000, 2)]}
+    types = {"Id": "integer", "Day": "date"}
+    clauses, params = ff.compile_where(where, "duckdb", lambda n: f'"{n}"', types=types.get)
+    assert clauses == ['"Id" IN (SELECT CAST(v AS BIGINT) FROM _fv_w_Id_set)',
+                       '"Day" IN (SELECT CAST(v AS DATE) FROM _fv_w_Day_set)']
+    assert _run_duck(duck, "SELECT COUNT(*) FROM typed WHERE " + " AND ".join(clauses), params) == [(2500,)]
+
+    cc.clear()
+    kw = dict(source="typed", x_field="G", y_field="Id", agg="count", where=where)
+    sql, binds = SQLGlotBuilder("duckdb", column_types=types).build_aggregation_template(**kw)
+    assert "CAST(v AS DATE)" in sql
+    assert _run_duck(duck, sql, binds) == [("all", 2500)]
+    # Without the declared types the relation is VARCHAR and DuckDB refuses the comparison.
+    sql, binds = SQLGlotBuilder("duckdb").build_aggregation_template(**kw)
+    with pytest.raises(duckdb.Error):
+        _run_duck(duck, sql, binds)
+
+
+def test_below_threshold_and_disabled_lists_stay_bound(monkeypatch):
+    assert ff.compile_where({"Client": CLIENTS[:50]}, "duckdb", str)[0] == [
+        "Client IN (" + ", ".join(f":w_Client_{i}" for i in range(50)) + ")"
+    ]
+    monkeypatch.setenv("FILTER_TEMP_TABLES", "0")
+    assert "_fv_" not in ff.compile_where({"Client": CLIENTS}, "duckdb", str)[0][0]
+
+
+def test_remote_session_temp_tables(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'remote.sqlite'}")
+    with eng.begin() as c:
+        c.execute(text('CREATE TABLE sales ("Client" TEXT, "Id" INTEGER)'))
+        c.execute(text("INSERT INTO sales VALUES (:c, :i)"), [{"c": f"c{i}", "i": i} for i in range(150_000)])
+    clauses, params = ff.compile_where({"Client": CLIENTS, "Id__ne": list(range(0, 150_000, 3))}, "sqlite",
+                                       lambda n: f'"{n}"')
+    sql = "SELECT COUNT(*) FROM sales WHERE " + " AND ".join(clauses)
+    lists = value_sets.staged(sql, params)
+    assert sorted(lists) == ["w_Client_set", "w_Id_ne_set"]
+    with eng.connect() as conn:
+        with value_sets.remote_temp_tables(conn, "sqlite", lists):
+            got = conn.execute(text(sql), value_sets.bind_params(params, lists)).scalar_one()
+        # The temp tables are gone afterwards.
+        assert conn.execute(text("SELECT COUNT(*) FROM sqlite_temp_master WHERE name LIKE '\\_fv\\_%' ESCAPE '\\'")).scalar_one() == 0
+    # even ids below 150k that are not multiples of 3
+    assert got == len([i for i in range(0, 150_000, 2) if i % 3])
+    eng.dispose()
+
+
+def test_column_types_follow_the_values():
+    assert value_sets._column_type("postgres", [1, 2, None]) == "BIGINT"
+    assert value_sets._column_type("mssql", [1, 2.5]) == "FLOAT"
+    assert value_sets._column_type("mysql", ["ab", 7]) == "VARCHAR(2)"
+    assert value_sets.relation_name("w_x_set", "tsql") == "#_fv_w_x_set"
+
+
+def test_cast_types_follow_the_declared_column():
+    assert value_sets.cast_type("duckdb", "INTEGER") == "BIGINT"
+    assert value_sets.cast_type("postgres", "timestamp with time zone") == "TIMESTAMPTZ"
+    assert value_sets.cast_type("mssql", "datetime2") == "DATETIME2"
+    assert value_sets.cast_type("mysql", "int") == "SIGNED"
+    assert value_sets.cast_type("duckdb", "DECIMAL(18,2)") == "DECIMAL(18,2)"
+    assert value_sets.cast_type("duckdb", "UUID") is None and value_sets.cast_type("duckdb", None) is None
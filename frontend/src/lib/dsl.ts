@@ -16,6 +16,7 @@ export type CustomColumn = {
   expr: Expr
   type?: 'string'|'number'|'date'|'boolean'
   scope?: Scope
+  materialized?: boolean // computed into the synced local table at sync time
 }
 
 export type Transform = (